@@ -0,0 +1,32 @@
+"""add_provider_id_to_doc.
+
+Revision ID: 9c2e5b7a1d40
+Revises: b93f2c2c2e84
+Create Date: 2025-05-12 08:30:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9c2e5b7a1d40"
+down_revision: Union[str, None] = "b93f2c2c2e84"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Apply the migration: link documents to the provider they came from."""
+    # The billing, damages and readiness code already reads and writes
+    # doc.provider_id, so some databases have it; add it where missing
+    op.execute(
+        "ALTER TABLE doc ADD COLUMN IF NOT EXISTS provider_id INTEGER "
+        "REFERENCES provider(id) ON DELETE SET NULL;"
+    )
+
+
+def downgrade() -> None:
+    """Revert the migration: remove the provider_id column from doc."""
+    op.execute("ALTER TABLE doc DROP COLUMN IF EXISTS provider_id;")
@@ -0,0 +1,55 @@
+"""keep_manifest_rows_of_deleted_docs.
+
+Revision ID: a3b9d6f0c5e7
+Revises: f1c3a7e9d2b4
+Create Date: 2025-05-18 09:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a3b9d6f0c5e7"
+down_revision: Union[str, None] = "f1c3a7e9d2b4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FOREIGN_KEY = "demand_package_exhibit_doc_id_fkey"
+
+
+def upgrade() -> None:
+    """Apply the migration: keep manifest rows when their doc is deleted."""
+    # Deleting an exhibit doc used to cascade to its manifest row, hiding the
+    # removal; a NULL doc_id lets the stale package check see it
+    op.drop_constraint(FOREIGN_KEY, "demand_package_exhibit", type_="foreignkey")
+    op.alter_column(
+        "demand_package_exhibit", "doc_id", existing_type=sa.Integer, nullable=True
+    )
+    op.create_foreign_key(
+        FOREIGN_KEY,
+        "demand_package_exhibit",
+        "doc",
+        ["doc_id"],
+        ["id"],
+        ondelete="SET NULL",
+    )
+
+
+def downgrade() -> None:
+    """Revert the migration: cascade doc deletions to manifest rows."""
+    op.execute("DELETE FROM demand_package_exhibit WHERE doc_id IS NULL;")
+    op.drop_constraint(FOREIGN_KEY, "demand_package_exhibit", type_="foreignkey")
+    op.alter_column(
+        "demand_package_exhibit", "doc_id", existing_type=sa.Integer, nullable=False
+    )
+    op.create_foreign_key(
+        FOREIGN_KEY,
+        "demand_package_exhibit",
+        "doc",
+        ["doc_id"],
+        ["id"],
+        ondelete="CASCADE",
+    )
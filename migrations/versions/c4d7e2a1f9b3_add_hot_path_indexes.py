@@ -0,0 +1,55 @@
+"""add_hot_path_indexes.
+
+Revision ID: c4d7e2a1f9b3
+Revises: 9c2e5b7a1d40
+Create Date: 2025-05-12 09:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c4d7e2a1f9b3"
+down_revision: Union[str, None] = "9c2e5b7a1d40"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, definition) for every index this migration owns. The plan-regression
+# benchmark (scripts/benchmark_queries.py) checks the hot queries use them.
+INDEXES = [
+    # Readiness, demand assembly and damages: doc filtered by incident and type
+    ("ix_doc_incident_id_type", "doc (incident_id, type)"),
+    # Provider bill checks: doc filtered by provider and type
+    (
+        "ix_doc_provider_id_type",
+        "doc (provider_id, type) WHERE provider_id IS NOT NULL",
+    ),
+    # Damages worksheet and bill roll-ups only ever read medical bills
+    (
+        "ix_doc_medical_bill_incident_provider",
+        "doc (incident_id, provider_id) WHERE type = 'medical_bill'",
+    ),
+    ("ix_provider_incident_id", "provider (incident_id)"),
+    ("ix_insurance_incident_id", "insurance (incident_id)"),
+    ("ix_fee_adjustments_incident_id", "fee_adjustments (incident_id)"),
+]
+
+
+def upgrade() -> None:
+    """Apply the migration: add composite and partial indexes on hot paths."""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block, and
+    # avoids locking writes on the tables while the indexes build.
+    with op.get_context().autocommit_block():
+        for name, definition in INDEXES:
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition};"
+            )
+
+
+def downgrade() -> None:
+    """Revert the migration: drop the hot path indexes."""
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
@@ -0,0 +1,49 @@
+"""add_outbox_table.
+
+Revision ID: d5e8f3b2a7c1
+Revises: c4d7e2a1f9b3
+Create Date: 2025-05-14 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "d5e8f3b2a7c1"
+down_revision: Union[str, None] = "c4d7e2a1f9b3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Apply the migration: add the transactional outbox table."""
+    # Celery tasks and activity events written in the same transaction as the
+    # business rows, drained by the relay in pi_auto_api.outbox
+    op.create_table(
+        "outbox",
+        sa.Column("id", sa.BigInteger, primary_key=True),
+        sa.Column("kind", sa.String(20), nullable=False),
+        sa.Column("payload", postgresql.JSONB, nullable=False),
+        sa.Column("attempts", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("last_error", sa.Text, nullable=True),
+        sa.Column(
+            "created_at", sa.TIMESTAMP, server_default=sa.func.now(), nullable=False
+        ),
+        sa.CheckConstraint("kind IN ('task', 'event')", name="ck_outbox_kind"),
+    )
+
+    # The relay claims the oldest rows that still have attempts left
+    op.create_index("ix_outbox_attempts_id", "outbox", ["attempts", "id"])
+
+    # Only the service role relays the outbox; staff and clients never read it
+    op.execute("ALTER TABLE outbox ENABLE ROW LEVEL SECURITY;")
+
+
+def downgrade() -> None:
+    """Revert the migration: drop the outbox table."""
+    op.drop_index("ix_outbox_attempts_id", table_name="outbox")
+    op.drop_table("outbox")
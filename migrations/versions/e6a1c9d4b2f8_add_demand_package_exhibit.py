@@ -0,0 +1,52 @@
+"""add_demand_package_exhibit.
+
+Revision ID: e6a1c9d4b2f8
+Revises: d5e8f3b2a7c1
+Create Date: 2025-05-16 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e6a1c9d4b2f8"
+down_revision: Union[str, None] = "d5e8f3b2a7c1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Apply the migration: record the exhibits of each demand package."""
+    # One row per exhibit, in package order, with the version that was merged
+    # and where its pages landed; incremental rebuilds reuse unchanged ranges
+    op.create_table(
+        "demand_package_exhibit",
+        sa.Column(
+            "package_id",
+            sa.Integer,
+            sa.ForeignKey("doc.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("position", sa.Integer, primary_key=True),
+        sa.Column(
+            "doc_id",
+            sa.Integer,
+            sa.ForeignKey("doc.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("etag", sa.String(255), nullable=True),
+        sa.Column("sha256", sa.String(64), nullable=False),
+        sa.Column("page_start", sa.Integer, nullable=False),
+        sa.Column("page_count", sa.Integer, nullable=False),
+    )
+
+    # Only the service role builds demand packages and reads their manifests
+    op.execute("ALTER TABLE demand_package_exhibit ENABLE ROW LEVEL SECURITY;")
+
+
+def downgrade() -> None:
+    """Revert the migration: drop the demand package exhibit table."""
+    op.drop_table("demand_package_exhibit")
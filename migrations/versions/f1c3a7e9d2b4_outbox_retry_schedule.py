@@ -0,0 +1,60 @@
+"""outbox_retry_schedule.
+
+Revision ID: f1c3a7e9d2b4
+Revises: e6a1c9d4b2f8
+Create Date: 2025-05-17 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f1c3a7e9d2b4"
+down_revision: Union[str, None] = "e6a1c9d4b2f8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Apply the migration: schedule outbox retries and lease claimed rows."""
+    # Failed rows are retried with exponential backoff rather than on every
+    # poll; rows out of attempts are dead-lettered instead of skipped silently
+    op.add_column(
+        "outbox",
+        sa.Column(
+            "next_attempt_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+    )
+    op.add_column(
+        "outbox", sa.Column("dead_at", sa.TIMESTAMP(timezone=True), nullable=True)
+    )
+    # Rows are claimed with a short lease so delivery happens outside the
+    # claiming transaction; an expired lease makes the row claimable again
+    op.add_column(
+        "outbox",
+        sa.Column("claimed_until", sa.TIMESTAMP(timezone=True), nullable=True),
+    )
+
+    # The relay claims the oldest live rows that are due
+    op.drop_index("ix_outbox_attempts_id", table_name="outbox")
+    op.create_index(
+        "ix_outbox_due",
+        "outbox",
+        ["next_attempt_at", "id"],
+        postgresql_where=sa.text("dead_at IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    """Revert the migration: back to claiming rows by attempt count."""
+    op.drop_index("ix_outbox_due", table_name="outbox")
+    op.create_index("ix_outbox_attempts_id", "outbox", ["attempts", "id"])
+    op.drop_column("outbox", "claimed_until")
+    op.drop_column("outbox", "dead_at")
+    op.drop_column("outbox", "next_attempt_at")
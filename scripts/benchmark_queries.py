@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Query plan regression benchmark.
+
+Seeds a synthetic book of incidents (clients, providers, insurance, fee
+adjustments and documents) inside a transaction, runs the hot queries from
+db.py, utils/ and tasks/ under EXPLAIN ANALYZE, and checks that:
+
+- each of them still runs against the migrated schema,
+
+- none of them sequentially scans a table it should reach through an index
+  (see migrations/versions/c4d7e2a1f9b3_add_hot_path_indexes.py), and
+- their median execution time stays under a per-query budget.
+
+The transaction is rolled back at the end, so the database is left untouched.
+Run it against a database migrated to head. Exits with 0 if every query
+passes, non-zero otherwise.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set
+
+import asyncpg
+
+from pi_auto_api.db import INSURANCE_QUERY, PROVIDER_PAYLOADS_QUERY
+from pi_auto_api.tasks.damages import MEDICAL_BILLS_QUERY
+from pi_auto_api.tasks.demand import DEMAND_DOCS_QUERY, STALE_PACKAGES_QUERY
+from pi_auto_api.tasks.medical_records import PENDING_PROVIDERS_QUERY
+from pi_auto_api.utils.disbursement_calc import FEE_ADJUSTMENTS_QUERY
+from pi_auto_api.utils.package_rules import DEMAND_READINESS_QUERY
+
+
+@dataclass
+class BenchmarkQuery:
+    """A hot query and the expectations its plan has to meet.
+
+    Attributes:
+        name: Short label used in the report
+        source: Where the query lives in the code base
+        sql: The query text
+        args: Query arguments; "$incident", "$incident_list" and
+            "$provider_list" pick seeded rows
+        no_seq_scan: Tables the plan must not read with a sequential scan
+        budget_ms: Maximum median execution time in milliseconds
+    """
+
+    name: str
+    source: str
+    sql: str
+    args: Sequence[Any] = ()
+    no_seq_scan: Set[str] = field(default_factory=set)
+    budget_ms: float = 20.0
+
+
+@dataclass
+class BenchmarkResult:
+    """Outcome of benchmarking one query."""
+
+    query: BenchmarkQuery
+    median_ms: float
+    seq_scans: Set[str]
+    error: Optional[str] = None
+
+    @property
+    def failures(self) -> List[str]:
+        """Describe every expectation the query missed."""
+        if self.error:
+            return [f"query failed: {self.error}"]
+        problems = [
+            f"sequential scan on {table}"
+            for table in sorted(self.seq_scans & self.query.no_seq_scan)
+        ]
+        if self.median_ms > self.query.budget_ms:
+            problems.append(
+                f"median {self.median_ms:.2f}ms over budget "
+                f"{self.query.budget_ms:.2f}ms"
+            )
+        return problems
+
+
+QUERIES = [
+    BenchmarkQuery(
+        name="insurance_by_incident",
+        source="db.get_insurance_payload",
+        sql=INSURANCE_QUERY,
+        args=("$incident",),
+        no_seq_scan={"insurance"},
+    ),
+    BenchmarkQuery(
+        name="provider_payloads",
+        source="db.get_provider_payloads",
+        sql=PROVIDER_PAYLOADS_QUERY,
+        args=("$incident_list", "$provider_list"),
+        no_seq_scan={"client", "incident", "provider"},
+    ),
+    BenchmarkQuery(
+        name="pending_providers",
+        source="tasks.medical_records.send_medical_record_requests",
+        sql=PENDING_PROVIDERS_QUERY,
+        # Looks at every provider of the book by design
+        budget_ms=2000.0,
+    ),
+    BenchmarkQuery(
+        name="medical_bills",
+        source="tasks.damages.build_damages_worksheet",
+        sql=MEDICAL_BILLS_QUERY,
+        args=("$incident",),
+        no_seq_scan={"doc", "provider"},
+    ),
+    BenchmarkQuery(
+        name="demand_exhibits",
+        source="tasks.demand.assemble_demand_package",
+        sql=DEMAND_DOCS_QUERY,
+        args=("$incident",),
+        no_seq_scan={"doc"},
+    ),
+    BenchmarkQuery(
+        name="stale_demand_packages",
+        source="tasks.demand.check_and_build_demand",
+        sql=STALE_PACKAGES_QUERY,
+        # Checks every package of the book nightly
+        budget_ms=2000.0,
+    ),
+    BenchmarkQuery(
+        name="fee_adjustments",
+        source="utils.disbursement_calc.calc_split",
+        sql=FEE_ADJUSTMENTS_QUERY,
+        args=("$incident",),
+        no_seq_scan={"fee_adjustments"},
+    ),
+    BenchmarkQuery(
+        name="demand_readiness_one",
+        source="utils.package_rules.is_demand_ready",
+        sql=DEMAND_READINESS_QUERY,
+        args=("$incident_list",),
+        no_seq_scan={"doc", "incident"},
+    ),
+    BenchmarkQuery(
+        name="demand_readiness_all",
+        source="utils.package_rules.get_demand_readiness",
+        sql=DEMAND_READINESS_QUERY,
+        args=(None,),
+        # Evaluates the whole book, so scanning doc once is the intended plan
+        budget_ms=2000.0,
+    ),
+]
+
+
+SEEDED_TABLES = (
+    "client",
+    "incident",
+    "provider",
+    "insurance",
+    "fee_adjustments",
+    "doc",
+)
+
+SEED_SQL = """
+INSERT INTO client (id, full_name, email)
+SELECT g, 'Bench Client ' || g, 'client' || g || '@example.com'
+FROM generate_series($1::int, $1::int + $2::int - 1) AS g;
+
+INSERT INTO incident (id, client_id, date, location)
+SELECT g, g, DATE '2024-01-01' + (g % 365), 'Bench Street ' || g
+FROM generate_series($1::int, $1::int + $2::int - 1) AS g;
+
+INSERT INTO provider (id, incident_id, name, fax)
+SELECT
+    $1::int * 3 + g,
+    $1::int + g / 3,
+    'Bench Provider ' || g,
+    '+1555' || lpad(g::text, 7, '0')
+FROM generate_series(0, $2::int * 3 - 1) AS g;
+
+INSERT INTO insurance (incident_id, carrier_name, is_client_side)
+SELECT $1::int + g / 2, 'Bench Carrier ' || (g % 17), g % 2 = 0
+FROM generate_series(0, $2::int * 2 - 1) AS g;
+
+INSERT INTO fee_adjustments (incident_id, description, amount)
+SELECT $1::int + g, 'Bench adjustment', 100 + g % 900
+FROM generate_series(0, $2::int - 1) AS g;
+
+-- Roughly a dozen documents per incident with a realistic type mix;
+-- bills and records belong to one of the incident's providers.
+INSERT INTO doc (incident_id, provider_id, type, url, status, amount)
+SELECT
+    $1::int + g / 12,
+    CASE WHEN g % 12 < 8 THEN $1::int * 3 + (g / 12) * 3 + g % 3 END,
+    (ARRAY[
+        'medical_bill', 'medical_bill', 'medical_bill', 'medical_bill',
+        'medical_records', 'medical_records', 'records_request_sent',
+        'records_request_sent', 'liability_photo', 'liability_photo',
+        'damages_worksheet_pdf', 'retainer'
+    ])[g % 12 + 1],
+    'https://bench.example.com/doc/' || g || '.pdf',
+    'received',
+    CASE WHEN g % 12 < 4 THEN 100 + g % 5000 END
+FROM generate_series(0, $2::int * 12 - 1) AS g;
+"""
+
+
+def iter_plan_nodes(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Yield a plan node and all of its children."""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from iter_plan_nodes(child)
+
+
+async def seed(conn: asyncpg.Connection, incidents: int, first_id: int) -> None:
+    """Insert the synthetic dataset and refresh planner statistics."""
+    for statement in SEED_SQL.split(";\n"):
+        if statement.strip():
+            await conn.execute(statement, first_id, incidents)
+    for table in SEEDED_TABLES:
+        await conn.execute(f"ANALYZE {table}")
+
+
+async def benchmark(
+    conn: asyncpg.Connection,
+    query: BenchmarkQuery,
+    sample: Dict[str, Any],
+    runs: int,
+) -> BenchmarkResult:
+    """Run one query under EXPLAIN ANALYZE and collect its plan and timing."""
+    args = [sample.get(a, a) if isinstance(a, str) else a for a in query.args]
+    timings: List[float] = []
+    seq_scans: Set[str] = set()
+    explain = f"EXPLAIN (ANALYZE, FORMAT JSON) {query.sql.strip().rstrip(';')}"
+    for _ in range(runs):
+        try:
+            # A savepoint keeps the seeded data usable if the query fails
+            async with conn.transaction():
+                explained = await conn.fetchval(explain, *args)
+        except asyncpg.PostgresError as e:
+            return BenchmarkResult(query, 0.0, set(), error=str(e))
+        # asyncpg returns EXPLAIN's json column as text
+        plan = json.loads(explained)[0]
+        timings.append(plan["Execution Time"])
+        seq_scans |= {
+            node["Relation Name"]
+            for node in iter_plan_nodes(plan["Plan"])
+            if node["Node Type"] == "Seq Scan"
+        }
+    return BenchmarkResult(query, statistics.median(timings), seq_scans)
+
+
+async def run(
+    dsn: str, incidents: int, runs: int, queries: Sequence[BenchmarkQuery] = QUERIES
+) -> List[BenchmarkResult]:
+    """Seed the dataset, benchmark every query and roll everything back."""
+    conn = await asyncpg.connect(dsn)
+    try:
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            # Keep seeded IDs clear of any real rows
+            first_id = 1_000_000 + await conn.fetchval(
+                "SELECT GREATEST("
+                "(SELECT COALESCE(MAX(id), 0) FROM client), "
+                "(SELECT COALESCE(MAX(id), 0) FROM incident), "
+                "(SELECT COALESCE(MAX(id), 0) FROM provider))"
+            )
+            await seed(conn, incidents, first_id)
+
+            middle = first_id + incidents // 2
+            sample = {
+                "$incident": middle,
+                "$incident_list": [middle],
+                "$provider_list": [first_id * 3 + (incidents // 2) * 3],
+            }
+            return [await benchmark(conn, q, sample, runs) for q in queries]
+        finally:
+            await transaction.rollback()
+    finally:
+        await conn.close()
+
+
+def report(results: Sequence[BenchmarkResult]) -> bool:
+    """Print the results table and return True if every query passed."""
+    ok = True
+    for result in results:
+        failures = result.failures
+        ok = ok and not failures
+        status = "FAIL" if failures else "ok"
+        scans = ", ".join(sorted(result.seq_scans)) or "-"
+        print(
+            f"{status:4} {result.query.name:24} {result.median_ms:9.2f}ms "
+            f"(budget {result.query.budget_ms:.0f}ms) seq scans: {scans}"
+            f"  [{result.query.source}]"
+        )
+        for failure in failures:
+            print(f"     - {failure}")
+    return ok
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Check hot query plans.")
+    parser.add_argument(
+        "--dsn",
+        default=os.environ.get("TEST_DATABASE_URL") or os.environ.get("SUPABASE_URL"),
+        help="PostgreSQL DSN of a database migrated to head.",
+    )
+    parser.add_argument(
+        "--incidents", type=int, default=20000, help="Synthetic incidents to seed."
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="EXPLAIN ANALYZE runs per query."
+    )
+    args = parser.parse_args()
+
+    if not args.dsn:
+        print("No database DSN given (use --dsn or TEST_DATABASE_URL).")
+        sys.exit(2)
+
+    results = asyncio.run(run(args.dsn, args.incidents, args.runs))
+    sys.exit(0 if report(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,21 @@
 
 from sqlalchemy import (
     NUMERIC,
+    BigInteger,
     Boolean,
+    CheckConstraint,
     Column,
     Date,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
     func,
+    text,
 )
-from sqlalchemy.dialects.postgresql import JSON, TIMESTAMP
+from sqlalchemy.dialects.postgresql import JSON, JSONB, TIMESTAMP
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -163,6 +167,9 @@ class Doc(Base):
     incident_id = Column(
         Integer, ForeignKey("incident.id", ondelete="CASCADE"), nullable=False
     )
+    provider_id = Column(
+        Integer, ForeignKey("provider.id", ondelete="SET NULL"), nullable=True
+    )
     type = Column(String(100), nullable=False)
     url = Column(String(255), nullable=False)
     status = Column(String(50), nullable=False, server_default="pending")
@@ -206,3 +213,47 @@ class FeeAdjustment(Base):
 
     # Relationships
     incident = relationship("Incident", back_populates="fee_adjustments")
+
+
+class Outbox(Base):
+    """Model representing a task or event waiting for the outbox relay."""
+
+    __tablename__ = "outbox"
+    __table_args__ = (
+        CheckConstraint("kind IN ('task', 'event')", name="ck_outbox_kind"),
+        Index(
+            "ix_outbox_due",
+            "next_attempt_at",
+            "id",
+            postgresql_where=text("dead_at IS NULL"),
+        ),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String(20), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    attempts = Column(Integer, nullable=False, server_default="0")
+    last_error = Column(Text, nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.now(), nullable=False)
+    next_attempt_at = Column(
+        TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+    )
+    dead_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    claimed_until = Column(TIMESTAMP(timezone=True), nullable=True)
+
+
+class DemandPackageExhibit(Base):
+    """Model representing one exhibit merged into a demand package."""
+
+    __tablename__ = "demand_package_exhibit"
+
+    package_id = Column(
+        Integer, ForeignKey("doc.id", ondelete="CASCADE"), primary_key=True
+    )
+    position = Column(Integer, primary_key=True)
+    # NULL once the doc is deleted, so the package is seen as stale
+    doc_id = Column(Integer, ForeignKey("doc.id", ondelete="SET NULL"), nullable=True)
+    etag = Column(String(255), nullable=True)
+    sha256 = Column(String(64), nullable=False)
+    page_start = Column(Integer, nullable=False)
+    page_count = Column(Integer, nullable=False)
@@ -3,10 +3,13 @@
 from celery import Celery
 from celery.schedules import crontab
 
+from pi_auto_api.worker_runtime import AsyncTask
+
 # from pi_auto_api.config import settings # Settings are loaded via config_from_object
 
-# Define the Celery application instance
-app = Celery("pi_auto_api")
+# Define the Celery application instance.
+# AsyncTask runs async task bodies on the per-process worker loop.
+app = Celery("pi_auto_api", task_cls=AsyncTask)
 
 # Load configuration from pi_auto_api.config
 app.config_from_object("pi_auto_api.config")
@@ -47,6 +50,10 @@ app.conf.beat_schedule = {
         "schedule": crontab(hour=3, minute=0),  # e.g., 3 AM ET
         # Optional: "args": (arg1, arg2)
     },
+    "nightly-doc-cache-purge": {
+        "task": "purge_doc_cache",
+        "schedule": crontab(hour=4, minute=0),
+    },
 }
 
 if __name__ == "__main__":
@@ -6,7 +6,7 @@ configuration settings for the API.
 
 import logging
 import os
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 
 from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -21,19 +21,128 @@ class Settings(BaseSettings):
         DATABASE_URL: Connection URL for SQLAlchemy async
         SUPABASE_URL: URL of the Supabase instance
         SUPABASE_KEY: API key for Supabase
+        DB_POOL_MIN_SIZE: Connections kept open in each asyncpg pool
+        DB_POOL_MAX_SIZE: Upper bound on connections in each asyncpg pool
+        DB_POOL_ACQUIRE_TIMEOUT: Seconds to wait for a free pooled connection
+        DB_POOL_MAX_INACTIVE_LIFETIME: Seconds before idle connections are closed
+        DB_COMMAND_TIMEOUT: Client-side timeout for a single query in seconds
+        DB_STATEMENT_TIMEOUT_MS: Server-side statement_timeout in milliseconds
         DOCASSEMBLE_URL: URL of the Docassemble API
+        DOCASSEMBLE_TIMEOUT: Request timeout for Docassemble in seconds
+        DOCASSEMBLE_HEALTH_TIMEOUT: Timeout of the /readyz Docassemble check
+            in seconds, kept short so a hung Docassemble fails readiness fast
+        LETTER_LOCAL_RENDER: Letter types rendered in-process from the
+            repository's Jinja templates instead of by Docassemble
+        LETTER_TEMPLATES_DIR: Directory of the letter templates (defaults to
+            the repository's templates/ directory)
+        LETTER_STRICT_TEMPLATES: Fail renders that use undefined variables
+            instead of leaving them blank (on by default, so letters are
+            never sent with missing sections)
+        CPU_POOL_PROCESSES: Worker processes running CPU-bound document work
+            (PDF and spreadsheet rendering); 0 runs it in threads instead.
+            Each API process and Celery prefork child that renders starts
+            its own pool, so a host runs up to N x CPU_POOL_PROCESSES of them
+        CPU_POOL_MAX_PENDING: Jobs queued or running at once per event loop;
+            further jobs wait for a slot
+        CPU_POOL_TIMEOUT: Seconds a CPU job may run before it is abandoned
+        CPU_POOL_PRELOAD: Modules each worker process imports when it starts
+        DOC_CACHE_ENABLED: Reuse generated documents for identical payloads
+        DOC_CACHE_MAX_BYTES: Size limit of the in-process document cache
+        DOC_CACHE_TTL: Seconds a cached document is reused before regenerating;
+            older blobs are deleted from Supabase Storage nightly
+        DOC_CACHE_STORAGE_ENABLED: Also keep cached documents in Supabase
+            Storage so other processes and retries can reuse them
+        DOC_TEMPLATE_VERSIONS: Version of each template type (e.g.
+            {"lor": "2"}); bump one to invalidate its cached documents
+        DOC_TEMPLATE_RELEASE: Version of the deployed Docassemble templates
+            (e.g. the package's commit), set by the Docassemble deploy; used
+            for template types without a DOC_TEMPLATE_VERSIONS entry.
+            Documents of templates with neither are not cached
+        PDF_SPOOL_THRESHOLD: Size in bytes above which PDFs being merged
+            are spooled to temporary files instead of kept in memory
+        PDF_SPOOL_DIR: Directory for spooled PDFs (defaults to the system
+            temp dir)
+        PDF_OPTIMIZE_ENABLED: Optimize PDFs before they are faxed or stored
+        PDF_OPTIMIZE_DPI: Target image resolution of each destination profile
+            (e.g. {"fax": 200}); destinations not listed keep their images
+        PDF_JPEG_QUALITY: JPEG quality of downsampled images
+        PDF_LINEARIZE: Linearize optimized PDFs for fast first-page display
+        STORAGE_CACHE_ENABLED: Keep files downloaded from Supabase Storage in
+            a local on-disk cache, revalidated by ETag on every use
+        STORAGE_CACHE_DIR: Directory of the storage cache, created with mode
+            0700 and refused if shared (defaults to a per-user directory under
+            the system temp dir)
+        STORAGE_CACHE_MAX_BYTES: Size limit of the storage cache; least
+            recently used files are evicted beyond it
+        DEMAND_DOWNLOAD_CONCURRENCY: Exhibits downloaded at once while
+            assembling a demand package
+        DEMAND_STAMP_ENABLED: Stamp Bates numbers, exhibit labels and a
+            header onto demand package pages while they are merged
+        DEMAND_BATES_PREFIX: Prefix of demand package Bates numbers; may
+            refer to {incident_id}
+        DEMAND_BATES_DIGITS: Width demand package Bates numbers are
+            zero-padded to
+        DEMAND_REBUILD_STALE: Have the nightly demand check rebuild packages
+            whose exhibit docs were added or deleted since they were built
+        SUPABASE_STORAGE_TIMEOUT: Request timeout for Supabase Storage in seconds
+        HTTP_MAX_CONNECTIONS_PER_HOST: Connection limit of each shared HTTP client
+        HTTP_MAX_KEEPALIVE_CONNECTIONS: Idle connections kept open per host
+        HTTP_KEEPALIVE_EXPIRY: Seconds an idle keep-alive connection is kept
+        HTTP2_ENABLED: Use HTTP/2 for shared clients (requires the h2 package)
+        MEDICAL_RECORDS_RENDER_CONCURRENCY: Letters rendered at once by the
+            nightly medical records job
+        MEDICAL_RECORDS_UPLOAD_CONCURRENCY: PDFs uploaded at once by that job
+        MEDICAL_RECORDS_FAX_CONCURRENCY: Faxes sent at once by that job
         ALLOWED_ORIGINS: List of allowed origins for CORS
         REDIS_URL: Connection URL for Redis
+        ACTIVITY_STREAM_MAXLEN: Approximate number of activity events kept in
+            the Redis Stream for Last-Event-ID replay
+        EVENT_FLUSH_INTERVAL_MS: How long record_event buffers events before
+            writing them to Redis in one pipelined request
+        EVENT_MAX_BATCH: Buffered events that trigger an immediate flush
+        SSE_CLIENT_QUEUE_SIZE: Events buffered per SSE client before the
+            overflow policy applies
+        SSE_OVERFLOW_POLICY: What to do when a client's buffer is full:
+            "drop_oldest", "coalesce" (keep the latest event per type and
+            incident/client) or "disconnect" (close the stream). Each sends
+            the client a resync hint, since the lost events cannot be replayed
+        SSE_BATCH_WINDOW_MS: Collect events arriving within this many
+            milliseconds into one multi-event frame (0 disables batching)
+        SSE_BATCH_MAX_EVENTS: Upper bound on events in one batched frame
+        TASK_ENQUEUE_BATCH_WINDOW_MS: How long async Celery sends wait to be
+            published together (0 publishes as soon as the publisher is free)
+        TASK_ENQUEUE_MAX_BATCH: Upper bound on Celery sends published at once
+        OUTBOX_BATCH_SIZE: Outbox rows the relay claims and delivers at once
+        OUTBOX_POLL_INTERVAL: Seconds the relay waits between checks of an
+            empty outbox when it is not woken up
+        OUTBOX_MAX_ATTEMPTS: Failed deliveries after which an outbox row is
+            dead-lettered (kept for inspection and logged as an error); 0
+            retries forever
+        OUTBOX_RETRY_BASE_DELAY: Seconds before the first retry of a failed
+            outbox row; doubles with every further failure
+        OUTBOX_RETRY_MAX_DELAY: Upper bound on the delay between retries
+        OUTBOX_CLAIM_LEASE: Seconds a relay owns the rows it claimed; rows
+            of a relay that dies are sent again after the lease
         DOCUSIGN_BASE_URL: DocuSign API base URL
         DOCUSIGN_ACCOUNT_ID: DocuSign Account ID
         DOCUSIGN_INTEGRATOR_KEY: DocuSign Integrator Key (Client ID)
         DOCUSIGN_USER_ID: DocuSign User ID (GUID)
         DOCUSIGN_PRIVATE_KEY: Path to the DocuSign private key file
         SENDGRID_API_KEY: API key for SendGrid
+        SENDGRID_TIMEOUT: Request timeout for the SendGrid Mail Send API in seconds
+        EMAIL_TEMPLATE_CACHE_DIR: Directory for compiled email template
+            bytecode (defaults to Jinja's per-user 0700 directory under the
+            system temp dir)
+        EMAIL_TEMPLATE_AUTO_RELOAD: Re-read email templates when they change
+            on disk (for development; off in production)
         TWILIO_ACCOUNT_SID: Twilio Account SID
         TWILIO_AUTH_TOKEN: Twilio Auth Token
         TWILIO_SMS_FROM: Phone number to send SMS from
         TWILIO_FAX_FROM: Phone number to send faxes from
+        TWILIO_TIMEOUT: Request timeout for the Twilio REST API in seconds
+        TWILIO_RETRY_BASE_DELAY: First retry delay in seconds (doubles per retry)
+        TWILIO_RETRY_MAX_DELAY: Upper bound for a single retry delay, including
+            delays requested by Retry-After
         JWT_SECRET: Secret key for JWT
         JWT_EXP_MINUTES: Expiration time for JWT in minutes
     """
@@ -50,14 +159,103 @@ class Settings(BaseSettings):
     SUPABASE_URL: Optional[str] = None  # For asyncpg pool if still used separately
     SUPABASE_KEY: Optional[str] = None
 
+    # Connection pool settings (one pool per event loop, see db_pool.py)
+    DB_POOL_MIN_SIZE: int = 2
+    DB_POOL_MAX_SIZE: int = 10
+    DB_POOL_ACQUIRE_TIMEOUT: float = 10.0
+    DB_POOL_MAX_INACTIVE_LIFETIME: float = 300.0
+    DB_COMMAND_TIMEOUT: float = 60.0
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+
     # Docassemble settings
     DOCASSEMBLE_URL: str = "http://localhost:5000"  # Default to local dev server
+    DOCASSEMBLE_TIMEOUT: float = 60.0
+    DOCASSEMBLE_HEALTH_TIMEOUT: float = 5.0
+
+    # Local letter rendering (see utils/letter_renderer.py)
+    LETTER_LOCAL_RENDER: List[str] = []
+    LETTER_TEMPLATES_DIR: Optional[str] = None
+    LETTER_STRICT_TEMPLATES: bool = True
+
+    # Process pool for CPU-bound document work (see cpu_pool.py)
+    # Per process: multiplied by API processes and Celery worker concurrency
+    CPU_POOL_PROCESSES: int = 1
+    CPU_POOL_MAX_PENDING: int = 16
+    CPU_POOL_TIMEOUT: float = 300.0
+    CPU_POOL_PRELOAD: List[str] = ["weasyprint", "pikepdf", "pandas", "xlsxwriter"]
+
+    # Generated document cache (see utils/doc_cache.py)
+    DOC_CACHE_ENABLED: bool = True
+    DOC_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    DOC_CACHE_TTL: int = 7 * 24 * 60 * 60
+    DOC_CACHE_STORAGE_ENABLED: bool = True
+    DOC_TEMPLATE_VERSIONS: Dict[str, str] = {}
+    DOC_TEMPLATE_RELEASE: Optional[str] = None
+
+    # PDF merging (see utils/pdf_merge.py)
+    PDF_SPOOL_THRESHOLD: int = 8 * 1024 * 1024
+    PDF_SPOOL_DIR: Optional[str] = None
+
+    # PDF optimization before fax and storage (see utils/pdf_optimize.py)
+    PDF_OPTIMIZE_ENABLED: bool = True
+    PDF_OPTIMIZE_DPI: Dict[str, int] = {"fax": 200, "email": 150}
+    PDF_JPEG_QUALITY: int = 75
+    PDF_LINEARIZE: bool = True
+
+    # Local cache of downloaded storage objects (see utils/storage_cache.py)
+    STORAGE_CACHE_ENABLED: bool = True
+    STORAGE_CACHE_DIR: Optional[str] = None
+    STORAGE_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    DEMAND_DOWNLOAD_CONCURRENCY: int = 8
+
+    # Demand package page stamping (see utils/pdf_stamp.py)
+    DEMAND_STAMP_ENABLED: bool = True
+    DEMAND_BATES_PREFIX: str = "INC{incident_id}-"
+    DEMAND_BATES_DIGITS: int = 6
+
+    # Nightly rebuilds of outdated demand packages (see tasks/demand.py)
+    DEMAND_REBUILD_STALE: bool = True
+
+    # Shared HTTP client settings (one pooled client per host, see http_clients.py)
+    SUPABASE_STORAGE_TIMEOUT: float = 30.0
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 20
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP2_ENABLED: bool = False
+
+    # Nightly medical records job: per-stage concurrency limits
+    MEDICAL_RECORDS_RENDER_CONCURRENCY: int = 4
+    MEDICAL_RECORDS_UPLOAD_CONCURRENCY: int = 8
+    MEDICAL_RECORDS_FAX_CONCURRENCY: int = 4
 
     # CORS settings
     ALLOWED_ORIGINS: str = "http://localhost:3000"  # Default to allow frontend dev
 
     # Redis settings
     REDIS_URL: str = "redis://redis:6379/0"  # Default to Redis container
+    ACTIVITY_STREAM_MAXLEN: int = 10000
+    EVENT_FLUSH_INTERVAL_MS: int = 50
+    EVENT_MAX_BATCH: int = 100
+
+    # SSE per-client buffering (see sse_hub.py)
+    SSE_CLIENT_QUEUE_SIZE: int = 1000
+    SSE_OVERFLOW_POLICY: Literal["drop_oldest", "coalesce", "disconnect"] = (
+        "drop_oldest"
+    )
+    SSE_BATCH_WINDOW_MS: int = 0
+    SSE_BATCH_MAX_EVENTS: int = 50
+
+    # Async Celery enqueue (see task_queue.py)
+    TASK_ENQUEUE_BATCH_WINDOW_MS: int = 0
+    TASK_ENQUEUE_MAX_BATCH: int = 100
+
+    # Transactional outbox relay (see outbox.py)
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_INTERVAL: float = 1.0
+    OUTBOX_MAX_ATTEMPTS: int = 25
+    OUTBOX_RETRY_BASE_DELAY: float = 1.0
+    OUTBOX_RETRY_MAX_DELAY: float = 300.0
+    OUTBOX_CLAIM_LEASE: float = 60.0
 
     # DocuSign settings
     DOCUSIGN_BASE_URL: str = "https://demo.docusign.net/restapi"
@@ -68,12 +266,18 @@ class Settings(BaseSettings):
 
     # SendGrid settings
     SENDGRID_API_KEY: Optional[str] = None
+    SENDGRID_TIMEOUT: float = 30.0
+    EMAIL_TEMPLATE_CACHE_DIR: Optional[str] = None
+    EMAIL_TEMPLATE_AUTO_RELOAD: bool = False
 
     # Twilio settings
     TWILIO_ACCOUNT_SID: Optional[str] = None
     TWILIO_AUTH_TOKEN: Optional[str] = None
     TWILIO_SMS_FROM: Optional[str] = None
     TWILIO_FAX_FROM: Optional[str] = None
+    TWILIO_TIMEOUT: float = 30.0
+    TWILIO_RETRY_BASE_DELAY: float = 1.0
+    TWILIO_RETRY_MAX_DELAY: float = 30.0
 
     # JWT settings for Staff Authentication
     JWT_SECRET: Optional[str] = None
@@ -0,0 +1,197 @@
+"""Shared process pool for CPU-bound document work.
+
+Rendering PDFs with WeasyPrint, exporting spreadsheets with pandas and
+xlsxwriter and similar work holds the GIL for seconds at a time; run inline in
+an async task it blocks the event loop and every request, query and upload
+waiting on it. ``run_cpu`` runs such a function in one of CPU_POOL_PROCESSES
+spawned worker processes instead:
+
+* workers are warm: each one imports the modules in CPU_POOL_PRELOAD when it
+  starts (WeasyPrint also renders a throwaway page so fonts are loaded), and
+  module-level caches such as Jinja environments live as long as the worker;
+* the queue is bounded: at most CPU_POOL_MAX_PENDING jobs per event loop are
+  queued or running, and further callers wait for a slot rather than piling
+  work up in the pool;
+* every job has a timeout (CPU_POOL_TIMEOUT unless given). A running job
+  cannot be interrupted, so when one overruns, or a worker dies, the pool is
+  torn down (jobs running alongside fail with ``BrokenProcessPool``) and the
+  next job starts a fresh one.
+
+The pool belongs to the process that uses it and starts with its first job,
+so processes that never render spawn nothing. Every API process and every
+Celery prefork child that does render gets its own CPU_POOL_PROCESSES
+workers: a host can run up to (API processes + worker concurrency) x
+CPU_POOL_PROCESSES of them, which is what CPU_POOL_PROCESSES should be sized
+against.
+
+Functions and arguments are pickled, so jobs must be module-level functions
+taking plain data. With CPU_POOL_PROCESSES set to 0 jobs run in a thread
+instead, where processes cannot be spawned (and in tests); timed out jobs then
+keep running in the background.
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import importlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Sequence, TypeVar
+
+from pi_auto_api.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# Job slots of each event loop
+_slots: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+
+
+def _warm_weasyprint() -> None:
+    """Render a tiny page so fonts and the layout engine are initialized."""
+    from weasyprint import HTML
+
+    HTML(string="<p>warm-up</p>").write_pdf()
+
+
+# Extra warm-up of preloaded modules, beyond importing them
+WARMUPS: Dict[str, Callable[[], None]] = {"weasyprint": _warm_weasyprint}
+
+
+def _init_worker(preload: Sequence[str]) -> None:
+    """Warm up a worker process: import (and exercise) the preloaded modules."""
+    for module in preload:
+        try:
+            importlib.import_module(module)
+            if module in WARMUPS:
+                WARMUPS[module]()
+        except Exception as e:
+            logger.warning(f"Failed to preload {module} in CPU worker: {e}")
+
+
+def _get_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """Get or start the worker pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawn rather than fork: API and worker processes run threads
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=settings.CPU_POOL_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(list(settings.CPU_POOL_PRELOAD),),
+            )
+            logger.info(f"Started {settings.CPU_POOL_PROCESSES} CPU worker(s)")
+        return _pool
+
+
+def _discard_pool(
+    pool: concurrent.futures.ProcessPoolExecutor, terminate: bool = False
+) -> None:
+    """Stop using a pool, killing its workers if they may be stuck."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    if terminate:
+        # The executor has no public way to stop a running job
+        processes = getattr(pool, "_processes", None) or {}
+        for process in list(processes.values()):
+            process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@contextlib.asynccontextmanager
+async def _slot() -> AsyncIterator[None]:
+    """Hold one of the current event loop's job slots."""
+    for loop in [loop for loop in _slots if loop.is_closed()]:
+        del _slots[loop]
+    loop = asyncio.get_running_loop()
+    semaphore = _slots.get(loop)
+    if semaphore is None:
+        semaphore = _slots[loop] = asyncio.Semaphore(settings.CPU_POOL_MAX_PENDING)
+    async with semaphore:
+        yield
+
+
+async def _run_in_pool(
+    func: Callable[..., T], args: Sequence[Any], timeout: float
+) -> T:
+    """Run a job in the worker pool, recycling the pool if it gets stuck."""
+    pool = _get_pool()
+    try:
+        future = pool.submit(func, *args)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        # Cancelling only works for jobs still queued; a running one is stuck
+        if not future.cancelled():
+            logger.error(
+                f"CPU job {func.__name__} timed out after {timeout}s; "
+                "restarting the worker pool"
+            )
+            _discard_pool(pool, terminate=True)
+        raise
+    except BrokenProcessPool:
+        logger.error(f"CPU worker died running {func.__name__}; restarting the pool")
+        _discard_pool(pool)
+        raise
+
+
+async def run_cpu(
+    func: Callable[..., T], *args: Any, timeout: Optional[float] = None
+) -> T:
+    """Run a CPU-bound function without blocking the event loop.
+
+    Args:
+        func: Module-level function to run
+        *args: Picklable arguments to call it with
+        timeout: Seconds the job may take once it has a slot (defaults to
+            CPU_POOL_TIMEOUT)
+
+    Returns:
+        Whatever the function returns.
+
+    Raises:
+        TimeoutError: If the job does not finish within ``timeout``.
+        BrokenProcessPool: If the worker running the job died.
+        Exception: Whatever the function raises.
+    """
+    if timeout is None:
+        timeout = settings.CPU_POOL_TIMEOUT
+    async with _slot():
+        if settings.CPU_POOL_PROCESSES <= 0:
+            return await asyncio.wait_for(asyncio.to_thread(func, *args), timeout)
+        return await _run_in_pool(func, args, timeout)
+
+
+async def close_pool() -> None:
+    """Stop the worker pool, letting queued jobs finish."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        await asyncio.to_thread(pool.shutdown)
+        logger.info("CPU workers stopped")
+
+
+def _reset_after_fork() -> None:
+    """Forget the parent's pool; its worker processes belong to the parent."""
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+    _slots.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -3,14 +3,15 @@
 This module contains helpers for database operations.
 """
 
+import copy
 import json
 import logging
 from datetime import datetime
-from typing import Dict
-
-import asyncpg
+from typing import Dict, Iterable, Tuple
 
+from pi_auto_api import outbox
 from pi_auto_api.config import settings
+from pi_auto_api.db_pool import acquire
 from pi_auto_api.schemas import IntakePayload
 
 logger = logging.getLogger(__name__)
@@ -19,6 +20,9 @@ logger = logging.getLogger(__name__)
 async def create_intake(payload: IntakePayload) -> Dict[str, int]:
     """Create a new client and incident record in the database.
 
+    The retainer generation task is written to the outbox in the same
+    transaction and sent to Celery by the outbox relay.
+
     Args:
         payload: The intake payload containing client and incident data
 
@@ -31,13 +35,10 @@ async def create_intake(payload: IntakePayload) -> Dict[str, int]:
     if not settings.SUPABASE_URL:
         raise ValueError("SUPABASE_URL is not set")
 
-    conn = None
     try:
-        # Connect to the database
-        conn = await asyncpg.connect(settings.SUPABASE_URL)
-
-        # Start a transaction to ensure both inserts succeed or both fail
-        async with conn.transaction():
+        # Borrow a pooled connection and use a transaction so both
+        # inserts succeed or both fail
+        async with acquire() as conn, conn.transaction():
             # Insert client record
             client_query = """
             INSERT INTO client (full_name, dob, phone, email, address)
@@ -76,18 +77,20 @@ async def create_intake(payload: IntakePayload) -> Dict[str, int]:
                 payload.incident.vehicle_damage_text,
             )
 
-            # Return the IDs
-            return {
-                "client_id": client_id,
-                "incident_id": incident_id,
-            }
+            # Queue retainer generation in the same transaction, so the task
+            # is sent if and only if the intake is stored
+            await outbox.enqueue_task(conn, "generate_retainer", [client_id])
+
+        outbox.wake_relay()
+
+        # Return the IDs
+        return {
+            "client_id": client_id,
+            "incident_id": incident_id,
+        }
     except Exception as e:
         logger.error(f"Error creating intake: {str(e)}", exc_info=True)
         raise
-    finally:
-        # Ensure connection is closed even if an exception occurs
-        if conn:
-            await conn.close()
 
 
 async def get_client_payload(client_id: int) -> dict:
@@ -106,12 +109,9 @@ async def get_client_payload(client_id: int) -> dict:
     if not settings.SUPABASE_URL:
         raise ValueError("SUPABASE_URL is not set")
 
-    conn = None
     try:
-        conn = await asyncpg.connect(settings.SUPABASE_URL)
-
         # Use a transaction for consistent read
-        async with conn.transaction():
+        async with acquire() as conn, conn.transaction():
             query = """
             SELECT
                 c.full_name, c.dob, c.phone, c.email, c.address,
@@ -148,10 +148,19 @@ async def get_client_payload(client_id: int) -> dict:
     except Exception as e:
         logger.error(f"Error fetching client data: {str(e)}", exc_info=True)
         raise
-    finally:
-        # Ensure connection is closed even if an exception occurs
-        if conn:
-            await conn.close()
+
+
+# Insurance policies of an incident
+INSURANCE_QUERY = """
+SELECT
+    id,
+    carrier_name,
+    policy_number,
+    claim_number,
+    is_client_side
+FROM insurance
+WHERE incident_id = $1;
+"""
 
 
 async def get_insurance_payload(client_id: int) -> dict:
@@ -171,45 +180,33 @@ async def get_insurance_payload(client_id: int) -> dict:
     if not settings.SUPABASE_URL:
         raise ValueError("SUPABASE_URL is not set")
 
-    conn = None
     try:
-        conn = await asyncpg.connect(settings.SUPABASE_URL)
-
-        # First, get the client and incident data
-        client_query = """
-        SELECT
-            c.id AS client_id,
-            c.full_name,
-            c.dob,
-            c.phone,
-            c.email,
-            c.address,
-            i.id AS incident_id,
-            i.date AS incident_date,
-            i.location AS incident_location
-        FROM client c
-        JOIN incident i ON c.id = i.client_id
-        WHERE c.id = $1;
-        """
-        client_record = await conn.fetchrow(client_query, client_id)
-
-        if not client_record:
-            raise ValueError(f"Client with ID {client_id} not found.")
-
-        incident_id = client_record["incident_id"]
-
-        # Now fetch insurance information
-        insurance_query = """
-        SELECT
-            id,
-            carrier_name,
-            policy_number,
-            claim_number,
-            is_client_side
-        FROM insurance
-        WHERE incident_id = $1;
-        """
-        insurance_records = await conn.fetch(insurance_query, incident_id)
+        async with acquire() as conn:
+            # First, get the client and incident data
+            client_query = """
+            SELECT
+                c.id AS client_id,
+                c.full_name,
+                c.dob,
+                c.phone,
+                c.email,
+                c.address,
+                i.id AS incident_id,
+                i.date AS incident_date,
+                i.location AS incident_location
+            FROM client c
+            JOIN incident i ON c.id = i.client_id
+            WHERE c.id = $1;
+            """
+            client_record = await conn.fetchrow(client_query, client_id)
+
+            if not client_record:
+                raise ValueError(f"Client with ID {client_id} not found.")
+
+            incident_id = client_record["incident_id"]
+
+            # Now fetch insurance information
+            insurance_records = await conn.fetch(INSURANCE_QUERY, incident_id)
 
         if not insurance_records:
             logger.warning(f"No insurance records found for incident {incident_id}")
@@ -277,105 +274,163 @@ async def get_insurance_payload(client_id: int) -> dict:
     except Exception as e:
         logger.error(f"Error fetching insurance data: {str(e)}", exc_info=True)
         raise
-    finally:
-        # Ensure connection is closed even if an exception occurs
-        if conn:
-            await conn.close()
 
 
-async def get_provider_payload(incident_id: int, provider_id: int) -> dict:
-    """Fetch client, incident, and provider data for medical records request.
+# Firm details printed on every medical records request letter
+LAW_FIRM = {
+    "name": "Law & Order Legal Services",
+    "address": "123 Legal Street",
+    "city": "New York",
+    "state": "NY",
+    "zip": "10001",
+    "phone": "(212) 555-1212",
+    "fax": "(212) 555-1213",
+    "email": "contact@lawandorder.legal",
+    "records_email": "records@lawandorder.legal",
+}
+
+# Signatory of medical records request letters
+RECORDS_STAFF = {
+    "name": "Medical Records Department",
+    "title": "Records Coordinator",
+}
+
+# Client, incident and provider data for many (incident_id, provider_id) pairs;
+# $1 and $2 are parallel int arrays unnested into one row per pair.
+PROVIDER_PAYLOADS_QUERY = """
+SELECT
+    c.id AS client_id,
+    c.full_name AS client_name,
+    c.dob AS client_dob,
+    c.phone AS client_phone,
+    c.email AS client_email,
+    c.address AS client_address,
+    i.id AS incident_id,
+    i.date AS incident_date,
+    i.location AS incident_location,
+    i.injuries AS incident_injuries,
+    p.id AS provider_id,
+    p.name AS provider_name,
+    p.address AS provider_address,
+    p.phone AS provider_phone,
+    p.fax AS provider_fax,
+    p.specialty AS provider_specialty
+FROM unnest($1::int[], $2::int[]) AS req(incident_id, provider_id)
+JOIN incident i ON i.id = req.incident_id
+JOIN client c ON c.id = i.client_id
+JOIN provider p ON p.id = req.provider_id
+"""
+
+
+async def get_provider_payloads(
+    pairs: Iterable[Tuple[int, int]],
+) -> Dict[Tuple[int, int], dict]:
+    """Fetch medical records request payloads for many providers at once.
+
+    All rows are fetched in a single query. The letter date is formatted once
+    per call and each incident's injuries are decoded once, however many of
+    its providers are requested. Every payload gets its own copy of the shared
+    sections, so callers may modify one payload without affecting the others.
 
     Args:
-        incident_id: The ID of the incident
-        provider_id: The ID of the healthcare provider
+        pairs: (incident_id, provider_id) pairs to build payloads for
 
     Returns:
-        A dictionary containing client, incident, and provider data formatted for
-        use with Docassemble medical records request template
+        Payloads keyed by (incident_id, provider_id). Pairs with no matching
+        client, incident or provider are left out.
 
     Raises:
-        ValueError: If the client, incident, or provider data is not found
+        ValueError: If SUPABASE_URL is not set
         Exception: If there is a database error
     """
     if not settings.SUPABASE_URL:
         raise ValueError("SUPABASE_URL is not set")
 
-    conn = None
+    requested = list(dict.fromkeys(pairs))
+    if not requested:
+        return {}
+
     try:
-        conn = await asyncpg.connect(settings.SUPABASE_URL)
-
-        # Fetch client, incident, and provider data in a single query
-        query = """
-        SELECT
-            c.id AS client_id,
-            c.full_name AS client_name,
-            c.dob AS client_dob,
-            c.phone AS client_phone,
-            c.email AS client_email,
-            c.address AS client_address,
-            i.id AS incident_id,
-            i.date AS incident_date,
-            i.location AS incident_location,
-            i.injuries AS incident_injuries,
-            p.id AS provider_id,
-            p.name AS provider_name,
-            p.address AS provider_address,
-            p.phone AS provider_phone,
-            p.fax AS provider_fax,
-            p.specialty AS provider_specialty
-        FROM client c
-        JOIN incident i ON c.id = i.client_id
-        JOIN provider p ON p.id = $2
-        WHERE i.id = $1
-        """
-
-        record = await conn.fetchrow(query, incident_id, provider_id)
-
-        if not record:
-            raise ValueError(
-                f"No data found for incident ID {incident_id} "
-                f"and provider ID {provider_id}"
+        incident_ids, provider_ids = zip(*requested, strict=True)
+        async with acquire() as conn:
+            records = await conn.fetch(
+                PROVIDER_PAYLOADS_QUERY, list(incident_ids), list(provider_ids)
             )
 
-        # Shape the data for Docassemble
-        payload = {
-            "client": {
-                "id": record["client_id"],
-                "full_name": record["client_name"],
-                "dob": str(record["client_dob"]),
-                "phone": record["client_phone"],
-                "email": record["client_email"],
-                "address": record["client_address"],
-            },
-            "incident": {
-                "id": record["incident_id"],
-                "date": str(record["incident_date"]),
-                "location": record["incident_location"],
-                "injuries": json.loads(record["incident_injuries"]),
-            },
-            "provider": {
-                "id": record["provider_id"],
-                "name": record["provider_name"],
-                "address": record["provider_address"],
-                "phone": record["provider_phone"],
-                "fax": record["provider_fax"],
-                "specialty": record["provider_specialty"],
-            },
-            "letter_date": datetime.now().strftime("%B %d, %Y"),
-            "law_firm": {
-                "name": "Law & Order Legal Services",
-                "address": "123 Legal Street, New York, NY 10001",
-                "phone": "(212) 555-1212",
-                "fax": "(212) 555-1213",
-                "email": "contact@lawandorder.legal",
-            },
-        }
+        letter_date = datetime.now().strftime("%B %d, %Y")
+        incidents: Dict[int, dict] = {}
+        clients: Dict[int, dict] = {}
+        payloads: Dict[Tuple[int, int], dict] = {}
+
+        for record in records:
+            incident_id = record["incident_id"]
+            # Client and incident sections are built once per incident
+            if incident_id not in incidents:
+                injuries = record["incident_injuries"]
+                clients[incident_id] = {
+                    "id": record["client_id"],
+                    "full_name": record["client_name"],
+                    "dob": str(record["client_dob"]),
+                    "phone": record["client_phone"],
+                    "email": record["client_email"],
+                    "address": record["client_address"],
+                }
+                incidents[incident_id] = {
+                    "id": incident_id,
+                    "date": str(record["incident_date"]),
+                    "location": record["incident_location"],
+                    # The column is nullable; one such incident must not fail
+                    # the whole batch
+                    "injuries": json.loads(injuries) if injuries is not None else [],
+                }
+
+            payloads[(incident_id, record["provider_id"])] = {
+                "client": copy.deepcopy(clients[incident_id]),
+                "incident": copy.deepcopy(incidents[incident_id]),
+                "provider": {
+                    "id": record["provider_id"],
+                    "name": record["provider_name"],
+                    "address": record["provider_address"],
+                    "phone": record["provider_phone"],
+                    "fax": record["provider_fax"],
+                    "specialty": record["provider_specialty"],
+                },
+                "letter_date": letter_date,
+                "law_firm": dict(LAW_FIRM),
+                "staff": dict(RECORDS_STAFF),
+            }
+
+        if len(payloads) < len(requested):
+            logger.warning(
+                f"No data found for {len(requested) - len(payloads)} of "
+                f"{len(requested)} incident/provider pairs"
+            )
+        return payloads
 
-        return payload
     except Exception as e:
         logger.error(f"Error fetching provider data: {str(e)}", exc_info=True)
         raise
-    finally:
-        if conn:
-            await conn.close()
+
+
+async def get_provider_payload(incident_id: int, provider_id: int) -> dict:
+    """Fetch client, incident, and provider data for medical records request.
+
+    Args:
+        incident_id: The ID of the incident
+        provider_id: The ID of the healthcare provider
+
+    Returns:
+        A dictionary containing client, incident, and provider data formatted for
+        use with Docassemble medical records request template
+
+    Raises:
+        ValueError: If the client, incident, or provider data is not found
+        Exception: If there is a database error
+    """
+    payloads = await get_provider_payloads([(incident_id, provider_id)])
+    payload = payloads.get((incident_id, provider_id))
+    if payload is None:
+        raise ValueError(
+            f"No data found for incident ID {incident_id} and provider ID {provider_id}"
+        )
+    return payload
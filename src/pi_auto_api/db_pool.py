@@ -0,0 +1,138 @@
+"""Process-wide asyncpg connection pool registry.
+
+asyncpg pools are bound to the event loop they were created on, so a single
+module-level pool cannot be shared between the FastAPI server loop and the
+loops used by Celery workers. This module keeps one pool per running event
+loop and hands out connections from it, so API handlers, db helpers and tasks
+all share warm connections instead of opening a new one per query.
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+import asyncpg
+
+from pi_auto_api.config import settings
+
+logger = logging.getLogger(__name__)
+
+# One pool (and one creation lock) per event loop
+_pools: Dict[asyncio.AbstractEventLoop, asyncpg.Pool] = {}
+_locks: Dict[asyncio.AbstractEventLoop, asyncio.Lock] = {}
+
+
+def _pool_kwargs() -> dict:
+    """Build the asyncpg.create_pool keyword arguments from settings."""
+    return {
+        "min_size": settings.DB_POOL_MIN_SIZE,
+        "max_size": settings.DB_POOL_MAX_SIZE,
+        "max_inactive_connection_lifetime": settings.DB_POOL_MAX_INACTIVE_LIFETIME,
+        "command_timeout": settings.DB_COMMAND_TIMEOUT,
+        "server_settings": {
+            "statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS),
+            "application_name": "pi_auto_api",
+        },
+    }
+
+
+def _discard_dead_pools() -> None:
+    """Drop pools whose event loop has been closed (e.g. after asyncio.run)."""
+    for loop in [loop for loop in _pools if loop.is_closed()]:
+        pool = _pools.pop(loop)
+        _locks.pop(loop, None)
+        # The owning loop is gone, so the pool cannot be closed gracefully
+        try:
+            pool.terminate()
+        except Exception as e:
+            logger.warning(f"Error terminating stale database pool: {e}")
+        logger.info("Discarded database pool bound to a closed event loop")
+
+
+async def get_pool() -> asyncpg.Pool:
+    """Get or create the connection pool for the running event loop.
+
+    Returns:
+        The asyncpg pool bound to the current event loop.
+
+    Raises:
+        ValueError: If SUPABASE_URL is not set.
+        Exception: If the pool cannot be created.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is not None:
+        return pool
+
+    if not settings.SUPABASE_URL:
+        raise ValueError("SUPABASE_URL is not set")
+
+    _discard_dead_pools()
+    lock = _locks.setdefault(loop, asyncio.Lock())
+    async with lock:
+        # Another coroutine may have created the pool while we waited
+        pool = _pools.get(loop)
+        if pool is None:
+            pool = await asyncpg.create_pool(settings.SUPABASE_URL, **_pool_kwargs())
+            _pools[loop] = pool
+            logger.info(
+                f"Database connection pool initialized "
+                f"(min={settings.DB_POOL_MIN_SIZE}, max={settings.DB_POOL_MAX_SIZE})"
+            )
+    return pool
+
+
+@asynccontextmanager
+async def acquire(timeout: Optional[float] = None) -> AsyncIterator[asyncpg.Connection]:
+    """Acquire a connection from the current loop's pool.
+
+    The connection is returned to the pool when the context exits.
+
+    Args:
+        timeout: Seconds to wait for a free connection
+                 (defaults to DB_POOL_ACQUIRE_TIMEOUT)
+
+    Yields:
+        A pooled asyncpg connection.
+    """
+    pool = await get_pool()
+    if timeout is None:
+        timeout = settings.DB_POOL_ACQUIRE_TIMEOUT
+    async with pool.acquire(timeout=timeout) as conn:
+        yield conn
+
+
+async def check_health() -> None:
+    """Run a trivial query on a pooled connection.
+
+    Raises:
+        Exception: If the pool cannot be created or the query fails.
+    """
+    async with acquire() as conn:
+        await conn.execute("SELECT 1")
+
+
+async def close_pool() -> None:
+    """Close the pool bound to the running event loop, if any."""
+    loop = asyncio.get_running_loop()
+    _locks.pop(loop, None)
+    pool = _pools.pop(loop, None)
+    if pool is not None:
+        await pool.close()
+        logger.info("Database connection pool closed")
+
+
+def _reset_after_fork() -> None:
+    """Forget pools inherited from the parent process.
+
+    Sockets copied across fork() must not be reused by the child (Celery
+    prefork workers), so the child starts with an empty registry.
+    """
+    _pools.clear()
+    _locks.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,39 +1,175 @@
-"""Helper functions for publishing events to Redis pub/sub."""
+"""Helper functions for publishing activity events to Redis.
 
+Events are appended to the capped ``activity`` Redis Stream. Stream entry IDs
+are monotonic, so they double as SSE event IDs and let a reconnecting client
+resume from its ``Last-Event-ID`` (see ``sse_hub``).
+
+``record_event`` does not talk to Redis itself: it hands the event to the
+``EventPublisher`` of the running event loop, which buffers events and writes
+them in one pipelined round trip every EVENT_FLUSH_INTERVAL_MS (or as soon as
+EVENT_MAX_BATCH are waiting). Like the database pool, publishers and their
+Redis clients are bound to the loop that created them, and
+``close_redis_client()`` flushes and closes them from the app lifespan and
+worker shutdown.
+
+Events that must not be lost if the process dies are written to the
+transactional outbox instead (see ``outbox.enqueue_event``) and reach the
+stream through ``write_events``.
+"""
+
+import asyncio
 import json
+import logging
+import os
+from typing import Dict, List, Optional
 
 import redis.asyncio as redis
 
 from pi_auto_api.config import settings
 
-# Initialize Redis client globally or manage its lifecycle appropriately
-# For simplicity in this module, we'll create it here.
-# In a larger app, you might manage this with FastAPI lifespan events.
-_redis_instance = None
+logger = logging.getLogger(__name__)
+
+ACTIVITY_STREAM = "activity"
+
+
+class EventPublisher:
+    """Buffers activity events and appends them to Redis in batches."""
+
+    def __init__(self, client: redis.Redis) -> None:
+        """Create a publisher writing through the given Redis client.
+
+        Args:
+            client: Redis client bound to the current event loop
+        """
+        self.client = client
+        self._buffer: List[str] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def publish(self, event: dict) -> None:
+        """Buffer an event, flushing right away if the batch is full."""
+        self._buffer.append(json.dumps(event))
+        if len(self._buffer) >= settings.EVENT_MAX_BATCH:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        """Flush once the flush interval has passed."""
+        await asyncio.sleep(settings.EVENT_FLUSH_INTERVAL_MS / 1000)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write every buffered event to the stream in one pipelined request.
+
+        Events that cannot be written are logged and dropped.
+        """
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+
+        try:
+            await self.write(batch)
+        except Exception as e:
+            logger.error(f"Failed to publish {len(batch)} activity event(s): {e}")
+
+    async def write(self, batch: List[str]) -> None:
+        """Append serialized events to the stream in one pipelined request.
+
+        Args:
+            batch: JSON-encoded events, in stream order
+
+        Raises:
+            Exception: Any Redis error, so callers can retry the batch
+        """
+        async with self.client.pipeline(transaction=False) as pipe:
+            for data in batch:
+                pipe.xadd(
+                    ACTIVITY_STREAM,
+                    {"data": data},
+                    maxlen=settings.ACTIVITY_STREAM_MAXLEN,
+                    approximate=True,
+                )
+            await pipe.execute()
+
+    async def close(self) -> None:
+        """Flush pending events and close the Redis client."""
+        task, self._flush_task = self._flush_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+        await self.client.aclose()
 
 
-async def get_redis_client():
-    """Get a Redis client instance, creating it if necessary."""
-    global _redis_instance
-    if _redis_instance is None:
-        _redis_instance = redis.from_url(settings.REDIS_URL, decode_responses=True)
-    return _redis_instance
+# One publisher per event loop
+_publishers: Dict[asyncio.AbstractEventLoop, EventPublisher] = {}
 
 
-async def record_event(event: dict):
-    """Publish a JSON event to the 'activity' Redis channel.
+def get_publisher() -> EventPublisher:
+    """Get or create the event publisher for the running event loop."""
+    loop = asyncio.get_running_loop()
+    publisher = _publishers.get(loop)
+    if publisher is None:
+        for dead in [dead for dead in _publishers if dead.is_closed()]:
+            # The owning loop is gone, so buffered events cannot be flushed
+            _publishers.pop(dead)
+            logger.warning("Discarded event publisher bound to a closed event loop")
+        publisher = _publishers[loop] = EventPublisher(
+            redis.from_url(settings.REDIS_URL, decode_responses=True)
+        )
+    return publisher
+
+
+async def get_redis_client() -> redis.Redis:
+    """Get the Redis client used for events on the running event loop."""
+    return get_publisher().client
+
+
+async def record_event(event: dict) -> None:
+    """Queue a JSON event for the 'activity' Redis Stream.
+
+    The event is written with the next batch, within EVENT_FLUSH_INTERVAL_MS.
+    The stream is trimmed to roughly ACTIVITY_STREAM_MAXLEN entries.
 
     Args:
         event: A dictionary representing the event to publish.
                It will be serialized to JSON.
     """
-    redis_client = await get_redis_client()
-    await redis_client.publish("activity", json.dumps(event))
+    await get_publisher().publish(event)
+
+
+async def write_events(batch: List[dict]) -> None:
+    """Append events to the 'activity' stream now, bypassing the buffer.
+
+    Unlike ``record_event``, failures are raised rather than logged, so the
+    outbox relay only marks events as delivered once Redis has them.
+
+    Args:
+        batch: Events to publish, in order.
+    """
+    if batch:
+        await get_publisher().write([json.dumps(event) for event in batch])
+
+
+async def flush_events() -> None:
+    """Write the running loop's buffered events now."""
+    publisher = _publishers.get(asyncio.get_running_loop())
+    if publisher is not None:
+        await publisher.flush()
 
 
 async def close_redis_client():
-    """Close the Redis client connection if it was initialized."""
-    global _redis_instance
-    if _redis_instance:
-        await _redis_instance.aclose()
-        _redis_instance = None
+    """Flush buffered events and close the running loop's Redis client."""
+    publisher = _publishers.pop(asyncio.get_running_loop(), None)
+    if publisher is not None:
+        await publisher.close()
+        logger.info("Event publisher closed")
+
+
+def _reset_after_fork() -> None:
+    """Forget publishers inherited from the parent process."""
+    _publishers.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
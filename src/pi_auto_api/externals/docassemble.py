@@ -1,9 +1,21 @@
-"""Client for interacting with the Docassemble API."""
+"""Client for interacting with the Docassemble API.
+
+Generated PDFs are cached by template and payload (see ``utils.doc_cache``),
+so retries and regenerations of unchanged documents skip the render. Letters
+dated at render time (with a ``letter_date``) are not cached: their payload
+changes every day, so an entry would never be reused. Letter
+types selected in LETTER_LOCAL_RENDER are rendered in-process from the
+repository's templates (see ``utils.letter_renderer``) instead of over HTTP.
+"""
+
+from functools import partial
 
 import httpx
 from fastapi import HTTPException, status
 
 from pi_auto_api.config import settings
+from pi_auto_api.http_clients import get_client
+from pi_auto_api.utils import doc_cache, letter_renderer
 
 
 async def generate_retainer_pdf(payload: dict) -> bytes:
@@ -18,37 +30,41 @@ async def generate_retainer_pdf(payload: dict) -> bytes:
     Raises:
         HTTPException: If the Docassemble API call fails.
     """
+    return await doc_cache.get_or_generate(
+        "retainer", payload, lambda: _render_retainer_pdf(payload)
+    )
+
+
+async def _render_retainer_pdf(payload: dict) -> bytes:
+    """Render a retainer PDF through the Docassemble API (uncached)."""
     api_url = f"{settings.DOCASSEMBLE_URL}/api/v1/generate/retainer"
     headers = {"Content-Type": "application/json"}
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                api_url, json=payload, headers=headers, timeout=60.0
-            )
-            response.raise_for_status()  # Raise exception for 4xx or 5xx responses
-            return response.content
-        except httpx.RequestError as exc:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail=f"Error contacting Docassemble API: {exc}",
-            ) from exc
-        except httpx.HTTPStatusError as exc:
-            status_code = (
-                status.HTTP_400_BAD_REQUEST
-                if 400 <= exc.response.status_code < 500
-                else status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
-            detail = (
-                f"Docassemble API error ({exc.response.status_code}): "
-                f"{exc.response.text}"
-            )
-            # Raise HTTPException, linking the original exception
-            raise HTTPException(status_code=status_code, detail=detail) from exc
+    client = get_client("docassemble")
+    try:
+        response = await client.post(api_url, json=payload, headers=headers)
+        response.raise_for_status()  # Raise exception for 4xx or 5xx responses
+        return response.content
+    except httpx.RequestError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Error contacting Docassemble API: {exc}",
+        ) from exc
+    except httpx.HTTPStatusError as exc:
+        status_code = (
+            status.HTTP_400_BAD_REQUEST
+            if 400 <= exc.response.status_code < 500
+            else status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+        detail = (
+            f"Docassemble API error ({exc.response.status_code}): {exc.response.text}"
+        )
+        # Raise HTTPException, linking the original exception
+        raise HTTPException(status_code=status_code, detail=detail) from exc
 
 
 async def generate_letter(letter_type: str, payload: dict) -> bytes:
-    """Generate a letter PDF using the Docassemble API.
+    """Generate a letter PDF using the Docassemble API or the local templates.
 
     Args:
         letter_type: The type of letter to generate (e.g. 'lor' for Letter
@@ -59,33 +75,59 @@ async def generate_letter(letter_type: str, payload: dict) -> bytes:
         Raw bytes of the generated PDF document
 
     Raises:
-        HTTPException: If the Docassemble API call fails
+        HTTPException: If the Docassemble API call or local rendering fails
     """
+    if letter_renderer.template_for(letter_type):
+        render = partial(_render_local_letter, letter_type, payload)
+        # Keyed on the template source, so editing the template invalidates it
+        version = f"local-{letter_renderer.template_hash(letter_type)}"
+    else:
+        render = partial(_render_letter, letter_type, payload)
+        version = None
+
+    if "letter_date" in payload:
+        return await render()
+    return await doc_cache.get_or_generate(
+        letter_type, payload, render, version=version
+    )
+
+
+async def _render_local_letter(letter_type: str, payload: dict) -> bytes:
+    """Render a letter PDF from the local templates (uncached)."""
+    try:
+        return await letter_renderer.render_letter(letter_type, payload)
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Local letter rendering failed for {letter_type}: {exc}",
+        ) from exc
+
+
+async def _render_letter(letter_type: str, payload: dict) -> bytes:
+    """Render a letter PDF through the Docassemble API (uncached)."""
     api_url = f"{settings.DOCASSEMBLE_URL}/api/v1/generate/letters/{letter_type}"
     headers = {"Content-Type": "application/json"}
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                api_url, json=payload, headers=headers, timeout=60.0
-            )
-            response.raise_for_status()  # Raise exception for 4xx or 5xx responses
-            return response.content
-        except httpx.RequestError as exc:
-            error_msg = f"Error contacting Docassemble API for letter generation: {exc}"
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail=error_msg,
-            ) from exc
-        except httpx.HTTPStatusError as exc:
-            status_code = (
-                status.HTTP_400_BAD_REQUEST
-                if 400 <= exc.response.status_code < 500
-                else status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
-            detail = (
-                f"Docassemble letter API error ({exc.response.status_code}): "
-                f"{exc.response.text}"
-            )
-            # Raise HTTPException, linking the original exception
-            raise HTTPException(status_code=status_code, detail=detail) from exc
+    client = get_client("docassemble")
+    try:
+        response = await client.post(api_url, json=payload, headers=headers)
+        response.raise_for_status()  # Raise exception for 4xx or 5xx responses
+        return response.content
+    except httpx.RequestError as exc:
+        error_msg = f"Error contacting Docassemble API for letter generation: {exc}"
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=error_msg,
+        ) from exc
+    except httpx.HTTPStatusError as exc:
+        status_code = (
+            status.HTTP_400_BAD_REQUEST
+            if 400 <= exc.response.status_code < 500
+            else status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+        detail = (
+            f"Docassemble letter API error ({exc.response.status_code}): "
+            f"{exc.response.text}"
+        )
+        # Raise HTTPException, linking the original exception
+        raise HTTPException(status_code=status_code, detail=detail) from exc
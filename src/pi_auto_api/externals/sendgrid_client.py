@@ -1,87 +1,178 @@
 """Client for interacting with the SendGrid API.
 
-This module provides a function to send emails via SendGrid using templates.
+This module provides functions to send emails via SendGrid using templates.
+
+Requests go straight to the SendGrid v3 Mail Send API over the shared, pooled
+HTTP client (see ``http_clients``), so sending never blocks the event loop and
+reuses warm connections. ``send_mail_batch`` renders a template once and
+delivers it to many recipients in a single request, with one personalization
+per recipient so they do not see each other's addresses. Batches above the
+personalization limit are split into requests; when some of them fail, the
+others are still sent and ``BatchSendError`` reports which recipients were
+reached, so only the rest are retried.
 """
 
 import logging
-from typing import Dict, Optional, Union
+from typing import Dict, List, Optional, Sequence, Union
 
 from fastapi import HTTPException, status
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Content, Email, Mail, To
 
 from pi_auto_api.config import settings
+from pi_auto_api.http_clients import get_client
 from pi_auto_api.utils.email_renderer import render_email_template
 
 logger = logging.getLogger(__name__)
 
+SENDGRID_MAIL_SEND_URL = "https://api.sendgrid.com/v3/mail/send"
+DEFAULT_FROM_EMAIL = "no-reply@pi-auto.example.com"
 
-async def send_mail(
+# SendGrid accepts at most 1000 personalizations per request
+MAX_PERSONALIZATIONS = 1000
+
+
+class BatchSendError(HTTPException):
+    """Some requests of a batch failed; the others were sent.
+
+    Sent requests cannot be recalled, so a retry should only address
+    ``failed``.
+
+    Attributes:
+        message_ids: Message ID of each recipient, in the order of to_emails
+            (None for recipients that were not sent to)
+        failed: Addresses of the recipients that were not sent to
+    """
+
+    def __init__(
+        self, detail: str, message_ids: List[Optional[str]], failed: List[str]
+    ) -> None:
+        """Initialize the error with the per-recipient outcome."""
+        super().__init__(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=detail
+        )
+        self.message_ids = message_ids
+        self.failed = failed
+
+
+def _default_subject(template_name: str) -> str:
+    """Derive a subject from the template name (e.g. "Retainer Sent")."""
+    return template_name.replace(".html", "").replace("_", " ").title()
+
+
+async def _post_mail(
+    recipients: Sequence[str], from_email: str, subject: str, html_content: str
+) -> str:
+    """Send one Mail Send request and return its message ID.
+
+    Args:
+        recipients: Recipient addresses, one personalization each
+        from_email: Sender email address
+        subject: Email subject
+        html_content: Rendered HTML body
+
+    Returns:
+        The X-Message-Id of the request, or the status code if it is missing
+
+    Raises:
+        HTTPException: If SendGrid rejects the request
+    """
+    payload = {
+        "personalizations": [{"to": [{"email": email}]} for email in recipients],
+        "from": {"email": from_email},
+        "subject": subject,
+        "content": [{"type": "text/html", "value": html_content}],
+    }
+    response = await get_client("sendgrid").post(
+        SENDGRID_MAIL_SEND_URL,
+        json=payload,
+        headers={"Authorization": f"Bearer {settings.SENDGRID_API_KEY}"},
+    )
+    if not response.is_success:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=(
+                f"Failed to send email: SendGrid returned "
+                f"{response.status_code}: {response.text}"
+            ),
+        )
+
+    # httpx headers are case-insensitive
+    return response.headers.get("X-Message-Id") or str(response.status_code)
+
+
+async def send_mail_batch(
     template_name: str,
-    to_email: str,
+    to_emails: Sequence[str],
     template_ctx: Dict[str, Union[str, Dict]],
     from_email: Optional[str] = None,
     subject: Optional[str] = None,
-) -> str:
-    """Render Jinja template and send via SendGrid.
+) -> List[str]:
+    """Render a Jinja template once and send it to many recipients.
+
+    Recipients are sent in as few requests as possible (up to
+    MAX_PERSONALIZATIONS per request), each in its own personalization. A
+    failed request does not stop the following ones.
 
     Args:
         template_name: Name of the template file to use
-        to_email: Recipient email address
-        template_ctx: Context variables for the template
+        to_emails: Recipient email addresses
+        template_ctx: Context variables for the template, shared by all recipients
         from_email: Sender email address (defaults to a no-reply address)
         subject: Email subject (defaults to a subject derived from template name)
 
     Returns:
-        SendGrid message ID if successful
+        SendGrid message ID for each recipient, in the order of to_emails.
+        Recipients sent in the same request share that request's
+        X-Message-Id, which SendGrid uses as the prefix of each recipient's
+        event message ID.
 
     Raises:
         ValueError: If SendGrid API key is not configured
-        HTTPException: If the email fails to send
+        BatchSendError: If any request failed, with the message IDs of the
+            recipients that were sent to and the addresses of the others
+        HTTPException: If the template cannot be rendered
     """
     if not settings.SENDGRID_API_KEY:
         logger.error("SENDGRID_API_KEY is not configured")
         raise ValueError("SendGrid API key is not configured")
 
-    # Set default from_email if not provided
-    if not from_email:
-        from_email = "no-reply@pi-auto.example.com"
+    if not to_emails:
+        return []
 
-    # Set default subject if not provided
-    if not subject:
-        # Generate a subject based on template name
-        # (remove .html and convert to title case)
-        subject = template_name.replace(".html", "").replace("_", " ").title()
+    from_email = from_email or DEFAULT_FROM_EMAIL
+    subject = subject or _default_subject(template_name)
 
     try:
-        # Render the template with provided context
         html_content = render_email_template(template_name, template_ctx)
 
-        # Create the email message
-        message = Mail(
-            from_email=Email(from_email),
-            to_emails=To(to_email),
-            subject=subject,
-            html_content=Content("text/html", html_content),
+        message_ids: List[Optional[str]] = []
+        failed: List[str] = []
+        errors: List[str] = []
+        for start in range(0, len(to_emails), MAX_PERSONALIZATIONS):
+            chunk = to_emails[start : start + MAX_PERSONALIZATIONS]
+            try:
+                message_id = await _post_mail(chunk, from_email, subject, html_content)
+            except Exception as e:
+                message_id = None
+                failed.extend(chunk)
+                errors.append(
+                    e.detail
+                    if isinstance(e, HTTPException)
+                    else f"Failed to send email: {e}"
+                )
+            message_ids.extend([message_id] * len(chunk))
+
+        if failed:
+            raise BatchSendError(
+                f"{errors[0]} ({len(failed)} of {len(to_emails)} recipient(s) "
+                "not sent)",
+                message_ids,
+                failed,
+            )
+
+        logger.info(
+            f"Email sent successfully to {len(to_emails)} recipient(s): {template_name}"
         )
-
-        # Send the email
-        sg = SendGridAPIClient(settings.SENDGRID_API_KEY)
-        response = sg.send(message)
-
-        # Extract message ID from response headers
-        # SendGrid includes a message ID in X-Message-Id header
-        message_id = None
-        if hasattr(response, "headers") and "X-Message-Id" in response.headers:
-            message_id = response.headers["X-Message-Id"]
-        elif hasattr(response, "headers") and "x-message-id" in response.headers:
-            message_id = response.headers["x-message-id"]
-
-        # Log success
-        logger.info(f"Email sent successfully to {to_email}: {template_name}")
-
-        # Return the message ID if available, otherwise return status code
-        return message_id or str(response.status_code)
+        return message_ids
 
     except FileNotFoundError as e:
         # Handle template not found
@@ -90,10 +181,42 @@ async def send_mail(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Email template not found: {template_name}",
         ) from e
+    except HTTPException as e:
+        logger.error(f"Error sending {template_name}: {e.detail}")
+        raise
     except Exception as e:
         # Handle other errors
-        logger.error(f"Error sending email to {to_email}: {str(e)}", exc_info=True)
+        logger.error(f"Error sending {template_name}: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to send email: {str(e)}",
         ) from e
+
+
+async def send_mail(
+    template_name: str,
+    to_email: str,
+    template_ctx: Dict[str, Union[str, Dict]],
+    from_email: Optional[str] = None,
+    subject: Optional[str] = None,
+) -> str:
+    """Render Jinja template and send via SendGrid.
+
+    Args:
+        template_name: Name of the template file to use
+        to_email: Recipient email address
+        template_ctx: Context variables for the template
+        from_email: Sender email address (defaults to a no-reply address)
+        subject: Email subject (defaults to a subject derived from template name)
+
+    Returns:
+        SendGrid message ID if successful
+
+    Raises:
+        ValueError: If SendGrid API key is not configured
+        HTTPException: If the email fails to send
+    """
+    message_ids = await send_mail_batch(
+        template_name, [to_email], template_ctx, from_email, subject
+    )
+    return message_ids[0]
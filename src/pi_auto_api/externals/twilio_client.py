@@ -1,24 +1,36 @@
 """Client for interacting with the Twilio API.
 
 This module provides functions to send SMS messages and faxes via Twilio.
+
+Requests go straight to the Twilio REST API over the shared, pooled HTTP
+client (see ``http_clients``), so they never block the event loop and reuse
+warm connections. Transient failures (429 and 5xx) are retried with
+``asyncio.sleep``, using jittered exponential backoff or the delay the API
+asks for in ``Retry-After``.
 """
 
+import asyncio
 import logging
-import time
-from typing import Optional
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
 
+import httpx
 from fastapi import HTTPException, status
 from twilio.base.exceptions import TwilioRestException
-from twilio.rest import Client
 
 from pi_auto_api.config import settings
+from pi_auto_api.http_clients import get_client
 
 logger = logging.getLogger(__name__)
 
+TWILIO_API_URL = "https://api.twilio.com/2010-04-01"
+TWILIO_FAX_URL = "https://fax.twilio.com/v1"
+
 
-# Initialize the Twilio client
-def get_twilio_client() -> Client:
-    """Returns a configured Twilio client instance.
+def get_twilio_credentials() -> Tuple[str, str]:
+    """Returns the Twilio account SID and auth token.
 
     Raises:
         ValueError: If Twilio credentials are not configured
@@ -27,75 +39,162 @@ def get_twilio_client() -> Client:
         logger.error("Twilio credentials not configured")
         raise ValueError("Twilio credentials not configured")
 
-    return Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+    return settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN
 
 
-async def send_sms(
-    to: str, body: str, from_number: Optional[str] = None, max_attempts: int = 3
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Parse the Retry-After header (delta-seconds or HTTP-date), if any."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Compute how long to wait before the next attempt.
+
+    Args:
+        attempt: The attempt that just failed (1-based)
+        retry_after: Delay requested by the API via Retry-After, if any
+
+    Returns:
+        Seconds to sleep, capped at TWILIO_RETRY_MAX_DELAY.
+    """
+    if retry_after is not None:
+        return min(retry_after, settings.TWILIO_RETRY_MAX_DELAY)
+
+    # Exponential backoff with jitter so concurrent senders do not retry in step
+    backoff = settings.TWILIO_RETRY_BASE_DELAY * 2 ** (attempt - 1)
+    return min(random.uniform(backoff / 2, backoff), settings.TWILIO_RETRY_MAX_DELAY)
+
+
+def _rest_exception(response: httpx.Response) -> TwilioRestException:
+    """Build a TwilioRestException from an error response."""
+    try:
+        error = response.json()
+    except ValueError:
+        error = {}
+    return TwilioRestException(
+        status=response.status_code,
+        uri=str(response.request.url),
+        msg=error.get("message") or response.text,
+        code=error.get("code"),
+        method=response.request.method,
+        details=error.get("details"),
+    )
+
+
+async def _create_resource(
+    url: str, data: Dict[str, str], label: str, max_attempts: int
 ) -> str:
-    """Sends SMS message via Twilio with retry logic.
+    """POST a resource to Twilio with retry logic and return its SID.
 
     Args:
-        to: Recipient phone number in E.164 format (e.g. +15551234567)
-        body: Message content
-        from_number: Sender phone number (defaults to TWILIO_SMS_FROM)
-        max_attempts: Maximum number of retry attempts for transient errors
+        url: Twilio REST API collection URL
+        data: Form parameters of the resource to create
+        label: What is being sent, used in logs and errors (e.g. "SMS")
+        max_attempts: Maximum number of attempts for transient errors
 
     Returns:
-        Twilio message SID
+        SID of the created resource
 
     Raises:
-        ValueError: If Twilio configuration is missing
-        HTTPException: If message sending fails after retries
+        ValueError: If Twilio credentials are missing
+        HTTPException: If the request fails after retries
     """
-    if not from_number:
-        from_number = settings.TWILIO_SMS_FROM
-
-    if not from_number:
-        logger.error("TWILIO_SMS_FROM not configured")
-        raise ValueError("Twilio SMS sender number not configured")
-
-    client = get_twilio_client()
+    auth = get_twilio_credentials()
+    client = get_client("twilio")
     attempt = 0
-    backoff_time = 1  # Start with 1 second backoff
 
     while attempt < max_attempts:
         attempt += 1
+        retry_after = None
         try:
-            message = client.messages.create(body=body, from_=from_number, to=to)
-            logger.info(f"SMS sent successfully to {to}, SID: {message.sid}")
-            return message.sid
+            response = await client.post(url, data=data, auth=auth)
+            if response.is_success:
+                return response.json()["sid"]
+
+            retry_after = _retry_after(response)
+            raise _rest_exception(response)
 
-        except TwilioRestException as e:
+        except (TwilioRestException, httpx.ConnectError, httpx.ConnectTimeout) as e:
             status_code = getattr(e, "status", 0)
 
-            # Check if error is transient (5xx or 429 Too Many Requests)
-            is_retryable = status_code >= 500 or status_code == 429
+            # Transient: 5xx, 429 Too Many Requests, or the request never left
+            is_retryable = (
+                status_code >= 500
+                or status_code == 429
+                or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+            )
 
             if is_retryable and attempt < max_attempts:
+                delay = _backoff_delay(attempt, retry_after)
                 logger.warning(
                     f"Transient Twilio error: {str(e)}. "
-                    f"Retry {attempt}/{max_attempts} in {backoff_time}s"
+                    f"Retry {attempt}/{max_attempts} in {delay:.2f}s"
                 )
-                time.sleep(backoff_time)
-                backoff_time *= 2  # Exponential backoff
+                await asyncio.sleep(delay)
                 continue
 
             # Not retryable or max attempts reached
-            logger.error(f"Failed to send SMS: {str(e)}")
+            logger.error(f"Failed to send {label}: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to send SMS: {str(e)}",
+                detail=f"Failed to send {label}: {str(e)}",
             ) from e
 
         except Exception as e:
-            logger.error(f"Unexpected error sending SMS: {str(e)}", exc_info=True)
+            logger.error(f"Unexpected error sending {label}: {str(e)}", exc_info=True)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to send SMS: {str(e)}",
+                detail=f"Failed to send {label}: {str(e)}",
             ) from e
 
 
+async def send_sms(
+    to: str, body: str, from_number: Optional[str] = None, max_attempts: int = 3
+) -> str:
+    """Sends SMS message via Twilio with retry logic.
+
+    Args:
+        to: Recipient phone number in E.164 format (e.g. +15551234567)
+        body: Message content
+        from_number: Sender phone number (defaults to TWILIO_SMS_FROM)
+        max_attempts: Maximum number of retry attempts for transient errors
+
+    Returns:
+        Twilio message SID
+
+    Raises:
+        ValueError: If Twilio configuration is missing
+        HTTPException: If message sending fails after retries
+    """
+    if not from_number:
+        from_number = settings.TWILIO_SMS_FROM
+
+    if not from_number:
+        logger.error("TWILIO_SMS_FROM not configured")
+        raise ValueError("Twilio SMS sender number not configured")
+
+    account_sid, _ = get_twilio_credentials()
+    sid = await _create_resource(
+        f"{TWILIO_API_URL}/Accounts/{account_sid}/Messages.json",
+        {"To": to, "From": from_number, "Body": body},
+        "SMS",
+        max_attempts,
+    )
+    logger.info(f"SMS sent successfully to {to}, SID: {sid}")
+    return sid
+
+
 async def send_fax(
     to: str, media_url: str, from_number: Optional[str] = None, max_attempts: int = 3
 ) -> str:
@@ -121,44 +220,11 @@ async def send_fax(
         logger.error("TWILIO_FAX_FROM not configured")
         raise ValueError("Twilio fax sender number not configured")
 
-    client = get_twilio_client()
-    attempt = 0
-    backoff_time = 1  # Start with 1 second backoff
-
-    while attempt < max_attempts:
-        attempt += 1
-        try:
-            fax = client.fax.v1.faxes.create(
-                from_=from_number, to=to, media_url=media_url
-            )
-            logger.info(f"Fax sent successfully to {to}, SID: {fax.sid}")
-            return fax.sid
-
-        except TwilioRestException as e:
-            status_code = getattr(e, "status", 0)
-
-            # Check if error is transient (5xx or 429 Too Many Requests)
-            is_retryable = status_code >= 500 or status_code == 429
-
-            if is_retryable and attempt < max_attempts:
-                logger.warning(
-                    f"Transient Twilio error: {str(e)}. "
-                    f"Retry {attempt}/{max_attempts} in {backoff_time}s"
-                )
-                time.sleep(backoff_time)
-                backoff_time *= 2  # Exponential backoff
-                continue
-
-            # Not retryable or max attempts reached
-            logger.error(f"Failed to send fax: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to send fax: {str(e)}",
-            ) from e
-
-        except Exception as e:
-            logger.error(f"Unexpected error sending fax: {str(e)}", exc_info=True)
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to send fax: {str(e)}",
-            ) from e
+    sid = await _create_resource(
+        f"{TWILIO_FAX_URL}/Faxes",
+        {"To": to, "From": from_number, "MediaUrl": media_url},
+        "fax",
+        max_attempts,
+    )
+    logger.info(f"Fax sent successfully to {to}, SID: {sid}")
+    return sid
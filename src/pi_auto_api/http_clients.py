@@ -0,0 +1,132 @@
+"""Shared, pooled HTTP clients for external integrations.
+
+Creating an ``httpx.AsyncClient`` per call throws away the connection pool,
+so every Docassemble render or Supabase Storage upload paid for a fresh
+TCP/TLS handshake. This module keeps one long-lived client per service (and
+therefore per host), with its own connection limits, keep-alive and timeout,
+so callers reuse warm connections.
+
+Like the database pool, clients are bound to the event loop that created
+them: the FastAPI server loop and each Celery worker loop get their own, and
+``close_clients()`` is called from the app lifespan and worker shutdown.
+"""
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, Tuple
+
+import httpx
+
+from pi_auto_api.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ServiceConfig:
+    """Connection settings for one external service.
+
+    Attributes:
+        timeout: Returns the default request timeout in seconds (read lazily
+            so settings overrides apply to newly created clients)
+    """
+
+    timeout: Callable[[], float]
+
+
+SERVICES: Dict[str, ServiceConfig] = {
+    "docassemble": ServiceConfig(timeout=lambda: settings.DOCASSEMBLE_TIMEOUT),
+    "supabase_storage": ServiceConfig(
+        timeout=lambda: settings.SUPABASE_STORAGE_TIMEOUT
+    ),
+    "sendgrid": ServiceConfig(timeout=lambda: settings.SENDGRID_TIMEOUT),
+    "twilio": ServiceConfig(timeout=lambda: settings.TWILIO_TIMEOUT),
+}
+
+# One client per (event loop, service)
+_clients: Dict[Tuple[asyncio.AbstractEventLoop, str], httpx.AsyncClient] = {}
+
+
+def _http2_available() -> bool:
+    """Check whether the optional h2 package needed for HTTP/2 is installed."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _build_client(service: str) -> httpx.AsyncClient:
+    """Create a pooled client configured for the given service."""
+    config = SERVICES[service]
+    http2 = settings.HTTP2_ENABLED and _http2_available()
+    if settings.HTTP2_ENABLED and not http2:
+        logger.warning("HTTP2_ENABLED is set but h2 is not installed; using HTTP/1.1")
+
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(config.timeout()),
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        http2=http2,
+    )
+
+
+def _discard_dead_clients() -> None:
+    """Drop clients whose event loop has been closed."""
+    for key in [key for key in _clients if key[0].is_closed()]:
+        # The owning loop is gone, so the client cannot be closed gracefully
+        _clients.pop(key)
+        logger.info(f"Discarded {key[1]} HTTP client bound to a closed event loop")
+
+
+def get_client(service: str) -> httpx.AsyncClient:
+    """Get the shared client for a service on the running event loop.
+
+    The returned client is long-lived: use it directly, do not close it or
+    use it as a context manager.
+
+    Args:
+        service: Name of a service in SERVICES (e.g. "docassemble")
+
+    Returns:
+        A pooled httpx.AsyncClient for the service.
+
+    Raises:
+        KeyError: If the service is not registered.
+    """
+    if service not in SERVICES:
+        raise KeyError(f"Unknown HTTP service: {service}")
+
+    key = (asyncio.get_running_loop(), service)
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        _discard_dead_clients()
+        client = _clients[key] = _build_client(service)
+        logger.info(f"Created pooled HTTP client for {service}")
+    return client
+
+
+async def close_clients() -> None:
+    """Close every client bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _clients if key[0] is loop]:
+        client = _clients.pop(key)
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing {key[1]} HTTP client: {e}")
+    logger.info("HTTP clients closed")
+
+
+def _reset_after_fork() -> None:
+    """Forget clients inherited from the parent process."""
+    _clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
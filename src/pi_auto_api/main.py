@@ -6,14 +6,21 @@ This module contains the FastAPI application instance and route definitions.
 import logging
 import uuid
 from contextlib import asynccontextmanager
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Callable, Dict
 
-import asyncpg
-import httpx
 from fastapi import Depends, FastAPI, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
+from pi_auto_api import (
+    cpu_pool,
+    db_pool,
+    events,
+    http_clients,
+    outbox,
+    sse_hub,
+    task_queue,
+)
 from pi_auto_api.config import settings
 from pi_auto_api.db import create_intake
 from pi_auto_api.routers import auth, pi_workflow, sse
@@ -23,9 +30,8 @@ from pi_auto_api.schemas import (
     IntakePayload,
     IntakeResponse,
 )
-from pi_auto_api.tasks.disbursement import generate_disbursement_sheet
 from pi_auto_api.tasks.insurance_notice import send_insurance_notice
-from pi_auto_api.tasks.retainer import generate_retainer
+from pi_auto_api.utils import email_renderer
 
 # Configure logging
 logging.basicConfig(
@@ -34,9 +40,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Global database connection pool
-db_pool: Optional[asyncpg.Pool] = None
-
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -66,26 +69,33 @@ async def lifespan(app: FastAPI):
 
     logger.info("Starting up PI Auto API")
 
-    # Initialize the database connection pool if URL is configured
-    global db_pool
+    # Compile email templates now rather than on the first send
+    try:
+        email_renderer.precompile_email_templates()
+    except Exception as e:
+        logger.warning(f"Failed to precompile email templates: {str(e)}")
+
+    # Warm up the shared connection pool for this event loop if configured
     if settings.SUPABASE_URL:
         try:
-            db_pool = await asyncpg.create_pool(
-                settings.SUPABASE_URL,
-                min_size=2,
-                max_size=10,
-            )
-            logger.info("Database connection pool initialized")
+            await db_pool.get_pool()
         except Exception as e:
             logger.error(f"Failed to initialize database connection pool: {str(e)}")
-            db_pool = None
+
+        # Drain tasks and events written to the transactional outbox
+        outbox.start_relay()
 
     yield
 
-    # Shutdown: Close the connection pool
-    if db_pool:
-        await db_pool.close()
-        logger.info("Database connection pool closed")
+    # Shutdown: Stop the outbox relay and SSE hub, publish pending tasks and
+    # events, close the connection pool, HTTP clients and CPU workers
+    await outbox.stop_relay()
+    await task_queue.close_enqueuer()
+    await sse_hub.close_hub()
+    await events.close_redis_client()
+    await db_pool.close_pool()
+    await http_clients.close_clients()
+    await cpu_pool.close_pool()
 
     logger.info("Shutting down PI Auto API")
 
@@ -171,34 +181,25 @@ async def check_database() -> None:
     Raises:
         HTTPException: If the database is not available.
     """
-    global db_pool
-
-    # Create the pool if it doesn't exist yet
-    if not db_pool and settings.SUPABASE_URL:
-        try:
-            db_pool = await asyncpg.create_pool(
-                settings.SUPABASE_URL,
-                min_size=2,
-                max_size=10,
-            )
-            logger.info("Database connection pool initialized during health check")
-        except Exception as e:
-            logger.error(f"Failed to initialize database connection pool: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail=f"Database connection failed: {str(e)}",
-            ) from e
-
-    if not db_pool:
+    if not settings.SUPABASE_URL:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Database connection pool not available",
         )
 
+    # Create the pool if it doesn't exist yet
     try:
-        async with db_pool.acquire() as conn:
-            await conn.execute("SELECT 1")
-            logger.info("Database check successful")
+        await db_pool.get_pool()
+    except Exception as e:
+        logger.error(f"Failed to initialize database connection pool: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Database connection failed: {str(e)}",
+        ) from e
+
+    try:
+        await db_pool.check_health()
+        logger.info("Database check successful")
     except Exception as e:
         logger.error(f"Database check failed: {str(e)}")
         raise HTTPException(
@@ -215,15 +216,19 @@ async def check_docassemble() -> None:
         HTTPException: If the Docassemble API is not available.
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{settings.DOCASSEMBLE_URL}/health")
-            if response.status_code != 200:
-                logger.error(f"Docassemble API check failed: {response.text}")
-                raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail=f"Docassemble API not available: {response.text}",
-                )
-            logger.info("Docassemble API check successful")
+        client = http_clients.get_client("docassemble")
+        # The shared client's timeout is sized for rendering, not probes
+        response = await client.get(
+            f"{settings.DOCASSEMBLE_URL}/health",
+            timeout=settings.DOCASSEMBLE_HEALTH_TIMEOUT,
+        )
+        if response.status_code != 200:
+            logger.error(f"Docassemble API check failed: {response.text}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Docassemble API not available: {response.text}",
+            )
+        logger.info("Docassemble API check successful")
     except Exception as e:
         logger.error(f"Docassemble API check failed: {str(e)}")
         raise HTTPException(
@@ -294,12 +299,10 @@ async def intake(payload: IntakePayload) -> IntakeResponse:
         HTTPException: If there's an error creating the records
     """
     try:
-        # Create the intake records
+        # Create the intake records; the retainer task is queued through
+        # the outbox in the same transaction
         result = await create_intake(payload)
 
-        # Queue the retainer generation task
-        generate_retainer.delay(result["client_id"])
-
         return IntakeResponse(
             client_id=result["client_id"],
             incident_id=result["incident_id"],
@@ -351,11 +354,7 @@ async def finalize_settlement(
         HTTPException: If there's an error updating the settlement details.
     """
     try:
-        conn = None
-        try:
-            # Connect to the database
-            conn = await asyncpg.connect(settings.SUPABASE_URL)
-
+        async with db_pool.acquire() as conn, conn.transaction():
             # 1. Update incident with settlement details
             update_query = """
             UPDATE incident
@@ -388,16 +387,17 @@ async def finalize_settlement(
                         adjustment.amount,
                     )
 
-            logger.info(f"Settlement finalized for incident {payload.incident_id}")
+            # 3. Queue the disbursement sheet in the same transaction, so the
+            # task is sent if and only if the settlement is stored
+            task_id = await outbox.enqueue_task(
+                conn, "generate_disbursement_sheet", [payload.incident_id]
+            )
 
-        finally:
-            if conn:
-                await conn.close()
+            logger.info(f"Settlement finalized for incident {payload.incident_id}")
 
-        # 3. Queue task to generate disbursement sheet
-        task = generate_disbursement_sheet.delay(payload.incident_id)
+        outbox.wake_relay()
         logger.info(
-            f"Queued disbursement sheet task {task.id} "
+            f"Queued disbursement sheet task {task_id} "
             f"for incident {payload.incident_id}"
         )
 
@@ -405,7 +405,7 @@ async def finalize_settlement(
             "status": "success",
             "message": "Settlement finalized and disbursement sheet generation queued",
             "incident_id": payload.incident_id,
-            "task_id": task.id,
+            "task_id": task_id,
         }
 
     except ValueError as e:
@@ -477,7 +477,7 @@ async def docusign_webhook(payload: DocuSignWebhookPayload) -> Dict[str, str]:
         logger.info(f"Extracted client_id: {client_id}")
 
         # Queue the insurance notice task
-        send_insurance_notice.delay(client_id)
+        await task_queue.enqueue(send_insurance_notice, client_id)
         logger.info(f"Queued insurance notice task for client_id: {client_id}")
 
         return {"status": "success", "client_id": str(client_id)}
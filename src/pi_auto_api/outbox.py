@@ -0,0 +1,329 @@
+"""Transactional outbox for Celery tasks and activity events.
+
+Handlers and tasks that change business rows used to commit and then call
+``task.delay()`` or ``record_event()``: two more round trips on the request
+path, and the message was lost if the process died between the commit and
+the send. Instead, ``enqueue_task`` and ``enqueue_event`` insert an ``outbox``
+row on the caller's connection, inside the caller's transaction, so the
+message exists if and only if the business rows do.
+
+An ``OutboxRelay`` runs on each long-lived event loop (the API lifespan and
+the Celery worker runtime). It claims due rows in batches with a short lease
+(OUTBOX_CLAIM_LEASE, taken with ``FOR UPDATE SKIP LOCKED`` in a single
+autocommitted statement, so several relays never send the same row), then,
+holding no connection or lock, publishes the batch's tasks through
+``task_queue`` (one pooled broker producer, off the event loop) and its events
+in one pipelined Redis request. A second short transaction deletes the rows
+it delivered.
+
+Delivery is at-least-once: a row whose send fails keeps its ``last_error``
+and is rescheduled with exponential backoff (OUTBOX_RETRY_BASE_DELAY doubling
+up to OUTBOX_RETRY_MAX_DELAY), so an outage of the broker or Redis does not
+burn through its attempts. A row that fails OUTBOX_MAX_ATTEMPTS times is
+dead-lettered: ``dead_at`` is set, an error is logged for alerting, and it
+stays in the table until ``retry_dead_letters()`` puts it back in the queue.
+If a relay dies mid-delivery, its lease expires and the rows are sent again.
+Celery does not deduplicate tasks by ID, so every task queued through the
+outbox has to be safe to run twice.
+
+The relay polls every OUTBOX_POLL_INTERVAL seconds; ``wake_relay()`` lets the
+committing code hand new rows to the local relay immediately.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import asyncpg
+
+from pi_auto_api import events, task_queue
+from pi_auto_api.config import settings
+from pi_auto_api.db_pool import acquire
+
+logger = logging.getLogger(__name__)
+
+TASK = "task"
+EVENT = "event"
+
+_INSERT_QUERY = "INSERT INTO outbox (kind, payload) VALUES ($1, $2::jsonb)"
+
+_CLAIM_QUERY = """
+UPDATE outbox
+SET claimed_until = now() + make_interval(secs => $2)
+WHERE id IN (
+    SELECT id
+    FROM outbox
+    WHERE dead_at IS NULL
+    AND next_attempt_at <= now()
+    AND (claimed_until IS NULL OR claimed_until < now())
+    ORDER BY id
+    LIMIT $1
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id, kind, payload, attempts
+"""
+
+_DELETE_QUERY = "DELETE FROM outbox WHERE id = ANY($1::bigint[])"
+
+_FAILED_QUERY = """
+UPDATE outbox
+SET attempts = attempts + 1,
+    last_error = $2,
+    claimed_until = NULL,
+    next_attempt_at = now() + make_interval(secs => $3),
+    dead_at = CASE WHEN $4 THEN now() END
+WHERE id = $1
+"""
+
+_RETRY_DEAD_QUERY = """
+UPDATE outbox
+SET dead_at = NULL, attempts = 0, next_attempt_at = now()
+WHERE dead_at IS NOT NULL
+AND ($1::bigint[] IS NULL OR id = ANY($1::bigint[]))
+"""
+
+
+async def enqueue_task(
+    conn: asyncpg.Connection,
+    task_name: str,
+    args: Sequence[Any] = (),
+    kwargs: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Write a Celery task to the outbox in the caller's transaction.
+
+    Args:
+        conn: Connection with the transaction holding the business rows
+        task_name: Registered Celery task name (e.g. "generate_retainer")
+        args: Positional task arguments (must be JSON serializable)
+        kwargs: Keyword task arguments (must be JSON serializable)
+
+    Returns:
+        The task ID the task will be sent with, known before it is sent.
+    """
+    task_id = str(uuid.uuid4())
+    payload = {
+        "name": task_name,
+        "args": list(args),
+        "kwargs": kwargs or {},
+        "task_id": task_id,
+    }
+    await conn.execute(_INSERT_QUERY, TASK, json.dumps(payload))
+    return task_id
+
+
+async def enqueue_event(conn: asyncpg.Connection, event: dict) -> None:
+    """Write an activity event to the outbox in the caller's transaction.
+
+    Args:
+        conn: Connection with the transaction holding the business rows
+        event: The event, as it would be passed to ``record_event``
+    """
+    await conn.execute(_INSERT_QUERY, EVENT, json.dumps(event))
+
+
+async def _dispatch(rows: List[asyncpg.Record]) -> Dict[int, str]:
+    """Deliver claimed rows and return the errors of those that failed."""
+    tasks: List[Tuple[int, dict]] = []
+    batch: List[Tuple[int, dict]] = []
+    for row in rows:
+        payload = row["payload"]
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        (tasks if row["kind"] == TASK else batch).append((row["id"], payload))
+
+    failed: Dict[int, str] = {}
+    if tasks:
+        # Send with the task IDs returned by enqueue_task. Celery does not
+        # deduplicate by ID, so a redelivered row runs its task again
+        futures = task_queue.get_enqueuer().submit(
+            [
+                (p["name"], p.get("args", []), p.get("kwargs", {}), p["task_id"])
+                for _, p in tasks
+            ]
+        )
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        for (outbox_id, _), result in zip(tasks, results, strict=True):
+            if isinstance(result, BaseException):
+                failed[outbox_id] = str(result)
+    if batch:
+        try:
+            await events.write_events([event for _, event in batch])
+        except Exception as e:
+            failed.update({outbox_id: str(e) for outbox_id, _ in batch})
+    return failed
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait before retrying a row that has failed ``attempts`` times."""
+    delay = settings.OUTBOX_RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0)
+    return min(delay, settings.OUTBOX_RETRY_MAX_DELAY)
+
+
+async def _settle(rows: List[asyncpg.Record], failed: Dict[int, str]) -> List[int]:
+    """Delete delivered rows and reschedule (or dead-letter) failed ones.
+
+    Returns:
+        The IDs of the delivered rows.
+    """
+    delivered = [row["id"] for row in rows if row["id"] not in failed]
+    retries = []
+    dead = []
+    for row in rows:
+        if row["id"] not in failed:
+            continue
+        attempts = row["attempts"] + 1
+        dead_letter = 0 < settings.OUTBOX_MAX_ATTEMPTS <= attempts
+        if dead_letter:
+            dead.append(row["id"])
+        retries.append(
+            (row["id"], failed[row["id"]], retry_delay(attempts), dead_letter)
+        )
+
+    async with acquire() as conn, conn.transaction():
+        if delivered:
+            await conn.execute(_DELETE_QUERY, delivered)
+        if retries:
+            await conn.executemany(_FAILED_QUERY, retries)
+
+    if failed:
+        logger.warning(
+            f"Outbox relay failed to deliver {len(failed)} of {len(rows)} row(s); "
+            "they will be retried"
+        )
+    if dead:
+        logger.error(
+            f"Outbox rows {dead} failed {settings.OUTBOX_MAX_ATTEMPTS} deliveries "
+            "and were dead-lettered; fix the cause and call retry_dead_letters()"
+        )
+    return delivered
+
+
+async def relay_batch(limit: Optional[int] = None) -> int:
+    """Claim up to ``limit`` due outbox rows and deliver them.
+
+    Args:
+        limit: Rows to claim (defaults to OUTBOX_BATCH_SIZE)
+
+    Returns:
+        The number of rows delivered and removed from the outbox.
+    """
+    limit = limit or settings.OUTBOX_BATCH_SIZE
+    # Claiming commits at once; delivery runs without a connection or lock
+    async with acquire() as conn:
+        rows = await conn.fetch(_CLAIM_QUERY, limit, settings.OUTBOX_CLAIM_LEASE)
+    if not rows:
+        return 0
+
+    rows = sorted(rows, key=lambda row: row["id"])
+    failed = await _dispatch(rows)
+    return len(await _settle(rows, failed))
+
+
+async def retry_dead_letters(ids: Optional[Sequence[int]] = None) -> int:
+    """Put dead-lettered outbox rows back in the queue.
+
+    Args:
+        ids: Rows to retry (defaults to every dead-lettered row)
+
+    Returns:
+        The number of rows requeued.
+    """
+    async with acquire() as conn:
+        status = await conn.execute(
+            _RETRY_DEAD_QUERY, list(ids) if ids is not None else None
+        )
+    requeued = int(status.split()[-1])
+    if requeued:
+        logger.info(f"Requeued {requeued} dead-lettered outbox row(s)")
+        wake_relay()
+    return requeued
+
+
+class OutboxRelay:
+    """Background task draining the outbox on one event loop."""
+
+    def __init__(self) -> None:
+        """Create a relay; call ``start()`` on the loop it should run on."""
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start draining the outbox in the background."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def wake(self) -> None:
+        """Check the outbox now instead of at the next poll."""
+        self._wake.set()
+
+    async def _run(self) -> None:
+        """Relay batches until cancelled, waiting between empty batches."""
+        while True:
+            try:
+                delivered = await relay_batch()
+            except Exception as e:
+                logger.error(f"Outbox relay error: {e}")
+                delivered = 0
+
+            # A full batch means more rows are probably waiting
+            if delivered >= settings.OUTBOX_BATCH_SIZE:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), settings.OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def close(self) -> None:
+        """Stop the relay; undelivered rows are picked up by the next one."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+# One relay per event loop, like the database pool it drains through
+_relays: Dict[asyncio.AbstractEventLoop, OutboxRelay] = {}
+
+
+def start_relay() -> OutboxRelay:
+    """Start (or return) the outbox relay for the running event loop."""
+    loop = asyncio.get_running_loop()
+    relay = _relays.get(loop)
+    if relay is None:
+        for dead in [dead for dead in _relays if dead.is_closed()]:
+            _relays.pop(dead)
+        relay = _relays[loop] = OutboxRelay()
+    relay.start()
+    return relay
+
+
+def wake_relay() -> None:
+    """Wake the running loop's relay, if any, after committing outbox rows."""
+    try:
+        relay = _relays.get(asyncio.get_running_loop())
+    except RuntimeError:
+        return
+    if relay is not None:
+        relay.wake()
+
+
+async def stop_relay() -> None:
+    """Stop the relay bound to the running event loop, if any."""
+    relay = _relays.pop(asyncio.get_running_loop(), None)
+    if relay is not None:
+        await relay.close()
+        logger.info("Outbox relay stopped")
+
+
+def _reset_after_fork() -> None:
+    """Forget relays inherited from the parent process."""
+    _relays.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,5 +1,6 @@
 """API Router for authentication related endpoints."""
 
+import asyncio
 import logging
 from typing import Any
 
@@ -56,7 +57,11 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    if not verify_password(form_data.password, staff_user.hashed_password):
+    # bcrypt is deliberately slow; it releases the GIL, so a thread keeps the
+    # event loop free while it runs
+    if not await asyncio.to_thread(
+        verify_password, form_data.password, staff_user.hashed_password
+    ):
         logger.warning(f"Invalid password attempt for email: {form_data.email}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -2,114 +2,205 @@
 
 import asyncio
 import logging
-import time
-from typing import Any, AsyncGenerator, Dict, Optional
+from typing import AsyncGenerator, Dict, List, Optional, Sequence, Set, Tuple
 
-import redis.asyncio as redis
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, HTTPException, Query, Request, status
 from sse_starlette.sse import EventSourceResponse
 
 from pi_auto_api.config import settings
+from pi_auto_api.db_pool import acquire
+from pi_auto_api.sse_hub import EventFilter, batch_frame, get_hub, parse_stream_id
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Define a longer timeout for Redis connection attempts during startup/reconnect
-REDIS_CONNECT_TIMEOUT = 10  # seconds
-HEARTBEAT_INTERVAL = 30  # seconds
-
-
-async def _process_redis_message(message: Dict[str, Any]) -> Optional[Dict[str, str]]:
-    """Formats a received Redis message into an SSE event dictionary."""
-    if message and message["type"] == "message":
-        event_id = str(int(time.time() * 1000))  # Millisecond timestamp
-        event_data = message["data"]  # Already bytes
-        logger.debug(f"SSE: Sending event ID {event_id}, Data: {event_data.decode()}")
-        return {
-            "id": event_id,
-            "event": "message",
-            "data": event_data.decode(),
-        }
-    return None
-
-
-# C901: `event_publisher` is too complex (13 > 10) - This might require refactoring
-#       or increasing the allowed complexity in pyproject.toml if acceptable.
-#       For now, we'll leave it and address other errors.
-async def event_publisher(request: Request) -> AsyncGenerator[Dict[str, str], None]:  # noqa: C901
-    """Yields server-sent events from a Redis pub/sub channel."""
-    redis_client = None
-    pubsub = None
-    last_event_id = request.headers.get("Last-Event-ID")
-    # Last-Event-ID is ignored for v1 as per requirements,
-    # but good to acknowledge its presence.
-    if last_event_id:
-        logger.info(f"Client connected with Last-Event-ID: {last_event_id}")
+# Incidents that client_id and assignee filters stand for
+CLIENT_INCIDENTS_QUERY = "SELECT id FROM incident WHERE client_id = ANY($1::int[])"
+ASSIGNEE_INCIDENTS_QUERY = """
+SELECT DISTINCT incident_id FROM task
+WHERE lower(assignee_email) = ANY($1::text[]) AND incident_id IS NOT NULL
+"""
+
+# Incident IDs start at 1, so this matches no event (an empty set means "any")
+_NO_INCIDENT = 0
+
+
+async def resolve_event_filter(
+    incident_ids: Optional[Sequence[int]] = None,
+    client_ids: Optional[Sequence[int]] = None,
+    assignees: Optional[Sequence[str]] = None,
+    types: Optional[Sequence[str]] = None,
+) -> EventFilter:
+    """Build a stream's filter, resolving client and assignee filters.
+
+    Activity events identify the incident they are about, but not always its
+    client or the staff working on it. Client and assignee filters are
+    therefore turned into the set of incidents they cover when the stream
+    opens: the client's incidents, and incidents with tasks assigned to the
+    given emails. Incidents created or assigned later are picked up when the
+    client reconnects.
+
+    Args:
+        incident_ids: Only events for these incidents
+        client_ids: Only events for these clients' incidents
+        assignees: Only events for incidents with tasks assigned to these emails
+        types: Only events of these types
+
+    Returns:
+        A filter on incident IDs and event types.
+
+    Raises:
+        HTTPException: 503 if client or assignee filters are given but the
+            database is not configured.
+    """
+    scopes: List[Set[int]] = []
+    if incident_ids:
+        scopes.append(set(incident_ids))
+    if client_ids or assignees:
+        if not settings.SUPABASE_URL:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Client and assignee filters need the database",
+            )
+        async with acquire() as conn:
+            if client_ids:
+                rows = await conn.fetch(CLIENT_INCIDENTS_QUERY, list(client_ids))
+                scopes.append({row["id"] for row in rows})
+            if assignees:
+                rows = await conn.fetch(
+                    ASSIGNEE_INCIDENTS_QUERY, [email.lower() for email in assignees]
+                )
+                scopes.append({row["incident_id"] for row in rows})
+
+    incidents = set.intersection(*scopes) if scopes else set()
+    if scopes and not incidents:
+        incidents = {_NO_INCIDENT}
+    return EventFilter.build(incident_ids=incidents, types=types)
+
+
+def _build_frames(
+    events: List[Dict[str, str]], last_seen: Optional[Tuple[int, int]]
+) -> Tuple[List[Dict[str, str]], Optional[Tuple[int, int]]]:
+    """Turn a burst of queued events into the frames to send.
 
+    Events the Last-Event-ID replay already sent are skipped, and runs of
+    activity events are combined with batch_frame.
+
+    Args:
+        events: Events taken from the subscriber, in order
+        last_seen: ID of the last replayed event, or None once live
+
+    Returns:
+        The frames to send and the updated last_seen.
+    """
+    frames: List[Dict[str, str]] = []
+    messages: List[Dict[str, str]] = []
+    for event in events:
+        event_id = parse_stream_id(event.get("id"))
+        if event_id is not None and last_seen is not None:
+            if event_id <= last_seen:
+                continue  # Already sent by the replay
+            last_seen = None  # Live events are in order from here on
+        if event.get("event") == "message":
+            messages.append(event)
+            continue
+        if messages:
+            frames.append(batch_frame(messages))
+            messages = []
+        frames.append(event)
+    if messages:
+        frames.append(batch_frame(messages))
+    return frames, last_seen
+
+
+async def event_publisher(
+    request: Request, event_filter: Optional[EventFilter] = None
+) -> AsyncGenerator[Dict[str, str], None]:
+    """Yields server-sent events relayed by the process-wide activity hub.
+
+    The hub owns the Redis Stream reader and the heartbeat timer; this
+    generator only waits on the client's queue, so it wakes up when there is
+    something to send. EventSourceResponse cancels it when the client goes
+    away.
+
+    A client reconnecting with `Last-Event-ID` first receives the events it
+    missed. The subscription is registered before the replay is read, and
+    live events the replay already covered are skipped, so there are no gaps
+    or duplicates.
+
+    With SSE_BATCH_WINDOW_MS set, a burst of activity events is sent as one
+    "batch" frame. A client that fell behind far enough to lose events
+    receives a `resync` event; under the "disconnect" overflow policy the
+    stream then ends.
+
+    Args:
+        request: The incoming SSE request
+        event_filter: Only stream activity events matching this filter
+    """
+    hub = get_hub()
+    subscriber = hub.subscribe(event_filter)
     try:
-        redis_client = redis.from_url(
-            settings.REDIS_URL, decode_responses=False
-        )  # SSE requires bytes
-        async with redis_client.pubsub() as pubsub:
-            await pubsub.subscribe("activity")
-            logger.info("SSE client subscribed to 'activity' Redis channel.")
-
-            last_heartbeat_time = time.time()
-
-            while True:
-                if await request.is_disconnected():
-                    logger.info("SSE client disconnected.")
-                    break
-
-                try:
-                    message = await pubsub.get_message(
-                        ignore_subscribe_messages=True, timeout=1.0
-                    )
-                    sse_event = await _process_redis_message(message)
-                    if sse_event:
-                        yield sse_event
-                        last_heartbeat_time = time.time()
-
-                except asyncio.TimeoutError:
-                    pass
-                except Exception as e:
-                    logger.error(f"Error processing Redis message: {e}", exc_info=True)
-                    await asyncio.sleep(1)  # Avoid tight loop on persistent error
-
-                current_time = time.time()
-                if current_time - last_heartbeat_time > HEARTBEAT_INTERVAL:
-                    logger.debug("SSE: Sending keep-alive heartbeat")
-                    yield {"event": "comment", "data": ": keep-alive"}
-                    last_heartbeat_time = current_time
-
-                await asyncio.sleep(0.01)
-
-    except redis.exceptions.ConnectionError as e:
-        logger.error(f"SSE: Could not connect to Redis: {e}")
-        # Optionally, yield an error event to the client
-        # if the connection fails at start
+        last_seen = None
+        last_event_id = request.headers.get("Last-Event-ID")
+        if last_event_id:
+            logger.info(f"Client connected with Last-Event-ID: {last_event_id}")
+            last_seen = parse_stream_id(last_event_id)
+            for event in await hub.replay(last_event_id, event_filter):
+                yield event
+                last_seen = parse_stream_id(event.get("id")) or last_seen
+
+        window = settings.SSE_BATCH_WINDOW_MS / 1000
+        while True:
+            burst = await subscriber.get_many(settings.SSE_BATCH_MAX_EVENTS, window)
+            frames, last_seen = _build_frames(burst, last_seen)
+            for frame in frames:
+                logger.debug(f"SSE: Sending event ID {frame.get('id')}")
+                yield frame
+
+            if subscriber.closed:
+                logger.info("SSE: Closing stream of a client that fell behind.")
+                break
     except asyncio.CancelledError:
         logger.info("SSE event_publisher task was cancelled (client disconnected).")
-    except Exception as e:
-        logger.error(f"SSE: Unexpected error in event_publisher: {e}", exc_info=True)
     finally:
-        if redis_client:
-            try:
-                await redis_client.aclose()
-                logger.info("SSE: Closed Redis client connection.")
-            except Exception as e:
-                logger.error(
-                    f"SSE: Error during Redis client cleanup: {e}", exc_info=True
-                )
+        hub.unsubscribe(subscriber)
         logger.info("SSE: event_publisher finished.")
 
 
 @router.get("/stream", summary="Stream live activity events", tags=["Events"])
-async def stream_events(request: Request):
+async def stream_events(
+    request: Request,
+    incident_id: Optional[List[int]] = Query(  # noqa: B008
+        None, description="Only events for these incidents"
+    ),
+    client_id: Optional[List[int]] = Query(  # noqa: B008
+        None, description="Only events for these clients' incidents"
+    ),
+    assignee: Optional[List[str]] = Query(  # noqa: B008
+        None, description="Only events for incidents with tasks assigned to these"
+    ),
+    event_type: Optional[List[str]] = Query(  # noqa: B008
+        None, alias="type", description="Only events of these types"
+    ),
+):
     """Endpoint for Server-Sent Events (SSE).
 
-    Streams events published to the 'activity' Redis channel.
-    Sends a keep-alive comment every 30 seconds.
-    The `Last-Event-ID` header is received but currently ignored for simplicity in v1.
+    Streams events appended to the 'activity' Redis Stream, using the stream
+    entry IDs as event IDs. Sends a keep-alive comment every 30 seconds.
+    Clients that reconnect with a `Last-Event-ID` header are sent the events
+    they missed; if those are no longer retained, a `resync` event tells the
+    client to reload its data.
+
+    Filters are matched server-side against the event payload: a filter may
+    be repeated (any value matches), and different filters must all match.
+    Client and assignee filters are resolved to incidents when the stream
+    opens (see resolve_event_filter), so they return 503 when the database
+    is not configured. Heartbeats and resync hints are always sent.
     """
-    return EventSourceResponse(event_publisher(request))
+    event_filter = await resolve_event_filter(
+        incident_ids=incident_id,
+        client_ids=client_id,
+        assignees=assignee,
+        types=event_type,
+    )
+    return EventSourceResponse(event_publisher(request, event_filter))
@@ -0,0 +1,552 @@
+"""Per-process broadcast hub for Server-Sent Events.
+
+Each ``/api/stream`` client used to open its own Redis connection and
+subscription, then busy-poll it. The hub holds a single blocking read of the
+``activity`` Redis Stream per event loop and fans every entry out to
+per-client ``asyncio.Queue`` objects, so an idle dashboard costs one queue in
+memory instead of a Redis connection and a polling loop. Heartbeats are sent
+to all clients from one timer.
+
+Stream entry IDs are monotonic and are used as SSE event IDs, so a client
+that reconnects with ``Last-Event-ID`` gets the entries it missed from
+``replay()`` instead of reloading everything. If the entries it needs have
+already been trimmed from the stream, it is sent a ``resync`` event.
+
+Clients can subscribe with an ``EventFilter`` (incident, event type); the
+SSE router resolves client and assignee filters to incidents first. Filtered
+subscribers are indexed by one of their filter values, so routing an event
+only touches the clients that could want it.
+
+Each client buffers at most SSE_CLIENT_QUEUE_SIZE events. When a slow client
+falls that far behind, SSE_OVERFLOW_POLICY decides whether to drop its oldest
+events, coalesce them, or disconnect it, so one stalled browser cannot grow
+the process's memory without bound. Every policy loses events the client can
+no longer replay, so each one sends it a ``resync`` event ahead of the events
+it still has buffered.
+
+The reader and heartbeat tasks start with the first subscriber and are
+stopped by ``close_hub()``, which the app lifespan calls on shutdown.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import redis.asyncio as redis
+
+from pi_auto_api.config import settings
+from pi_auto_api.events import ACTIVITY_STREAM
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 30  # seconds
+HEARTBEAT_EVENT = {"event": "comment", "data": ": keep-alive"}
+# Tells the client it missed events that can no longer be replayed
+RESYNC_EVENT = {"event": "resync", "data": ""}
+
+# Entries fetched per XREAD and at most replayed to one reconnecting client
+READ_COUNT = 100
+MAX_REPLAY = 1000
+
+# Delay before reading again after a Redis error (doubles up to the maximum)
+RECONNECT_BASE_DELAY = 1.0  # seconds
+RECONNECT_MAX_DELAY = 30.0  # seconds
+
+_STREAM_ID_RE = re.compile(r"^\d+(-\d+)?$")
+
+# EventFilter attribute -> event payload field, most selective first. A
+# filtered subscriber is indexed under the first dimension it restricts.
+FILTER_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ("incident_ids", "incident_id"),
+    ("types", "type"),
+)
+# Payload fields used to route and coalesce events
+ROUTING_FIELDS: Tuple[str, ...] = ("incident_id", "client_id", "type")
+
+
+def parse_stream_id(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Parse a Redis Stream ID ("ms-seq" or "ms") into a comparable tuple.
+
+    Returns:
+        (milliseconds, sequence), or None if the value is not a stream ID.
+    """
+    if not value or not _STREAM_ID_RE.match(value):
+        return None
+    ms, _, seq = value.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def format_stream_entry(entry_id: str, fields: Dict[str, str]) -> Dict[str, str]:
+    """Format an activity stream entry into an SSE event dictionary."""
+    return {"id": entry_id, "event": "message", "data": fields.get("data", "")}
+
+
+def routing_fields(data: str) -> Dict[str, str]:
+    """Extract the routing fields of an event's JSON payload as strings."""
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        return {}
+    if not isinstance(payload, dict):
+        return {}
+
+    fields = {}
+    for field in ROUTING_FIELDS:
+        value = payload.get(field)
+        if value is not None:
+            fields[field] = str(value)
+    return fields
+
+
+def _normalise(values: Optional[Iterable]) -> FrozenSet[str]:
+    """Turn optional filter values into a set of comparable strings."""
+    return frozenset(str(value) for value in values or ())
+
+
+@dataclass(frozen=True)
+class EventFilter:
+    """Which activity events a subscriber wants.
+
+    Each attribute restricts one event field; an empty set means "any".
+    An event matches when every restricted field has one of the given values.
+
+    Attributes:
+        incident_ids: Accepted values of the event's incident_id
+        types: Accepted values of the event's type
+    """
+
+    incident_ids: FrozenSet[str] = frozenset()
+    types: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def build(
+        cls,
+        incident_ids: Optional[Iterable] = None,
+        types: Optional[Iterable[str]] = None,
+    ) -> "EventFilter":
+        """Build a filter from raw query values (ints or strings)."""
+        return cls(incident_ids=_normalise(incident_ids), types=_normalise(types))
+
+    def __bool__(self) -> bool:
+        """Whether the filter restricts anything."""
+        return any(getattr(self, attr) for attr, _ in FILTER_FIELDS)
+
+    def index_keys(self) -> List[Tuple[str, str]]:
+        """The (field, value) keys this filter is indexed under in the hub."""
+        for attr, field in FILTER_FIELDS:
+            values = getattr(self, attr)
+            if values:
+                return [(field, value) for value in values]
+        return []
+
+    def matches(self, fields: Dict[str, str]) -> bool:
+        """Check an event's routing fields against the filter."""
+        for attr, field in FILTER_FIELDS:
+            values = getattr(self, attr)
+            if values and fields.get(field) not in values:
+                return False
+        return True
+
+
+def _coalesce_key(event: Dict[str, str]) -> Optional[Tuple[str, ...]]:
+    """Key under which newer activity events supersede older ones."""
+    if event.get("event") != "message":
+        return None
+    fields = routing_fields(event["data"])
+    if "type" not in fields:
+        return None
+    return (
+        fields["type"],
+        fields.get("incident_id", ""),
+        fields.get("client_id", ""),
+    )
+
+
+def batch_frame(events: List[Dict[str, str]]) -> Dict[str, str]:
+    """Combine activity events into one SSE frame.
+
+    A single event is returned unchanged. Several events become one "batch"
+    event whose data is a JSON array of their payloads and whose ID is the
+    last event's, so Last-Event-ID resumes after the whole batch.
+    """
+    if len(events) == 1:
+        return events[0]
+    return {
+        "id": events[-1]["id"],
+        "event": "batch",
+        "data": "[" + ",".join(event["data"] for event in events) + "]",
+    }
+
+
+class Subscriber:
+    """One SSE client's view of the hub: a bounded event buffer.
+
+    Attributes:
+        event_filter: Events the client wants (empty means all)
+        maxsize: Events buffered before the overflow policy applies
+        overflow: "drop_oldest", "coalesce" or "disconnect"
+        dropped: Events discarded because the client fell behind
+        closed: Set when the client was disconnected for falling behind
+    """
+
+    def __init__(
+        self,
+        event_filter: Optional[EventFilter] = None,
+        maxsize: Optional[int] = None,
+        overflow: Optional[str] = None,
+    ) -> None:
+        """Create a subscriber with an empty buffer.
+
+        Args:
+            event_filter: Events the client wants (defaults to all)
+            maxsize: Buffer size (defaults to SSE_CLIENT_QUEUE_SIZE)
+            overflow: Overflow policy (defaults to SSE_OVERFLOW_POLICY)
+        """
+        self.event_filter = event_filter or EventFilter()
+        self.maxsize = maxsize or settings.SSE_CLIENT_QUEUE_SIZE
+        self.overflow = overflow or settings.SSE_OVERFLOW_POLICY
+        self.dropped = 0
+        self.closed = False
+        self._events: Deque[Dict[str, str]] = deque()
+        self._ready = asyncio.Event()
+
+    def qsize(self) -> int:
+        """Number of buffered events."""
+        return len(self._events)
+
+    def empty(self) -> bool:
+        """Whether no events are buffered."""
+        return not self._events
+
+    def put(self, event: Dict[str, str]) -> None:
+        """Buffer an event for the client, applying the overflow policy."""
+        if self.closed:
+            return
+        if len(self._events) >= self.maxsize:
+            self._overflow(event)
+        else:
+            self._events.append(event)
+        self._ready.set()
+
+    def _overflow(self, event: Dict[str, str]) -> None:
+        """Make room for an event in a full buffer.
+
+        Dropping or coalescing events leaves a gap that Last-Event-ID cannot
+        fill, so the client is sent a single resync hint before the events
+        that survived.
+        """
+        if self.overflow == "disconnect":
+            self.dropped += len(self._events) + 1
+            self._events.clear()
+            self._events.append(RESYNC_EVENT)
+            self.closed = True
+            logger.warning(
+                f"SSE client fell {self.maxsize} events behind; disconnecting it"
+            )
+            return
+
+        previously_dropped = self.dropped
+        # A resync hint waits at the head of the buffer, outside the size
+        # limit, so the client learns about the gap before the events after it
+        resync_pending = self._events[0] is RESYNC_EVENT
+        if resync_pending:
+            self._events.popleft()
+        self._events.append(event)
+        if self.overflow == "coalesce":
+            self._coalesce()
+        while len(self._events) > self.maxsize:
+            self._events.popleft()
+            self.dropped += 1
+        if resync_pending or self.dropped > previously_dropped:
+            self._events.appendleft(RESYNC_EVENT)
+        # Warn on the first drop and then once per buffer's worth
+        if previously_dropped == 0 or (
+            previously_dropped // self.maxsize != self.dropped // self.maxsize
+        ):
+            logger.warning(
+                f"SSE client is falling behind ({self.dropped} events dropped)"
+            )
+
+    def _coalesce(self) -> None:
+        """Keep only the newest buffered event per type and incident/client."""
+        latest: Dict[Tuple[str, ...], int] = {}
+        keys = [_coalesce_key(event) for event in self._events]
+        for position, key in enumerate(keys):
+            if key is not None:
+                latest[key] = position
+        kept = deque(
+            event
+            for position, (event, key) in enumerate(
+                zip(self._events, keys, strict=True)
+            )
+            if key is None or latest[key] == position
+        )
+        self.dropped += len(self._events) - len(kept)
+        self._events = kept
+
+    def get_nowait(self) -> Optional[Dict[str, str]]:
+        """Take the next buffered event, if any."""
+        return self._events.popleft() if self._events else None
+
+    async def get(self) -> Dict[str, str]:
+        """Wait for the next event for the client."""
+        while not self._events:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._events.popleft()
+
+    async def get_many(self, max_events: int, window: float) -> List[Dict[str, str]]:
+        """Wait for the next event, then collect a burst of activity events.
+
+        Activity events arriving within `window` seconds of the first are
+        returned together (up to `max_events`). Collection stops early at any
+        other event (heartbeat, resync), which is returned last.
+
+        Args:
+            max_events: Most events to return
+            window: Seconds to keep collecting; 0 returns a single event
+        """
+        events = [await self.get()]
+        if window <= 0:
+            return events
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + window
+        while len(events) < max_events and events[-1].get("event") == "message":
+            if self._events:
+                events.append(self._events.popleft())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return events
+
+
+class ActivityHub:
+    """Fans one Redis Stream reader out to many SSE subscribers."""
+
+    def __init__(
+        self,
+        stream: str = ACTIVITY_STREAM,
+        heartbeat_interval: float = HEARTBEAT_INTERVAL,
+    ) -> None:
+        """Create an idle hub; tasks start with the first subscriber.
+
+        Args:
+            stream: Redis Stream to relay
+            heartbeat_interval: Seconds between keep-alive comments
+        """
+        self.stream = stream
+        self.heartbeat_interval = heartbeat_interval
+        self.subscribers: Set[Subscriber] = set()
+        # Routing: unfiltered subscribers get everything, filtered ones are
+        # found through their index keys
+        self._unfiltered: Set[Subscriber] = set()
+        self._index: Dict[Tuple[str, str], Set[Subscriber]] = {}
+        self._redis: Optional[redis.Redis] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    @property
+    def redis(self) -> redis.Redis:
+        """The hub's Redis client (its pool serves the reader and replays)."""
+        if self._redis is None:
+            self._redis = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        return self._redis
+
+    def subscribe(self, event_filter: Optional[EventFilter] = None) -> Subscriber:
+        """Register a new client and make sure the hub is running.
+
+        Args:
+            event_filter: Events the client wants (defaults to all)
+        """
+        subscriber = Subscriber(event_filter)
+        self.subscribers.add(subscriber)
+        if subscriber.event_filter:
+            for key in subscriber.event_filter.index_keys():
+                self._index.setdefault(key, set()).add(subscriber)
+        else:
+            self._unfiltered.add(subscriber)
+        self._ensure_started()
+        logger.info(f"SSE client subscribed ({len(self.subscribers)} connected)")
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """Remove a client from the hub."""
+        if subscriber not in self.subscribers:
+            return
+        self.subscribers.discard(subscriber)
+        self._unfiltered.discard(subscriber)
+        for key in subscriber.event_filter.index_keys():
+            indexed = self._index.get(key)
+            if indexed is not None:
+                indexed.discard(subscriber)
+                if not indexed:
+                    del self._index[key]
+        logger.info(f"SSE client unsubscribed ({len(self.subscribers)} connected)")
+
+    def broadcast(self, event: Dict[str, str]) -> None:
+        """Queue an event for every subscriber, regardless of filters."""
+        for subscriber in list(self.subscribers):
+            subscriber.put(event)
+
+    def publish(self, event: Dict[str, str]) -> None:
+        """Queue an activity event for the subscribers whose filters match."""
+        for subscriber in list(self._unfiltered):
+            subscriber.put(event)
+
+        fields = routing_fields(event["data"])
+        for key in fields.items():
+            # Each subscriber is indexed under one field, so it is seen once
+            for subscriber in list(self._index.get(key, ())):
+                if subscriber.event_filter.matches(fields):
+                    subscriber.put(event)
+
+    async def replay(
+        self, last_event_id: str, event_filter: Optional[EventFilter] = None
+    ) -> List[Dict[str, str]]:
+        """Fetch the events a reconnecting client missed.
+
+        Args:
+            last_event_id: The Last-Event-ID sent by the client
+            event_filter: Only return events matching this filter
+
+        Returns:
+            The events after last_event_id in stream order, or [RESYNC_EVENT]
+            if some of them are no longer in the stream (or there are more
+            than MAX_REPLAY). Unrecognised IDs replay nothing.
+        """
+        last = parse_stream_id(last_event_id)
+        if last is None:
+            logger.info(f"Ignoring unrecognised Last-Event-ID: {last_event_id}")
+            return []
+
+        oldest = await self.redis.xrange(self.stream, count=1)
+        if oldest and parse_stream_id(oldest[0][0]) > last:
+            # Entries after last_event_id may have been trimmed away
+            return [RESYNC_EVENT]
+
+        entries = await self.redis.xrange(
+            self.stream, min=f"({last[0]}-{last[1]}", count=MAX_REPLAY + 1
+        )
+        if len(entries) > MAX_REPLAY:
+            return [RESYNC_EVENT]
+
+        events = [format_stream_entry(entry_id, fields) for entry_id, fields in entries]
+        if event_filter:
+            events = [
+                event
+                for event in events
+                if event_filter.matches(routing_fields(event["data"]))
+            ]
+        return events
+
+    def _ensure_started(self) -> None:
+        """Start the reader and heartbeat tasks if they are not running."""
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read_loop())
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def _read_loop(self) -> None:
+        """Relay new stream entries to subscribers, retrying on errors."""
+        delay = RECONNECT_BASE_DELAY
+        cursor = None
+        while True:
+            try:
+                if cursor is None:
+                    # Start after the newest entry; keeping our own cursor
+                    # (rather than "$") means nothing is skipped on reconnect
+                    newest = await self.redis.xrevrange(self.stream, count=1)
+                    cursor = newest[0][0] if newest else "0-0"
+                    logger.info(f"SSE hub reading '{self.stream}' after {cursor}")
+
+                # XREAD BLOCK waits on the socket, so an idle stream costs no
+                # wakeups
+                response = await self.redis.xread(
+                    {self.stream: cursor}, count=READ_COUNT, block=0
+                )
+                delay = RECONNECT_BASE_DELAY
+                for _, entries in response:
+                    for entry_id, fields in entries:
+                        self.publish(format_stream_entry(entry_id, fields))
+                        cursor = entry_id
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(
+                    f"SSE hub failed to read the activity stream: {e}. "
+                    f"Retrying in {delay:.0f}s"
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _heartbeat_loop(self) -> None:
+        """Send a keep-alive comment to every subscriber periodically."""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            # Clients with events still buffered do not need a keep-alive
+            idle = [subscriber for subscriber in self.subscribers if subscriber.empty()]
+            if idle:
+                logger.debug("SSE: Sending keep-alive heartbeat")
+            for subscriber in idle:
+                subscriber.put(HEARTBEAT_EVENT)
+
+    async def close(self) -> None:
+        """Stop the hub's tasks and forget all subscribers."""
+        tasks = [task for task in (self._reader, self._heartbeat) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._reader = self._heartbeat = None
+        self.subscribers.clear()
+        self._unfiltered.clear()
+        self._index.clear()
+        if self._redis is not None:
+            try:
+                await self._redis.aclose()
+            except Exception as e:
+                logger.warning(f"SSE hub: error closing Redis client: {e}")
+            self._redis = None
+
+
+# One hub per event loop, like the database pool and HTTP clients
+_hubs: Dict[asyncio.AbstractEventLoop, ActivityHub] = {}
+
+
+def get_hub() -> ActivityHub:
+    """Get or create the activity hub for the running event loop."""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        for dead in [dead for dead in _hubs if dead.is_closed()]:
+            _hubs.pop(dead)
+        hub = _hubs[loop] = ActivityHub()
+    return hub
+
+
+async def close_hub() -> None:
+    """Close the hub bound to the running event loop, if any."""
+    hub = _hubs.pop(asyncio.get_running_loop(), None)
+    if hub is not None:
+        await hub.close()
+        logger.info("SSE hub closed")
+
+
+def _reset_after_fork() -> None:
+    """Forget hubs inherited from the parent process."""
+    _hubs.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,192 @@
+"""Non-blocking Celery enqueue for async code.
+
+``task.delay()`` publishes to the broker synchronously, so calling it from an
+``async def`` handler stalls every request on the event loop for a broker
+round trip (and for a reconnect when Redis is slow). ``enqueue`` hands the
+send to the running loop's ``TaskEnqueuer`` instead and awaits only its own
+result:
+
+* Sends are published on a worker thread, never on the event loop.
+* Sends that pile up while a publish is in flight (or within
+  TASK_ENQUEUE_BATCH_WINDOW_MS, if set) go out together, up to
+  TASK_ENQUEUE_MAX_BATCH at a time, over one producer borrowed from Celery's
+  broker connection pool.
+* Task IDs are generated up front, so a caller that is cancelled while its
+  task is being published does not lose the send.
+
+Like the database pool, enqueuers are bound to the loop that created them;
+``close_enqueuer()`` publishes anything still pending at shutdown.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from celery import Task
+
+from pi_auto_api.config import settings
+
+logger = logging.getLogger(__name__)
+
+# (task name, args, kwargs, task ID)
+Send = Tuple[str, Sequence[Any], Dict[str, Any], str]
+
+# A task (or task name) with its positional and keyword arguments
+Call = Tuple[Union[str, Task], Sequence[Any], Optional[Dict[str, Any]]]
+
+
+def _publish(batch: List[Send]) -> List[Union[str, Exception]]:
+    """Publish sends over a single pooled producer (blocking).
+
+    Returns:
+        The task ID of each send, or the exception raised while sending it.
+    """
+    # Imported here: the Celery app imports the worker runtime, which closes
+    # this module's enqueuers
+    from pi_auto_api.celery_app import app
+
+    results: List[Union[str, Exception]] = []
+    with app.producer_or_acquire() as producer:
+        for name, args, kwargs, task_id in batch:
+            try:
+                result = app.send_task(
+                    name, args=args, kwargs=kwargs, task_id=task_id, producer=producer
+                )
+                results.append(result.id)
+            except Exception as e:
+                results.append(e)
+    return results
+
+
+class TaskEnqueuer:
+    """Publishes Celery tasks off the event loop in batches."""
+
+    def __init__(self) -> None:
+        """Create an enqueuer for the running event loop."""
+        self._pending: List[Tuple[Send, asyncio.Future]] = []
+        self._drainer: Optional[asyncio.Task] = None
+
+    def submit(self, sends: Iterable[Send]) -> List[asyncio.Future]:
+        """Queue sends for publishing.
+
+        Returns:
+            A future per send, resolving to its task ID once published.
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        for send in sends:
+            future = loop.create_future()
+            self._pending.append((send, future))
+            futures.append(future)
+        if self._pending and (self._drainer is None or self._drainer.done()):
+            self._drainer = asyncio.create_task(self._drain())
+        return futures
+
+    async def _drain(self) -> None:
+        """Publish pending sends until none are left."""
+        if settings.TASK_ENQUEUE_BATCH_WINDOW_MS > 0:
+            await asyncio.sleep(settings.TASK_ENQUEUE_BATCH_WINDOW_MS / 1000)
+
+        while self._pending:
+            batch = self._pending[: settings.TASK_ENQUEUE_MAX_BATCH]
+            del self._pending[: len(batch)]
+            sends = [send for send, _ in batch]
+            try:
+                results = await asyncio.to_thread(_publish, sends)
+            except Exception as e:
+                # No producer could be acquired: fail the whole batch
+                logger.error(f"Failed to publish {len(batch)} Celery task(s): {e}")
+                results = [e] * len(batch)
+
+            for (_, future), result in zip(batch, results, strict=True):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def close(self) -> None:
+        """Wait for pending sends to be published."""
+        drainer, self._drainer = self._drainer, None
+        if drainer is not None:
+            await asyncio.gather(drainer, return_exceptions=True)
+
+
+# One enqueuer per event loop
+_enqueuers: Dict[asyncio.AbstractEventLoop, TaskEnqueuer] = {}
+
+
+def get_enqueuer() -> TaskEnqueuer:
+    """Get or create the task enqueuer for the running event loop."""
+    loop = asyncio.get_running_loop()
+    enqueuer = _enqueuers.get(loop)
+    if enqueuer is None:
+        for dead in [dead for dead in _enqueuers if dead.is_closed()]:
+            _enqueuers.pop(dead)
+        enqueuer = _enqueuers[loop] = TaskEnqueuer()
+    return enqueuer
+
+
+def _to_send(task: Union[str, Task], args: Sequence[Any], kwargs: Optional[dict]):
+    """Build a send with a fresh task ID."""
+    name = task if isinstance(task, str) else task.name
+    return (name, list(args), kwargs or {}, str(uuid.uuid4()))
+
+
+async def enqueue(task: Union[str, Task], *args: Any, **kwargs: Any) -> str:
+    """Queue a Celery task without blocking the event loop.
+
+    Async counterpart of ``task.delay(*args, **kwargs)``.
+
+    Args:
+        task: The Celery task, or its registered name
+        *args: Positional task arguments
+        **kwargs: Keyword task arguments
+
+    Returns:
+        The ID of the queued task.
+
+    Raises:
+        Exception: Whatever the broker raised if the task could not be sent
+    """
+    (future,) = get_enqueuer().submit([_to_send(task, args, kwargs)])
+    return await future
+
+
+async def enqueue_many(
+    calls: Iterable[Call], return_exceptions: bool = False
+) -> List[Union[str, BaseException]]:
+    """Queue many Celery tasks, published together in as few batches as possible.
+
+    Args:
+        calls: (task or task name, args, kwargs) for each task
+        return_exceptions: Return send errors in place of task IDs instead of
+            raising the first one (as with ``asyncio.gather``)
+
+    Returns:
+        The ID of each queued task, in the order of ``calls``.
+    """
+    futures = get_enqueuer().submit(
+        [_to_send(task, args, kwargs) for task, args, kwargs in calls]
+    )
+    return await asyncio.gather(*futures, return_exceptions=return_exceptions)
+
+
+async def close_enqueuer() -> None:
+    """Publish pending sends and drop the running loop's enqueuer."""
+    enqueuer = _enqueuers.pop(asyncio.get_running_loop(), None)
+    if enqueuer is not None:
+        await enqueuer.close()
+        logger.info("Celery task enqueuer closed")
+
+
+def _reset_after_fork() -> None:
+    """Forget enqueuers inherited from the parent process."""
+    _enqueuers.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -10,6 +10,7 @@ from . import (
     demand,
     disbursement,
     insurance_notice,
+    maintenance,
     medical_records,
     retainer,
 )
@@ -21,6 +22,7 @@ __all__ = (
     "demand",
     "disbursement",
     "insurance_notice",
+    "maintenance",
     "medical_records",
     "retainer",
 )
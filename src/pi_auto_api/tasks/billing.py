@@ -3,10 +3,8 @@
 import logging
 from typing import Any, Dict, Optional
 
-import asyncpg
-
 from pi_auto_api.celery_app import app
-from pi_auto_api.config import settings
+from pi_auto_api.db_pool import acquire
 
 from .damages import (
     build_damages_worksheet,  # Corrected to relative import
@@ -34,7 +32,6 @@ async def process_medical_bill(
     Returns:
         A dictionary containing the ID of the created doc row and worksheet status.
     """
-    conn = None
     doc_id = None
     worksheet_task_id: Optional[str] = None  # Ensure it is Optional[str]
 
@@ -66,8 +63,6 @@ async def process_medical_bill(
             parsed_amount = 0.0  # Default on error
 
     try:
-        conn = await asyncpg.connect(settings.SUPABASE_URL)
-
         # 2. Insert 'medical_bill' doc row
         insert_query = """
         INSERT INTO doc (
@@ -76,13 +71,14 @@ async def process_medical_bill(
         VALUES ($1, $2, 'medical_bill', $3, 'received', $4, NOW())
         RETURNING id
         """
-        doc_id = await conn.fetchval(
-            insert_query,
-            incident_id,
-            provider_id,
-            document_url,
-            parsed_amount,
-        )
+        async with acquire() as conn:
+            doc_id = await conn.fetchval(
+                insert_query,
+                incident_id,
+                provider_id,
+                document_url,
+                parsed_amount,
+            )
         logger.info(f"Created medical_bill doc row with ID: {doc_id}")
 
         # 3. Trigger damages worksheet build
@@ -112,6 +108,3 @@ async def process_medical_bill(
             "amount_recorded": parsed_amount,
             "worksheet_task_id": worksheet_task_id,
         }
-    finally:
-        if conn:
-            await conn.close()
@@ -1,80 +1,474 @@
 """Celery tasks for assembling and managing demand packages."""
 
+import asyncio
+import hashlib
 import logging
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Optional
-
-import asyncpg
-
+from typing import (
+    Any,
+    Awaitable,
+    BinaryIO,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Union,
+)
+
+from pi_auto_api import cpu_pool
 from pi_auto_api.celery_app import app
 from pi_auto_api.config import settings
-from pi_auto_api.utils.package_rules import is_demand_ready
-from pi_auto_api.utils.pdf_merge import merge_pdfs
-from pi_auto_api.utils.storage import get_file_content, upload_file
+from pi_auto_api.db_pool import acquire
+from pi_auto_api.utils.package_rules import get_demand_readiness, is_demand_ready
+from pi_auto_api.utils.pdf_merge import PdfPages, merge_pdfs_to
+from pi_auto_api.utils.pdf_stamp import BatesStamper
+from pi_auto_api.utils.storage import get_file_etag, open_file, upload_file
 
 logger = logging.getLogger(__name__)
 
+# Exhibit documents of an incident, in package order
+DEMAND_DOCS_QUERY = """
+SELECT id, type FROM doc
+WHERE incident_id = $1
+AND type IN (
+    'medical_records', 'medical_bill',
+    'damages_worksheet_pdf', 'liability_photo'
+)
+ORDER BY
+    CASE
+        WHEN type = 'damages_worksheet_pdf' THEN 1
+        WHEN type = 'liability_photo' THEN 2
+        WHEN type = 'medical_records' THEN 3
+        WHEN type = 'medical_bill' THEN 4
+        ELSE 5
+    END;
+"""
+
+# Exhibits of the most recent demand package of an incident, in package order
+PREVIOUS_MANIFEST_QUERY = """
+SELECT package_id, position, doc_id, etag, sha256, page_start, page_count
+FROM demand_package_exhibit
+WHERE package_id = (
+    SELECT id FROM doc
+    WHERE incident_id = $1 AND type = 'demand_package'
+    ORDER BY created_at DESC, id DESC
+    LIMIT 1
+)
+ORDER BY position;
+"""
+
+# Incidents whose latest demand package no longer matches their exhibit docs,
+# by an anti-join in each direction: an exhibit doc is missing from the
+# manifest (for packages built before manifests were recorded, one added after
+# the package), or a manifest row's doc is no longer an exhibit doc (deleted
+# docs leave their rows with a NULL doc_id)
+STALE_PACKAGES_QUERY = """
+WITH latest AS (
+    SELECT DISTINCT ON (incident_id)
+        incident_id,
+        id AS package_id,
+        created_at,
+        EXISTS (
+            SELECT 1 FROM demand_package_exhibit e WHERE e.package_id = doc.id
+        ) AS has_manifest
+    FROM doc
+    WHERE type = 'demand_package'
+    ORDER BY incident_id, created_at DESC, id DESC
+)
+SELECT l.incident_id, l.package_id
+FROM latest l
+WHERE EXISTS (
+    SELECT 1 FROM doc d
+    WHERE d.incident_id = l.incident_id
+    AND d.type IN (
+        'medical_records', 'medical_bill',
+        'damages_worksheet_pdf', 'liability_photo'
+    )
+    AND (l.has_manifest OR d.created_at > l.created_at)
+    AND NOT EXISTS (
+        SELECT 1 FROM demand_package_exhibit e
+        WHERE e.package_id = l.package_id AND e.doc_id = d.id
+    )
+)
+OR EXISTS (
+    SELECT 1 FROM demand_package_exhibit e
+    WHERE e.package_id = l.package_id
+    AND NOT EXISTS (
+        SELECT 1 FROM doc d
+        WHERE d.id = e.doc_id
+        AND d.incident_id = l.incident_id
+        AND d.type IN (
+            'medical_records', 'medical_bill',
+            'damages_worksheet_pdf', 'liability_photo'
+        )
+    )
+)
+ORDER BY l.incident_id;
+"""
+
+INSERT_MANIFEST_QUERY = """
+INSERT INTO demand_package_exhibit (
+    package_id, position, doc_id, etag, sha256, page_start, page_count
+)
+VALUES ($1, $2, $3, $4, $5, $6, $7);
+"""
+
+# Size of the chunks read when hashing exhibit content
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class _Exhibit:
+    """One exhibit of the package being built.
+
+    Attributes:
+        doc_id: ID of the exhibit document
+        etag: Storage ETag of the exhibit when the build started
+        sha256: Hash of the exhibit content
+        content: The downloaded exhibit, if it had to be downloaded
+        reused: Manifest row of the previous package whose pages are reused
+    """
+
+    doc_id: Any
+    etag: Optional[str] = None
+    sha256: Optional[str] = None
+    content: Optional[BinaryIO] = None
+    reused: Optional[Mapping[str, Any]] = None
+
+
+async def _gather_limited(coros: Iterable[Awaitable]) -> List[Any]:
+    """Await coroutines at most DEMAND_DOWNLOAD_CONCURRENCY at a time.
+
+    Returns:
+        The results in order, with exceptions returned in place.
+    """
+    semaphore = asyncio.Semaphore(settings.DEMAND_DOWNLOAD_CONCURRENCY)
+
+    async def _run(coro: Awaitable) -> Any:
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(_run(coro) for coro in coros), return_exceptions=True)
+
+
+async def _open_exhibits(doc_ids: List[str]) -> List[Optional[BinaryIO]]:
+    """Download exhibits concurrently, at most DEMAND_DOWNLOAD_CONCURRENCY at once.
+
+    Args:
+        doc_ids: IDs of the exhibit documents, in package order.
+
+    Returns:
+        An open file per document, in the same order (None where the
+        document could not be retrieved). The caller closes them.
+    """
+    results = await _gather_limited(open_file(doc_id) for doc_id in doc_ids)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        for result in results:
+            if result is not None and not isinstance(result, BaseException):
+                result.close()
+        raise errors[0]
+    return results
+
+
+def _file_sha256(fileobj: BinaryIO) -> str:
+    """Hash a file from the start, leaving it rewound."""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    while chunk := fileobj.read(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+async def _download(exhibits: List[_Exhibit], previous: Mapping[Any, Mapping]) -> None:
+    """Download exhibits, reusing previous pages when the content is unchanged."""
+    files = await _open_exhibits([exhibit.doc_id for exhibit in exhibits])
+    for exhibit, content in zip(exhibits, files, strict=True):
+        if content is None:
+            continue
+        exhibit.sha256 = await asyncio.to_thread(_file_sha256, content)
+        reusable = previous.get(exhibit.doc_id)
+        if reusable is not None and reusable["sha256"] == exhibit.sha256:
+            # Re-uploaded with identical content: keep the merged pages
+            content.close()
+            exhibit.reused = reusable
+        else:
+            exhibit.content = content
+
+
+async def _collect_exhibits(
+    doc_ids: List[Any], manifest: List[Mapping[str, Any]]
+) -> List[_Exhibit]:
+    """Work out which exhibits changed since the previous package and fetch them.
+
+    An exhibit is reused from the previous package when its ETag, or failing
+    that the hash of its downloaded content, matches the manifest.
+
+    Args:
+        doc_ids: IDs of the exhibit documents, in package order
+        manifest: Exhibits of the previous package (empty for a full build)
+
+    Returns:
+        The exhibits, with downloaded content the caller closes.
+    """
+    exhibits = [_Exhibit(doc_id) for doc_id in doc_ids]
+    etags = await _gather_limited(get_file_etag(doc_id) for doc_id in doc_ids)
+    previous = {row["doc_id"]: row for row in manifest}
+    for exhibit, etag in zip(exhibits, etags, strict=True):
+        if isinstance(etag, BaseException):
+            continue
+        exhibit.etag = etag
+        reusable = previous.get(exhibit.doc_id)
+        if etag and reusable is not None and reusable["etag"] == etag:
+            exhibit.reused = reusable
+            exhibit.sha256 = reusable["sha256"]
+
+    await _download([e for e in exhibits if e.reused is None], previous)
+    return exhibits
+
+
+async def _open_previous_package(
+    exhibits: List[_Exhibit], manifest: List[Mapping[str, Any]]
+) -> Optional[BinaryIO]:
+    """Open the previous package, or download the reused exhibits instead.
+
+    Returns:
+        The previous package opened for reading, or None when no pages are
+        reused from it. The caller closes it.
+    """
+    reused = [exhibit for exhibit in exhibits if exhibit.reused]
+    if not reused:
+        return None
+    package_id = manifest[0]["package_id"]
+    package = await open_file(package_id)
+    if package is None:
+        logger.warning(
+            f"Previous demand package {package_id} is unavailable; "
+            "downloading every exhibit"
+        )
+        for exhibit in reused:
+            exhibit.reused = None
+        await _download(reused, {})
+    return package
+
+
+def _available(exhibits: List[_Exhibit]) -> List[_Exhibit]:
+    """Drop (and log) exhibits that could not be retrieved."""
+    available = []
+    for exhibit in exhibits:
+        if exhibit.content is None and exhibit.reused is None:
+            logger.error(f"Could not retrieve content for document {exhibit.doc_id}")
+        else:
+            available.append(exhibit)
+    return available
+
+
+def _close_exhibits(exhibits: List[_Exhibit], package: Optional[BinaryIO]) -> None:
+    """Close downloaded exhibits and the previous package."""
+    for exhibit in exhibits:
+        if exhibit.content is not None:
+            exhibit.content.close()
+    if package is not None:
+        package.close()
+
+
+def _stamper(incident_id: int, exhibit_count: int) -> Optional[BatesStamper]:
+    """Stamper numbering and labelling the pages of a demand package."""
+    if not settings.DEMAND_STAMP_ENABLED:
+        return None
+    return BatesStamper(
+        prefix=settings.DEMAND_BATES_PREFIX.format(incident_id=incident_id),
+        digits=settings.DEMAND_BATES_DIGITS,
+        header=f"Demand Package - Incident {incident_id}",
+        labels=[f"Exhibit {number}" for number in range(1, exhibit_count + 1)],
+    )
+
+
+def _link_or_copy(fileobj: BinaryIO, path: str) -> None:
+    """Make an open exhibit readable at ``path`` by a CPU worker process.
+
+    Files from the storage cache are hard-linked, so evicting them cannot pull
+    them out from under the merge; anything else (in-memory downloads, or a
+    cache on another filesystem) is copied.
+    """
+    name = getattr(fileobj, "name", None)
+    if isinstance(name, str):
+        try:
+            os.link(name, path)
+            return
+        except OSError:
+            pass
+    fileobj.seek(0)
+    with open(path, "wb") as copy:
+        shutil.copyfileobj(fileobj, copy, HASH_CHUNK_SIZE)
+    fileobj.seek(0)
+
+
+def _stage_exhibits(
+    exhibits: List[_Exhibit], package: Optional[BinaryIO], workdir: str
+) -> List[Union[str, PdfPages]]:
+    """Put the merge sources in ``workdir`` as files, in package order.
+
+    Returns:
+        A path per exhibit, or a ``PdfPages`` range of the previous package
+        for reused exhibits.
+    """
+    package_path = None
+    if package is not None:
+        package_path = os.path.join(workdir, "previous.pdf")
+        _link_or_copy(package, package_path)
+
+    sources: List[Union[str, PdfPages]] = []
+    for position, exhibit in enumerate(exhibits):
+        if exhibit.reused:
+            start = exhibit.reused["page_start"]
+            sources.append(
+                PdfPages(package_path, start, start + exhibit.reused["page_count"])
+            )
+        else:
+            path = os.path.join(workdir, f"exhibit-{position}.pdf")
+            _link_or_copy(exhibit.content, path)
+            sources.append(path)
+    return sources
+
+
+def _merge_exhibits(
+    sources: List[Union[str, PdfPages]],
+    output_path: str,
+    stamper: Optional[BatesStamper] = None,
+) -> List[int]:
+    """Merge staged exhibits into a package file (runs in the CPU worker pool).
+
+    Pages reused from the previous package carry its stamps; the stamper
+    replaces them, so Bates numbers and labels stay consecutive when exhibits
+    are added or removed.
+
+    Returns:
+        The page count of each exhibit.
+    """
+    with open(output_path, "wb") as output:
+        return merge_pdfs_to(sources, output, destination="storage", stamper=stamper)
+
+
+async def _record_manifest(
+    package_id: Any, exhibits: List[_Exhibit], page_counts: List[int]
+) -> None:
+    """Store which exhibit versions went into a package and where."""
+    rows = []
+    page_start = 0
+    for position, (exhibit, page_count) in enumerate(
+        zip(exhibits, page_counts, strict=True)
+    ):
+        rows.append(
+            (
+                package_id,
+                position,
+                exhibit.doc_id,
+                exhibit.etag,
+                exhibit.sha256,
+                page_start,
+                page_count,
+            )
+        )
+        page_start += page_count
+    try:
+        async with acquire() as conn:
+            await conn.executemany(INSERT_MANIFEST_QUERY, rows)
+    except Exception as e:
+        # The package is usable; the next rebuild is just a full one
+        logger.warning(f"Failed to record exhibits of demand package {package_id}: {e}")
+
 
 @app.task(name="assemble_demand_package")
-async def assemble_demand_package(incident_id: int) -> Optional[str]:
+async def assemble_demand_package(
+    incident_id: int, readiness_checked: bool = False, incremental: bool = True
+) -> Optional[str]:
     """Assemble demand package for a given incident.
 
+    Each package records the version (ETag and content hash) and page range of
+    every exhibit. With ``incremental`` set, a new package reuses the pages of
+    unchanged exhibits from the incident's previous package and only
+    downloads and merges new or changed ones, keeping exhibit order. If no
+    exhibit changed, the previous package is returned as is.
+
     Args:
         incident_id: The ID of the incident to build the demand package for.
+        readiness_checked: Skip the readiness check when the caller has
+            already evaluated it (e.g. the nightly bulk check).
+        incremental: Reuse the previous package where possible instead of
+            rebuilding every exhibit from scratch.
 
     Returns:
         The ID of the newly created demand package document, or None if failed.
     """
-    conn = None
     try:
         # Double-check the incident is ready for demand package
-        if not await is_demand_ready(incident_id):
+        if not readiness_checked and not await is_demand_ready(incident_id):
             logger.info(
                 f"Incident {incident_id} is not ready for demand package assembly"
             )
             return None
 
-        conn = await asyncpg.connect(settings.SUPABASE_URL)
-
         # Fetch all document IDs needed for the package
-        query = """
-        SELECT id, type FROM doc
-        WHERE incident_id = $1
-        AND type IN (
-            'medical_records', 'medical_bill',
-            'damages_worksheet_pdf', 'liability_photo'
-        )
-        ORDER BY
-            CASE
-                WHEN type = 'damages_worksheet_pdf' THEN 1
-                WHEN type = 'liability_photo' THEN 2
-                WHEN type = 'medical_records' THEN 3
-                WHEN type = 'medical_bill' THEN 4
-                ELSE 5
-            END;
-        """
-        rows = await conn.fetch(query, incident_id)
+        async with acquire() as conn:
+            rows = await conn.fetch(DEMAND_DOCS_QUERY, incident_id)
 
         if not rows:
             logger.error(f"No documents found for incident {incident_id}")
             return None
 
-        # Get the content of each document
-        doc_contents: List[bytes] = []
-        for row in rows:
-            doc_id = row["id"]
-            content = await get_file_content(doc_id)
-            if content:
-                doc_contents.append(content)
-            else:
-                logger.error(f"Could not retrieve content for document {doc_id}")
-
-        if not doc_contents:
-            logger.error(f"No contents for incident {incident_id} could be retrieved")
-            return None
-
-        # Merge all PDFs into one demand package
-        merged_pdf = merge_pdfs(doc_contents)
+        manifest = []
+        if incremental:
+            async with acquire() as conn:
+                manifest = await conn.fetch(PREVIOUS_MANIFEST_QUERY, incident_id)
+
+        # Download new and changed exhibits concurrently (repeat downloads hit
+        # the storage cache); unchanged ones are reused from the last package
+        exhibits = await _collect_exhibits([row["id"] for row in rows], manifest)
+        package = None
+        try:
+            exhibits = _available(exhibits)
+            if not exhibits:
+                logger.error(
+                    f"No contents for incident {incident_id} could be retrieved"
+                )
+                return None
+
+            if manifest and [(e.doc_id, e.sha256) for e in exhibits] == [
+                (row["doc_id"], row["sha256"]) for row in manifest
+            ]:
+                logger.info(
+                    f"Demand package {manifest[0]['package_id']} for incident "
+                    f"{incident_id} is up to date"
+                )
+                return manifest[0]["package_id"]
+
+            package = await _open_previous_package(exhibits, manifest)
+            exhibits = _available(exhibits)
+
+            # Merge into one demand package in the CPU worker pool, copying
+            # reused page ranges and stamping every page on the way. Workers
+            # take paths, not open files, so the sources are staged first.
+            with tempfile.TemporaryDirectory(dir=settings.PDF_SPOOL_DIR) as workdir:
+                sources = await asyncio.to_thread(
+                    _stage_exhibits, exhibits, package, workdir
+                )
+                output_path = os.path.join(workdir, "package.pdf")
+                page_counts = await cpu_pool.run_cpu(
+                    _merge_exhibits,
+                    sources,
+                    output_path,
+                    _stamper(incident_id, len(exhibits)),
+                )
+                # Still readable once the directory is removed
+                merged_pdf = open(output_path, "rb")
+        finally:
+            _close_exhibits(exhibits, package)
 
         # Create new demand package document in the database
         insert_query = """
@@ -86,21 +480,26 @@ async def assemble_demand_package(incident_id: int) -> Optional[str]:
         timestamp = datetime.now().strftime("%Y-%m-%d")
         doc_name = f"Demand Package - {timestamp}"
 
-        demand_package_id = await conn.fetchval(
-            insert_query, incident_id, doc_name, datetime.now()
-        )
+        with merged_pdf:
+            async with acquire() as conn:
+                demand_package_id = await conn.fetchval(
+                    insert_query, incident_id, doc_name, datetime.now()
+                )
 
-        # Upload the merged PDF to storage
-        upload_success = await upload_file(
-            demand_package_id, merged_pdf, "application/pdf"
-        )
+            # Stream the merged PDF to storage
+            upload_success = await upload_file(
+                demand_package_id, merged_pdf, "application/pdf"
+            )
 
         if not upload_success:
             logger.error(f"Failed to upload demand package for incident {incident_id}")
             # Delete the document record if upload failed
-            await conn.execute("DELETE FROM doc WHERE id = $1", demand_package_id)
+            async with acquire() as conn:
+                await conn.execute("DELETE FROM doc WHERE id = $1", demand_package_id)
             return None
 
+        await _record_manifest(demand_package_id, exhibits, page_counts)
+
         logger.info(
             f"Demand package {demand_package_id} created for incident {incident_id}"
         )
@@ -112,60 +511,78 @@ async def assemble_demand_package(incident_id: int) -> Optional[str]:
             exc_info=True,
         )
         return None
-    finally:
-        if conn:
-            await conn.close()
+
+
+async def _rebuild_stale_packages() -> int:
+    """Rebuild the demand packages whose exhibit docs changed since they were built.
+
+    Returns:
+        Number of new package versions created.
+    """
+    async with acquire() as conn:
+        stale = await conn.fetch(STALE_PACKAGES_QUERY)
+    if not stale:
+        return 0
+
+    logger.info(f"{len(stale)} demand packages have new or removed exhibits")
+    rebuilt = 0
+    for row in stale:
+        incident_id = row["incident_id"]
+        logger.info(f"Rebuilding demand package for incident {incident_id}")
+        # The incident has a package, so the readiness rules would reject it
+        package_id = await assemble_demand_package(incident_id, readiness_checked=True)
+        if package_id and package_id != row["package_id"]:
+            rebuilt += 1
+    return rebuilt
 
 
 @app.task(name="check_and_build_demand")
 async def check_and_build_demand() -> int:
-    """Check all incidents and build demand packages for eligible ones.
+    """Check all incidents and build or rebuild their demand packages.
 
-    This task runs nightly to check all incidents that don't have demand packages
-    and builds packages for those that meet the criteria.
+    This task runs nightly. With DEMAND_REBUILD_STALE set, it first rebuilds
+    (incrementally) the packages whose exhibit docs were added or deleted
+    since they were built. It then builds packages for the incidents without
+    one that meet the criteria. Exhibits replaced in Storage under the same
+    doc only show up in a rebuild requested with assemble_demand_package.
 
     Returns:
-        Number of demand packages successfully created.
+        Number of demand packages successfully created or rebuilt.
     """
-    conn = None
     try:
-        conn = await asyncpg.connect(settings.SUPABASE_URL)
-
-        # Get all incident IDs without demand packages
-        query = """
-        SELECT DISTINCT i.id
-        FROM incident i
-        WHERE NOT EXISTS (
-            SELECT 1 FROM doc d
-            WHERE d.incident_id = i.id AND d.type = 'demand_package'
-        );
-        """
+        rebuilt = 0
+        if settings.DEMAND_REBUILD_STALE:
+            rebuilt = await _rebuild_stale_packages()
+            logger.info(f"Rebuilt {rebuilt} demand packages in this run")
 
-        incident_ids = [row["id"] for row in await conn.fetch(query)]
+        # Evaluate every incident without a demand package in one query
+        readiness = await get_demand_readiness()
 
-        if not incident_ids:
+        checked = len(readiness.ready) + len(readiness.missing)
+        if not checked:
             logger.info("No incidents found that need demand packages")
-            return 0
+            return rebuilt
 
         logger.info(
-            f"Checking {len(incident_ids)} incidents for demand package eligibility"
+            f"{len(readiness.ready)} of {checked} incidents are eligible "
+            "for a demand package"
         )
+        for incident_id, reasons in readiness.missing.items():
+            logger.debug(f"Incident {incident_id} not ready: {'; '.join(reasons)}")
 
-        # Check each incident and build package if ready
+        # Build packages for the ready incidents
         packages_created = 0
-        for incident_id in incident_ids:
-            if await is_demand_ready(incident_id):
-                logger.info(f"Building demand package for incident {incident_id}")
-                package_id = await assemble_demand_package(incident_id)
-                if package_id:
-                    packages_created += 1
+        for incident_id in readiness.ready:
+            logger.info(f"Building demand package for incident {incident_id}")
+            package_id = await assemble_demand_package(
+                incident_id, readiness_checked=True
+            )
+            if package_id:
+                packages_created += 1
 
         logger.info(f"Created {packages_created} demand packages in this run")
-        return packages_created
+        return packages_created + rebuilt
 
     except Exception as e:
         logger.error(f"Error in check_and_build_demand task: {e}", exc_info=True)
         return 0
-    finally:
-        if conn:
-            await conn.close()
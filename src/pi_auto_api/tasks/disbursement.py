@@ -4,11 +4,9 @@ import logging
 from datetime import datetime
 from typing import Optional
 
-import asyncpg
-
+from pi_auto_api import outbox
 from pi_auto_api.celery_app import app
-from pi_auto_api.config import settings
-from pi_auto_api.events import record_event
+from pi_auto_api.db_pool import acquire
 from pi_auto_api.externals.docassemble import generate_letter
 from pi_auto_api.externals.docusign import send_envelope
 from pi_auto_api.utils.disbursement_calc import calc_split
@@ -26,10 +24,7 @@ async def generate_disbursement_sheet(incident_id: int) -> Optional[str]:
     Returns:
         The DocuSign envelope ID if successful, None otherwise.
     """
-    conn = None
     try:
-        conn = await asyncpg.connect(settings.SUPABASE_URL)
-
         # Fetch incident and client details
         query = """
         SELECT
@@ -45,7 +40,8 @@ async def generate_disbursement_sheet(incident_id: int) -> Optional[str]:
         JOIN client c ON i.client_id = c.id
         WHERE i.id = $1
         """
-        row = await conn.fetchrow(query, incident_id)
+        async with acquire() as conn:
+            row = await conn.fetchrow(query, incident_id)
 
         if not row or not row["settlement_amount"]:
             logger.error(
@@ -109,8 +105,6 @@ async def generate_disbursement_sheet(incident_id: int) -> Optional[str]:
         SET disbursement_status = 'sent'
         WHERE id = $1
         """
-        await conn.execute(update_query, incident_id)
-
         # Insert a new document record
         doc_query = """
         INSERT INTO doc (incident_id, type, url, status, created_at)
@@ -118,23 +112,30 @@ async def generate_disbursement_sheet(incident_id: int) -> Optional[str]:
         RETURNING id
         """
         doc_url = f"envelope:{envelope_id}"
-        doc_id = await conn.fetchval(doc_query, incident_id, doc_url, datetime.now())
+        # Update status, store the doc and record the event atomically; the
+        # outbox relay publishes the event once the transaction commits
+        async with acquire() as conn, conn.transaction():
+            await conn.execute(update_query, incident_id)
+            doc_id = await conn.fetchval(
+                doc_query, incident_id, doc_url, datetime.now()
+            )
+            await outbox.enqueue_event(
+                conn,
+                {
+                    "type": "disbursement_sent",
+                    "incident_id": incident_id,
+                    "client_id": row["client_id"],
+                    "envelope_id": envelope_id,
+                    "doc_id": doc_id,
+                },
+            )
+        outbox.wake_relay()
 
         logger.info(
             f"Disbursement sheet generated and sent for incident {incident_id}, "
             f"envelope_id: {envelope_id}, doc_id: {doc_id}"
         )
 
-        # Record event after successful generation and sending
-        await record_event(
-            {
-                "type": "disbursement_sent",
-                "incident_id": incident_id,
-                "envelope_id": envelope_id,
-                "doc_id": doc_id,
-            }
-        )
-
         return envelope_id
 
     except Exception as e:
@@ -143,6 +144,3 @@ async def generate_disbursement_sheet(incident_id: int) -> Optional[str]:
             exc_info=True,
         )
         return None
-    finally:
-        if conn:
-            await conn.close()
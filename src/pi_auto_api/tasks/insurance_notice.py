@@ -1,7 +1,7 @@
 """Tasks for sending Letter of Representation to insurance carriers."""
 
-import asyncio
 import logging
+from typing import Any, Dict, List, Tuple
 
 # from pi_auto_api.config import settings # Unused
 from pi_auto_api.celery_app import app  # Corrected import
@@ -9,12 +9,57 @@ from pi_auto_api.db import get_insurance_payload
 
 # from pi_auto_api.db import get_insurance_payload_for_lor # Unused
 from pi_auto_api.externals.docassemble import generate_letter
-from pi_auto_api.externals.sendgrid_client import send_mail
+from pi_auto_api.externals.sendgrid_client import BatchSendError, send_mail_batch
 from pi_auto_api.externals.twilio_client import send_fax
+from pi_auto_api.worker_runtime import run_async
 
 logger = logging.getLogger(__name__)
 
 
+async def _email_adjusters(
+    adjuster_emails: List[Tuple[str, str]], client: dict
+) -> List[Dict[str, Any]]:
+    """Email the LOR notice to adjusters and report each one's outcome.
+
+    Args:
+        adjuster_emails: (carrier, email) of every adjuster
+        client: Client section of the insurance payload
+
+    Returns:
+        One result per adjuster, "sent" with its message ID or "failed".
+    """
+    error = None
+    try:
+        message_ids = await send_mail_batch(
+            # This would be a specific LOR template
+            template_name="retainer_sent.html",
+            to_emails=[email for _, email in adjuster_emails],
+            template_ctx={
+                "client": client,
+                "support_email": "support@piautolaw.com",
+                "support_phone": "(555) 123-4567",
+            },
+        )
+        logger.info(f"Email sent successfully to {len(adjuster_emails)} adjusters")
+    except BatchSendError as e:
+        # Adjusters in the requests that went through were emailed; only the
+        # others are reported as failed
+        logger.error(f"Error sending email to adjusters: {e.detail}")
+        message_ids, error = e.message_ids, e.detail
+    except Exception as e:
+        logger.error(f"Error sending email to adjusters: {str(e)}")
+        message_ids, error = [None] * len(adjuster_emails), str(e)
+
+    results = []
+    for (carrier, email), message_id in zip(adjuster_emails, message_ids, strict=True):
+        if message_id is None:
+            outcome = {"status": "failed", "error": error}
+        else:
+            outcome = {"status": "sent", "message_id": message_id}
+        results.append({"carrier": carrier, "email": email, **outcome})
+    return results
+
+
 async def _run_insurance_notice_flow(client_id: int):
     """Helper async function containing the LOR generation and distribution logic.
 
@@ -75,6 +120,7 @@ async def _run_insurance_notice_flow(client_id: int):
             )
 
     # 4. Process adverse insurance carriers
+    adjuster_emails = []
     for insurance in payload.get("adverse_insurance", []):
         carrier = insurance.get("carrier_name")
         if not carrier:
@@ -105,37 +151,7 @@ async def _run_insurance_notice_flow(client_id: int):
             mock_adjuster_email = (
                 "adjuster@example.com"  # This would come from the database
             )
-
-            try:
-                message_id = await send_mail(
-                    # This would be a specific LOR template
-                    template_name="retainer_sent.html",
-                    to_email=mock_adjuster_email,
-                    template_ctx={
-                        "client": payload["client"],
-                        "support_email": "support@piautolaw.com",
-                        "support_phone": "(555) 123-4567",
-                    },
-                )
-                results["emails_sent"].append(
-                    {
-                        "carrier": carrier,
-                        "email": mock_adjuster_email,
-                        "status": "sent",
-                        "message_id": message_id,
-                    }
-                )
-                logger.info(f"Email sent successfully to adjuster at {carrier}")
-            except Exception as e:
-                logger.error(f"Error sending email to adjuster: {str(e)}")
-                results["emails_sent"].append(
-                    {
-                        "carrier": carrier,
-                        "email": mock_adjuster_email,
-                        "status": "failed",
-                        "error": str(e),
-                    }
-                )
+            adjuster_emails.append((carrier, mock_adjuster_email))
         except Exception as e:
             logger.error(f"Error sending fax to adverse carrier: {str(e)}")
             results["faxes_sent"].append(
@@ -147,7 +163,13 @@ async def _run_insurance_notice_flow(client_id: int):
                 }
             )
 
-    # 5. TODO: Update database task status here (e.g., mark LOR as sent)
+    # 5. Email every adjuster in one SendGrid request
+    if adjuster_emails:
+        results["emails_sent"] = await _email_adjusters(
+            adjuster_emails, payload["client"]
+        )
+
+    # 6. TODO: Update database task status here (e.g., mark LOR as sent)
 
     return results
 
@@ -171,8 +193,8 @@ def send_insurance_notice(self, client_id: int):
     """
     logger.info(f"Starting insurance notice for client_id: {client_id}")
     try:
-        # Always run the async helper in a new event loop for the task context
-        result = asyncio.run(_run_insurance_notice_flow(client_id))
+        # Run the async helper on the worker's persistent event loop
+        result = run_async(_run_insurance_notice_flow(client_id))
         return result
     except Exception as exc:
         logger.error(
@@ -0,0 +1,20 @@
+"""Housekeeping tasks for cached and temporary data."""
+
+import logging
+
+from pi_auto_api.celery_app import app
+from pi_auto_api.utils import doc_cache
+
+logger = logging.getLogger(__name__)
+
+
+@app.task(name="purge_doc_cache")
+async def purge_doc_cache() -> int:
+    """Delete expired generated documents from the Supabase Storage cache.
+
+    Returns:
+        Number of cached documents deleted.
+    """
+    deleted = await doc_cache.purge_storage()
+    logger.info(f"Document cache purge removed {deleted} blobs")
+    return deleted
@@ -1,121 +1,229 @@
 """Task for sending medical record requests to healthcare providers."""
 
-from typing import Dict
+import asyncio
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
 
-import asyncpg
 from celery.utils.log import get_task_logger
 
+from pi_auto_api import cpu_pool
 from pi_auto_api.celery_app import app
 from pi_auto_api.config import settings
-from pi_auto_api.db import get_provider_payload
+from pi_auto_api.db import get_provider_payloads
+from pi_auto_api.db_pool import acquire
 from pi_auto_api.externals.docassemble import generate_letter
 from pi_auto_api.externals.twilio_client import send_fax
+from pi_auto_api.utils.pdf_optimize import optimize_pdf_bytes
 from pi_auto_api.utils.storage import upload_to_bucket
 
 # Use the Celery logger for tasks
 logger = get_task_logger(__name__)
 
+PENDING_PROVIDERS_QUERY = """
+SELECT
+    i.id AS incident_id,
+    p.id AS provider_id,
+    p.name AS provider_name,
+    p.fax AS provider_fax
+FROM incident i
+JOIN provider p ON p.incident_id = i.id
+WHERE p.status <> 'records_received'
+AND NOT EXISTS (
+    SELECT 1 FROM document d
+    WHERE d.provider_id = p.id
+    AND d.type = 'records_request_sent'
+)
+"""
+
+RECORD_REQUEST_QUERY = """
+INSERT INTO document (
+    incident_id, provider_id, type, url, status,
+    external_id, created_at
+)
+VALUES ($1, $2, $3, $4, $5, $6, NOW())
+"""
+
+
+@dataclass
+class RunSummary:
+    """Throughput, latency and failure accounting for one run of the job.
+
+    Attributes:
+        total: Number of pending providers picked up by the run
+        queued: Number of faxes sent and recorded
+        failures: Failure count keyed by the stage that failed
+        stage_latencies: Per-stage durations in seconds, one entry per provider
+        elapsed: Wall-clock duration of the whole run in seconds
+    """
+
+    total: int = 0
+    queued: int = 0
+    failures: Counter = field(default_factory=Counter)
+    stage_latencies: Dict[str, List[float]] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Record how long one provider spent in a stage."""
+        self.stage_latencies.setdefault(stage, []).append(seconds)
+
+    def log(self) -> None:
+        """Log the run summary."""
+        rate = self.total / self.elapsed if self.elapsed else 0.0
+        latencies = ", ".join(
+            f"{stage}: avg {sum(values) / len(values):.2f}s max {max(values):.2f}s"
+            for stage, values in self.stage_latencies.items()
+        )
+        failed = ", ".join(f"{stage}={n}" for stage, n in self.failures.items())
+        logger.info(
+            f"Medical records run: {self.queued}/{self.total} queued, "
+            f"{sum(self.failures.values())} failed ({failed or 'none'}) "
+            f"in {self.elapsed:.1f}s ({rate:.2f} providers/s); "
+            f"stage latency: {latencies or 'n/a'}"
+        )
+
+
+class _Pipeline:
+    """Process pending providers through bounded render/upload/fax stages.
+
+    Each provider flows through the stages independently, so one provider
+    can be faxing while others are still rendering; a semaphore per stage
+    caps how many providers are inside that stage at any one time.
+    """
+
+    def __init__(self, summary: RunSummary) -> None:
+        self.summary = summary
+        self.stages = {
+            "render": asyncio.Semaphore(settings.MEDICAL_RECORDS_RENDER_CONCURRENCY),
+            "upload": asyncio.Semaphore(settings.MEDICAL_RECORDS_UPLOAD_CONCURRENCY),
+            "fax": asyncio.Semaphore(settings.MEDICAL_RECORDS_FAX_CONCURRENCY),
+        }
+
+    async def _stage(self, name: str, coro):
+        """Run one stage under its concurrency limit and time it."""
+        async with self.stages[name]:
+            started = time.perf_counter()
+            try:
+                return await coro
+            finally:
+                self.summary.observe(name, time.perf_counter() - started)
+
+    async def process(self, provider, payload: Optional[dict]) -> bool:
+        """Send and record a medical records request for one provider.
+
+        Args:
+            provider: The pending provider row
+            payload: The provider's letter payload, None if it was not found
+
+        Returns:
+            True if the fax was sent and recorded, False otherwise.
+        """
+        stage = "payload"
+        try:
+            # 1. The payload was built up front for the whole batch
+            if payload is None:
+                raise ValueError("No client/incident/provider data found")
+
+            # 2. Generate the medical records request letter
+            stage = "render"
+            pdf_bytes = await self._stage(
+                "render", generate_letter("medical_records_request", payload)
+            )
+
+            # 3. Shrink the PDF for faxing and upload it to storage
+            stage = "upload"
+            pdf_bytes = await cpu_pool.run_cpu(
+                optimize_pdf_bytes,
+                pdf_bytes,
+                "fax",
+                f"records request for provider {provider['provider_id']}",
+            )
+            media_url = await self._stage("upload", upload_to_bucket(pdf_bytes))
+
+            # 4-5. Send the fax and record the request in the database
+            stage = "fax"
+            await self._stage("fax", self._fax(provider, media_url))
+
+            logger.info(
+                f"Successfully sent medical records request to "
+                f"provider ID {provider['provider_id']} "
+                f"({provider['provider_name']})"
+            )
+            return True
+
+        except Exception as e:
+            self.summary.failures[stage] += 1
+            logger.error(
+                f"Error sending medical records request to provider ID "
+                f"{provider['provider_id']} ({stage} stage): {str(e)}",
+                exc_info=True,
+            )
+            # Other providers carry on even if one fails
+            return False
+
+    async def _fax(self, provider, media_url: str) -> None:
+        fax_sid = await send_fax(provider["provider_fax"], media_url)
+        async with acquire() as conn:
+            await conn.execute(
+                RECORD_REQUEST_QUERY,
+                provider["incident_id"],
+                provider["provider_id"],
+                "records_request_sent",
+                media_url,
+                "sent",
+                fax_sid,
+            )
+
 
 @app.task(name="send_medical_record_requests")
 async def send_medical_record_requests() -> Dict[str, int]:
     """Send medical record requests to providers who haven't sent records yet.
 
     For each provider lacking a 'records_request_sent' document:
-    1. Build a provider payload
+    1. Build a provider payload (one batched query for the whole run)
     2. Generate a medical records request letter
     3. Upload the PDF to Supabase storage
     4. Send a fax to the provider
     5. Record the request in the database
 
+    Providers are processed concurrently, with the render, upload and fax
+    stages each capped by their MEDICAL_RECORDS_*_CONCURRENCY setting.
+    A summary of throughput, per-stage latency and failures is logged at
+    the end of the run.
+
     Returns:
         Dictionary with count of faxes queued
     """
-    conn = None
-    fax_count = 0
+    summary = RunSummary()
+    started = time.perf_counter()
 
     try:
-        # Connect to the database
-        conn = await asyncpg.connect(settings.SUPABASE_URL)
-
         # Find incidents with providers who haven't sent records yet
-        query = """
-        SELECT
-            i.id AS incident_id,
-            p.id AS provider_id,
-            p.name AS provider_name,
-            p.fax AS provider_fax
-        FROM incident i
-        JOIN provider p ON p.incident_id = i.id
-        WHERE p.status <> 'records_received'
-        AND NOT EXISTS (
-            SELECT 1 FROM document d
-            WHERE d.provider_id = p.id
-            AND d.type = 'records_request_sent'
-        )
-        """
-
-        pending_providers = await conn.fetch(query)
+        async with acquire() as conn:
+            pending_providers = await conn.fetch(PENDING_PROVIDERS_QUERY)
+        summary.total = len(pending_providers)
         logger.info(
             f"Found {len(pending_providers)} providers needing medical records requests"
         )
 
-        for provider in pending_providers:
-            try:
-                # 1. Build provider payload
-                payload = await get_provider_payload(
-                    provider["incident_id"], provider["provider_id"]
-                )
-
-                # 2. Generate the medical records request letter
-                pdf_bytes = await generate_letter("medical_records_request", payload)
-
-                # 3. Upload the PDF to storage
-                media_url = await upload_to_bucket(pdf_bytes)
-
-                # 4. Send the fax to the provider
-                fax_sid = await send_fax(provider["provider_fax"], media_url)
-
-                # 5. Record the request in the database
-                insert_query = """
-                INSERT INTO document (
-                    incident_id, provider_id, type, url, status,
-                    external_id, created_at
-                )
-                VALUES ($1, $2, $3, $4, $5, $6, NOW())
-                """
-                await conn.execute(
-                    insert_query,
-                    provider["incident_id"],
-                    provider["provider_id"],
-                    "records_request_sent",
-                    media_url,
-                    "sent",
-                    fax_sid,
-                )
-
-                logger.info(
-                    f"Successfully sent medical records request to "
-                    f"provider ID {provider['provider_id']} "
-                    f"({provider['provider_name']})"
-                )
-
-                fax_count += 1
-
-            except Exception as e:
-                logger.error(
-                    f"Error sending medical records request to provider ID "
-                    f"{provider['provider_id']}: {str(e)}",
-                    exc_info=True,
-                )
-                # Continue with the next provider even if one fails
-                continue
-
-        return {"queued": fax_count}
+        # Build every letter payload in one round trip
+        keys = [(p["incident_id"], p["provider_id"]) for p in pending_providers]
+        payloads = await get_provider_payloads(keys) if keys else {}
+
+        pipeline = _Pipeline(summary)
+        results = await asyncio.gather(
+            *(
+                pipeline.process(provider, payloads.get(key))
+                for provider, key in zip(pending_providers, keys, strict=True)
+            )
+        )
+        summary.queued = sum(results)
+
+        summary.elapsed = time.perf_counter() - started
+        summary.log()
+        return {"queued": summary.queued}
 
     except Exception as e:
         logger.error(f"Error in medical records request task: {str(e)}", exc_info=True)
         return {"queued": 0}  # Return 0 on error instead of raising
-
-    finally:
-        if conn:
-            await conn.close()
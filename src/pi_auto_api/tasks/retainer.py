@@ -1,12 +1,12 @@
 """Tasks for generating retainer agreements and handling e-signatures."""
 
-import asyncio
 import logging
 
 from pi_auto_api.celery_app import app
 from pi_auto_api.db import get_client_payload
 from pi_auto_api.externals.docassemble import generate_retainer_pdf
 from pi_auto_api.externals.docusign import send_envelope
+from pi_auto_api.worker_runtime import run_async
 
 logger = logging.getLogger(__name__)
 
@@ -56,8 +56,8 @@ def generate_retainer(self, client_id: int):
     """
     logger.info(f"Starting retainer generation for client_id: {client_id}")
     try:
-        # Always run the async helper in a new event loop for the task context
-        result = asyncio.run(_run_retainer_flow(client_id))
+        # Run the async helper on the worker's persistent event loop
+        result = run_async(_run_retainer_flow(client_id))
         return result
 
     except Exception as exc:
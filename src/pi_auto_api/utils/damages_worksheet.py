@@ -0,0 +1,77 @@
+"""Rendering of damages worksheets to Excel and PDF.
+
+Both renders are CPU bound (pandas/xlsxwriter and WeasyPrint), so
+``tasks/damages.py`` runs them in the CPU worker pool (see ``cpu_pool.py``).
+They are plain module-level functions of the bill rows, which keeps them
+cheap to send to a worker process.
+"""
+
+import io
+from typing import Dict, List
+
+import pandas as pd
+
+SHEET_NAME = "Damages Worksheet"
+
+
+def render_excel(bills: List[Dict]) -> bytes:
+    """Render bill rows (Provider, Date, Amount) to an Excel worksheet."""
+    df = pd.DataFrame(bills)
+    excel_io = io.BytesIO()
+    with pd.ExcelWriter(excel_io, engine="xlsxwriter") as writer:
+        df.to_excel(writer, sheet_name=SHEET_NAME, index=False)
+        # Basic formatting (optional, can be expanded)
+        workbook = writer.book
+        worksheet = writer.sheets[SHEET_NAME]
+        header_format = workbook.add_format(
+            {
+                "bold": True,
+                "text_wrap": True,
+                "valign": "top",
+                "fg_color": "#D7E4BC",
+                "border": 1,
+            }
+        )
+        for col_num, value in enumerate(df.columns.values):
+            worksheet.write(0, col_num, value, header_format)
+        # Auto-adjust column width (approximate)
+        for i, col in enumerate(df.columns):
+            # Calculate max length considering header and data
+            column_len = max(df[col].astype(str).map(len).max(), len(col))
+            worksheet.set_column(i, i, column_len + 2)
+    return excel_io.getvalue()
+
+
+def render_pdf(incident_id: int, bills: List[Dict], total_damages: float) -> bytes:
+    """Render bill rows and their total to a styled PDF worksheet."""
+    from weasyprint import HTML
+
+    df = pd.DataFrame(bills)
+    # Basic HTML styling for the PDF
+    html_string = f"""
+    <html>
+      <head><title>Damages Worksheet</title></head>
+      <style>
+        body {{ font-family: sans-serif; margin: 20px; }}
+        h1 {{ text-align: center; color: #333; }}
+        table {{ width: 100%; border-collapse: collapse; margin-top: 20px; }}
+        th, td {{ border: 1px solid #ccc; padding: 8px; text-align: left; }}
+        th {{ background-color: #f2f2f2; }}
+        .total-row td {{ font-weight: bold; background-color: #e6e6e6; }}
+      </style>
+      <body>
+        <h1>Damages Worksheet</h1>
+        <h3>Incident ID: {incident_id}</h3>
+        {df.to_html(index=False, classes="table table-striped")}
+        <table class='table'>
+            <tr class='total-row'>
+                <td><strong>Total Damages</strong></td>
+                <td colspan="2" style="text-align:right;">
+                    <strong>${total_damages:,.2f}</strong>
+                </td>
+            </tr>
+        </table>
+      </body>
+    </html>
+    """
+    return HTML(string=html_string).write_pdf()
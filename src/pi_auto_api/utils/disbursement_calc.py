@@ -6,10 +6,16 @@ from typing import Dict
 
 import asyncpg
 
-from pi_auto_api.config import settings
+from pi_auto_api.db_pool import acquire
 
 logger = logging.getLogger(__name__)
 
+FEE_ADJUSTMENTS_QUERY = """
+SELECT SUM(amount) as total_adjustments
+FROM fee_adjustments
+WHERE incident_id = $1
+"""
+
 
 async def calc_split(incident_id: int) -> Dict[str, Decimal]:
     """Calculate the split of a settlement amount for an incident.
@@ -31,60 +37,53 @@ async def calc_split(incident_id: int) -> Dict[str, Decimal]:
         ValueError: If the incident doesn't have a settlement amount or
                   if there's an error in the calculation.
     """
-    conn = None
     try:
-        conn = await asyncpg.connect(settings.SUPABASE_URL)
-
-        # Get settlement details from the incident
-        incident_query = """
-        SELECT
-            settlement_amount,
-            attorney_fee_pct,
-            lien_total
-        FROM incident
-        WHERE id = $1
-        """
-        incident = await conn.fetchrow(incident_query, incident_id)
-
-        if not incident or not incident["settlement_amount"]:
-            raise ValueError(f"Incident {incident_id} has no settlement amount")
-
-        # Get fee adjustments for the incident
-        adjustments_query = """
-        SELECT SUM(amount) as total_adjustments
-        FROM fee_adjustments
-        WHERE incident_id = $1
-        """
-        adjustments = await conn.fetchval(adjustments_query, incident_id)
-
-        # Calculate the split
-        gross_amount = Decimal(str(incident["settlement_amount"]))
-        attorney_fee_pct = Decimal(str(incident["attorney_fee_pct"]))
-        lien_total = Decimal(str(incident["lien_total"] or 0))
-        other_adjustments = Decimal(str(adjustments or 0))
-
-        # Calculate attorney fee
-        attorney_fee = (gross_amount * attorney_fee_pct / Decimal("100")).quantize(
-            Decimal("0.01")
-        )
+        async with acquire() as conn:
+            # Get settlement details from the incident
+            incident_query = """
+            SELECT
+                settlement_amount,
+                attorney_fee_pct,
+                lien_total
+            FROM incident
+            WHERE id = $1
+            """
+            incident = await conn.fetchrow(incident_query, incident_id)
+
+            if not incident or not incident["settlement_amount"]:
+                raise ValueError(f"Incident {incident_id} has no settlement amount")
+
+            # Get fee adjustments for the incident
+            adjustments = await conn.fetchval(FEE_ADJUSTMENTS_QUERY, incident_id)
+
+            # Calculate the split
+            gross_amount = Decimal(str(incident["settlement_amount"]))
+            attorney_fee_pct = Decimal(str(incident["attorney_fee_pct"]))
+            lien_total = Decimal(str(incident["lien_total"] or 0))
+            other_adjustments = Decimal(str(adjustments or 0))
+
+            # Calculate attorney fee
+            attorney_fee = (gross_amount * attorney_fee_pct / Decimal("100")).quantize(
+                Decimal("0.01")
+            )
 
-        # Calculate net to client
-        net_to_client = gross_amount - attorney_fee - lien_total - other_adjustments
+            # Calculate net to client
+            net_to_client = gross_amount - attorney_fee - lien_total - other_adjustments
 
-        # Ensure we don't have negative values
-        if net_to_client < 0:
-            raise ValueError(
-                f"Calculated negative net to client: {net_to_client}. "
-                f"Please check settlement amount and deductions."
-            )
+            # Ensure we don't have negative values
+            if net_to_client < 0:
+                raise ValueError(
+                    f"Calculated negative net to client: {net_to_client}. "
+                    f"Please check settlement amount and deductions."
+                )
 
-        return {
-            "gross": gross_amount,
-            "attorney_fee": attorney_fee,
-            "lien_total": lien_total,
-            "other_adjustments": other_adjustments,
-            "net_to_client": net_to_client,
-        }
+            return {
+                "gross": gross_amount,
+                "attorney_fee": attorney_fee,
+                "lien_total": lien_total,
+                "other_adjustments": other_adjustments,
+                "net_to_client": net_to_client,
+            }
 
     except asyncpg.PostgresError as e:
         logger.error(
@@ -98,6 +97,3 @@ async def calc_split(incident_id: int) -> Dict[str, Decimal]:
             exc_info=True,
         )
         raise ValueError(f"Calculation error: {str(e)}") from e
-    finally:
-        if conn:
-            await conn.close()
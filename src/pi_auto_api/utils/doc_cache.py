@@ -0,0 +1,289 @@
+"""Content-addressed cache for generated documents.
+
+Rendering a letter through Docassemble is the slowest step of most flows, and
+the same payload is often rendered more than once: Celery retries
+``generate_retainer`` after a DocuSign failure, and disbursement sheets and
+LORs are regenerated from unchanged data. Documents are therefore cached
+under a key derived from the template type, the template version and a
+canonical hash of the payload.
+
+Docassemble templates are deployed separately from this service, so a
+template is only cached when its version is known: an entry in
+DOC_TEMPLATE_VERSIONS, DOC_TEMPLATE_RELEASE (set by the Docassemble deploy,
+e.g. to the package's commit) or an explicit version such as a hash of a
+local template's source. Documents of unversioned templates are always
+rendered, since a deploy could change them without changing the key.
+
+There are two tiers:
+
+* an in-process LRU of at most DOC_CACHE_MAX_BYTES, shared by every event
+  loop of the process;
+* PDF blobs in Supabase Storage under ``doc_cache/<key>.pdf`` (when Supabase
+  is configured), shared by all API and worker processes.
+
+Entries older than DOC_CACHE_TTL seconds are ignored and regenerated in both
+tiers. Expired blobs hold client data, so ``purge_storage`` deletes them; the
+``purge_doc_cache`` task runs it nightly. Failed generations are never cached.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from pi_auto_api.config import settings
+from pi_auto_api.http_clients import get_client
+
+logger = logging.getLogger(__name__)
+
+BUCKET = "documents"
+PREFIX = "doc_cache"
+PURGE_PAGE_SIZE = 1000
+
+# key -> (stored at, PDF bytes), least recently used first
+_entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+_size = 0
+_lock = threading.Lock()
+
+
+def canonical_json(payload: Any) -> str:
+    """Serialize a payload so equal payloads always produce the same string.
+
+    Keys are sorted and whitespace is fixed; dates, decimals and other values
+    JSON cannot represent are converted with ``str``.
+    """
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def template_version(template_type: str) -> Optional[str]:
+    """Get the configured version of a template.
+
+    Returns:
+        The DOC_TEMPLATE_VERSIONS entry of the template, else
+        DOC_TEMPLATE_RELEASE, else None when the version is unknown.
+    """
+    return settings.DOC_TEMPLATE_VERSIONS.get(
+        template_type, settings.DOC_TEMPLATE_RELEASE
+    )
+
+
+def cache_key(template_type: str, payload: Any, version: Optional[str] = None) -> str:
+    """Build the cache key of a document.
+
+    Args:
+        template_type: Template the document is rendered from (e.g. "lor")
+        payload: Data the template is rendered with
+        version: Template version (defaults to template_version)
+
+    Returns:
+        "<template type>-<sha256 of template type, version and payload>"
+    """
+    if version is None:
+        version = template_version(template_type) or ""
+    digest = hashlib.sha256(
+        "\0".join((template_type, version, canonical_json(payload))).encode()
+    ).hexdigest()
+    return f"{template_type}-{digest}"
+
+
+def _memory_get(key: str) -> Optional[bytes]:
+    """Return a fresh in-memory entry and mark it recently used."""
+    global _size
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        stored_at, content = entry
+        if time.time() - stored_at > settings.DOC_CACHE_TTL:
+            del _entries[key]
+            _size -= len(content)
+            return None
+        _entries.move_to_end(key)
+        return content
+
+
+def _memory_put(key: str, content: bytes, stored_at: Optional[float] = None) -> None:
+    """Store an entry, evicting least recently used ones over the size limit."""
+    global _size
+    if len(content) > settings.DOC_CACHE_MAX_BYTES:
+        return
+    with _lock:
+        previous = _entries.pop(key, None)
+        if previous is not None:
+            _size -= len(previous[1])
+        _entries[key] = (stored_at or time.time(), content)
+        _size += len(content)
+        while _size > settings.DOC_CACHE_MAX_BYTES:
+            _, (_, evicted) = _entries.popitem(last=False)
+            _size -= len(evicted)
+
+
+def clear() -> None:
+    """Drop every in-memory entry (stored blobs are left in place)."""
+    global _size
+    with _lock:
+        _entries.clear()
+        _size = 0
+
+
+def _storage_enabled() -> bool:
+    """Check whether the Supabase Storage tier can be used."""
+    return bool(
+        settings.DOC_CACHE_STORAGE_ENABLED
+        and settings.SUPABASE_URL
+        and settings.SUPABASE_KEY
+    )
+
+
+def _blob_url(key: str) -> str:
+    """Build the Supabase Storage URL of a cached blob."""
+    return f"{settings.SUPABASE_URL}/storage/v1/object/{BUCKET}/{PREFIX}/{key}.pdf"
+
+
+async def _storage_get(key: str) -> Optional[Tuple[float, bytes]]:
+    """Download a cached blob if it exists and is not older than the TTL."""
+    response = await get_client("supabase_storage").get(
+        _blob_url(key),
+        headers={"Authorization": f"Bearer {settings.SUPABASE_KEY}"},
+    )
+    if response.status_code in (400, 404):
+        # Supabase answers 400 "Object not found" for missing objects
+        return None
+    response.raise_for_status()
+
+    stored_at = time.time()
+    last_modified = response.headers.get("Last-Modified")
+    if last_modified:
+        stored_at = parsedate_to_datetime(last_modified).timestamp()
+        if time.time() - stored_at > settings.DOC_CACHE_TTL:
+            return None
+    return stored_at, response.content
+
+
+async def _storage_put(key: str, content: bytes) -> None:
+    """Upload a blob, replacing an expired one with the same key."""
+    response = await get_client("supabase_storage").post(
+        _blob_url(key),
+        content=content,
+        headers={
+            "Authorization": f"Bearer {settings.SUPABASE_KEY}",
+            "Content-Type": "application/pdf",
+            "x-upsert": "true",
+        },
+    )
+    response.raise_for_status()
+
+
+async def _storage_expired(now: float) -> List[str]:
+    """List the oldest page of blobs and return the names of expired ones."""
+    response = await get_client("supabase_storage").post(
+        f"{settings.SUPABASE_URL}/storage/v1/object/list/{BUCKET}",
+        json={
+            "prefix": PREFIX,
+            "limit": PURGE_PAGE_SIZE,
+            "offset": 0,
+            "sortBy": {"column": "updated_at", "order": "asc"},
+        },
+        headers={"Authorization": f"Bearer {settings.SUPABASE_KEY}"},
+    )
+    response.raise_for_status()
+
+    expired = []
+    for item in response.json():
+        updated_at = item.get("updated_at") or item.get("created_at")
+        if not updated_at:
+            continue
+        stored_at = datetime.fromisoformat(updated_at.replace("Z", "+00:00"))
+        if now - stored_at.timestamp() <= settings.DOC_CACHE_TTL:
+            # Sorted oldest first, so the rest of the page is fresh too
+            break
+        expired.append(f"{PREFIX}/{item['name']}")
+    return expired
+
+
+async def purge_storage() -> int:
+    """Delete cached blobs older than DOC_CACHE_TTL from Supabase Storage.
+
+    Returns:
+        Number of blobs deleted.
+    """
+    if not _storage_enabled():
+        return 0
+
+    now = time.time()
+    deleted = 0
+    while True:
+        expired = await _storage_expired(now)
+        if not expired:
+            break
+        response = await get_client("supabase_storage").request(
+            "DELETE",
+            f"{settings.SUPABASE_URL}/storage/v1/object/{BUCKET}",
+            json={"prefixes": expired},
+            headers={"Authorization": f"Bearer {settings.SUPABASE_KEY}"},
+        )
+        response.raise_for_status()
+        deleted += len(expired)
+        if len(expired) < PURGE_PAGE_SIZE:
+            break
+    logger.info(f"Purged {deleted} expired documents from the document cache")
+    return deleted
+
+
+async def get_or_generate(
+    template_type: str,
+    payload: Any,
+    generate: Callable[[], Awaitable[bytes]],
+    version: Optional[str] = None,
+) -> bytes:
+    """Return the cached document for a payload, generating it on a miss.
+
+    Storage errors are logged and treated as misses, so the cache can never
+    make generation fail.
+
+    Args:
+        template_type: Template the document is rendered from (e.g. "lor")
+        payload: Data the template is rendered with
+        generate: Renders the document when it is not cached
+        version: Template version (defaults to template_version), e.g. a hash
+            of a local template's source
+
+    Returns:
+        The PDF bytes.
+    """
+    if version is None:
+        version = template_version(template_type)
+    if not settings.DOC_CACHE_ENABLED or version is None:
+        return await generate()
+
+    key = cache_key(template_type, payload, version)
+    content = _memory_get(key)
+    if content is not None:
+        logger.info(f"Document cache hit (memory): {key}")
+        return content
+
+    if _storage_enabled():
+        try:
+            cached = await _storage_get(key)
+        except Exception as e:
+            logger.warning(f"Document cache lookup failed for {key}: {e}")
+            cached = None
+        if cached is not None:
+            stored_at, content = cached
+            _memory_put(key, content, stored_at)
+            logger.info(f"Document cache hit (storage): {key}")
+            return content
+
+    content = await generate()
+    _memory_put(key, content)
+    if _storage_enabled():
+        try:
+            await _storage_put(key, content)
+        except Exception as e:
+            logger.warning(f"Failed to store {key} in the document cache: {e}")
+    return content
@@ -1,18 +1,93 @@
 """Email template renderer using Jinja2.
 
 This module provides utilities for loading and rendering email templates.
+
+Templates are compiled once per process: one Jinja ``Environment`` is kept per
+templates directory, and Jinja caches every template it has compiled.
+``precompile_email_templates()`` compiles all of ``email_templates/*.html`` at
+startup, and compiled bytecode is kept on disk (EMAIL_TEMPLATE_CACHE_DIR) so
+new processes skip parsing too. Templates are only re-read when they change
+if EMAIL_TEMPLATE_AUTO_RELOAD is set, which is meant for development.
 """
 
-import os
+import logging
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Union
+from typing import Dict, Iterable, List, Union
+
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    TemplateNotFound,
+    select_autoescape,
+)
 
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from pi_auto_api.config import settings
+
+logger = logging.getLogger(__name__)
 
 # Path to email templates directory
 TEMPLATES_DIR = Path(__file__).parent.parent / "email_templates"
 
+# One environment (and so one compiled template cache) per templates directory
+_environments: Dict[str, Environment] = {}
+_lock = threading.Lock()
+
+
+def _bytecode_cache() -> FileSystemBytecodeCache:
+    """Create the on-disk cache for compiled template bytecode.
+
+    Bytecode is loaded with ``marshal``, so whoever can write the cache
+    directory can run code in this process. Without EMAIL_TEMPLATE_CACHE_DIR,
+    Jinja's default is used: a per-user directory under the temp directory,
+    created with mode 0700 and rejected if another user owns it.
+    """
+    if not settings.EMAIL_TEMPLATE_CACHE_DIR:
+        return FileSystemBytecodeCache()
+    cache_dir = Path(settings.EMAIL_TEMPLATE_CACHE_DIR)
+    cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return FileSystemBytecodeCache(str(cache_dir))
+
+
+def get_environment() -> Environment:
+    """Get the Jinja environment for the current templates directory."""
+    templates_dir = str(TEMPLATES_DIR)
+    with _lock:
+        env = _environments.get(templates_dir)
+        if env is None:
+            env = _environments[templates_dir] = Environment(
+                loader=FileSystemLoader(templates_dir),
+                autoescape=select_autoescape(["html", "xml"]),
+                bytecode_cache=_bytecode_cache(),
+                auto_reload=settings.EMAIL_TEMPLATE_AUTO_RELOAD,
+                cache_size=-1,
+            )
+        return env
+
+
+def precompile_email_templates() -> int:
+    """Compile every email template so the first send does not pay for it.
+
+    Returns:
+        The number of templates compiled.
+    """
+    env = get_environment()
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    logger.info(f"Precompiled {len(names)} email template(s)")
+    return len(names)
+
+
+def _get_template(template_name: str):
+    """Load a compiled template, raising FileNotFoundError if it is missing."""
+    try:
+        return get_environment().get_template(template_name)
+    except TemplateNotFound as e:
+        raise FileNotFoundError(f"Email template {template_name} not found") from e
+
 
 def render_email_template(
     template_name: str, context: Dict[str, Union[str, Dict]]
@@ -30,19 +105,36 @@ def render_email_template(
         FileNotFoundError: If the template file doesn't exist
         jinja2.exceptions.TemplateError: If there are syntax errors in the template
     """
-    if not os.path.exists(TEMPLATES_DIR / template_name):
-        raise FileNotFoundError(f"Email template {template_name} not found")
-
-    # Set up Jinja environment
-    env = Environment(
-        loader=FileSystemLoader(TEMPLATES_DIR),
-        autoescape=select_autoescape(["html", "xml"]),
-    )
+    template = _get_template(template_name)
 
     # Add current_year to the context
     if "current_year" not in context:
         context["current_year"] = datetime.now().year
 
-    # Load and render the template
-    template = env.get_template(template_name)
     return template.render(**context)
+
+
+def render_email_batch(
+    template_name: str, contexts: Iterable[Dict[str, Union[str, Dict]]]
+) -> List[str]:
+    """Render one email template for many contexts.
+
+    The template is looked up once; each message then costs a single render.
+
+    Args:
+        template_name: The name of the template file to render
+        contexts: One context per message
+
+    Returns:
+        The rendered HTML of each message, in the order of ``contexts``
+
+    Raises:
+        FileNotFoundError: If the template file doesn't exist
+        jinja2.exceptions.TemplateError: If there are syntax errors in the template
+    """
+    template = _get_template(template_name)
+    current_year = datetime.now().year
+    return [
+        template.render(**{"current_year": current_year, **context})
+        for context in contexts
+    ]
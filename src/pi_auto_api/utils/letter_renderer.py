@@ -0,0 +1,231 @@
+"""Local letter rendering from the repository's Jinja templates.
+
+Letters are normally rendered by the Docassemble wrapper over HTTP, which is
+rate limited and slow for bulk jobs. Letter types listed in
+LETTER_LOCAL_RENDER (and mapped in LETTER_TEMPLATES) are rendered here
+instead: the text template under LETTER_TEMPLATES_DIR is rendered with Jinja,
+wrapped in a printable HTML page and converted to PDF with WeasyPrint.
+
+The payloads are shaped for Docassemble (``law_firm``, ``letter_date``), while
+the templates use their own names (``firm``, ``today.date``, ``staff``,
+``medical``); ``template_context`` maps one onto the other. Templates are
+strict by default (LETTER_STRICT_TEMPLATES), so a variable the context does
+not supply fails the render instead of leaving a blank in a letter that is
+then faxed.
+
+Rendering is CPU bound, so it runs in the shared CPU worker pool (see
+``cpu_pool.py``), whose workers have WeasyPrint preloaded. Each worker builds
+the Jinja environment on its first letter and keeps it, so Jinja compiles each
+template once per worker.
+"""
+
+import hashlib
+import logging
+from datetime import date
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from jinja2 import ChainableUndefined, Environment, FileSystemLoader, StrictUndefined
+from markupsafe import escape
+
+from pi_auto_api import cpu_pool
+from pi_auto_api.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Default location of the letter templates (repository root /templates)
+TEMPLATES_DIR = Path(__file__).resolve().parents[3] / "templates"
+
+# Repository template of each letter type that can be rendered locally
+LETTER_TEMPLATES: Dict[str, str] = {
+    "lor": "correspondence/letter_of_representation.txt",
+    "medical_records_request": "medical/records_request.txt",
+    "medical_lien": "medical/medical_lien_letter.txt",
+    "disbursement": "settlement/disbursement_sheet.txt",
+    "demand": "settlement/demand_letter.txt",
+    "release": "settlement/release_agreement.txt",
+    "settlement_rejection": "correspondence/settlement_rejection.txt",
+    "case_closure": "correspondence/case_closure.txt",
+}
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<style>
+@page {{ size: Letter; margin: 1in; }}
+body {{ font-family: "Times New Roman", serif; font-size: 12pt; }}
+pre {{ font-family: inherit; white-space: pre-wrap; margin: 0; }}
+</style>
+</head>
+<body><pre>{body}</pre></body>
+</html>
+"""
+
+# Jinja environments by (templates dir, strict), kept for the process lifetime
+_envs: Dict[Tuple[str, bool], Environment] = {}
+
+# Template source hashes by (path, modification time)
+_source_hashes: Dict[Tuple[str, float], str] = {}
+
+
+def template_for(letter_type: str) -> Optional[str]:
+    """Get the local template of a letter type, or None to use Docassemble."""
+    if letter_type not in settings.LETTER_LOCAL_RENDER:
+        return None
+    return LETTER_TEMPLATES.get(letter_type)
+
+
+def _templates_dir() -> str:
+    """Resolve the configured templates directory."""
+    return str(settings.LETTER_TEMPLATES_DIR or TEMPLATES_DIR)
+
+
+def template_hash(letter_type: str) -> str:
+    """Hash the source of a letter type's local template.
+
+    Used as the template version in document cache keys, so editing a
+    template invalidates the letters rendered from it.
+
+    Raises:
+        ValueError: If the letter type has no local template
+        OSError: If the template cannot be read
+    """
+    template_name = template_for(letter_type)
+    if template_name is None:
+        raise ValueError(f"No local template configured for letter type {letter_type}")
+    path = Path(_templates_dir()) / template_name
+    key = (str(path), path.stat().st_mtime)
+    digest = _source_hashes.get(key)
+    if digest is None:
+        digest = _source_hashes[key] = hashlib.sha256(path.read_bytes()).hexdigest()
+    return digest
+
+
+def _today() -> str:
+    """Today's date as printed on letters."""
+    return date.today().strftime("%B %d, %Y")
+
+
+def _records_request_context(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Template names of a medical records request payload."""
+    incident = payload.get("incident") or {}
+    return {
+        # Records are requested from the date of the incident onwards
+        "medical": {
+            "start_date": incident.get("date"),
+            "end_date": payload.get("letter_date") or _today(),
+        },
+    }
+
+
+# Extra template context of each letter type, built from its payload
+CONTEXT_BUILDERS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "medical_records_request": _records_request_context,
+}
+
+
+def template_context(letter_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a letter payload onto the variable names the templates use.
+
+    ``law_firm`` becomes ``firm`` and ``letter_date`` becomes ``today.date``
+    (today when the payload has none); letter types in CONTEXT_BUILDERS add
+    their own sections. Keys the template already expects are kept as is.
+
+    Args:
+        letter_type: Letter type being rendered
+        payload: Letter payload as sent to Docassemble
+
+    Returns:
+        The template context.
+    """
+    context = dict(payload)
+    if "firm" not in context and "law_firm" in payload:
+        context["firm"] = payload["law_firm"]
+    context.setdefault("today", {"date": payload.get("letter_date") or _today()})
+    builder = CONTEXT_BUILDERS.get(letter_type)
+    if builder is not None:
+        for name, section in builder(payload).items():
+            context.setdefault(name, section)
+    return context
+
+
+def _build_env(templates_dir: str, strict: bool) -> Environment:
+    """Create the Jinja environment used to render letters."""
+    return Environment(
+        loader=FileSystemLoader(templates_dir),
+        undefined=StrictUndefined if strict else ChainableUndefined,
+        # Templates are plain text; the page wrapper escapes the result
+        autoescape=False,
+        keep_trailing_newline=True,
+        auto_reload=False,
+    )
+
+
+def _get_env(templates_dir: Optional[str], strict: Optional[bool]) -> Environment:
+    """Get the Jinja environment for a templates directory, building it once."""
+    if templates_dir is None:
+        templates_dir = _templates_dir()
+    if strict is None:
+        strict = settings.LETTER_STRICT_TEMPLATES
+    env = _envs.get((templates_dir, strict))
+    if env is None:
+        env = _envs[(templates_dir, strict)] = _build_env(templates_dir, strict)
+    return env
+
+
+def render_text(
+    template_name: str,
+    payload: Dict[str, Any],
+    templates_dir: Optional[str] = None,
+    strict: Optional[bool] = None,
+) -> str:
+    """Render a letter template to text in the current process.
+
+    ``templates_dir`` and ``strict`` default to the configured settings; they
+    are passed explicitly to worker processes, which do not see the parent's
+    settings overrides.
+    """
+    env = _get_env(templates_dir, strict)
+    return env.get_template(template_name).render(**payload)
+
+
+def render_pdf(
+    template_name: str,
+    payload: Dict[str, Any],
+    templates_dir: Optional[str] = None,
+    strict: Optional[bool] = None,
+) -> bytes:
+    """Render a letter template to PDF in the current process (blocking)."""
+    from weasyprint import HTML
+
+    body = escape(render_text(template_name, payload, templates_dir, strict))
+    return HTML(string=PAGE_TEMPLATE.format(body=body)).write_pdf()
+
+
+async def render_letter(letter_type: str, payload: Dict[str, Any]) -> bytes:
+    """Render a letter to PDF in the CPU worker pool.
+
+    Args:
+        letter_type: Letter type selected for local rendering
+        payload: Letter payload, mapped with template_context
+
+    Returns:
+        Raw bytes of the generated PDF document
+
+    Raises:
+        ValueError: If the letter type has no local template
+        jinja2.TemplateError: If the template cannot be rendered
+        TimeoutError: If rendering takes longer than CPU_POOL_TIMEOUT
+    """
+    template_name = template_for(letter_type)
+    if template_name is None:
+        raise ValueError(f"No local template configured for letter type {letter_type}")
+
+    return await cpu_pool.run_cpu(
+        render_pdf,
+        template_name,
+        template_context(letter_type, payload),
+        _templates_dir(),
+        settings.LETTER_STRICT_TEMPLATES,
+    )
@@ -1,13 +1,121 @@
 """Utility functions for checking if a demand package is ready to be assembled."""
 
 import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
 
-import asyncpg
-
-from pi_auto_api.config import settings
+from pi_auto_api.db_pool import acquire
 
 logger = logging.getLogger(__name__)
 
+# Document types every demand package needs
+REQUIRED_DOC_TYPES = ("medical_records", "damages_worksheet_pdf", "liability_photo")
+
+# Evaluates every readiness rule for a set of incidents in one pass over doc.
+# With $1 NULL it covers every incident that has no demand package yet;
+# otherwise it covers exactly the given incident IDs.
+DEMAND_READINESS_QUERY = """
+WITH doc_flags AS (
+    SELECT
+        incident_id,
+        bool_or(type = 'medical_records') AS has_medical_records,
+        bool_or(type = 'damages_worksheet_pdf') AS has_damages_worksheet_pdf,
+        bool_or(type = 'liability_photo') AS has_liability_photo,
+        bool_or(type = 'demand_package') AS has_demand_package
+    FROM doc
+    WHERE $1::int[] IS NULL OR incident_id = ANY($1::int[])
+    GROUP BY incident_id
+),
+provider_bills AS (
+    SELECT
+        incident_id,
+        provider_id,
+        bool_or(type = 'medical_bill') AS has_bill
+    FROM doc
+    WHERE provider_id IS NOT NULL
+      AND ($1::int[] IS NULL OR incident_id = ANY($1::int[]))
+    GROUP BY incident_id, provider_id
+),
+unbilled AS (
+    SELECT
+        incident_id,
+        array_agg(provider_id ORDER BY provider_id) AS providers_missing_bills
+    FROM provider_bills
+    WHERE NOT has_bill
+    GROUP BY incident_id
+)
+SELECT
+    i.id AS incident_id,
+    COALESCE(f.has_medical_records, FALSE) AS has_medical_records,
+    COALESCE(f.has_damages_worksheet_pdf, FALSE) AS has_damages_worksheet_pdf,
+    COALESCE(f.has_liability_photo, FALSE) AS has_liability_photo,
+    COALESCE(f.has_demand_package, FALSE) AS has_demand_package,
+    COALESCE(u.providers_missing_bills, '{}'::int[]) AS providers_missing_bills
+FROM incident i
+LEFT JOIN doc_flags f ON f.incident_id = i.id
+LEFT JOIN unbilled u ON u.incident_id = i.id
+WHERE ($1::int[] IS NULL AND NOT COALESCE(f.has_demand_package, FALSE))
+   OR i.id = ANY($1::int[])
+ORDER BY i.id;
+"""
+
+
+@dataclass
+class DemandReadiness:
+    """Readiness of a set of incidents for demand package assembly.
+
+    Attributes:
+        ready: IDs of incidents that meet every requirement, in ascending order
+        missing: Reasons each remaining incident is not ready, keyed by ID
+    """
+
+    ready: List[int] = field(default_factory=list)
+    missing: Dict[int, List[str]] = field(default_factory=dict)
+
+
+def _missing_requirements(row) -> List[str]:
+    """List the readiness rules a readiness query row fails."""
+    reasons = [
+        f"missing {doc_type}"
+        for doc_type in REQUIRED_DOC_TYPES
+        if not row[f"has_{doc_type}"]
+    ]
+    if row["has_demand_package"]:
+        reasons.append("demand_package already exists")
+    if row["providers_missing_bills"]:
+        provider_ids = ", ".join(str(p) for p in row["providers_missing_bills"])
+        reasons.append(f"no medical_bill for provider(s) {provider_ids}")
+    return reasons
+
+
+async def get_demand_readiness(
+    incident_ids: Optional[Sequence[int]] = None,
+) -> DemandReadiness:
+    """Evaluate demand package readiness for many incidents in a single query.
+
+    Args:
+        incident_ids: Incidents to evaluate. If omitted, every incident that
+            does not have a demand package yet is evaluated.
+
+    Returns:
+        The ready incident IDs and the missing requirements of the rest.
+
+    Raises:
+        Exception: If the database query fails.
+    """
+    ids = list(incident_ids) if incident_ids is not None else None
+    async with acquire() as conn:
+        rows = await conn.fetch(DEMAND_READINESS_QUERY, ids)
+
+    readiness = DemandReadiness()
+    for row in rows:
+        reasons = _missing_requirements(row)
+        if reasons:
+            readiness.missing[row["incident_id"]] = reasons
+        else:
+            readiness.ready.append(row["incident_id"])
+    return readiness
+
 
 async def is_demand_ready(incident_id: int) -> bool:
     """Check if all required documents for a demand package are present for an incident.
@@ -18,74 +126,14 @@ async def is_demand_ready(incident_id: int) -> bool:
     Returns:
         True if all conditions are met, False otherwise.
     """
-    conn = None
     try:
-        conn = await asyncpg.connect(settings.SUPABASE_URL)
-
-        # Check for medical_records, damages_worksheet_pdf, and liability_photo
-        # Also checks if a demand_package already exists
-        doc_types_query = """
-        SELECT
-            EXISTS(SELECT 1 FROM doc
-                   WHERE incident_id = $1 AND type = 'medical_records')
-                   AS has_medical_records,
-            EXISTS(SELECT 1 FROM doc
-                   WHERE incident_id = $1 AND type = 'damages_worksheet_pdf')
-                   AS has_damages_worksheet_pdf,
-            EXISTS(SELECT 1 FROM doc
-                   WHERE incident_id = $1 AND type = 'liability_photo')
-                   AS has_liability_photo,
-            NOT EXISTS(SELECT 1 FROM doc
-                       WHERE incident_id = $1 AND type = 'demand_package')
-                       AS no_existing_demand_package;
-        """
-        doc_types_check = await conn.fetchrow(doc_types_query, incident_id)
-
-        if not doc_types_check or not all(
-            [
-                doc_types_check["has_medical_records"],
-                doc_types_check["has_damages_worksheet_pdf"],
-                doc_types_check["has_liability_photo"],
-                doc_types_check["no_existing_demand_package"],
-            ]
-        ):
-            logger.info(
-                f"Incident {incident_id}: Missing required docs or pkg exists. "
-                f"Details: {doc_types_check}"
-            )
-            return False
-
-        # Check if all providers associated with the incident
-        # have at least one medical bill
-        all_providers_have_bills_query = """
-        SELECT COALESCE(
-            (
-                SELECT bool_and(EXISTS(
-                    SELECT 1 FROM doc d_bill
-                    WHERE d_bill.incident_id = d_prov.incident_id
-                      AND d_bill.provider_id = d_prov.provider_id
-                      AND d_bill.type = 'medical_bill'
-                ))
-                FROM (
-                    SELECT DISTINCT
-                        incident_id,
-                        provider_id  # noqa: E501
-                    FROM doc
-                    WHERE incident_id = $1 AND provider_id IS NOT NULL
-                )
-                AS d_prov
-            ),
-            TRUE -- If no providers associated, condition is met.
-        ) AS all_providers_have_bills;
-        """
-
-        providers_check = await conn.fetchval(
-            all_providers_have_bills_query, incident_id
-        )
+        readiness = await get_demand_readiness([incident_id])
 
-        if not providers_check:
+        if incident_id not in readiness.ready:
+            reasons = readiness.missing.get(incident_id, ["incident not found"])
             logger.info(
-                f"Incident {incident_id}: Not all providers have medical bills logged."
+                f"Incident {incident_id}: Not ready for demand package. "
+                f"Details: {'; '.join(reasons)}"
             )
             return False
 
@@ -98,6 +146,3 @@ async def is_demand_ready(incident_id: int) -> bool:
             exc_info=True,
         )
         return False
-    finally:
-        if conn:
-            await conn.close()
@@ -1,42 +1,259 @@
-"""Utility functions for merging PDF documents."""
+"""Utility functions for merging PDF documents.
 
+Demand packages can run to thousands of pages, so merging avoids holding whole
+documents in memory where it can. ``merge_pdfs_to`` takes any iterable of
+sources (bytes, paths or binary file objects, or ``PdfPages`` ranges of them)
+and writes the merged PDF to a file handle. Inputs that cannot be read in
+place, such as non-seekable streams, and the output of ``merge_pdfs_to_spool``
+are spooled to temporary files once they grow past PDF_SPOOL_THRESHOLD bytes.
+``merge_pdfs`` keeps the original all-in-memory ``bytes`` interface for small
+documents.
+
+Given a ``destination``, the merged document is optimized for it (see
+``utils/pdf_optimize.py``) as part of writing it, without another pass.
+Likewise, a ``stamper`` (such as ``utils/pdf_stamp.BatesStamper``) stamps every
+page as it is appended, instead of reopening the merged document to stamp it.
+"""
+
+import contextlib
 import io
 import logging
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import pikepdf
 
+from pi_auto_api.config import settings
+from pi_auto_api.utils import pdf_optimize
+
 logger = logging.getLogger(__name__)
 
+# A PDF to merge: its content, a path to it, or a binary file object
+PdfSource = Union[bytes, bytearray, memoryview, str, os.PathLike, BinaryIO]
 
-def merge_pdfs(list_of_pdf_bytes: list[bytes]) -> bytes:
-    """Merge multiple PDF documents (provided as bytes) into a single PDF.
+# Size of the chunks copied when spooling a stream
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class PdfPages:
+    """A range of pages of a merge source, like ``pages[start:stop]``.
+
+    Attributes:
+        source: The PDF the pages are taken from
+        start: Index of the first page
+        stop: Index after the last page (None for the end of the document)
+    """
+
+    source: PdfSource
+    start: int = 0
+    stop: Optional[int] = None
+
+
+class PageStamper(Protocol):
+    """Hook stamping pages (Bates numbers, labels...) while they are merged."""
+
+    def stamp_page(
+        self, pdf: pikepdf.Pdf, page: pikepdf.Page, source_index: int
+    ) -> None:
+        """Stamp one page appended to the merged document.
+
+        Args:
+            pdf: The merged document
+            page: The page, already part of ``pdf``
+            source_index: Index of the merge source the page came from
+        """
+
+
+def spooled_file() -> BinaryIO:
+    """Create a temporary file kept in memory up to PDF_SPOOL_THRESHOLD bytes."""
+    return tempfile.SpooledTemporaryFile(
+        max_size=settings.PDF_SPOOL_THRESHOLD, dir=settings.PDF_SPOOL_DIR
+    )
+
+
+def spool(data: Union[bytes, BinaryIO]) -> BinaryIO:
+    """Copy content into a spooled temporary file, rewound for reading.
+
+    Lets callers drop a large ``bytes`` object (or finish reading a
+    non-seekable stream) while keeping the content available for merging.
 
     Args:
-        list_of_pdf_bytes: A list where each element is the byte content of a PDF.
+        data: Content to copy, as bytes or a binary file object
 
     Returns:
-        Bytes of the merged PDF document.
+        The spooled file, positioned at the start.
+    """
+    spooled = spooled_file()
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        spooled.write(data)
+    else:
+        shutil.copyfileobj(data, spooled, COPY_CHUNK_SIZE)
+    spooled.seek(0)
+    return spooled
+
+
+def _open_source(source: PdfSource, stack: contextlib.ExitStack) -> pikepdf.Pdf:
+    """Open a merge source, registering everything to close on the stack."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        stream = io.BytesIO(source)
+    elif isinstance(source, (str, os.PathLike)):
+        return stack.enter_context(pikepdf.Pdf.open(source))
+    elif source.seekable():
+        stream = source
+    else:
+        stream = stack.enter_context(spool(source))
+    return stack.enter_context(pikepdf.Pdf.open(stream))
+
+
+def _append(
+    merged_pdf: pikepdf.Pdf,
+    pages: Sequence[pikepdf.Page],
+    source_index: int,
+    stamper: Optional[PageStamper],
+) -> None:
+    """Append pages to the merged document, stamping each copy."""
+    first = len(merged_pdf.pages)
+    merged_pdf.pages.extend(pages)
+    if stamper is not None:
+        for index in range(first, len(merged_pdf.pages)):
+            stamper.stamp_page(merged_pdf, merged_pdf.pages[index], source_index)
+
+
+def merge_pdfs_to(
+    sources: Iterable[Union[PdfSource, PdfPages]],
+    output: BinaryIO,
+    destination: Optional[str] = None,
+    stamper: Optional[PageStamper] = None,
+) -> List[int]:
+    """Merge PDF documents into a single PDF written to a file handle.
+
+    Sources are opened one at a time as the iterable is consumed; a source
+    object that appears more than once (e.g. in several ``PdfPages``) is only
+    opened once. Page content is copied from the sources when the output is
+    written, so every source stays open (and file objects passed in must stay
+    readable) until this function returns.
+
+    Args:
+        sources: PDFs to merge, in order. Each is the PDF content, a path to
+            a PDF file, a binary file object or a ``PdfPages`` range of one.
+        output: Writable binary file object the merged PDF is written to
+        destination: Optimize the merged PDF for this destination profile
+            (e.g. "fax" or "storage"); None writes it unoptimized
+        stamper: Stamps every page as it is appended, if given. Only the
+            merged copies are stamped; the sources are left untouched.
+
+    Returns:
+        The number of pages taken from each source, in order.
 
     Raises:
         pikepdf.PdfError: If any of the inputs are not valid PDFs or merging fails.
-        ValueError: If the list_of_pdf_bytes is empty.
+        ValueError: If there are no sources.
     """
-    if not list_of_pdf_bytes:
-        raise ValueError("Cannot merge an empty list of PDFs.")
+    with contextlib.ExitStack() as stack:
+        merged_pdf = stack.enter_context(pikepdf.Pdf.new())
+        report = None
+        if destination and settings.PDF_OPTIMIZE_ENABLED:
+            report = pdf_optimize.OptimizationReport(destination)
+        # id(source) -> (source, opened document)
+        opened: Dict[int, Tuple[PdfSource, pikepdf.Pdf]] = {}
+        page_counts: List[int] = []
+        for i, source in enumerate(sources):
+            pages = slice(None)
+            if isinstance(source, PdfPages):
+                source, pages = source.source, slice(source.start, source.stop)
+            try:
+                if id(source) not in opened:
+                    if report is not None:
+                        report.input_bytes += pdf_optimize.source_size(source)
+                    opened[id(source)] = (source, _open_source(source, stack))
+                selected = opened[id(source)][1].pages[pages]
+                _append(merged_pdf, selected, i, stamper)
+                page_counts.append(len(selected))
+            except Exception as e:
+                logger.error(f"Error processing PDF document at index {i}: {e}")
+                raise pikepdf.PdfError(
+                    f"Failed to process or merge PDF at index {i}. Error: {e}"
+                ) from e
 
-    merged_pdf = pikepdf.Pdf.new()
+        if not page_counts:
+            raise ValueError("Cannot merge an empty list of PDFs.")
+
+        if report is None:
+            merged_pdf.save(output)
+            return page_counts
 
-    for i, pdf_bytes in enumerate(list_of_pdf_bytes):
         try:
-            with pikepdf.Pdf.open(io.BytesIO(pdf_bytes)) as pdf_doc:
-                merged_pdf.pages.extend(pdf_doc.pages)
+            pdf_optimize.prepare(merged_pdf, report)
         except Exception as e:
-            logger.error(f"Error processing PDF document at index {i}: {e}")
-            # Optionally, re-raise a more specific error or handle it
-            raise pikepdf.PdfError(
-                f"Failed to process or merge PDF at index {i}. Error: {e}"
-            ) from e
+            logger.warning(f"Failed to optimize merged PDF, saving as-is: {e}")
+        pdf_optimize.save(merged_pdf, output, report)
+        report.log(f"merged PDF of {len(page_counts)} document(s)")
+        return page_counts
+
+
+def merge_pdfs_to_spool(
+    sources: Iterable[Union[PdfSource, PdfPages]],
+    destination: Optional[str] = None,
+    stamper: Optional[PageStamper] = None,
+) -> BinaryIO:
+    """Merge PDF documents into a spooled temporary file.
+
+    The result stays in memory up to PDF_SPOOL_THRESHOLD bytes and is moved to
+    disk beyond that, so large packages can be streamed to storage without a
+    full in-memory copy.
 
+    Args:
+        sources: PDFs to merge, as accepted by ``merge_pdfs_to``
+        destination: Destination profile to optimize for, if any
+        stamper: Stamps every page as it is appended, if given
+
+    Returns:
+        The merged PDF, positioned at the start. The caller closes it.
+
+    Raises:
+        pikepdf.PdfError: If any of the inputs are not valid PDFs or merging fails.
+        ValueError: If there are no sources.
+    """
+    output = spooled_file()
+    try:
+        merge_pdfs_to(sources, output, destination, stamper)
+    except BaseException:
+        output.close()
+        raise
+    output.seek(0)
+    return output
+
+
+def merge_pdfs(
+    list_of_pdf_bytes: list[bytes], stamper: Optional[PageStamper] = None
+) -> bytes:
+    """Merge multiple PDF documents (provided as bytes) into a single PDF.
+
+    Args:
+        list_of_pdf_bytes: A list where each element is the byte content of a PDF.
+        stamper: Stamps every page as it is appended, if given
+
+    Returns:
+        Bytes of the merged PDF document.
+
+    Raises:
+        pikepdf.PdfError: If any of the inputs are not valid PDFs or merging fails.
+        ValueError: If the list_of_pdf_bytes is empty.
+    """
     output_io = io.BytesIO()
-    merged_pdf.save(output_io)
+    merge_pdfs_to(list_of_pdf_bytes, output_io, stamper=stamper)
     return output_io.getvalue()
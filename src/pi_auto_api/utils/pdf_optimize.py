@@ -0,0 +1,318 @@
+"""Size optimization for PDFs before they are faxed, emailed or stored.
+
+Merged demand packages repeat the same fonts and images once per input
+document, and scanned records carry full-resolution page images, so PDFs are
+optimized before they leave the system:
+
+* identical fonts and images referenced from page resources are merged into
+  one object (unreferenced copies are dropped when the file is written);
+* images are downsampled to the DPI of the destination's profile in
+  PDF_OPTIMIZE_DPI (e.g. 200 for "fax"); destinations without a profile keep
+  their images;
+* streams are recompressed, objects are packed into object streams and the
+  file is linearized (PDF_LINEARIZE) so viewers can show page one early.
+
+Optimization never makes a flow fail: ``optimize_pdf_bytes`` falls back to
+the original PDF if anything goes wrong.
+"""
+
+import hashlib
+import io
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Dict, Set, Tuple
+
+import pikepdf
+from pikepdf import Name
+
+from pi_auto_api.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Page resource categories whose entries are merged when identical
+DEDUPLICATED_RESOURCES = ("/Font", "/XObject")
+
+# Images are only resampled when that shrinks them by more than this factor
+MIN_DOWNSAMPLE_SCALE = 0.9
+
+
+@dataclass
+class OptimizationReport:
+    """Size accounting for one optimized document.
+
+    Attributes:
+        destination: Profile the document was optimized for (e.g. "fax")
+        input_bytes: Size of the input document(s)
+        output_bytes: Size of the optimized document
+        duplicates_merged: Resource references pointed at an identical object
+        images_downsampled: Images resampled to the destination DPI
+    """
+
+    destination: str
+    input_bytes: int = 0
+    output_bytes: int = 0
+    duplicates_merged: int = 0
+    images_downsampled: int = 0
+
+    @property
+    def reduction(self) -> float:
+        """Fraction of the input size saved (negative if the output grew)."""
+        if not self.input_bytes:
+            return 0.0
+        return 1 - self.output_bytes / self.input_bytes
+
+    def log(self, label: str) -> None:
+        """Log the size reduction of a document."""
+        logger.info(
+            f"Optimized {label} for {self.destination}: "
+            f"{self.input_bytes} -> {self.output_bytes} bytes "
+            f"({self.reduction:.1%} smaller), "
+            f"{self.duplicates_merged} duplicate resource(s) merged, "
+            f"{self.images_downsampled} image(s) downsampled"
+        )
+
+
+def _fingerprint(
+    obj: object, memo: Dict[Tuple[int, int], bytes], active: Set[Tuple[int, int]]
+) -> bytes:
+    """Hash an object and everything it references, ignoring object numbers."""
+    objgen = None
+    if isinstance(obj, pikepdf.Object) and obj.is_indirect:
+        objgen = obj.objgen
+        if objgen in memo:
+            return memo[objgen]
+        if objgen in active:
+            # Reference cycle: fall back to the identity of the object
+            return repr(objgen).encode()
+        active.add(objgen)
+
+    digest = hashlib.sha256()
+    if isinstance(obj, pikepdf.Stream):
+        digest.update(b"stream")
+        digest.update(obj.read_raw_bytes())
+    _hash_value(obj, digest, memo, active)
+
+    fingerprint = digest.digest()
+    if objgen is not None:
+        active.discard(objgen)
+        memo[objgen] = fingerprint
+    return fingerprint
+
+
+def _hash_value(
+    obj: object,
+    digest: Any,
+    memo: Dict[Tuple[int, int], bytes],
+    active: Set[Tuple[int, int]],
+) -> None:
+    """Add a value (or, for a stream, its dictionary) to a fingerprint."""
+    if isinstance(obj, (pikepdf.Dictionary, pikepdf.Stream)):
+        digest.update(b"dict")
+        for key in sorted(obj.keys()):
+            digest.update(key.encode())
+            digest.update(_fingerprint(obj[key], memo, active))
+    elif isinstance(obj, pikepdf.Array):
+        digest.update(b"array")
+        for item in obj:
+            digest.update(_fingerprint(item, memo, active))
+    elif isinstance(obj, pikepdf.Object):
+        digest.update(obj.unparse())
+    else:
+        digest.update(repr(obj).encode())
+
+
+def deduplicate_resources(pdf: pikepdf.Pdf) -> int:
+    """Point identical fonts and images used by the pages at a single object.
+
+    Returns:
+        The number of resource references that were redirected.
+    """
+    memo: Dict[Tuple[int, int], bytes] = {}
+    canonical: Dict[bytes, pikepdf.Object] = {}
+    merged = 0
+    for page in pdf.pages:
+        resources = page.obj.get(Name.Resources)
+        if resources is None:
+            continue
+        for category in DEDUPLICATED_RESOURCES:
+            entries = resources.get(category)
+            if not isinstance(entries, pikepdf.Dictionary):
+                continue
+            for name in list(entries.keys()):
+                obj = entries[name]
+                if not obj.is_indirect:
+                    continue
+                original = canonical.setdefault(_fingerprint(obj, memo, set()), obj)
+                if original.objgen != obj.objgen:
+                    entries[name] = original
+                    merged += 1
+    return merged
+
+
+def _page_images(page: pikepdf.Page):
+    """Yield the image XObjects drawn directly by a page."""
+    resources = page.obj.get(Name.Resources)
+    xobjects = resources.get(Name.XObject) if resources is not None else None
+    if not isinstance(xobjects, pikepdf.Dictionary):
+        return
+    for name in xobjects.keys():
+        xobject = xobjects[name]
+        if isinstance(xobject, pikepdf.Stream) and xobject.get(Name.Subtype) == (
+            Name.Image
+        ):
+            yield xobject
+
+
+def _can_resample(image: pikepdf.Stream) -> bool:
+    """Check whether an image can be re-encoded as JPEG without side effects."""
+    if image.get(Name.BitsPerComponent) != 8 or image.get(Name.ImageMask):
+        return False
+    if any(key in image for key in (Name.SMask, Name.Mask, Name.Decode)):
+        return False
+    return image.get(Name.ColorSpace) in (Name.DeviceRGB, Name.DeviceGray)
+
+
+def downsample_images(pdf: pikepdf.Pdf, dpi: int) -> int:
+    """Resample page images above a target resolution and store them as JPEG.
+
+    The resolution of an image is estimated as if it covered the whole page,
+    which is how scanned records are laid out; smaller images are therefore
+    never downsampled more than they should be. Images with masks, decode
+    arrays or colour spaces other than RGB and grayscale are left alone.
+
+    Args:
+        pdf: Open document, modified in place
+        dpi: Target resolution in dots per inch
+
+    Returns:
+        The number of images resampled.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning("Pillow is not installed; images will not be downsampled")
+        return 0
+
+    done: Set[Tuple[int, int]] = set()
+    resampled = 0
+    for page in pdf.pages:
+        box = page.mediabox
+        width_in = float(box[2] - box[0]) / 72
+        height_in = float(box[3] - box[1]) / 72
+        for image in _page_images(page):
+            if image.objgen in done or not _can_resample(image):
+                continue
+            done.add(image.objgen)
+
+            pdf_image = pikepdf.PdfImage(image)
+            scale = min(
+                dpi * width_in / pdf_image.width, dpi * height_in / pdf_image.height
+            )
+            if scale >= MIN_DOWNSAMPLE_SCALE:
+                continue
+
+            resized = pdf_image.as_pil_image().resize(
+                (
+                    max(1, round(pdf_image.width * scale)),
+                    max(1, round(pdf_image.height * scale)),
+                ),
+                Image.LANCZOS,
+            )
+            encoded = io.BytesIO()
+            resized.save(
+                encoded, "JPEG", quality=settings.PDF_JPEG_QUALITY, optimize=True
+            )
+            image.write(encoded.getvalue(), filter=Name.DCTDecode)
+            image.Width = resized.width
+            image.Height = resized.height
+            if Name.DecodeParms in image:
+                del image.DecodeParms
+            resampled += 1
+    return resampled
+
+
+def prepare(pdf: pikepdf.Pdf, report: OptimizationReport) -> None:
+    """Deduplicate and downsample an open document for its destination."""
+    report.duplicates_merged = deduplicate_resources(pdf)
+    dpi = settings.PDF_OPTIMIZE_DPI.get(report.destination)
+    if dpi:
+        report.images_downsampled = downsample_images(pdf, dpi)
+    pdf.remove_unreferenced_resources()
+
+
+def save(pdf: pikepdf.Pdf, output: BinaryIO, report: OptimizationReport) -> None:
+    """Write a prepared document compactly, recording the output size."""
+    start = output.tell()
+    pdf.save(
+        output,
+        compress_streams=True,
+        recompress_flate=True,
+        object_stream_mode=pikepdf.ObjectStreamMode.generate,
+        linearize=settings.PDF_LINEARIZE,
+    )
+    report.output_bytes = output.tell() - start
+
+
+def source_size(source: object) -> int:
+    """Best-effort size of a PDF source (content, path or seekable file)."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    try:
+        position = source.tell()
+        size = source.seek(0, os.SEEK_END) - position
+        source.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+def optimize_pdf(
+    source: BinaryIO, output: BinaryIO, destination: str
+) -> OptimizationReport:
+    """Optimize a PDF for a destination.
+
+    Args:
+        source: Seekable binary file object holding the PDF
+        output: Writable binary file object the optimized PDF is written to
+        destination: Profile to optimize for (e.g. "fax", "email", "storage")
+
+    Returns:
+        The size report of the document.
+
+    Raises:
+        pikepdf.PdfError: If the input is not a valid PDF.
+    """
+    report = OptimizationReport(destination, input_bytes=source_size(source))
+    with pikepdf.Pdf.open(source) as pdf:
+        prepare(pdf, report)
+        save(pdf, output, report)
+    return report
+
+
+def optimize_pdf_bytes(pdf_bytes: bytes, destination: str, label: str = "PDF") -> bytes:
+    """Optimize an in-memory PDF, returning the original if that fails.
+
+    Args:
+        pdf_bytes: Raw bytes of the PDF
+        destination: Profile to optimize for (e.g. "fax", "email", "storage")
+        label: How the document is described in the size report log
+
+    Returns:
+        The optimized PDF, or ``pdf_bytes`` when optimization is disabled,
+        fails or does not make the document smaller.
+    """
+    if not settings.PDF_OPTIMIZE_ENABLED:
+        return pdf_bytes
+    output = io.BytesIO()
+    try:
+        report = optimize_pdf(io.BytesIO(pdf_bytes), output, destination)
+    except Exception as e:
+        logger.warning(f"Failed to optimize {label}, sending it as-is: {e}")
+        return pdf_bytes
+    report.log(label)
+    if report.output_bytes >= len(pdf_bytes):
+        return pdf_bytes
+    return output.getvalue()
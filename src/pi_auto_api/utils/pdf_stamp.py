@@ -0,0 +1,193 @@
+"""Bates numbers, exhibit labels and headers stamped onto merged pages.
+
+``BatesStamper`` is a page stamper for ``merge_pdfs_to``: each page is stamped
+as it is appended to the merged document, so stamping needs no separate pass
+over the output. Per page it only adds two content stream references to the
+page's ``/Contents`` array; the page's own content is never decoded or
+rewritten:
+
+* a shared ``q`` stream in front of the page content, so whatever graphics
+  state the page leaves behind cannot move the stamp;
+* a short stream that restores that state, draws the cached overlay and
+  writes the page's Bates number.
+
+The header and exhibit label are the same on every page of an exhibit, so
+they are drawn by a Form XObject built once per (label, page box) and reused.
+Stamp streams are marked, and any stamp already on a page (e.g. pages copied
+from a previous version of a package) is replaced rather than stacked.
+Stamps are laid out in the page's MediaBox; page rotation is not taken into
+account.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import pikepdf
+from pikepdf import Name
+
+logger = logging.getLogger(__name__)
+
+# Key marking content streams added by the stamper
+STAMP_MARKER = Name("/PiAutoStamp")
+
+# Resource names the stamp font and overlays are registered under on pages
+FONT_NAME = Name("/PiAutoStampFont")
+OVERLAY_PREFIX = "/PiAutoStampOverlay"
+
+# Courier glyphs are 600/1000 em wide, so text can be right-aligned exactly
+CHAR_WIDTH = 0.6
+
+# Distance of the stamps from the page edges, in points
+MARGIN = 18
+
+
+def _text(x: float, y: float, size: float, text: str) -> bytes:
+    """Content stream operators drawing one line of text."""
+    literal = pikepdf.String(text).unparse()
+    position = f"BT {FONT_NAME} {size:g} Tf {x:.2f} {y:.2f} Td ".encode()
+    return position + literal + b" Tj ET\n"
+
+
+def _right_x(box: Tuple[float, ...], size: float, text: str) -> float:
+    """X position that right-aligns text against the page margin."""
+    return box[2] - MARGIN - CHAR_WIDTH * size * len(text)
+
+
+@dataclass
+class BatesStamper:
+    """Stamp Bates numbers, exhibit labels and a header while merging.
+
+    Attributes:
+        prefix: Text in front of every Bates number (e.g. "PI123-")
+        start: Bates number of the first stamped page
+        digits: Width the Bates number is zero-padded to
+        header: Text at the top left of every page, if any
+        labels: Label of each merge source (e.g. "Exhibit 1"), by source index;
+            sources without a label get none
+        font_size: Size of the stamped text in points
+    """
+
+    prefix: str = ""
+    start: int = 1
+    digits: int = 6
+    header: Optional[str] = None
+    labels: Sequence[Optional[str]] = ()
+    font_size: float = 9
+    next_number: int = field(init=False)
+    _pdf: Optional[pikepdf.Pdf] = field(default=None, init=False, repr=False)
+    _objects: Dict[object, Any] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        """Start numbering at ``start``."""
+        self.next_number = self.start
+
+    def _cached(self, pdf: pikepdf.Pdf, key: object, build: Callable[[], Any]) -> Any:
+        """Get a shared object of the document, building it on first use."""
+        if pdf is not self._pdf:
+            # Objects belong to one document; start over for another one
+            self._pdf = pdf
+            self._objects = {}
+        obj = self._objects.get(key)
+        if obj is None:
+            obj = self._objects[key] = build()
+        return obj
+
+    def _font(self, pdf: pikepdf.Pdf) -> pikepdf.Object:
+        """The stamp font (standard Courier, so nothing is embedded)."""
+        return self._cached(
+            pdf,
+            "font",
+            lambda: pdf.make_indirect(
+                pikepdf.Dictionary(
+                    Type=Name.Font,
+                    Subtype=Name.Type1,
+                    BaseFont=Name.Courier,
+                    Encoding=Name.WinAnsiEncoding,
+                )
+            ),
+        )
+
+    def _save_state(self, pdf: pikepdf.Pdf) -> pikepdf.Object:
+        """The shared stream saving the graphics state before page content."""
+        return self._cached(pdf, "save", lambda: self._marked(pdf.make_stream(b"q\n")))
+
+    def _overlay(
+        self, pdf: pikepdf.Pdf, box: Tuple[float, ...], label: Optional[str]
+    ) -> Optional[Tuple[Name, pikepdf.Object]]:
+        """The Form XObject with the header and exhibit label for a page box.
+
+        Returns:
+            The resource name and the XObject, or None if there is nothing to
+            draw.
+        """
+        if not self.header and not label:
+            return None
+
+        def build() -> Tuple[Name, pikepdf.Object]:
+            y = box[3] - MARGIN - self.font_size
+            content = b""
+            if self.header:
+                content += _text(box[0] + MARGIN, y, self.font_size, self.header)
+            if label:
+                x = _right_x(box, self.font_size, label)
+                content += _text(x, y, self.font_size, label)
+            name = Name(f"{OVERLAY_PREFIX}{len(self._objects)}")
+            return name, pdf.make_stream(
+                content,
+                Type=Name.XObject,
+                Subtype=Name.Form,
+                BBox=list(box),
+                Resources=pikepdf.Dictionary(
+                    Font=pikepdf.Dictionary({str(FONT_NAME): self._font(pdf)})
+                ),
+            )
+
+        return self._cached(pdf, ("overlay", label, box), build)
+
+    @staticmethod
+    def _marked(stream: pikepdf.Object) -> pikepdf.Object:
+        """Mark a content stream as added by the stamper."""
+        stream[STAMP_MARKER] = True
+        return stream
+
+    @staticmethod
+    def _remove_stamp(page: pikepdf.Page) -> None:
+        """Drop stamp streams a page already carries."""
+        contents = page.obj.get(Name.Contents)
+        if isinstance(contents, pikepdf.Array):
+            kept = [stream for stream in contents if STAMP_MARKER not in stream]
+            if len(kept) != len(contents):
+                page.obj.Contents = pikepdf.Array(kept)
+
+    def stamp_page(
+        self, pdf: pikepdf.Pdf, page: pikepdf.Page, source_index: int
+    ) -> None:
+        """Stamp one page appended to the merged document.
+
+        Args:
+            pdf: The merged document
+            page: The page, already part of ``pdf``
+            source_index: Index of the merge source the page came from
+        """
+        self._remove_stamp(page)
+        box = tuple(float(value) for value in page.mediabox)
+        label = None
+        if source_index < len(self.labels):
+            label = self.labels[source_index]
+        bates = f"{self.prefix}{self.next_number:0{self.digits}d}"
+        self.next_number += 1
+
+        page.add_resource(self._font(pdf), Name.Font, FONT_NAME)
+        content = b"Q q\n"
+        overlay = self._overlay(pdf, box, label)
+        if overlay is not None:
+            name, xobject = overlay
+            page.add_resource(xobject, Name.XObject, name)
+            content += f"{name} Do\n".encode()
+        x = _right_x(box, self.font_size, bates)
+        content += _text(x, box[1] + MARGIN, self.font_size, bates)
+        content += b"Q\n"
+
+        page.contents_add(self._save_state(pdf), prepend=True)
+        page.contents_add(self._marked(pdf.make_stream(content)), prepend=False)
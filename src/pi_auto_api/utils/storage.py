@@ -1,16 +1,28 @@
 """Storage utilities for handling file uploads and downloads."""
 
+import asyncio
+import io
 import logging
+import os
 import uuid
 from datetime import datetime
+from typing import AsyncIterator, BinaryIO, Optional, Tuple, Union
 
 import httpx
 from fastapi import HTTPException, status
 
 from pi_auto_api.config import settings
+from pi_auto_api.http_clients import get_client
+from pi_auto_api.utils import storage_cache
 
 logger = logging.getLogger(__name__)
 
+# Size of the chunks read from file objects streamed to storage
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Size of the chunks written to the storage cache while downloading
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
 
 async def upload_to_bucket(pdf_bytes: bytes) -> str:
     """Upload a PDF to Supabase Storage and return a signed URL valid for 24 hours.
@@ -49,67 +61,85 @@ async def upload_to_bucket(pdf_bytes: bytes) -> str:
         "Content-Type": "application/pdf",
     }
 
-    async with httpx.AsyncClient() as client:
-        try:
-            # Upload the PDF to Supabase Storage
-            upload_response = await client.post(
-                upload_url, content=pdf_bytes, headers=headers, timeout=30.0
-            )
-            upload_response.raise_for_status()
-
-            # Generate a signed URL valid for 24 hours
-            expires_in = 60 * 60 * 24  # 24 hours in seconds
-            sign_response = await client.post(
-                sign_url, json={"expiresIn": expires_in}, headers=headers, timeout=10.0
-            )
-            sign_response.raise_for_status()
-
-            signed_url = sign_response.json().get("signedURL")
-            if not signed_url:
-                raise ValueError("No signed URL returned from Supabase")
-
-            # Make sure the URL is publicly accessible (required by Twilio)
-            signed_url = (
-                signed_url
-                if signed_url.startswith("http")
-                else f"{settings.SUPABASE_URL}{signed_url}"
-            )
-
-            logger.info(f"Successfully uploaded and signed URL for {object_path}")
-            return signed_url
-
-        except httpx.RequestError as exc:
-            logger.error(f"Error uploading to Supabase Storage: {exc}", exc_info=True)
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail=f"Error uploading document: {exc}",
-            ) from exc
-        except httpx.HTTPStatusError as exc:
-            status_code = (
-                status.HTTP_400_BAD_REQUEST
-                if 400 <= exc.response.status_code < 500
-                else status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
-            detail = (
-                f"Supabase Storage API error ({exc.response.status_code}): "
-                f"{exc.response.text}"
-            )
-            logger.error(detail, exc_info=True)
-            raise HTTPException(status_code=status_code, detail=detail) from exc
-        except Exception as exc:
-            logger.error(f"Unexpected error in storage operation: {exc}", exc_info=True)
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Unexpected error: {exc}",
-            ) from exc
-
-
-async def upload_file(doc_id: str, content_bytes: bytes, content_type: str) -> bool:
+    client = get_client("supabase_storage")
+    try:
+        # Upload the PDF to Supabase Storage
+        upload_response = await client.post(
+            upload_url, content=pdf_bytes, headers=headers
+        )
+        upload_response.raise_for_status()
+
+        # Generate a signed URL valid for 24 hours
+        expires_in = 60 * 60 * 24  # 24 hours in seconds
+        sign_response = await client.post(
+            sign_url, json={"expiresIn": expires_in}, headers=headers, timeout=10.0
+        )
+        sign_response.raise_for_status()
+
+        signed_url = sign_response.json().get("signedURL")
+        if not signed_url:
+            raise ValueError("No signed URL returned from Supabase")
+
+        # Make sure the URL is publicly accessible (required by Twilio)
+        signed_url = (
+            signed_url
+            if signed_url.startswith("http")
+            else f"{settings.SUPABASE_URL}{signed_url}"
+        )
+
+        logger.info(f"Successfully uploaded and signed URL for {object_path}")
+        return signed_url
+
+    except httpx.RequestError as exc:
+        logger.error(f"Error uploading to Supabase Storage: {exc}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Error uploading document: {exc}",
+        ) from exc
+    except httpx.HTTPStatusError as exc:
+        status_code = (
+            status.HTTP_400_BAD_REQUEST
+            if 400 <= exc.response.status_code < 500
+            else status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+        detail = (
+            f"Supabase Storage API error ({exc.response.status_code}): "
+            f"{exc.response.text}"
+        )
+        logger.error(detail, exc_info=True)
+        raise HTTPException(status_code=status_code, detail=detail) from exc
+    except Exception as exc:
+        logger.error(f"Unexpected error in storage operation: {exc}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Unexpected error: {exc}",
+        ) from exc
+
+
+async def _iter_file(fileobj: BinaryIO) -> AsyncIterator[bytes]:
+    """Read a file object in chunks without blocking the event loop."""
+    while chunk := await asyncio.to_thread(fileobj.read, UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+
+def _remaining_size(fileobj: BinaryIO) -> int:
+    """Get the number of bytes between the current position and the end."""
+    position = fileobj.tell()
+    size = fileobj.seek(0, os.SEEK_END) - position
+    fileobj.seek(position)
+    return size
+
+
+async def upload_file(
+    doc_id: str, content_bytes: Union[bytes, BinaryIO], content_type: str
+) -> bool:
     """Upload a file to Supabase Storage under a specific doc_id.
 
     Args:
         doc_id: The unique ID of the document, used as the filename.
-        content_bytes: Raw bytes of the file to upload.
+        content_bytes: Raw bytes of the file to upload, or a seekable binary
+            file object positioned at the start of the content. File objects
+            are streamed in chunks instead of being read into memory.
         content_type: The MIME type of the file (e.g., 'application/pdf').
 
     Returns:
@@ -134,37 +164,132 @@ async def upload_file(doc_id: str, content_bytes: bytes, content_type: str) -> b
         "Content-Type": content_type,
     }
 
-    async with httpx.AsyncClient() as client:
-        try:
-            upload_response = await client.post(
-                upload_url, content=content_bytes, headers=headers, timeout=30.0
-            )
-            upload_response.raise_for_status()
-            logger.info(f"Successfully uploaded file {doc_id} to {object_path}")
-            return True
-        except httpx.RequestError as exc:
-            logger.error(
-                f"Error uploading file {doc_id} to Supabase: {exc}", exc_info=True
+    content = content_bytes
+    if not isinstance(content_bytes, (bytes, bytearray)):
+        headers["Content-Length"] = str(_remaining_size(content_bytes))
+        content = _iter_file(content_bytes)
+
+    client = get_client("supabase_storage")
+    try:
+        upload_response = await client.post(
+            upload_url, content=content, headers=headers
+        )
+        upload_response.raise_for_status()
+        logger.info(f"Successfully uploaded file {doc_id} to {object_path}")
+        return True
+    except httpx.RequestError as exc:
+        logger.error(f"Error uploading file {doc_id} to Supabase: {exc}", exc_info=True)
+        return False
+    except httpx.HTTPStatusError as exc:
+        logger.error(
+            f"Supabase API error for {doc_id} ({exc.response.status_code}): "
+            f"{exc.response.text}",
+            exc_info=True,
+        )
+        return False
+    except Exception as exc:
+        logger.error(f"Unexpected error uploading file {doc_id}: {exc}", exc_info=True)
+        return False
+
+
+async def _download(
+    doc_id: str,
+    url: str,
+    headers: dict,
+    cache_path: str,
+    cached: Optional[Tuple[str, BinaryIO]],
+) -> BinaryIO:
+    """Download a file, revalidating or filling the storage cache."""
+    client = get_client("supabase_storage")
+    async with client.stream("GET", url, headers=headers) as response:
+        if cached is not None and response.status_code == 304:
+            logger.info(f"Using cached file content for {doc_id}")
+            return cached[1]
+        if response.is_error:
+            # Load the body so error handlers can log it
+            await response.aread()
+        response.raise_for_status()
+
+        etag = response.headers.get("ETag")
+        if settings.STORAGE_CACHE_ENABLED and etag:
+            return await storage_cache.store(
+                cache_path, etag, response.aiter_bytes(DOWNLOAD_CHUNK_SIZE)
             )
-            return False
-        except httpx.HTTPStatusError as exc:
+        return io.BytesIO(await response.aread())
+
+
+async def open_file(doc_id: str) -> BinaryIO | None:
+    """Open a file stored under a doc_id in Supabase Storage.
+
+    When STORAGE_CACHE_ENABLED is set the file is served from the local
+    storage cache (see ``utils/storage_cache.py``) if Storage confirms, by
+    ETag, that the cached copy is current; otherwise it is downloaded and
+    cached. Without the cache the content is read into memory.
+
+    Args:
+        doc_id: The unique ID of the document (used as filename).
+
+    Returns:
+        A binary file object positioned at the start of the content (the
+        caller closes it), or None if the file could not be retrieved.
+
+    Raises:
+        ValueError: If Supabase credentials are not configured.
+    """
+    if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
+        logger.error("Supabase credentials not configured for open_file")
+        raise ValueError("Supabase credentials not configured for open_file")
+
+    bucket_name = "documents"
+    object_path = f"generated/{doc_id}"  # Assuming files are stored here by upload_file
+
+    download_url = (
+        f"{settings.SUPABASE_URL}/storage/v1/object/{bucket_name}/{object_path}"
+    )
+    headers = {"Authorization": f"Bearer {settings.SUPABASE_KEY}"}
+
+    cache_path = f"{bucket_name}/{object_path}"
+    cached = None
+    content = None
+    if settings.STORAGE_CACHE_ENABLED:
+        cached = await asyncio.to_thread(storage_cache.lookup, cache_path)
+        if cached is not None:
+            headers["If-None-Match"] = cached[0]
+
+    try:
+        content = await _download(doc_id, download_url, headers, cache_path, cached)
+        logger.info(f"Successfully retrieved file content for {doc_id}")
+        return content
+    except httpx.RequestError as exc:
+        logger.error(
+            f"Error downloading file {doc_id} from Supabase: {exc}", exc_info=True
+        )
+        return None
+    except httpx.HTTPStatusError as exc:
+        if exc.response.status_code == 404:
+            logger.warning(f"File {doc_id} not found in Supabase at {object_path}.")
+        else:
             logger.error(
                 f"Supabase API error for {doc_id} ({exc.response.status_code}): "
                 f"{exc.response.text}",
                 exc_info=True,
             )
-            return False
-        except Exception as exc:
-            logger.error(
-                f"Unexpected error uploading file {doc_id}: {exc}", exc_info=True
-            )
-            return False
+        return None
+    except Exception as exc:
+        logger.error(
+            f"Unexpected error downloading file {doc_id}: {exc}", exc_info=True
+        )
+        return None
+    finally:
+        if cached is not None and content is not cached[1]:
+            cached[1].close()
 
 
 async def get_file_content(doc_id: str) -> bytes | None:
     """Retrieve the content of a file from Supabase Storage using its doc_id.
 
     Assumes the file was stored using the doc_id as its name in a 'generated' path.
+    Goes through the local storage cache like ``open_file``.
 
     Args:
         doc_id: The unique ID of the document (used as filename).
@@ -172,44 +297,43 @@ async def get_file_content(doc_id: str) -> bytes | None:
     Returns:
         The file content as bytes if successful, None otherwise.
 
+    Raises:
+        ValueError: If Supabase credentials are not configured.
+    """
+    content = await open_file(doc_id)
+    if content is None:
+        return None
+    with content:
+        return await asyncio.to_thread(content.read)
+
+
+async def get_file_etag(doc_id: str) -> str | None:
+    """Get the current ETag of a file without downloading it.
+
+    Args:
+        doc_id: The unique ID of the document (used as filename).
+
+    Returns:
+        The ETag reported by Supabase Storage, or None if the file is missing,
+        has no ETag or could not be checked.
+
     Raises:
         ValueError: If Supabase credentials are not configured.
     """
     if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
-        logger.error("Supabase credentials not configured for get_file_content")
-        raise ValueError("Supabase credentials not configured for get_file_content")
+        logger.error("Supabase credentials not configured for get_file_etag")
+        raise ValueError("Supabase credentials not configured for get_file_etag")
 
     bucket_name = "documents"
-    object_path = f"generated/{doc_id}"  # Assuming files are stored here by upload_file
+    object_path = f"generated/{doc_id}"
 
-    download_url = (
-        f"{settings.SUPABASE_URL}/storage/v1/object/{bucket_name}/{object_path}"
-    )
+    url = f"{settings.SUPABASE_URL}/storage/v1/object/{bucket_name}/{object_path}"
     headers = {"Authorization": f"Bearer {settings.SUPABASE_KEY}"}
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(download_url, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            logger.info(f"Successfully retrieved file content for {doc_id}")
-            return response.content
-        except httpx.RequestError as exc:
-            logger.error(
-                f"Error downloading file {doc_id} from Supabase: {exc}", exc_info=True
-            )
-            return None
-        except httpx.HTTPStatusError as exc:
-            if exc.response.status_code == 404:
-                logger.warning(f"File {doc_id} not found in Supabase at {object_path}.")
-            else:
-                logger.error(
-                    f"Supabase API error for {doc_id} ({exc.response.status_code}): "
-                    f"{exc.response.text}",
-                    exc_info=True,
-                )
-            return None
-        except Exception as exc:
-            logger.error(
-                f"Unexpected error downloading file {doc_id}: {exc}", exc_info=True
-            )
-            return None
+    try:
+        response = await get_client("supabase_storage").head(url, headers=headers)
+        response.raise_for_status()
+        return response.headers.get("ETag")
+    except Exception as exc:
+        logger.warning(f"Could not check the version of file {doc_id}: {exc}")
+        return None
@@ -0,0 +1,229 @@
+"""On-disk cache of objects downloaded from Supabase Storage.
+
+Demand packages are rebuilt from the same medical records, bills and photos
+over and over (retries, new versions), so downloaded objects are kept on local
+disk under STORAGE_CACHE_DIR and shared by every process of the same user on
+the host:
+
+* ``blobs/<sha256>`` holds object content, addressed by its hash, so identical
+  objects are stored once;
+* ``index/<sha256 of object path>.json`` maps an object path to the ETag
+  Storage returned for it and the hash of its content.
+
+A cached object is never trusted blindly: ``storage.open_file`` sends its ETag
+in ``If-None-Match`` and only uses the blob when Storage answers 304 Not
+Modified. Blobs are evicted least recently used first (by modification time,
+which is bumped on every hit) once the cache grows past STORAGE_CACHE_MAX_BYTES.
+
+The cache holds client records, so its directory is created with mode 0700
+and refused if another user owns it or it is group or world accessible.
+Without STORAGE_CACHE_DIR it lives in a per-user directory under the system
+temp directory.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Optional, Tuple
+
+from pi_auto_api.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bytes this process believes the cache holds: set by every eviction scan and
+# increased by what the process stores, so the directory is only scanned once
+# the estimate crosses the limit. Other processes' writes are only seen at the
+# next scan, so the cache can overshoot by what they stored in between.
+_size: Optional[int] = None
+_size_lock = threading.Lock()
+
+
+def _private_dir(path: str) -> Path:
+    """Create a directory only the current user can use, or verify it is one.
+
+    Raises:
+        PermissionError: If the directory is a symlink, belongs to another
+            user or is accessible to other users.
+    """
+    directory = Path(path)
+    directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"Storage cache directory {path} is not ours")
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        raise PermissionError(
+            f"Storage cache directory {path} is accessible to other users"
+        )
+    return directory
+
+
+def cache_dir() -> Path:
+    """Resolve the cache directory, creating it private to the current user.
+
+    Raises:
+        PermissionError: If the directory is not private to the current user.
+    """
+    return _private_dir(
+        settings.STORAGE_CACHE_DIR
+        or os.path.join(
+            tempfile.gettempdir(), f"pi_auto_api_storage_cache-{os.getuid()}"
+        )
+    )
+
+
+def _index_path(object_path: str) -> Path:
+    """Path of the index entry of an object."""
+    name = hashlib.sha256(object_path.encode()).hexdigest()
+    return cache_dir() / "index" / f"{name}.json"
+
+
+def _blob_path(digest: str) -> Path:
+    """Path of the blob holding content with the given hash."""
+    return cache_dir() / "blobs" / digest
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """Write a file so readers never see it half written."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    with os.fdopen(fd, "wb") as tmp:
+        tmp.write(data)
+    os.replace(tmp_path, path)
+
+
+def lookup(object_path: str) -> Optional[Tuple[str, BinaryIO]]:
+    """Find the cached copy of an object.
+
+    The blob is opened here, so it stays readable even if another process
+    evicts it before the caller is done with it.
+
+    Args:
+        object_path: Path of the object in Storage (``<bucket>/<path>``)
+
+    Returns:
+        The ETag the copy was stored with and the open blob, or None.
+    """
+    try:
+        entry = json.loads(_index_path(object_path).read_text())
+        blob_path = _blob_path(entry["sha256"])
+        blob = open(blob_path, "rb")
+    except (OSError, ValueError, KeyError):
+        return None
+    # Mark the blob as recently used
+    try:
+        os.utime(blob_path)
+    except OSError:
+        pass
+    return entry["etag"], blob
+
+
+async def store(object_path: str, etag: str, chunks: AsyncIterator[bytes]) -> BinaryIO:
+    """Write downloaded content to the cache and return it opened for reading.
+
+    Args:
+        object_path: Path of the object in Storage (``<bucket>/<path>``)
+        etag: ETag Storage returned with the content
+        chunks: The downloaded content
+
+    Returns:
+        The cached blob, open at the start.
+    """
+    blobs = cache_dir() / "blobs"
+    await asyncio.to_thread(blobs.mkdir, parents=True, exist_ok=True)
+
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=blobs, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            async for chunk in chunks:
+                digest.update(chunk)
+                await asyncio.to_thread(tmp.write, chunk)
+        blob_path = _blob_path(digest.hexdigest())
+        blob, added = await asyncio.to_thread(_publish, tmp_path, blob_path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+    entry = {"etag": etag, "sha256": digest.hexdigest()}
+    await asyncio.to_thread(
+        _write_atomic, _index_path(object_path), json.dumps(entry).encode()
+    )
+    if _grow(added, settings.STORAGE_CACHE_MAX_BYTES):
+        await asyncio.to_thread(evict, settings.STORAGE_CACHE_MAX_BYTES)
+    return blob
+
+
+def _publish(tmp_path: str, blob_path: Path) -> Tuple[BinaryIO, int]:
+    """Move a downloaded file into place and open it before eviction can run.
+
+    Returns:
+        The open blob and the bytes it added to the cache (0 if identical
+        content was already cached).
+    """
+    existed = blob_path.exists()
+    os.replace(tmp_path, blob_path)
+    blob = open(blob_path, "rb")
+    return blob, 0 if existed else os.fstat(blob.fileno()).st_size
+
+
+def _grow(added: int, max_bytes: int) -> bool:
+    """Add stored bytes to the size estimate and tell whether to scan."""
+    global _size
+    with _size_lock:
+        if _size is None:
+            return True
+        _size += added
+        return _size > max_bytes
+
+
+def evict(max_bytes: int) -> int:
+    """Delete least recently used blobs until the cache fits in max_bytes.
+
+    Index entries of evicted blobs are left behind; they are treated as misses
+    and overwritten on the next download.
+
+    Returns:
+        The number of blobs deleted.
+    """
+    blobs = []
+    try:
+        with os.scandir(cache_dir() / "blobs") as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith(".tmp-"):
+                    stat = entry.stat()
+                    blobs.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return 0
+
+    global _size
+    total = sum(size for _, size, _ in blobs)
+    evicted = 0
+    for _, size, path in sorted(blobs):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        evicted += 1
+    with _size_lock:
+        _size = total
+    if evicted:
+        logger.info(f"Evicted {evicted} blob(s) from the storage cache")
+    return evicted
+
+
+def clear() -> None:
+    """Delete every cached object."""
+    global _size
+    shutil.rmtree(cache_dir(), ignore_errors=True)
+    with _size_lock:
+        _size = None
@@ -0,0 +1,197 @@
+"""Persistent asyncio runtime for Celery worker processes.
+
+Each worker process owns a single long-lived event loop running on a
+background thread. Async task bodies and the sync tasks that call async
+helpers both run their coroutines on that loop, so loop-bound resources
+(the asyncpg pool from ``db_pool``, the Redis client in ``events``, HTTP
+clients) are created once and reused across tasks instead of being thrown
+away by ``asyncio.run`` on every invocation.
+
+The loop is started from ``worker_process_init`` and torn down from
+``worker_process_shutdown``; it is also started lazily on first use so the
+solo pool, eager mode and scripts work without the signals.
+"""
+
+import asyncio
+import concurrent.futures
+import inspect
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Optional, TypeVar
+
+from celery import Task
+from celery.signals import worker_process_init, worker_process_shutdown
+
+from pi_auto_api import cpu_pool, db_pool, events, http_clients, outbox, task_queue
+from pi_auto_api.config import settings
+from pi_auto_api.utils import email_renderer
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop) -> None:
+    """Thread target that runs the worker loop until it is stopped."""
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Get the worker event loop, starting it if it is not running yet.
+
+    Returns:
+        The event loop shared by all tasks in this process.
+    """
+    global _loop, _thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(
+                target=_run_loop,
+                args=(_loop,),
+                name="celery-async-runtime",
+                daemon=True,
+            )
+            _thread.start()
+            logger.info(f"Started async worker runtime in process {os.getpid()}")
+        return _loop
+
+
+def run_async(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """Run a coroutine on the worker loop and block until it finishes.
+
+    Args:
+        coro: The coroutine to run.
+        timeout: Optional number of seconds to wait for the result.
+
+    Returns:
+        The coroutine's result.
+
+    Raises:
+        RuntimeError: If called from the worker loop itself (it would deadlock).
+        TimeoutError: If the coroutine does not finish within ``timeout``.
+        Exception: Whatever the coroutine raises.
+    """
+    loop = get_loop()
+    if threading.current_thread() is _thread:
+        raise RuntimeError("run_async() cannot be called from the worker loop")
+
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+
+async def _open_resources() -> None:
+    """Warm up loop-bound resources shared by tasks."""
+    try:
+        email_renderer.precompile_email_templates()
+    except Exception as e:
+        logger.warning(f"Failed to precompile email templates: {e}")
+
+    if settings.SUPABASE_URL:
+        try:
+            await db_pool.get_pool()
+        except Exception as e:
+            logger.error(f"Failed to initialize database connection pool: {str(e)}")
+
+        # Deliver outbox rows committed by tasks on this worker
+        outbox.start_relay()
+
+
+async def _close_resources() -> None:
+    """Release loop-bound resources before the loop stops."""
+    for close in (
+        outbox.stop_relay,
+        task_queue.close_enqueuer,
+        db_pool.close_pool,
+        events.close_redis_client,
+        http_clients.close_clients,
+        cpu_pool.close_pool,
+    ):
+        try:
+            await close()
+        except Exception as e:
+            logger.warning(f"Error closing worker resource {close.__name__}: {e}")
+
+
+def start() -> None:
+    """Start the worker loop and open shared resources."""
+    run_async(_open_resources())
+
+
+def shutdown(timeout: float = 10.0) -> None:
+    """Close shared resources and stop the worker loop.
+
+    Args:
+        timeout: Seconds to wait for resources to close and the thread to exit.
+    """
+    global _loop, _thread
+    with _lock:
+        loop, thread = _loop, _thread
+        _loop, _thread = None, None
+    if loop is None or loop.is_closed():
+        return
+
+    try:
+        asyncio.run_coroutine_threadsafe(_close_resources(), loop).result(timeout)
+    except Exception as e:
+        logger.warning(f"Error closing worker resources: {e}")
+
+    loop.call_soon_threadsafe(loop.stop)
+    if thread is not None:
+        thread.join(timeout)
+    loop.close()
+    logger.info(f"Stopped async worker runtime in process {os.getpid()}")
+
+
+class AsyncTask(Task):
+    """Celery task base class with native support for ``async def`` bodies.
+
+    When the worker executes a task whose body is a coroutine function, the
+    coroutine is driven to completion on the worker loop. When the task is
+    called directly from async code (``await some_task(...)``), the coroutine
+    is returned unchanged so the caller's loop awaits it.
+    """
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        """Execute the task body, running coroutines on the worker loop."""
+        result = super().__call__(*args, **kwargs)
+        if not inspect.isawaitable(result):
+            return result
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return run_async(result)
+        return result
+
+
+@worker_process_init.connect
+def _on_worker_process_init(**kwargs: Any) -> None:
+    """Start the runtime in each freshly forked worker process."""
+    start()
+
+
+@worker_process_shutdown.connect
+def _on_worker_process_shutdown(**kwargs: Any) -> None:
+    """Stop the runtime before the worker process exits."""
+    shutdown()
+
+
+def _reset_after_fork() -> None:
+    """Forget the parent's loop; its thread does not exist in the child."""
+    global _loop, _thread, _lock
+    _loop, _thread = None, None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
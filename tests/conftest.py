@@ -4,6 +4,7 @@ import os
 import sys
 from pathlib import Path
 from typing import AsyncGenerator
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import asyncpg
 import pytest
@@ -17,6 +18,9 @@ src_path = str(Path(__file__).parent.parent / "src")
 if src_path not in sys.path:
     sys.path.insert(0, src_path)
 
+# Run CPU-bound jobs in threads, where tests can patch what they call
+os.environ.setdefault("CPU_POOL_PROCESSES", "0")
+
 # Imports needed for test setup & app context
 from pi_auto.db.models import Base, Staff  # noqa: E402 # Import Base & Staff
 from pi_auto.db.session import (  # noqa: E402
@@ -25,6 +29,7 @@ from pi_auto.db.session import (  # noqa: E402
 from pi_auto_api.auth import get_password_hash  # noqa: E402 # For test user fixtures
 from pi_auto_api.config import settings  # noqa: E402
 from pi_auto_api.main import app  # noqa: E402 # App instance
+from pi_auto_api.utils import doc_cache  # noqa: E402
 
 # Import test constants needed by fixtures
 from tests.test_auth_login import TEST_STAFF_EMAIL, TEST_STAFF_PASSWORD  # noqa: E402
@@ -128,6 +133,41 @@ async def inactive_test_staff_user(db_session: AsyncSession) -> Staff:
     return user
 
 
+# --- Shared asyncpg pool mock (pi_auto_api.db_pool) ---
+
+
+@pytest.fixture(autouse=True)
+def clear_doc_cache():
+    """Keep generated documents from leaking between tests."""
+    doc_cache.clear()
+    yield
+    doc_cache.clear()
+
+
+@pytest.fixture
+def mock_db_pool():
+    """Patch the shared asyncpg pool registry with a mock pool.
+
+    ``mock_db_pool.conn`` is the connection yielded by ``db_pool.acquire()``;
+    tests may replace it with their own mock via ``mock_db_pool.use(conn)``.
+    """
+    pool = MagicMock()
+
+    def use(conn):
+        pool.conn = conn
+        pool.acquire.return_value.__aenter__.return_value = conn
+        if isinstance(conn.transaction, AsyncMock):
+            # conn.transaction() is a sync call returning an async context manager
+            conn.transaction = MagicMock(return_value=AsyncMock())
+        return conn
+
+    pool.use = use
+    use(AsyncMock())
+
+    with patch("pi_auto_api.db_pool.get_pool", AsyncMock(return_value=pool)):
+        yield pool
+
+
 # --- RLS Test Setup (Uses PostgreSQL, separate from above) ---
 
 
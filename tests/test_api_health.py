@@ -1,5 +1,7 @@
 """Tests for health check endpoints."""
 
+from unittest.mock import AsyncMock, MagicMock, patch
+
 import pytest
 from fastapi import status
 from httpx import AsyncClient
@@ -34,3 +36,15 @@ async def test_readyz_endpoint(async_client: AsyncClient):
     finally:
         # Clean up overrides
         app.dependency_overrides = original_deps
+
+
+@pytest.mark.asyncio
+async def test_check_docassemble_uses_short_timeout():
+    """Test the readiness probe does not wait the full rendering timeout."""
+    client = MagicMock()
+    client.get = AsyncMock(return_value=MagicMock(status_code=200))
+
+    with patch("pi_auto_api.main.http_clients.get_client", return_value=client):
+        await check_docassemble()
+
+    assert client.get.call_args.kwargs["timeout"] == 5.0
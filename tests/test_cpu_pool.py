@@ -0,0 +1,84 @@
+"""Tests for the shared CPU worker pool."""
+
+import asyncio
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+
+from pi_auto_api import cpu_pool
+
+
+@pytest.fixture
+def process_pool():
+    """Run jobs in one real worker process without preloading anything."""
+    with (
+        patch.object(cpu_pool.settings, "CPU_POOL_PROCESSES", 1),
+        patch.object(cpu_pool.settings, "CPU_POOL_PRELOAD", []),
+    ):
+        yield
+    asyncio.run(cpu_pool.close_pool())
+
+
+@pytest.mark.asyncio
+async def test_job_runs_in_worker_process(process_pool):
+    """Test jobs run in another process that is kept for later jobs."""
+    first = await cpu_pool.run_cpu(os.getpid)
+    second = await cpu_pool.run_cpu(os.getpid)
+
+    assert first != os.getpid()
+    assert first == second
+
+
+@pytest.mark.asyncio
+async def test_pool_starts_with_first_job(process_pool):
+    """Test no workers are spawned until a job needs them."""
+    assert cpu_pool._pool is None
+
+    await cpu_pool.run_cpu(os.getpid)
+
+    assert cpu_pool._pool is not None
+
+
+@pytest.mark.asyncio
+async def test_timed_out_job_restarts_pool(process_pool):
+    """Test a stuck job is abandoned and the next job gets a new worker."""
+    worker = await cpu_pool.run_cpu(os.getpid)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await cpu_pool.run_cpu(time.sleep, 30, timeout=0.5)
+
+    assert await cpu_pool.run_cpu(os.getpid) != worker
+
+
+@pytest.mark.asyncio
+async def test_thread_mode_runs_without_processes():
+    """Test jobs run in threads when the pool is disabled."""
+    with patch.object(cpu_pool.settings, "CPU_POOL_PROCESSES", 0):
+        assert await cpu_pool.run_cpu(sum, [1, 2, 3]) == 6
+
+    assert cpu_pool._pool is None
+
+
+@pytest.mark.asyncio
+async def test_pending_jobs_are_bounded():
+    """Test no more than CPU_POOL_MAX_PENDING jobs run at once per loop."""
+    running = []
+    peak = []
+
+    def job():
+        running.append(1)
+        peak.append(len(running))
+        time.sleep(0.05)
+        running.pop()
+
+    with (
+        patch.object(cpu_pool.settings, "CPU_POOL_PROCESSES", 0),
+        patch.object(cpu_pool.settings, "CPU_POOL_MAX_PENDING", 2),
+    ):
+        cpu_pool._slots.clear()
+        await asyncio.gather(*(cpu_pool.run_cpu(job) for _ in range(6)))
+    cpu_pool._slots.clear()
+
+    assert max(peak) == 2
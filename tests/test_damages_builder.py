@@ -9,13 +9,13 @@ import pandas as pd
 import pytest
 
 from pi_auto_api.config import settings
-from pi_auto_api.tasks.damages import build_damages_worksheet
+from pi_auto_api.tasks.damages import MEDICAL_BILLS_QUERY, build_damages_worksheet
 
 
 @pytest.fixture
-def mock_db_connection_damages():
-    """Mock database connection for damages worksheet tests."""
-    mock_conn = AsyncMock()
+def mock_db_connection_damages(mock_db_pool):
+    """Mock pooled database connection for damages worksheet tests."""
+    mock_conn = mock_db_pool.use(AsyncMock())
 
     # Seed three medical bill docs
     mock_bill_records = [
@@ -63,7 +63,6 @@ async def test_build_damages_worksheet_success(mock_db_connection_damages):
     mock_pdf_url = "https://supabase.example.com/pdf_worksheet.pdf"
 
     with (
-        patch("asyncpg.connect", return_value=mock_db_connection_damages),
         patch.object(settings, "SUPABASE_URL", "https://fake.supabase.co"),
         patch.object(settings, "SUPABASE_KEY", "fake-key"),
         patch(
@@ -87,19 +86,7 @@ async def test_build_damages_worksheet_success(mock_db_connection_damages):
 
         # Check database calls
         mock_db_connection_damages.fetch.assert_called_once_with(
-            """
-        SELECT
-            d.id AS doc_id,
-            p.name AS provider_name,
-            d.url AS bill_url,
-            d.amount AS bill_amount,
-            d.created_at AS bill_date
-        FROM doc d
-        JOIN provider p ON d.provider_id = p.id
-        WHERE d.incident_id = $1 AND d.type = 'medical_bill'
-        ORDER BY p.name, d.created_at;
-        """,
-            incident_id,
+            MEDICAL_BILLS_QUERY, incident_id
         )
 
         # Two uploads, two doc inserts
@@ -129,10 +116,8 @@ async def test_build_damages_worksheet_no_bills(mock_db_connection_damages):
     incident_id = 2
     mock_db_connection_damages.fetch.return_value = []  # Override to return no bills
 
-    with patch(
-        "asyncpg.connect", return_value=mock_db_connection_damages
-    ):  # Only need to mock connection
-        result = await build_damages_worksheet(incident_id)
+    # The pooled connection is already mocked by the fixture
+    result = await build_damages_worksheet(incident_id)
 
     assert result["status"] == "no_bills"
     assert result["incident_id"] == incident_id
@@ -148,7 +133,6 @@ async def test_build_damages_worksheet_upload_failure(mock_db_connection_damages
     incident_id = 3
 
     with (
-        patch("asyncpg.connect", return_value=mock_db_connection_damages),
         patch.object(settings, "SUPABASE_URL", "https://fake.supabase.co"),
         patch.object(settings, "SUPABASE_KEY", "fake-key"),
         patch(
@@ -7,7 +7,12 @@ from unittest.mock import AsyncMock, MagicMock, patch
 import asyncpg
 import pytest
 
-from pi_auto_api.db import get_client_payload
+from pi_auto_api.db import (
+    LAW_FIRM,
+    get_client_payload,
+    get_provider_payload,
+    get_provider_payloads,
+)
 
 # Sample data returned by mock fetchrow
 SAMPLE_DB_RECORD = {
@@ -44,48 +49,46 @@ CLIENT_ID = 99
 
 @pytest.mark.asyncio
 @patch("pi_auto_api.db.settings")
-@patch("pi_auto_api.db.asyncpg.connect")
-async def test_get_client_payload_success(mock_connect, mock_settings):
+async def test_get_client_payload_success(mock_settings, mock_db_pool):
     """Test get_client_payload successfully fetches and shapes data."""
     # Configure mocks
     mock_settings.SUPABASE_URL = "fake-url"
-    mock_conn = AsyncMock(spec=asyncpg.Connection)
+    mock_conn = mock_db_pool.use(AsyncMock(spec=asyncpg.Connection))
     # Simple MagicMock that returns the sample dict when accessed
     # This mock implicitly evaluates to True
     mock_record = MagicMock()
     mock_record.__getitem__.side_effect = SAMPLE_DB_RECORD.__getitem__
     mock_fetchrow = AsyncMock(return_value=mock_record)
     mock_conn.fetchrow = mock_fetchrow
-    mock_connect.return_value = mock_conn
 
     # Call the function
     payload = await get_client_payload(CLIENT_ID)
 
     # Assertions
-    mock_connect.assert_awaited_once_with("fake-url")
+    mock_db_pool.acquire.assert_called_once()
     mock_fetchrow.assert_awaited_once()
-    mock_conn.close.assert_awaited_once()
+    # The connection goes back to the pool instead of being closed
+    mock_db_pool.acquire.return_value.__aexit__.assert_awaited_once()
+    mock_conn.close.assert_not_called()
     assert payload == EXPECTED_PAYLOAD
 
 
 @pytest.mark.asyncio
 @patch("pi_auto_api.db.settings")
-@patch("pi_auto_api.db.asyncpg.connect")
-async def test_get_client_payload_not_found(mock_connect, mock_settings):
+async def test_get_client_payload_not_found(mock_settings, mock_db_pool):
     """Test get_client_payload raises ValueError when client not found."""
     # Configure mocks
     mock_settings.SUPABASE_URL = "fake-url"
-    mock_conn = AsyncMock(spec=asyncpg.Connection)
+    mock_conn = mock_db_pool.use(AsyncMock(spec=asyncpg.Connection))
     mock_fetchrow = AsyncMock(return_value=None)  # Simulate record not found
     mock_conn.fetchrow = mock_fetchrow
-    mock_connect.return_value = mock_conn
 
     # Call and assert exception
     with pytest.raises(ValueError, match=f"Client with ID {CLIENT_ID} not found."):
         await get_client_payload(CLIENT_ID)
 
-    # Assert connection closed even on error
-    mock_conn.close.assert_awaited_once()
+    # Assert connection released back to the pool even on error
+    mock_db_pool.acquire.return_value.__aexit__.assert_awaited_once()
 
 
 @pytest.mark.asyncio
@@ -95,3 +98,105 @@ async def test_get_client_payload_no_supabase_url(mock_settings):
     mock_settings.SUPABASE_URL = None
     with pytest.raises(ValueError, match="SUPABASE_URL is not set"):
         await get_client_payload(CLIENT_ID)
+
+
+def _provider_row(incident_id, provider_id):
+    """Build a row as returned by the batched provider payload query."""
+    return {
+        "client_id": 10 + incident_id,
+        "client_name": f"Client {incident_id}",
+        "client_dob": date(1990, 1, 1),
+        "client_phone": "555-555-5555",
+        "client_email": "client@example.com",
+        "client_address": "123 Test St",
+        "incident_id": incident_id,
+        "incident_date": date(2024, 1, 1),
+        "incident_location": "Test Location",
+        "incident_injuries": json.dumps(["Whiplash"]),
+        "provider_id": provider_id,
+        "provider_name": f"Provider {provider_id}",
+        "provider_address": "1 Clinic Way",
+        "provider_phone": "555-000-0000",
+        "provider_fax": "555-000-0001",
+        "provider_specialty": "Orthopedics",
+    }
+
+
+@pytest.mark.asyncio
+@patch("pi_auto_api.db.settings")
+async def test_get_provider_payloads_single_query(mock_settings, mock_db_pool):
+    """Test get_provider_payloads fetches every pair in one query."""
+    mock_settings.SUPABASE_URL = "fake-url"
+    mock_conn = mock_db_pool.conn
+    mock_conn.fetch.return_value = [
+        _provider_row(1, 100),
+        _provider_row(1, 101),
+        _provider_row(2, 200),
+    ]
+
+    with patch("pi_auto_api.db.json.loads", side_effect=json.loads) as mock_loads:
+        payloads = await get_provider_payloads(
+            [(1, 100), (1, 101), (2, 200), (1, 100), (3, 300)]
+        )
+
+    # One round trip with parallel, de-duplicated id arrays
+    mock_conn.fetch.assert_awaited_once()
+    assert mock_conn.fetch.call_args.args[1:] == ([1, 1, 2, 3], [100, 101, 200, 300])
+
+    # Missing pairs are left out; the rest are keyed by pair
+    assert set(payloads) == {(1, 100), (1, 101), (2, 200)}
+    assert payloads[(1, 101)]["provider"]["name"] == "Provider 101"
+    assert payloads[(2, 200)]["client"]["full_name"] == "Client 2"
+    assert payloads[(1, 100)]["incident"]["injuries"] == ["Whiplash"]
+    assert payloads[(1, 100)]["letter_date"] == payloads[(2, 200)]["letter_date"]
+
+    # Injuries are decoded once per incident, not once per provider
+    assert mock_loads.call_count == 2
+
+
+@pytest.mark.asyncio
+@patch("pi_auto_api.db.settings")
+async def test_get_provider_payloads_null_injuries(mock_settings, mock_db_pool):
+    """Test an incident without injuries does not fail the rest of the batch."""
+    mock_settings.SUPABASE_URL = "fake-url"
+    mock_db_pool.conn.fetch.return_value = [
+        {**_provider_row(1, 100), "incident_injuries": None},
+        _provider_row(2, 200),
+    ]
+
+    payloads = await get_provider_payloads([(1, 100), (2, 200)])
+
+    assert payloads[(1, 100)]["incident"]["injuries"] == []
+    assert payloads[(2, 200)]["incident"]["injuries"] == ["Whiplash"]
+
+
+@pytest.mark.asyncio
+@patch("pi_auto_api.db.settings")
+async def test_get_provider_payloads_are_independent(mock_settings, mock_db_pool):
+    """Test modifying one payload leaves the others and LAW_FIRM unchanged."""
+    mock_settings.SUPABASE_URL = "fake-url"
+    mock_db_pool.conn.fetch.return_value = [
+        _provider_row(1, 100),
+        _provider_row(1, 101),
+    ]
+
+    payloads = await get_provider_payloads([(1, 100), (1, 101)])
+    first, second = payloads[(1, 100)], payloads[(1, 101)]
+    first["client"]["full_name"] = "Changed"
+    first["incident"]["injuries"].append("Fracture")
+    first["law_firm"]["name"] = "Changed"
+
+    assert second["client"]["full_name"] == "Client 1"
+    assert second["incident"]["injuries"] == ["Whiplash"]
+    assert second["law_firm"]["name"] == LAW_FIRM["name"] != "Changed"
+
+
+@pytest.mark.asyncio
+@patch("pi_auto_api.db.settings")
+async def test_get_provider_payload_not_found(mock_settings, mock_db_pool):
+    """Test get_provider_payload raises when the pair has no data."""
+    mock_settings.SUPABASE_URL = "fake-url"
+    mock_db_pool.conn.fetch.return_value = []
+
+    with pytest.raises(ValueError, match="No data found for incident ID 1"):
+        await get_provider_payload(1, 2)
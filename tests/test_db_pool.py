@@ -0,0 +1,83 @@
+"""Tests for the per-event-loop asyncpg pool registry."""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from pi_auto_api import db_pool
+from pi_auto_api.config import settings
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    """Start and end every test with an empty pool registry."""
+    db_pool._pools.clear()
+    db_pool._locks.clear()
+    yield
+    db_pool._pools.clear()
+    db_pool._locks.clear()
+
+
+@pytest.mark.asyncio
+async def test_get_pool_requires_supabase_url():
+    """Test that get_pool raises when SUPABASE_URL is not configured."""
+    with patch.object(settings, "SUPABASE_URL", None):
+        with pytest.raises(ValueError, match="SUPABASE_URL is not set"):
+            await db_pool.get_pool()
+
+
+@pytest.mark.asyncio
+async def test_get_pool_is_cached_per_loop():
+    """Test that concurrent callers on one loop share a single pool."""
+    mock_pool = MagicMock()
+    with (
+        patch.object(settings, "SUPABASE_URL", "postgresql://u:p@localhost/db"),
+        patch(
+            "pi_auto_api.db_pool.asyncpg.create_pool",
+            AsyncMock(return_value=mock_pool),
+        ) as mock_create_pool,
+    ):
+        pools = await asyncio.gather(*(db_pool.get_pool() for _ in range(5)))
+
+    assert all(pool is mock_pool for pool in pools)
+    mock_create_pool.assert_awaited_once()
+    kwargs = mock_create_pool.call_args.kwargs
+    assert kwargs["min_size"] == settings.DB_POOL_MIN_SIZE
+    assert kwargs["max_size"] == settings.DB_POOL_MAX_SIZE
+    assert kwargs["server_settings"]["statement_timeout"] == str(
+        settings.DB_STATEMENT_TIMEOUT_MS
+    )
+
+
+@pytest.mark.asyncio
+async def test_pools_from_closed_loops_are_discarded():
+    """Test that a pool left behind by a closed loop is terminated."""
+    stale_loop = MagicMock()
+    stale_loop.is_closed.return_value = True
+    stale_pool = MagicMock()
+    db_pool._pools[stale_loop] = stale_pool
+
+    with (
+        patch.object(settings, "SUPABASE_URL", "postgresql://u:p@localhost/db"),
+        patch(
+            "pi_auto_api.db_pool.asyncpg.create_pool",
+            AsyncMock(return_value=MagicMock()),
+        ),
+    ):
+        await db_pool.get_pool()
+
+    stale_pool.terminate.assert_called_once()
+    assert stale_loop not in db_pool._pools
+
+
+@pytest.mark.asyncio
+async def test_close_pool():
+    """Test that close_pool closes and forgets the current loop's pool."""
+    mock_pool = AsyncMock()
+    db_pool._pools[asyncio.get_running_loop()] = mock_pool
+
+    await db_pool.close_pool()
+
+    mock_pool.close.assert_awaited_once()
+    assert not db_pool._pools
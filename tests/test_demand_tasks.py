@@ -1,12 +1,21 @@
 """Tests for demand package assembly tasks."""
 
 import io
+import os
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pikepdf
 import pytest
 
-from pi_auto_api.tasks.demand import assemble_demand_package, check_and_build_demand
+from pi_auto_api.tasks.demand import (
+    STALE_PACKAGES_QUERY,
+    _Exhibit,
+    _stage_exhibits,
+    assemble_demand_package,
+    check_and_build_demand,
+)
+from pi_auto_api.utils.package_rules import DemandReadiness
+from pi_auto_api.utils.pdf_merge import PdfPages
 
 
 def create_sample_pdf() -> bytes:
@@ -21,14 +30,17 @@ def create_sample_pdf() -> bytes:
 
 
 @pytest.mark.asyncio
-async def test_assemble_demand_package_success():
+async def test_assemble_demand_package_success(mock_db_pool):
     """Test successful assembly of a demand package."""
     # Mock dependencies
-    mock_conn = AsyncMock()
-    mock_conn.fetch.return_value = [
-        {"id": "doc1", "type": "medical_records"},
-        {"id": "doc2", "type": "damages_worksheet_pdf"},
-        {"id": "doc3", "type": "liability_photo"},
+    mock_conn = mock_db_pool.use(AsyncMock())
+    mock_conn.fetch.side_effect = [
+        [
+            {"id": "doc1", "type": "medical_records"},
+            {"id": "doc2", "type": "damages_worksheet_pdf"},
+            {"id": "doc3", "type": "liability_photo"},
+        ],
+        [],  # No previous package
     ]
     mock_conn.fetchval.return_value = "new_demand_package_id"
 
@@ -38,16 +50,12 @@ async def test_assemble_demand_package_success():
     with (
         patch("pi_auto_api.tasks.demand.is_demand_ready", AsyncMock(return_value=True)),
         patch(
-            "pi_auto_api.tasks.demand.asyncpg.connect",
-            AsyncMock(return_value=mock_conn),
-        ),
-        patch(
-            "pi_auto_api.tasks.demand.get_file_content",
-            AsyncMock(return_value=sample_pdf),
+            "pi_auto_api.tasks.demand.open_file",
+            AsyncMock(side_effect=lambda doc_id: io.BytesIO(sample_pdf)),
         ),
         patch("pi_auto_api.tasks.demand.upload_file", AsyncMock(return_value=True)),
         patch(
-            "pi_auto_api.tasks.demand.merge_pdfs", MagicMock(return_value=sample_pdf)
+            "pi_auto_api.tasks.demand.merge_pdfs_to", MagicMock(return_value=[1, 1, 1])
         ),
     ):
         # Call the function
@@ -55,9 +63,9 @@ async def test_assemble_demand_package_success():
 
         # Assertions
         assert result == "new_demand_package_id"
-        mock_conn.fetch.assert_called_once()
+        assert mock_conn.fetch.call_count == 2
         mock_conn.fetchval.assert_called_once()
-        mock_conn.close.assert_called_once()
+        mock_conn.close.assert_not_called()
 
 
 @pytest.mark.asyncio
@@ -75,13 +83,11 @@ async def test_assemble_demand_package_not_ready():
 
 
 @pytest.mark.asyncio
-async def test_assemble_demand_package_upload_failure():
+async def test_assemble_demand_package_upload_failure(mock_db_pool):
     """Test demand package assembly when upload fails."""
     # Mock dependencies
-    mock_conn = AsyncMock()
-    mock_conn.fetch.return_value = [
-        {"id": "doc1", "type": "medical_records"},
-    ]
+    mock_conn = mock_db_pool.use(AsyncMock())
+    mock_conn.fetch.side_effect = [[{"id": "doc1", "type": "medical_records"}], []]
     mock_conn.fetchval.return_value = "new_demand_package_id"
 
     sample_pdf = create_sample_pdf()
@@ -90,17 +96,11 @@ async def test_assemble_demand_package_upload_failure():
     with (
         patch("pi_auto_api.tasks.demand.is_demand_ready", AsyncMock(return_value=True)),
         patch(
-            "pi_auto_api.tasks.demand.asyncpg.connect",
-            AsyncMock(return_value=mock_conn),
-        ),
-        patch(
-            "pi_auto_api.tasks.demand.get_file_content",
-            AsyncMock(return_value=sample_pdf),
+            "pi_auto_api.tasks.demand.open_file",
+            AsyncMock(side_effect=lambda doc_id: io.BytesIO(sample_pdf)),
         ),
         patch("pi_auto_api.tasks.demand.upload_file", AsyncMock(return_value=False)),
-        patch(
-            "pi_auto_api.tasks.demand.merge_pdfs", MagicMock(return_value=sample_pdf)
-        ),
+        patch("pi_auto_api.tasks.demand.merge_pdfs_to", MagicMock(return_value=[1])),
     ):
         # Call the function
         result = await assemble_demand_package(incident_id=123)
@@ -111,41 +111,36 @@ async def test_assemble_demand_package_upload_failure():
 
 
 @pytest.mark.asyncio
-async def test_check_and_build_demand_no_incidents():
+async def test_check_and_build_demand_no_incidents(mock_db_pool):
     """Test nightly check with no incidents found."""
     # Mock dependencies
-    mock_conn = AsyncMock()
+    mock_conn = mock_db_pool.use(AsyncMock())
     mock_conn.fetch.return_value = []
 
-    # Patch dependencies
-    with patch(
-        "pi_auto_api.tasks.demand.asyncpg.connect", AsyncMock(return_value=mock_conn)
-    ):
-        # Call the function
-        result = await check_and_build_demand()
+    # Call the function
+    result = await check_and_build_demand()
 
-        # Assertions
-        assert result == 0
-        mock_conn.close.assert_called_once()
+    # Assertions
+    assert result == 0
+    # One query for stale packages, one for readiness
+    assert mock_conn.fetch.call_count == 2
+    # The pooled connection is released, not closed
+    mock_conn.close.assert_not_called()
 
 
 @pytest.mark.asyncio
-async def test_check_and_build_demand_with_eligible_incidents():
+async def test_check_and_build_demand_with_eligible_incidents(mock_db_pool):
     """Test nightly check with eligible incidents."""
-    # Mock dependencies
-    mock_conn = AsyncMock()
-    mock_conn.fetch.return_value = [{"id": 123}, {"id": 456}]
+    mock_db_pool.conn.fetch.return_value = []  # No outdated packages
+    readiness = DemandReadiness(ready=[123], missing={456: ["missing liability_photo"]})
 
     # Patch dependencies
     with (
         patch(
-            "pi_auto_api.tasks.demand.asyncpg.connect",
-            AsyncMock(return_value=mock_conn),
-        ),
-        patch(
-            "pi_auto_api.tasks.demand.is_demand_ready",
-            AsyncMock(side_effect=[True, False]),
-        ),
+            "pi_auto_api.tasks.demand.get_demand_readiness",
+            AsyncMock(return_value=readiness),
+        ) as mock_get_demand_readiness,
+        patch("pi_auto_api.tasks.demand.is_demand_ready") as mock_is_demand_ready,
         patch(
             "pi_auto_api.tasks.demand.assemble_demand_package",
             AsyncMock(return_value="demand_id"),
@@ -156,5 +151,232 @@ async def test_check_and_build_demand_with_eligible_incidents():
 
         # Assertions
         assert result == 1  # Only one package should be created
-        assert mock_assemble_demand_package.called
-        assert mock_assemble_demand_package.call_count == 1
+        mock_get_demand_readiness.assert_awaited_once_with()
+        # Readiness was evaluated in bulk, not per incident
+        mock_is_demand_ready.assert_not_called()
+        mock_assemble_demand_package.assert_called_once_with(
+            123, readiness_checked=True
+        )
+
+
+@pytest.mark.asyncio
+async def test_check_and_build_demand_rebuilds_stale_packages(mock_db_pool):
+    """Test packages whose exhibits changed are rebuilt incrementally."""
+    mock_conn = mock_db_pool.use(AsyncMock())
+    mock_conn.fetch.return_value = [
+        {"incident_id": 5, "package_id": 50},
+        {"incident_id": 6, "package_id": 60},
+    ]
+
+    with (
+        patch(
+            "pi_auto_api.tasks.demand.get_demand_readiness",
+            AsyncMock(return_value=DemandReadiness()),
+        ),
+        patch(
+            "pi_auto_api.tasks.demand.assemble_demand_package",
+            # Incident 6's exhibits turn out to be unchanged
+            AsyncMock(side_effect=[51, 60]),
+        ) as mock_assemble_demand_package,
+    ):
+        result = await check_and_build_demand()
+
+    assert result == 1
+    assert mock_conn.fetch.call_args.args == (STALE_PACKAGES_QUERY,)
+    assert [call.args for call in mock_assemble_demand_package.await_args_list] == [
+        (5,),
+        (6,),
+    ]
+    mock_assemble_demand_package.assert_awaited_with(6, readiness_checked=True)
+
+
+@pytest.mark.asyncio
+async def test_check_and_build_demand_can_skip_rebuilds(mock_db_pool):
+    """Test DEMAND_REBUILD_STALE=false leaves existing packages alone."""
+    with (
+        patch("pi_auto_api.tasks.demand.settings.DEMAND_REBUILD_STALE", False),
+        patch(
+            "pi_auto_api.tasks.demand.get_demand_readiness",
+            AsyncMock(return_value=DemandReadiness()),
+        ),
+    ):
+        assert await check_and_build_demand() == 0
+
+    mock_db_pool.conn.fetch.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_assemble_demand_package_streams_merged_pdf(mock_db_pool):
+    """Test the merged package is uploaded as a file object, not bytes."""
+    mock_conn = mock_db_pool.use(AsyncMock())
+    mock_conn.fetch.side_effect = [
+        [
+            {"id": "doc1", "type": "damages_worksheet_pdf"},
+            {"id": "doc2", "type": "medical_records"},
+        ],
+        [],
+    ]
+    mock_conn.fetchval.return_value = "new_demand_package_id"
+    uploaded = {}
+
+    async def upload_file(doc_id, content, content_type):
+        uploaded["content"] = content.read()
+        return True
+
+    with (
+        patch("pi_auto_api.tasks.demand.is_demand_ready", AsyncMock(return_value=True)),
+        patch(
+            "pi_auto_api.tasks.demand.open_file",
+            AsyncMock(side_effect=lambda doc_id: io.BytesIO(create_sample_pdf())),
+        ),
+        patch("pi_auto_api.tasks.demand.upload_file", upload_file),
+    ):
+        result = await assemble_demand_package(incident_id=123)
+
+    assert result == "new_demand_package_id"
+    with pikepdf.Pdf.open(io.BytesIO(uploaded["content"])) as pdf:
+        assert len(pdf.pages) == 2
+        # Pages are Bates numbered while merging
+        last_page = b"".join(s.read_bytes() for s in pdf.pages[1].Contents)
+        assert b"(INC123-000002)" in last_page
+
+
+def create_pages_pdf(pages: int) -> bytes:
+    """Create a PDF with the given number of pages."""
+    pdf = pikepdf.Pdf.new()
+    for _ in range(pages):
+        pdf.add_blank_page(page_size=(200, 200))
+    out_stream = io.BytesIO()
+    pdf.save(out_stream)
+    return out_stream.getvalue()
+
+
+EXHIBIT_ROWS = [
+    {"id": "doc1", "type": "damages_worksheet_pdf"},
+    {"id": "doc2", "type": "medical_bill"},
+]
+
+PREVIOUS_MANIFEST = [
+    {
+        "package_id": "old_package",
+        "position": 0,
+        "doc_id": "doc1",
+        "etag": '"v1"',
+        "sha256": "a" * 64,
+        "page_start": 0,
+        "page_count": 2,
+    },
+]
+
+
+@pytest.mark.asyncio
+async def test_incremental_rebuild_appends_only_new_exhibits(mock_db_pool):
+    """Test unchanged exhibits are copied from the previous package."""
+    mock_conn = mock_db_pool.use(AsyncMock())
+    mock_conn.fetch.side_effect = [EXHIBIT_ROWS, PREVIOUS_MANIFEST]
+    mock_conn.fetchval.return_value = "new_package"
+    files = {"old_package": create_pages_pdf(2), "doc2": create_pages_pdf(1)}
+    uploaded = {}
+
+    async def upload_file(doc_id, content, content_type):
+        uploaded["content"] = content.read()
+        return True
+
+    with (
+        patch(
+            "pi_auto_api.tasks.demand.get_file_etag",
+            AsyncMock(side_effect=lambda doc_id: {"doc1": '"v1"'}.get(doc_id)),
+        ),
+        patch(
+            "pi_auto_api.tasks.demand.open_file",
+            AsyncMock(side_effect=lambda doc_id: io.BytesIO(files[doc_id])),
+        ) as open_file,
+        patch("pi_auto_api.tasks.demand.upload_file", upload_file),
+    ):
+        result = await assemble_demand_package(123, readiness_checked=True)
+
+    assert result == "new_package"
+    assert sorted(call.args[0] for call in open_file.await_args_list) == [
+        "doc2",
+        "old_package",
+    ]
+    with pikepdf.Pdf.open(io.BytesIO(uploaded["content"])) as pdf:
+        assert len(pdf.pages) == 3
+    query, rows = mock_conn.executemany.call_args.args
+    assert "demand_package_exhibit" in query
+    assert [row[:4] for row in rows] == [
+        ("new_package", 0, "doc1", '"v1"'),
+        ("new_package", 1, "doc2", None),
+    ]
+    assert [row[5:] for row in rows] == [(0, 2), (2, 1)]
+    assert rows[0][4] == "a" * 64
+
+
+@pytest.mark.asyncio
+async def test_incremental_rebuild_keeps_up_to_date_package(mock_db_pool):
+    """Test nothing is rebuilt when no exhibit changed."""
+    mock_conn = mock_db_pool.use(AsyncMock())
+    mock_conn.fetch.side_effect = [EXHIBIT_ROWS[:1], PREVIOUS_MANIFEST]
+
+    with (
+        patch("pi_auto_api.tasks.demand.get_file_etag", AsyncMock(return_value='"v1"')),
+        patch("pi_auto_api.tasks.demand.open_file", AsyncMock()) as open_file,
+        patch("pi_auto_api.tasks.demand.upload_file", AsyncMock()) as upload,
+    ):
+        result = await assemble_demand_package(123, readiness_checked=True)
+
+    assert result == "old_package"
+    open_file.assert_not_awaited()
+    upload.assert_not_awaited()
+    mock_conn.fetchval.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_full_rebuild_ignores_previous_package(mock_db_pool):
+    """Test incremental=False downloads every exhibit again."""
+    mock_conn = mock_db_pool.use(AsyncMock())
+    mock_conn.fetch.return_value = EXHIBIT_ROWS[:1]
+    mock_conn.fetchval.return_value = "new_package"
+
+    with (
+        patch("pi_auto_api.tasks.demand.get_file_etag", AsyncMock(return_value='"v1"')),
+        patch(
+            "pi_auto_api.tasks.demand.open_file",
+            AsyncMock(side_effect=lambda doc_id: io.BytesIO(create_pages_pdf(2))),
+        ) as open_file,
+        patch("pi_auto_api.tasks.demand.upload_file", AsyncMock(return_value=True)),
+    ):
+        result = await assemble_demand_package(
+            123, readiness_checked=True, incremental=False
+        )
+
+    assert result == "new_package"
+    mock_conn.fetch.assert_called_once()
+    open_file.assert_awaited_once_with("doc1")
+
+
+def test_stage_exhibits_links_cached_files(tmp_path):
+    """Test cached exhibits are hard-linked and in-memory ones written out."""
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    blob = tmp_path / "blob"
+    blob.write_bytes(b"%PDF-cached")
+    previous = io.BytesIO(b"%PDF-previous")
+    reused = {"page_start": 2, "page_count": 3}
+
+    with open(blob, "rb") as cached:
+        sources = _stage_exhibits(
+            [
+                _Exhibit("1", content=cached),
+                _Exhibit("2", content=io.BytesIO(b"%PDF-downloaded")),
+                _Exhibit("3", reused=reused),
+            ],
+            previous,
+            str(workdir),
+        )
+
+    assert os.path.samefile(sources[0], blob)
+    with open(sources[1], "rb") as f:
+        assert f.read() == b"%PDF-downloaded"
+    assert sources[2] == PdfPages(str(workdir / "previous.pdf"), 2, 5)
+    assert (workdir / "previous.pdf").read_bytes() == b"%PDF-previous"
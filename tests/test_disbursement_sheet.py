@@ -1,5 +1,6 @@
 """Tests for the disbursement sheet generation functionality."""
 
+import json
 from datetime import date
 from decimal import Decimal
 from unittest.mock import AsyncMock, MagicMock, Mock, patch
@@ -60,7 +61,7 @@ def mock_task():
 
 
 @pytest.mark.asyncio
-async def test_calc_split_success():
+async def test_calc_split_success(mock_db_pool):
     """Test successful settlement split calculation."""
     # Mock database response
     mock_conn = AsyncMock(spec=asyncpg.Connection)
@@ -71,8 +72,8 @@ async def test_calc_split_success():
     }
     mock_conn.fetchval.return_value = Decimal("1500.00")  # other adjustments
 
-    with patch("asyncpg.connect", return_value=mock_conn):
-        result = await calc_split(incident_id=123)
+    mock_db_pool.use(mock_conn)
+    result = await calc_split(incident_id=123)
 
     # Verify the result
     assert result["gross"] == Decimal("60000.00")
@@ -85,27 +86,23 @@ async def test_calc_split_success():
 
 
 @pytest.mark.asyncio
-async def test_calc_split_no_settlement():
+async def test_calc_split_no_settlement(mock_db_pool):
     """Test calculation with no settlement amount."""
     # Mock database response
     mock_conn = AsyncMock(spec=asyncpg.Connection)
     mock_conn.fetchrow.return_value = None  # No incident found
 
-    with patch("asyncpg.connect", return_value=mock_conn):
-        with pytest.raises(ValueError, match="Incident .* has no settlement amount"):
-            await calc_split(incident_id=999)
+    mock_db_pool.use(mock_conn)
+    with pytest.raises(ValueError, match="Incident .* has no settlement amount"):
+        await calc_split(incident_id=999)
 
 
-def test_finalize_settlement_success():
+def test_finalize_settlement_success(mock_db_pool):
     """Test successful settlement finalization."""
     # Mock database connection
     mock_conn = AsyncMock()
     mock_conn.fetchval.return_value = 123  # incident_id
 
-    # Mock task for celery
-    mock_task = MagicMock()
-    mock_task.id = "mock-task-id-123"
-
     # Test data
     payload = FinalizeSettlementPayload(
         incident_id=123,
@@ -132,31 +129,33 @@ def test_finalize_settlement_success():
         ),
     }
 
-    # We need to mock the following:
-    # 1. Database connection
-    # 2. Celery task directly at the base level
-    with patch("asyncpg.connect", return_value=mock_conn):
-        with patch("pi_auto_api.celery_app.app.send_task") as mock_send_task:
-            # Configure the mock to return a mock task
-            mock_send_task.return_value = mock_task
-
-            # Make request
-            response = client.post("/internal/finalize_settlement", json=payload_dict)
+    mock_db_pool.use(mock_conn)
+    with (
+        patch("pi_auto_api.outbox.wake_relay") as mock_wake,
+        patch("pi_auto_api.celery_app.app.send_task") as mock_send_task,
+    ):
+        # Make request
+        response = client.post("/internal/finalize_settlement", json=payload_dict)
 
     # Verify response
     assert response.status_code == 202
     assert response.json()["status"] == "success"
     assert response.json()["incident_id"] == 123
-    assert response.json()["task_id"] == "mock-task-id-123"
 
     # Verify database calls
     mock_conn.fetchval.assert_called_once()
-    # The implementation uses 2 execute calls:
-    # 1 for incident update, 1 for combined fee adjustments
-    assert mock_conn.execute.call_count == 2
+    # One insert per fee adjustment, then the outbox row
+    assert mock_conn.execute.call_count == 3
 
-    # Verify task was enqueued via send_task
-    mock_send_task.assert_called_once()
+    # The task is written to the outbox in the transaction, not sent directly
+    outbox_call = mock_conn.execute.call_args
+    assert "INSERT INTO outbox" in outbox_call[0][0]
+    outbox_payload = json.loads(outbox_call[0][2])
+    assert outbox_payload["name"] == "generate_disbursement_sheet"
+    assert outbox_payload["args"] == [123]
+    assert response.json()["task_id"] == outbox_payload["task_id"]
+    mock_wake.assert_called_once()
+    mock_send_task.assert_not_called()
 
 
 # Mock HTTP response for testing
@@ -215,7 +214,7 @@ class MockAsyncClient:
 
 @pytest.mark.xfail(reason="Simulated DocuSign environment not available")
 @pytest.mark.asyncio
-async def test_generate_disbursement_sheet():
+async def test_generate_disbursement_sheet(mock_db_pool):
     """Test the disbursement sheet generation task."""
     # Mock database query results
     mock_conn = AsyncMock(spec=asyncpg.Connection)
@@ -249,37 +248,37 @@ async def test_generate_disbursement_sheet():
     mock_client = MockAsyncClient(response=mock_response)
 
     # Apply all the necessary patches
-    with patch("asyncpg.connect", return_value=mock_conn):
-        with patch(
-            "pi_auto_api.utils.disbursement_calc.calc_split", return_value=mock_totals
-        ):
-            with patch("httpx.AsyncClient", return_value=mock_client):
-                # Mock the _get_docusign_api_client function
+    mock_db_pool.use(mock_conn)
+    with patch(
+        "pi_auto_api.utils.disbursement_calc.calc_split", return_value=mock_totals
+    ):
+        with patch("httpx.AsyncClient", return_value=mock_client):
+            # Mock the _get_docusign_api_client function
+            with patch(
+                "pi_auto_api.externals.docusign._get_docusign_api_client"
+            ) as mock_docusign_client:
+                # Configure the API client mock
+                mock_api_client = MagicMock()
+                mock_api_client.loop = MagicMock()
+                mock_api_client.loop.run_in_executor = AsyncMock()
+                mock_api_client.loop.run_in_executor.return_value = MagicMock(
+                    envelope_id=envelope_id
+                )
+                mock_docusign_client.return_value = mock_api_client
+
+                # This is also necessary: mock the send_envelope function
+                # to avoid call to API client
                 with patch(
-                    "pi_auto_api.externals.docusign._get_docusign_api_client"
-                ) as mock_docusign_client:
-                    # Configure the API client mock
-                    mock_api_client = MagicMock()
-                    mock_api_client.loop = MagicMock()
-                    mock_api_client.loop.run_in_executor = AsyncMock()
-                    mock_api_client.loop.run_in_executor.return_value = MagicMock(
-                        envelope_id=envelope_id
+                    "pi_auto_api.externals.docusign.send_envelope",
+                    return_value=envelope_id,
+                ):
+                    # Import the task module we're testing
+                    from pi_auto_api.tasks.disbursement import (
+                        generate_disbursement_sheet,
                     )
-                    mock_docusign_client.return_value = mock_api_client
-
-                    # This is also necessary: mock the send_envelope function
-                    # to avoid call to API client
-                    with patch(
-                        "pi_auto_api.externals.docusign.send_envelope",
-                        return_value=envelope_id,
-                    ):
-                        # Import the task module we're testing
-                        from pi_auto_api.tasks.disbursement import (
-                            generate_disbursement_sheet,
-                        )
-
-                        # Call the function we're testing
-                        result = await generate_disbursement_sheet(123)
+
+                    # Call the function we're testing
+                    result = await generate_disbursement_sheet(123)
 
     # Verify the result
     assert result == envelope_id
@@ -293,7 +292,7 @@ async def test_generate_disbursement_sheet():
 
 # Edge case test
 @pytest.mark.asyncio
-async def test_calc_split_zero_liens():
+async def test_calc_split_zero_liens(mock_db_pool):
     """Test calculation with zero liens."""
     # Mock database response
     mock_conn = AsyncMock(spec=asyncpg.Connection)
@@ -304,8 +303,8 @@ async def test_calc_split_zero_liens():
     }
     mock_conn.fetchval.return_value = Decimal("0.00")  # No adjustments
 
-    with patch("asyncpg.connect", return_value=mock_conn):
-        result = await calc_split(incident_id=123)
+    mock_db_pool.use(mock_conn)
+    result = await calc_split(incident_id=123)
 
     # Verify the result with no liens or adjustments
     assert result["gross"] == Decimal("50000.00")
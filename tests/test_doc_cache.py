@@ -0,0 +1,181 @@
+"""Tests for the generated document cache."""
+
+from datetime import date
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from pi_auto_api.utils import doc_cache
+
+PAYLOAD = {"client": {"name": "Test", "dob": date(1990, 1, 1)}, "amount": Decimal("1")}
+
+
+@pytest.fixture(autouse=True)
+def memory_only():
+    """Use an empty in-memory cache without the storage tier."""
+    doc_cache.clear()
+    with (
+        patch.object(doc_cache.settings, "DOC_CACHE_STORAGE_ENABLED", False),
+        patch.object(doc_cache.settings, "DOC_TEMPLATE_RELEASE", "release-1"),
+    ):
+        yield
+    doc_cache.clear()
+
+
+def test_cache_key_ignores_key_order():
+    """Test equal payloads get the same key regardless of key order."""
+    reordered = {
+        "amount": Decimal("1"),
+        "client": {"dob": date(1990, 1, 1), "name": "Test"},
+    }
+
+    assert doc_cache.cache_key("lor", PAYLOAD) == doc_cache.cache_key("lor", reordered)
+    assert doc_cache.cache_key("lor", PAYLOAD) != doc_cache.cache_key(
+        "disbursement", PAYLOAD
+    )
+
+
+def test_template_version_changes_key():
+    """Test bumping a template version invalidates its entries."""
+    before = doc_cache.cache_key("lor", PAYLOAD)
+    with patch.object(doc_cache.settings, "DOC_TEMPLATE_VERSIONS", {"lor": "2"}):
+        assert doc_cache.cache_key("lor", PAYLOAD) != before
+
+
+def test_template_release_changes_key():
+    """Test a Docassemble deploy invalidates templates without a version."""
+    before = doc_cache.cache_key("lor", PAYLOAD)
+    with patch.object(doc_cache.settings, "DOC_TEMPLATE_RELEASE", "release-2"):
+        assert doc_cache.cache_key("lor", PAYLOAD) != before
+
+
+@pytest.mark.asyncio
+async def test_unversioned_templates_are_not_cached():
+    """Test documents are always rendered when the template version is unknown."""
+    generate = AsyncMock(return_value=b"%PDF-1")
+
+    with patch.object(doc_cache.settings, "DOC_TEMPLATE_RELEASE", None):
+        await doc_cache.get_or_generate("lor", PAYLOAD, generate)
+        await doc_cache.get_or_generate("lor", PAYLOAD, generate)
+
+    assert generate.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_identical_payload_is_generated_once():
+    """Test a repeated payload is served from the cache."""
+    generate = AsyncMock(return_value=b"%PDF-1")
+
+    first = await doc_cache.get_or_generate("lor", PAYLOAD, generate)
+    second = await doc_cache.get_or_generate("lor", dict(PAYLOAD), generate)
+
+    assert first == second == b"%PDF-1"
+    generate.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_failures_are_not_cached():
+    """Test a failed generation is retried on the next call."""
+    generate = AsyncMock(side_effect=[RuntimeError("boom"), b"%PDF-1"])
+
+    with pytest.raises(RuntimeError):
+        await doc_cache.get_or_generate("lor", PAYLOAD, generate)
+    assert await doc_cache.get_or_generate("lor", PAYLOAD, generate) == b"%PDF-1"
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_by_size():
+    """Test the least recently used entry is evicted over the size limit."""
+    with patch.object(doc_cache.settings, "DOC_CACHE_MAX_BYTES", 10):
+        await doc_cache.get_or_generate(
+            "lor", {"n": 1}, AsyncMock(return_value=b"a" * 4)
+        )
+        await doc_cache.get_or_generate(
+            "lor", {"n": 2}, AsyncMock(return_value=b"b" * 4)
+        )
+        # Touch the first entry so the second becomes least recently used
+        await doc_cache.get_or_generate("lor", {"n": 1}, AsyncMock())
+        await doc_cache.get_or_generate(
+            "lor", {"n": 3}, AsyncMock(return_value=b"c" * 4)
+        )
+
+        regenerate = AsyncMock(return_value=b"b" * 4)
+        await doc_cache.get_or_generate("lor", {"n": 2}, regenerate)
+        reuse = AsyncMock()
+        await doc_cache.get_or_generate("lor", {"n": 3}, reuse)
+
+    regenerate.assert_awaited_once()
+    reuse.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_regenerated():
+    """Test entries older than the TTL are not reused."""
+    generate = AsyncMock(return_value=b"%PDF-1")
+    with patch.object(doc_cache.settings, "DOC_CACHE_TTL", 60):
+        with patch("pi_auto_api.utils.doc_cache.time.time", return_value=1000.0):
+            await doc_cache.get_or_generate("lor", PAYLOAD, generate)
+        with patch("pi_auto_api.utils.doc_cache.time.time", return_value=1100.0):
+            await doc_cache.get_or_generate("lor", PAYLOAD, generate)
+
+    assert generate.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_storage_tier_serves_other_processes():
+    """Test a blob stored by another process is used instead of rendering."""
+    response = MagicMock(status_code=200, content=b"%PDF-stored", headers={})
+    client = MagicMock()
+    client.get = AsyncMock(return_value=response)
+    generate = AsyncMock()
+
+    with (
+        patch.object(doc_cache.settings, "DOC_CACHE_STORAGE_ENABLED", True),
+        patch.object(doc_cache.settings, "SUPABASE_URL", "https://sb.example"),
+        patch.object(doc_cache.settings, "SUPABASE_KEY", "key"),
+        patch("pi_auto_api.utils.doc_cache.get_client", return_value=client),
+    ):
+        content = await doc_cache.get_or_generate("lor", PAYLOAD, generate)
+
+    assert content == b"%PDF-stored"
+    generate.assert_not_awaited()
+    url = client.get.call_args.args[0]
+    assert url.startswith(
+        "https://sb.example/storage/v1/object/documents/doc_cache/lor-"
+    )
+
+
+@pytest.mark.asyncio
+async def test_purge_storage_deletes_expired_blobs():
+    """Test blobs older than the TTL are deleted from Supabase Storage."""
+    listing = MagicMock(
+        json=MagicMock(
+            return_value=[
+                {"name": "lor-old.pdf", "updated_at": "2025-01-01T00:00:00Z"},
+                {"name": "lor-new.pdf", "updated_at": "2025-01-10T00:00:00Z"},
+            ]
+        )
+    )
+    client = MagicMock()
+    client.post = AsyncMock(return_value=listing)
+    client.request = AsyncMock()
+    now = 1736467200.0  # 2025-01-10T00:00:00Z
+
+    with (
+        patch.object(doc_cache.settings, "DOC_CACHE_STORAGE_ENABLED", True),
+        patch.object(doc_cache.settings, "DOC_CACHE_TTL", 24 * 60 * 60),
+        patch.object(doc_cache.settings, "SUPABASE_URL", "https://sb.example"),
+        patch.object(doc_cache.settings, "SUPABASE_KEY", "key"),
+        patch("pi_auto_api.utils.doc_cache.get_client", return_value=client),
+        patch("pi_auto_api.utils.doc_cache.time.time", return_value=now),
+    ):
+        deleted = await doc_cache.purge_storage()
+
+    assert deleted == 1
+    assert client.post.call_args.kwargs["json"]["prefix"] == "doc_cache"
+    method, url = client.request.call_args.args
+    assert (method, url) == ("DELETE", "https://sb.example/storage/v1/object/documents")
+    assert client.request.call_args.kwargs["json"] == {
+        "prefixes": ["doc_cache/lor-old.pdf"]
+    }
@@ -15,8 +15,8 @@ DOCASSEMBLE_API_URL = "http://fake-da.com/api/v1/generate/retainer"
 
 @pytest.mark.asyncio
 @patch("pi_auto_api.externals.docassemble.settings")
-@patch("pi_auto_api.externals.docassemble.httpx.AsyncClient")
-async def test_generate_retainer_pdf_success(MockAsyncClient, mock_settings):
+@patch("pi_auto_api.externals.docassemble.get_client")
+async def test_generate_retainer_pdf_success(mock_get_client, mock_settings):
     """Test successful PDF generation via Docassemble API."""
     mock_settings.DOCASSEMBLE_URL = "http://fake-da.com"
 
@@ -26,22 +26,20 @@ async def test_generate_retainer_pdf_success(MockAsyncClient, mock_settings):
     mock_response.content = DUMMY_PDF_BYTES
     mock_response.raise_for_status = MagicMock()
 
-    # Mock the client instance and its methods, removing spec=httpx.AsyncClient
+    # Mock the shared client and its methods
     mock_client_instance = AsyncMock()
     mock_client_instance.post = AsyncMock(return_value=mock_response)
-    mock_client_instance.__aenter__.return_value = mock_client_instance
-    MockAsyncClient.return_value = mock_client_instance
+    mock_get_client.return_value = mock_client_instance
 
     # Call the function
     pdf_bytes = await generate_retainer_pdf(SAMPLE_PAYLOAD)
 
     # Assertions
-    MockAsyncClient.assert_called_once()
+    mock_get_client.assert_called_once_with("docassemble")
     mock_client_instance.post.assert_awaited_once_with(
         DOCASSEMBLE_API_URL,
         json=SAMPLE_PAYLOAD,
         headers={"Content-Type": "application/json"},
-        timeout=60.0,
     )
     mock_response.raise_for_status.assert_called_once()
     assert pdf_bytes == DUMMY_PDF_BYTES
@@ -49,8 +47,8 @@ async def test_generate_retainer_pdf_success(MockAsyncClient, mock_settings):
 
 @pytest.mark.asyncio
 @patch("pi_auto_api.externals.docassemble.settings")
-@patch("pi_auto_api.externals.docassemble.httpx.AsyncClient")
-async def test_generate_retainer_pdf_request_error(MockAsyncClient, mock_settings):
+@patch("pi_auto_api.externals.docassemble.get_client")
+async def test_generate_retainer_pdf_request_error(mock_get_client, mock_settings):
     """Test handling of httpx.RequestError during API call."""
     mock_settings.DOCASSEMBLE_URL = "http://fake-da.com"
 
@@ -59,8 +57,7 @@ async def test_generate_retainer_pdf_request_error(MockAsyncClient, mock_setting
     mock_client_instance.post = AsyncMock(
         side_effect=httpx.RequestError("Connection failed")
     )
-    mock_client_instance.__aenter__.return_value = mock_client_instance
-    MockAsyncClient.return_value = mock_client_instance
+    mock_get_client.return_value = mock_client_instance
 
     # Call and assert exception
     with pytest.raises(HTTPException) as exc_info:
@@ -76,9 +73,9 @@ async def test_generate_retainer_pdf_request_error(MockAsyncClient, mock_setting
     [(400, 400), (404, 400), (500, 500), (502, 500)],
 )
 @patch("pi_auto_api.externals.docassemble.settings")
-@patch("pi_auto_api.externals.docassemble.httpx.AsyncClient")
+@patch("pi_auto_api.externals.docassemble.get_client")
 async def test_generate_retainer_pdf_http_status_error(
-    MockAsyncClient, mock_settings, status_code, expected_http_status
+    mock_get_client, mock_settings, status_code, expected_http_status
 ):
     """Test handling of httpx.HTTPStatusError (4xx and 5xx)."""
     mock_settings.DOCASSEMBLE_URL = "http://fake-da.com"
@@ -96,8 +93,7 @@ async def test_generate_retainer_pdf_http_status_error(
     # Mock the client instance
     mock_client_instance = AsyncMock()
     mock_client_instance.post = AsyncMock(return_value=mock_response)
-    mock_client_instance.__aenter__.return_value = mock_client_instance
-    MockAsyncClient.return_value = mock_client_instance
+    mock_get_client.return_value = mock_client_instance
 
     # Call and assert exception
     with pytest.raises(HTTPException) as exc_info:
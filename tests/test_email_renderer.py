@@ -1,11 +1,19 @@
 """Tests for the email template renderer."""
 
+import os
+import stat
 from unittest.mock import patch
 
 import pytest
+from jinja2 import Environment
 from jinja2.exceptions import TemplateError
 
-from pi_auto_api.utils.email_renderer import render_email_template
+from pi_auto_api.utils import email_renderer
+from pi_auto_api.utils.email_renderer import (
+    precompile_email_templates,
+    render_email_batch,
+    render_email_template,
+)
 
 # Test data
 TEST_CONTEXT = {
@@ -105,25 +113,70 @@ def test_template_syntax_error(mock_templates_dir, mock_template_dir):
             render_email_template("invalid_template.html", TEST_CONTEXT)
 
 
-def test_current_year_added_to_context():
+def test_current_year_added_to_context(mock_template_dir):
     """Test that current_year is added to the context if not present."""
-    context = {"test": "value"}
+    context = dict(TEST_CONTEXT)
 
+    with patch("pi_auto_api.utils.email_renderer.TEMPLATES_DIR", mock_template_dir):
+        render_email_template("valid_template.html", context)
+
+    from datetime import datetime
+
+    assert context["current_year"] == datetime.now().year
+
+
+def test_templates_are_compiled_once(mock_template_dir):
+    """Test repeated renders reuse the compiled template."""
     with (
-        patch("pi_auto_api.utils.email_renderer.os.path.exists", return_value=True),
-        patch("pi_auto_api.utils.email_renderer.Environment") as mock_env,
+        patch("pi_auto_api.utils.email_renderer.TEMPLATES_DIR", mock_template_dir),
+        patch.object(
+            Environment, "compile", autospec=True, side_effect=Environment.compile
+        ) as compile_,
     ):
-        # Mock the Environment and Template objects
-        mock_template = mock_env.return_value.get_template.return_value
+        render_email_template("valid_template.html", dict(TEST_CONTEXT))
+        render_email_template("valid_template.html", dict(TEST_CONTEXT))
+
+    assert compile_.call_count <= 1
+
+
+def test_precompile_email_templates():
+    """Test every packaged email template compiles at startup."""
+    assert precompile_email_templates() == len(
+        list(email_renderer.TEMPLATES_DIR.glob("*.html"))
+    )
 
-        # Call the function
-        render_email_template("template.html", context)
 
-        # Get the context that was passed to render
-        render_kwargs = mock_template.render.call_args[1]
+def test_render_email_batch(mock_template_dir):
+    """Test one template is rendered for many contexts."""
+    contexts = [
+        {**TEST_CONTEXT, "client": {"full_name": name}} for name in ("Ann", "Bob")
+    ]
 
-        # Verify current_year was added
-        assert "current_year" in render_kwargs
-        from datetime import datetime
+    with patch("pi_auto_api.utils.email_renderer.TEMPLATES_DIR", mock_template_dir):
+        rendered = render_email_batch("valid_template.html", contexts)
+
+    assert "Hello Ann!" in rendered[0]
+    assert "Hello Bob!" in rendered[1]
+    assert all("Current year:" in html for html in rendered)
+
+
+def test_bytecode_cache_defaults_to_private_dir():
+    """Test the default bytecode cache is Jinja's per-user directory."""
+    with patch.object(email_renderer.settings, "EMAIL_TEMPLATE_CACHE_DIR", None):
+        cache = email_renderer._bytecode_cache()
+
+    assert cache.directory.endswith(f"_jinja2-cache-{os.getuid()}")
+    assert stat.S_IMODE(os.stat(cache.directory).st_mode) == 0o700
+
+
+def test_bytecode_cache_configured_dir(tmp_path):
+    """Test a configured bytecode cache directory is created owner-only."""
+    cache_dir = tmp_path / "bytecode"
+
+    with patch.object(
+        email_renderer.settings, "EMAIL_TEMPLATE_CACHE_DIR", str(cache_dir)
+    ):
+        cache = email_renderer._bytecode_cache()
 
-        assert render_kwargs["current_year"] == datetime.now().year
+    assert cache.directory == str(cache_dir)
+    assert stat.S_IMODE(cache_dir.stat().st_mode) == 0o700
@@ -0,0 +1,140 @@
+"""Tests for the activity event helpers."""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from pi_auto_api import events
+from pi_auto_api.config import settings
+
+
+class FakePipeline:
+    """Records the XADDs queued on a pipeline."""
+
+    def __init__(self, client):
+        """Bind the pipeline to the fake client collecting executed batches."""
+        self.client = client
+        self.queued = []
+
+    async def __aenter__(self):
+        """Enter the pipeline context."""
+        return self
+
+    async def __aexit__(self, *exc):
+        """Leave the pipeline context."""
+        return False
+
+    def xadd(self, stream, fields, maxlen=None, approximate=False):
+        """Queue an XADD."""
+        self.queued.append((stream, fields, maxlen, approximate))
+
+    async def execute(self):
+        """Send the queued commands as one batch."""
+        if self.client.fail:
+            raise ConnectionError("Redis is down")
+        self.client.batches.append(self.queued)
+
+
+@pytest.fixture
+def fake_redis():
+    """Patch redis.from_url in events with a client recording batches."""
+    client = MagicMock()
+    client.batches = []
+    client.fail = False
+    client.pipeline.side_effect = lambda transaction: FakePipeline(client)
+    client.aclose = AsyncMock()
+    with patch("pi_auto_api.events.redis.from_url", return_value=client):
+        yield client
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    """Start and end every test with an empty publisher registry."""
+    events._publishers.clear()
+    yield
+    events._publishers.clear()
+
+
+@pytest.mark.asyncio
+async def test_record_event_batches_into_one_pipeline(fake_redis):
+    """Test events recorded together are written in one pipelined request."""
+    await events.record_event({"type": "a", "incident_id": 1})
+    await events.record_event({"type": "b", "incident_id": 1})
+    assert fake_redis.batches == []
+
+    await events.flush_events()
+
+    assert fake_redis.batches == [
+        [
+            (
+                "activity",
+                {"data": '{"type": "a", "incident_id": 1}'},
+                settings.ACTIVITY_STREAM_MAXLEN,
+                True,
+            ),
+            (
+                "activity",
+                {"data": '{"type": "b", "incident_id": 1}'},
+                settings.ACTIVITY_STREAM_MAXLEN,
+                True,
+            ),
+        ]
+    ]
+
+
+@pytest.mark.asyncio
+async def test_record_event_flushes_after_interval(fake_redis):
+    """Test buffered events are written once the flush interval passes."""
+    with patch.object(settings, "EVENT_FLUSH_INTERVAL_MS", 1):
+        await events.record_event({"type": "a"})
+        await asyncio.sleep(0.05)
+
+    assert len(fake_redis.batches) == 1
+
+
+@pytest.mark.asyncio
+async def test_record_event_flushes_full_batch(fake_redis):
+    """Test reaching EVENT_MAX_BATCH flushes immediately."""
+    with patch.object(settings, "EVENT_MAX_BATCH", 2):
+        await events.record_event({"type": "a"})
+        await events.record_event({"type": "b"})
+
+    assert [len(batch) for batch in fake_redis.batches] == [2]
+
+
+@pytest.mark.asyncio
+async def test_close_flushes_pending_events(fake_redis):
+    """Test shutdown writes buffered events before closing the client."""
+    await events.record_event({"type": "a"})
+
+    await events.close_redis_client()
+
+    assert len(fake_redis.batches) == 1
+    fake_redis.aclose.assert_awaited_once()
+    assert not events._publishers
+
+
+@pytest.mark.asyncio
+async def test_flush_failure_is_logged(fake_redis):
+    """Test a Redis failure does not propagate to the caller."""
+    fake_redis.fail = True
+    await events.record_event({"type": "a"})
+
+    with patch("pi_auto_api.events.logger") as mock_logger:
+        await events.flush_events()
+
+    mock_logger.error.assert_called_once()
+
+
+def test_publishers_are_per_event_loop(fake_redis):
+    """Test that each event loop gets its own publisher."""
+
+    async def get():
+        return events.get_publisher()
+
+    first = asyncio.run(get())
+    second = asyncio.run(get())
+
+    assert first is not second
+    assert list(events._publishers.values()) == [second]
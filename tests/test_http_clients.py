@@ -0,0 +1,85 @@
+"""Tests for the shared, pooled HTTP client registry."""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from pi_auto_api import http_clients
+from pi_auto_api.config import settings
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    """Start and end every test with an empty client registry."""
+    http_clients._clients.clear()
+    yield
+    http_clients._clients.clear()
+
+
+@pytest.mark.asyncio
+async def test_get_client_is_shared_per_service():
+    """Test that a service gets one pooled client on a given loop."""
+    first = http_clients.get_client("docassemble")
+    second = http_clients.get_client("docassemble")
+    storage = http_clients.get_client("supabase_storage")
+
+    assert first is second
+    assert storage is not first
+    assert first.timeout.read == settings.DOCASSEMBLE_TIMEOUT
+    assert storage.timeout.read == settings.SUPABASE_STORAGE_TIMEOUT
+
+    await http_clients.close_clients()
+    assert first.is_closed and storage.is_closed
+    assert not http_clients._clients
+
+
+@pytest.mark.asyncio
+async def test_get_client_unknown_service():
+    """Test that unregistered services are rejected."""
+    with pytest.raises(KeyError, match="Unknown HTTP service"):
+        http_clients.get_client("nope")
+
+
+@pytest.mark.asyncio
+async def test_closed_client_is_replaced():
+    """Test that a client closed elsewhere is transparently recreated."""
+    first = http_clients.get_client("docassemble")
+    await first.aclose()
+
+    second = http_clients.get_client("docassemble")
+
+    assert second is not first
+    assert not second.is_closed
+    await http_clients.close_clients()
+
+
+def test_clients_are_per_event_loop():
+    """Test that each event loop gets its own client."""
+
+    async def get():
+        return http_clients.get_client("docassemble")
+
+    first_loop, second_loop = asyncio.new_event_loop(), asyncio.new_event_loop()
+    try:
+        first = first_loop.run_until_complete(get())
+        second = second_loop.run_until_complete(get())
+        assert first is not second
+    finally:
+        first_loop.run_until_complete(http_clients.close_clients())
+        second_loop.run_until_complete(http_clients.close_clients())
+        first_loop.close()
+        second_loop.close()
+
+
+@pytest.mark.asyncio
+async def test_http2_falls_back_without_h2():
+    """Test that HTTP2_ENABLED degrades to HTTP/1.1 when h2 is missing."""
+    with (
+        patch.object(settings, "HTTP2_ENABLED", True),
+        patch("pi_auto_api.http_clients._http2_available", return_value=False),
+        patch("pi_auto_api.http_clients.httpx.AsyncClient") as mock_client,
+    ):
+        http_clients.get_client("docassemble")
+
+    assert mock_client.call_args.kwargs["http2"] is False
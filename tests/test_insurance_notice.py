@@ -1,11 +1,12 @@
 """Tests for insurance notice functionality."""
 
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, patch
 
 import pytest
 from fastapi.testclient import TestClient
 
 from pi_auto_api.main import app
+from pi_auto_api.tasks.insurance_notice import send_insurance_notice
 
 
 @pytest.fixture
@@ -26,16 +27,15 @@ def docusign_webhook_payload():
 
 
 @pytest.fixture
-def mock_send_insurance_notice():
-    """Mock the send_insurance_notice Celery task."""
-    with patch("pi_auto_api.main.send_insurance_notice") as mock_task:
-        mock_task.delay = MagicMock()
-        yield mock_task
+def mock_enqueue():
+    """Mock the async Celery enqueue used by the webhook."""
+    with patch(
+        "pi_auto_api.task_queue.enqueue", AsyncMock(return_value="task-123")
+    ) as mock:
+        yield mock
 
 
-def test_docusign_webhook_success(
-    test_client, docusign_webhook_payload, mock_send_insurance_notice
-):
+def test_docusign_webhook_success(test_client, docusign_webhook_payload, mock_enqueue):
     """Test successful processing of a DocuSign webhook."""
     response = test_client.post("/webhooks/docusign", json=docusign_webhook_payload)
 
@@ -45,11 +45,11 @@ def test_docusign_webhook_success(
     assert response.json()["client_id"] == "101"
 
     # Verify task was queued
-    mock_send_insurance_notice.delay.assert_called_once_with(101)
+    mock_enqueue.assert_awaited_once_with(send_insurance_notice, 101)
 
 
 def test_docusign_webhook_non_completed(
-    test_client, docusign_webhook_payload, mock_send_insurance_notice
+    test_client, docusign_webhook_payload, mock_enqueue
 ):
     """Test handling of non-completed envelope status."""
     # Modify payload to have non-completed status
@@ -63,11 +63,11 @@ def test_docusign_webhook_non_completed(
     assert response.json()["reason"] == "not_completed"
 
     # Verify task was not queued
-    mock_send_insurance_notice.delay.assert_not_called()
+    mock_enqueue.assert_not_called()
 
 
 def test_docusign_webhook_parsing_error(
-    test_client, docusign_webhook_payload, mock_send_insurance_notice
+    test_client, docusign_webhook_payload, mock_enqueue
 ):
     """Test handling of payload parsing errors."""
     # Remove required field
@@ -79,7 +79,7 @@ def test_docusign_webhook_parsing_error(
     assert response.status_code == 422
 
     # Verify task was not queued
-    mock_send_insurance_notice.delay.assert_not_called()
+    mock_enqueue.assert_not_called()
 
 
 @pytest.mark.asyncio
@@ -134,3 +134,40 @@ async def test_insurance_notice_task(
     mock_get_payload.assert_called_once_with(101)
     mock_generate_letter.assert_called_once()
     assert mock_send_fax.call_count == 2
+
+
+@pytest.mark.asyncio
+@patch("pi_auto_api.tasks.insurance_notice.get_insurance_payload")
+@patch("pi_auto_api.tasks.insurance_notice.generate_letter")
+@patch("pi_auto_api.tasks.insurance_notice.send_fax")
+@patch("pi_auto_api.tasks.insurance_notice.send_mail_batch")
+async def test_insurance_notice_emails_adjusters_in_one_batch(
+    mock_send_mail_batch, mock_send_fax, mock_generate_letter, mock_get_payload
+):
+    """Test adjusters of all adverse carriers are emailed in a single batch."""
+    from pi_auto_api.tasks.insurance_notice import _run_insurance_notice_flow
+
+    mock_get_payload.return_value = {
+        "client": {"full_name": "Test Client", "email": "client@example.com"},
+        "client_insurance": {},
+        "adverse_insurance": [
+            {"carrier_name": "Adverse One"},
+            {"carrier_name": "Adverse Two"},
+        ],
+    }
+    mock_generate_letter.return_value = b"PDF bytes"
+    mock_send_fax.return_value = "FX12345"
+    mock_send_mail_batch.return_value = ["msg-1", "msg-2"]
+
+    result = await _run_insurance_notice_flow(101)
+
+    mock_send_mail_batch.assert_awaited_once()
+    assert len(mock_send_mail_batch.call_args.kwargs["to_emails"]) == 2
+    assert [item["carrier"] for item in result["emails_sent"]] == [
+        "Adverse One",
+        "Adverse Two",
+    ]
+    assert [item["message_id"] for item in result["emails_sent"]] == [
+        "msg-1",
+        "msg-2",
+    ]
@@ -1,7 +1,7 @@
 """Tests for the intake endpoint."""
 
 from datetime import date
-from unittest.mock import AsyncMock, patch
+from unittest.mock import patch
 
 import pytest
 from fastapi import status
@@ -52,19 +52,8 @@ def mock_create_intake():
         yield mock
 
 
-@pytest.fixture
-def mock_generate_retainer():
-    """Mock the generate_retainer task."""
-    with patch("pi_auto_api.main.generate_retainer") as mock:
-        # Create mock for .delay() method
-        mock.delay = AsyncMock()
-        yield mock
-
-
 @pytest.mark.asyncio
-async def test_intake_success(
-    mock_create_intake, mock_generate_retainer, async_client: AsyncClient
-):
+async def test_intake_success(mock_create_intake, async_client: AsyncClient):
     """Test successful intake creation."""
     response = await async_client.post(
         "/intake",
@@ -85,9 +74,6 @@ async def test_intake_success(
     assert call_arg.client.full_name == "John Doe"
     assert call_arg.incident.date == date(2023, 5, 15)
 
-    # Assert Celery task was queued
-    mock_generate_retainer.delay.assert_called_once_with(123)
-
 
 @pytest.mark.asyncio
 async def test_intake_validation_error(async_client: AsyncClient):
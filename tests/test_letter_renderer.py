@@ -0,0 +1,169 @@
+"""Tests for local letter rendering."""
+
+import os
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from jinja2 import UndefinedError
+
+from pi_auto_api.db import LAW_FIRM, RECORDS_STAFF
+from pi_auto_api.externals.docassemble import generate_letter
+from pi_auto_api.utils import doc_cache, letter_renderer
+
+PAYLOAD = {
+    "client": {"full_name": "John Doe", "dob": "1980-01-01"},
+    "provider": {"name": "City Hospital"},
+}
+
+# Shaped like db.get_provider_payloads output
+RECORDS_PAYLOAD = {
+    "client": {"full_name": "John Doe", "dob": "1980-01-01"},
+    "incident": {"id": 1, "date": "2024-03-01"},
+    "provider": {"name": "City Hospital", "address": "1 Main St"},
+    "letter_date": "May 17, 2025",
+    "law_firm": LAW_FIRM,
+    "staff": RECORDS_STAFF,
+}
+
+
+@pytest.fixture(autouse=True)
+def empty_doc_cache():
+    """Keep cached documents from leaking between tests."""
+    doc_cache.clear()
+    yield
+    doc_cache.clear()
+
+
+def test_template_for_only_selected_letter_types():
+    """Test only letter types selected in settings render locally."""
+    with patch.object(letter_renderer.settings, "LETTER_LOCAL_RENDER", ["lor"]):
+        assert letter_renderer.template_for("lor") == (
+            "correspondence/letter_of_representation.txt"
+        )
+        assert letter_renderer.template_for("medical_records_request") is None
+
+
+@pytest.mark.parametrize(
+    "template_name", sorted(letter_renderer.LETTER_TEMPLATES.values())
+)
+def test_repository_templates_compile(template_name):
+    """Test every mapped repository template exists and compiles."""
+    env = letter_renderer._build_env(str(letter_renderer.TEMPLATES_DIR), strict=False)
+    assert env.get_template(template_name) is not None
+
+
+def test_render_text_fills_template():
+    """Test a records request payload fills every section of the template."""
+    context = letter_renderer.template_context(
+        "medical_records_request", RECORDS_PAYLOAD
+    )
+
+    text = letter_renderer.render_text(
+        "medical/records_request.txt", context, strict=True
+    )
+
+    assert "Patient: John Doe" in text
+    assert "City Hospital" in text
+    # Letterhead, date and signature come from law_firm, letter_date and staff
+    assert text.startswith("Law & Order Legal Services\n123 Legal Street\n")
+    assert "New York, NY 10001" in text
+    assert "\nMay 17, 2025\n" in text
+    assert "Date(s) of Service: 2024-03-01 to May 17, 2025" in text
+    assert "Medical Records Department\nRecords Coordinator\n" in text
+
+
+def test_strict_templates_reject_incomplete_payloads():
+    """Test a missing section fails the render instead of leaving a blank."""
+    with pytest.raises(UndefinedError):
+        letter_renderer.render_text("medical/records_request.txt", PAYLOAD)
+
+
+@pytest.mark.asyncio
+async def test_local_letters_are_cached_by_template_source(tmp_path):
+    """Test editing a local template invalidates its cached letters."""
+    template = tmp_path / "medical" / "records_request.txt"
+    template.parent.mkdir()
+    template.write_text("{{ client.full_name }}")
+    render = AsyncMock(side_effect=[b"%PDF-1", b"%PDF-2"])
+
+    with (
+        patch.object(
+            letter_renderer.settings,
+            "LETTER_LOCAL_RENDER",
+            ["medical_records_request"],
+        ),
+        patch.object(letter_renderer.settings, "LETTER_TEMPLATES_DIR", str(tmp_path)),
+        patch.object(letter_renderer, "render_letter", render),
+    ):
+        first = await generate_letter("medical_records_request", PAYLOAD)
+        assert await generate_letter("medical_records_request", PAYLOAD) == first
+        template.write_text("Patient: {{ client.full_name }}")
+        os.utime(template, (template.stat().st_atime, template.stat().st_mtime + 1))
+        second = await generate_letter("medical_records_request", PAYLOAD)
+
+    assert (first, second) == (b"%PDF-1", b"%PDF-2")
+
+
+@pytest.mark.asyncio
+async def test_dated_letters_are_not_cached():
+    """Test letters carrying a letter_date are rendered every time."""
+    render = AsyncMock(return_value=b"%PDF-1")
+
+    with (
+        patch.object(
+            letter_renderer.settings,
+            "LETTER_LOCAL_RENDER",
+            ["medical_records_request"],
+        ),
+        patch.object(letter_renderer, "render_letter", render),
+    ):
+        await generate_letter("medical_records_request", RECORDS_PAYLOAD)
+        await generate_letter("medical_records_request", RECORDS_PAYLOAD)
+
+    assert render.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_render_letter_runs_in_pool():
+    """Test rendering is handed to the CPU worker pool with explicit settings."""
+    with (
+        patch.object(letter_renderer.settings, "LETTER_LOCAL_RENDER", ["lor"]),
+        patch.object(
+            letter_renderer.cpu_pool,
+            "run_cpu",
+            AsyncMock(return_value=b"%PDF-local"),
+        ) as run_cpu,
+    ):
+        pdf = await letter_renderer.render_letter("lor", PAYLOAD)
+
+    assert pdf == b"%PDF-local"
+    run_cpu.assert_awaited_once_with(
+        letter_renderer.render_pdf,
+        "correspondence/letter_of_representation.txt",
+        letter_renderer.template_context("lor", PAYLOAD),
+        str(letter_renderer.TEMPLATES_DIR),
+        True,
+    )
+
+
+@pytest.mark.asyncio
+async def test_render_letter_rejects_unselected_type():
+    """Test letter types without a local template are refused."""
+    with pytest.raises(ValueError):
+        await letter_renderer.render_letter("lor", PAYLOAD)
+
+
+@pytest.mark.asyncio
+async def test_generate_letter_uses_local_backend_when_selected():
+    """Test generate_letter skips Docassemble for locally rendered types."""
+    render = AsyncMock(return_value=b"%PDF-local")
+    with (
+        patch.object(letter_renderer.settings, "LETTER_LOCAL_RENDER", ["lor"]),
+        patch.object(letter_renderer, "render_letter", render),
+        patch("pi_auto_api.externals.docassemble.get_client") as get_client,
+    ):
+        pdf = await generate_letter("lor", PAYLOAD)
+
+    assert pdf == b"%PDF-local"
+    render.assert_awaited_once_with("lor", PAYLOAD)
+    get_client.assert_not_called()
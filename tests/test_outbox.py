@@ -0,0 +1,206 @@
+"""Tests for the transactional outbox and its relay."""
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from pi_auto_api import outbox
+
+
+@pytest.fixture
+def conn():
+    """Patch the pool used by the relay with a mock connection."""
+    conn = AsyncMock()
+    conn.transaction = MagicMock(return_value=AsyncMock())
+
+    @asynccontextmanager
+    async def acquire():
+        yield conn
+
+    with patch("pi_auto_api.outbox.acquire", acquire):
+        yield conn
+
+
+@pytest.fixture
+def send_task():
+    """Patch Celery publishing with a mock send_task."""
+    app = MagicMock()
+    with patch("pi_auto_api.celery_app.app", app):
+        yield app.send_task
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    """Start and end every test with no relays."""
+    outbox._relays.clear()
+    yield
+    outbox._relays.clear()
+
+
+def rows(*entries):
+    """Build claimed outbox rows from (id, kind, payload[, attempts]) tuples."""
+    return [
+        {
+            "id": outbox_id,
+            "kind": kind,
+            "payload": json.dumps(payload),
+            "attempts": attempts,
+        }
+        for outbox_id, kind, payload, *rest in entries
+        for attempts in [rest[0] if rest else 0]
+    ]
+
+
+@pytest.mark.asyncio
+async def test_enqueue_task_writes_row_on_callers_connection():
+    """Test a task is inserted on the given connection with a fixed task ID."""
+    conn = AsyncMock()
+
+    task_id = await outbox.enqueue_task(conn, "generate_retainer", [123])
+
+    query, kind, payload = conn.execute.call_args[0]
+    assert "INSERT INTO outbox" in query
+    assert kind == "task"
+    assert json.loads(payload) == {
+        "name": "generate_retainer",
+        "args": [123],
+        "kwargs": {},
+        "task_id": task_id,
+    }
+
+
+@pytest.mark.asyncio
+async def test_relay_batch_delivers_and_deletes_rows(conn, send_task):
+    """Test tasks and events are sent in one batch and removed."""
+    conn.fetch.return_value = rows(
+        (1, "task", {"name": "generate_retainer", "args": [7], "task_id": "t-1"}),
+        (2, "event", {"type": "a"}),
+        (3, "event", {"type": "b"}),
+    )
+
+    with patch("pi_auto_api.events.write_events", AsyncMock()) as write_events:
+        delivered = await outbox.relay_batch()
+
+    assert delivered == 3
+    send_task.assert_called_once()
+    assert send_task.call_args.args == ("generate_retainer",)
+    assert send_task.call_args.kwargs["args"] == [7]
+    assert send_task.call_args.kwargs["task_id"] == "t-1"
+    write_events.assert_awaited_once_with([{"type": "a"}, {"type": "b"}])
+    conn.execute.assert_awaited_once_with(outbox._DELETE_QUERY, [1, 2, 3])
+    conn.executemany.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_relay_batch_keeps_failed_rows(conn, send_task):
+    """Test undelivered rows are marked for retry instead of deleted."""
+    conn.fetch.return_value = rows(
+        (1, "task", {"name": "generate_retainer", "args": [7], "task_id": "t-1"}),
+        (2, "event", {"type": "a"}),
+    )
+    send_task.side_effect = ConnectionError("broker down")
+
+    with patch("pi_auto_api.events.write_events", AsyncMock()):
+        delivered = await outbox.relay_batch()
+
+    assert delivered == 1
+    conn.execute.assert_awaited_once_with(outbox._DELETE_QUERY, [2])
+    conn.executemany.assert_awaited_once_with(
+        outbox._FAILED_QUERY, [(1, "broker down", 1.0, False)]
+    )
+
+
+@pytest.mark.asyncio
+async def test_relay_batch_backs_off_and_dead_letters(conn, send_task, caplog):
+    """Test retries wait longer each time and the last attempt dead-letters."""
+    conn.fetch.return_value = rows(
+        (1, "task", {"name": "generate_retainer", "args": [7], "task_id": "t-1"}, 3),
+        (2, "task", {"name": "generate_retainer", "args": [8], "task_id": "t-2"}, 24),
+    )
+    send_task.side_effect = ConnectionError("broker down")
+
+    assert await outbox.relay_batch() == 0
+
+    conn.executemany.assert_awaited_once_with(
+        outbox._FAILED_QUERY,
+        [(1, "broker down", 8.0, False), (2, "broker down", 300.0, True)],
+    )
+    assert "dead-lettered" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_relay_batch_dispatches_without_holding_a_connection(send_task):
+    """Test rows are claimed and settled in separate, short connection uses."""
+    conn = AsyncMock()
+    conn.transaction = MagicMock(return_value=AsyncMock())
+    conn.fetch.return_value = rows(
+        (1, "task", {"name": "generate_retainer", "args": [7], "task_id": "t-1"}),
+    )
+    held = []
+
+    @asynccontextmanager
+    async def acquire():
+        held.append(True)
+        yield conn
+        held.pop()
+
+    held_while_publishing = []
+
+    def publish(*args, **kwargs):
+        held_while_publishing.append(bool(held))
+        return MagicMock(id=kwargs["task_id"])
+
+    send_task.side_effect = publish
+
+    with patch("pi_auto_api.outbox.acquire", acquire):
+        assert await outbox.relay_batch() == 1
+
+    assert held_while_publishing == [False]
+    claim_query = conn.fetch.call_args.args[0]
+    assert "claimed_until" in claim_query
+    conn.execute.assert_awaited_once_with(outbox._DELETE_QUERY, [1])
+
+
+def test_retry_delay_doubles_up_to_the_cap():
+    """Test the retry delay grows exponentially and is capped."""
+    assert [outbox.retry_delay(n) for n in (1, 2, 3, 10, 20)] == [
+        1.0,
+        2.0,
+        4.0,
+        300.0,
+        300.0,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_relay_batch_empty_outbox(conn, send_task):
+    """Test an empty outbox sends nothing."""
+    conn.fetch.return_value = []
+
+    assert await outbox.relay_batch() == 0
+    send_task.assert_not_called()
+    conn.execute.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_wake_relay_drains_without_waiting_for_poll():
+    """Test waking the relay runs a batch before the poll interval."""
+    relay_batch = AsyncMock(return_value=0)
+    with (
+        patch("pi_auto_api.outbox.relay_batch", relay_batch),
+        patch("pi_auto_api.outbox.settings.OUTBOX_POLL_INTERVAL", 60.0),
+    ):
+        outbox.start_relay()
+        await asyncio.sleep(0)
+        assert relay_batch.await_count == 1
+
+        outbox.wake_relay()
+        await asyncio.sleep(0.01)
+        assert relay_batch.await_count == 2
+
+        await outbox.stop_relay()
+
+    assert not outbox._relays
@@ -4,6 +4,22 @@ from unittest.mock import AsyncMock
 
 import pytest
 
+from pi_auto_api.utils.package_rules import get_demand_readiness, is_demand_ready
+
+
+def _row(incident_id, **overrides):
+    """Build a readiness query row where every requirement is met."""
+    row = {
+        "incident_id": incident_id,
+        "has_medical_records": True,
+        "has_damages_worksheet_pdf": True,
+        "has_liability_photo": True,
+        "has_demand_package": False,
+        "providers_missing_bills": [],
+    }
+    row.update(overrides)
+    return row
+
 
 @pytest.mark.asyncio
 async def test_is_demand_ready_all_conditions_met():
@@ -64,3 +80,58 @@ async def test_is_demand_ready_all_conditions_met():
 # - test_is_demand_ready_demand_package_exists
 # - test_is_demand_ready_provider_missing_bill
 # - test_is_demand_ready_no_providers_associated
+
+
+@pytest.mark.asyncio
+async def test_get_demand_readiness_single_query(mock_db_pool):
+    """Test that the whole book is evaluated with one query."""
+    mock_db_pool.conn.fetch.return_value = [
+        _row(1),
+        _row(2, has_liability_photo=False),
+        _row(3, providers_missing_bills=[7, 9]),
+        _row(4),
+    ]
+
+    readiness = await get_demand_readiness()
+
+    assert readiness.ready == [1, 4]
+    assert readiness.missing == {
+        2: ["missing liability_photo"],
+        3: ["no medical_bill for provider(s) 7, 9"],
+    }
+    mock_db_pool.conn.fetch.assert_awaited_once()
+    # No incident filter means "every incident without a demand package"
+    assert mock_db_pool.conn.fetch.call_args.args[1] is None
+
+
+@pytest.mark.asyncio
+async def test_get_demand_readiness_for_given_incidents(mock_db_pool):
+    """Test that explicit incident IDs are passed to the query as an array."""
+    mock_db_pool.conn.fetch.return_value = [_row(5, has_demand_package=True)]
+
+    readiness = await get_demand_readiness((5,))
+
+    assert readiness.ready == []
+    assert readiness.missing == {5: ["demand_package already exists"]}
+    assert mock_db_pool.conn.fetch.call_args.args[1] == [5]
+
+
+@pytest.mark.asyncio
+async def test_is_demand_ready_uses_bulk_check(mock_db_pool):
+    """Test is_demand_ready for ready, not-ready and unknown incidents."""
+    mock_db_pool.conn.fetch.return_value = [_row(1)]
+    assert await is_demand_ready(1) is True
+
+    mock_db_pool.conn.fetch.return_value = [_row(1, has_medical_records=False)]
+    assert await is_demand_ready(1) is False
+
+    mock_db_pool.conn.fetch.return_value = []
+    assert await is_demand_ready(1) is False
+
+
+@pytest.mark.asyncio
+async def test_is_demand_ready_db_error(mock_db_pool):
+    """Test is_demand_ready returns False when the query fails."""
+    mock_db_pool.conn.fetch.side_effect = Exception("db down")
+
+    assert await is_demand_ready(1) is False
@@ -1,11 +1,19 @@
 """Tests for PDF merge utility functions."""
 
 import io
+from unittest.mock import patch
 
 import pikepdf
 import pytest
 
-from pi_auto_api.utils.pdf_merge import merge_pdfs
+from pi_auto_api.utils import pdf_merge
+from pi_auto_api.utils.pdf_merge import (
+    PdfPages,
+    merge_pdfs,
+    merge_pdfs_to,
+    merge_pdfs_to_spool,
+    spool,
+)
 
 
 def create_sample_pdf() -> bytes:
@@ -59,3 +67,81 @@ def test_merge_pdfs_mixed_valid_invalid():
 
     with pytest.raises(pikepdf.PdfError):
         merge_pdfs([valid_pdf, invalid_data])
+
+
+class NonSeekableStream(io.RawIOBase):
+    """A read-only stream that cannot seek, like an HTTP response body."""
+
+    def __init__(self, data: bytes):
+        """Wrap the data to stream."""
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        """Report the stream as readable."""
+        return True
+
+    def readinto(self, buffer):
+        """Read the next chunk into the buffer."""
+        return self._data.readinto(buffer)
+
+
+def test_merge_pdfs_to_accepts_mixed_sources(tmp_path):
+    """Test bytes, paths and seekable or non-seekable streams can be merged."""
+    path = tmp_path / "exhibit.pdf"
+    path.write_bytes(create_sample_pdf())
+
+    sources = iter(
+        [
+            create_sample_pdf(),
+            path,
+            str(path),
+            io.BytesIO(create_sample_pdf()),
+            NonSeekableStream(create_sample_pdf()),
+        ]
+    )
+    output = io.BytesIO()
+
+    assert merge_pdfs_to(sources, output) == [1] * 5
+    with pikepdf.Pdf.open(io.BytesIO(output.getvalue())) as pdf:
+        assert len(pdf.pages) == 5
+
+
+def test_merge_pdfs_to_empty_iterator():
+    """Test merging an exhausted iterator raises ValueError."""
+    with pytest.raises(ValueError, match="Cannot merge an empty list of PDFs"):
+        merge_pdfs_to(iter([]), io.BytesIO())
+
+
+def test_merge_pdfs_to_spool_rolls_over_to_disk(sample_pdfs):
+    """Test the merged output moves to a temporary file above the threshold."""
+    spooled_inputs = [spool(pdf) for pdf in sample_pdfs]
+
+    with patch.object(pdf_merge.settings, "PDF_SPOOL_THRESHOLD", 100):
+        with merge_pdfs_to_spool(spooled_inputs) as merged:
+            assert merged._rolled
+            with pikepdf.Pdf.open(io.BytesIO(merged.read())) as pdf:
+                assert len(pdf.pages) == 3
+
+
+def test_merge_pdfs_to_page_ranges():
+    """Test page ranges of one source are merged without reopening it."""
+    three_pages = merge_pdfs([create_sample_pdf() for _ in range(3)])
+    source = io.BytesIO(three_pages)
+    output = io.BytesIO()
+
+    with patch.object(
+        pdf_merge, "_open_source", wraps=pdf_merge._open_source
+    ) as open_source:
+        page_counts = merge_pdfs_to(
+            [
+                PdfPages(source, 0, 2),
+                create_sample_pdf(),
+                PdfPages(source, start=2),
+            ],
+            output,
+        )
+
+    assert page_counts == [2, 1, 1]
+    assert open_source.call_count == 2
+    with pikepdf.Pdf.open(io.BytesIO(output.getvalue())) as pdf:
+        assert len(pdf.pages) == 4
@@ -0,0 +1,110 @@
+"""Tests for PDF optimization."""
+
+import io
+import os
+import zlib
+from unittest.mock import patch
+
+import pikepdf
+import pytest
+from pikepdf import Name
+
+from pi_auto_api.utils import pdf_optimize
+from pi_auto_api.utils.pdf_merge import merge_pdfs_to
+from pi_auto_api.utils.pdf_optimize import optimize_pdf, optimize_pdf_bytes
+
+PAGE_SIZE = 144  # points, i.e. two inches
+
+
+def create_scanned_pdf(pixels: int = 800) -> bytes:
+    """Create a one-page PDF holding a full-page grayscale scan."""
+    pdf = pikepdf.Pdf.new()
+    page = pdf.add_blank_page(page_size=(PAGE_SIZE, PAGE_SIZE))
+    image = pikepdf.Stream(
+        pdf,
+        zlib.compress(os.urandom(pixels * pixels)),
+        Type=Name.XObject,
+        Subtype=Name.Image,
+        Width=pixels,
+        Height=pixels,
+        ColorSpace=Name.DeviceGray,
+        BitsPerComponent=8,
+        Filter=Name.FlateDecode,
+    )
+    page.Resources = pikepdf.Dictionary(XObject=pikepdf.Dictionary(Im0=image))
+    page.Contents = pdf.make_stream(
+        f"q {PAGE_SIZE} 0 0 {PAGE_SIZE} 0 0 cm /Im0 Do Q".encode()
+    )
+    output = io.BytesIO()
+    pdf.save(output)
+    return output.getvalue()
+
+
+@pytest.fixture(scope="module")
+def scanned_pdf():
+    """A scan at 400 DPI."""
+    return create_scanned_pdf()
+
+
+def test_merge_deduplicates_identical_images(scanned_pdf):
+    """Test an image repeated across merged inputs is written once."""
+    plain, optimized = io.BytesIO(), io.BytesIO()
+    merge_pdfs_to([io.BytesIO(scanned_pdf), io.BytesIO(scanned_pdf)], plain)
+    with patch.object(pdf_optimize.settings, "PDF_LINEARIZE", False):
+        merge_pdfs_to(
+            [io.BytesIO(scanned_pdf), io.BytesIO(scanned_pdf)],
+            optimized,
+            destination="storage",
+        )
+
+    assert len(optimized.getvalue()) < 0.6 * len(plain.getvalue())
+    with pikepdf.Pdf.open(io.BytesIO(optimized.getvalue())) as pdf:
+        first, second = (page.Resources.XObject.Im0.objgen for page in pdf.pages)
+        assert first == second
+
+
+def test_fax_profile_downsamples_images(scanned_pdf):
+    """Test images are resampled to the destination DPI."""
+    output = io.BytesIO()
+
+    report = optimize_pdf(io.BytesIO(scanned_pdf), output, "fax")
+
+    assert report.images_downsampled == 1
+    assert report.output_bytes < report.input_bytes
+    assert report.reduction > 0.5
+    with pikepdf.Pdf.open(io.BytesIO(output.getvalue())) as pdf:
+        image = pdf.pages[0].Resources.XObject.Im0
+        assert image.Width == 400  # 200 DPI over two inches
+        assert image.Filter == Name.DCTDecode
+        assert pdf.is_linearized
+
+
+def test_storage_profile_keeps_image_resolution(scanned_pdf):
+    """Test destinations without a DPI profile keep their images."""
+    output = io.BytesIO()
+
+    report = optimize_pdf(io.BytesIO(scanned_pdf), output, "storage")
+
+    assert report.images_downsampled == 0
+    with pikepdf.Pdf.open(io.BytesIO(output.getvalue())) as pdf:
+        assert pdf.pages[0].Resources.XObject.Im0.Width == 800
+
+
+def test_optimize_pdf_bytes_falls_back_on_invalid_pdf():
+    """Test a document that cannot be optimized is sent unchanged."""
+    assert optimize_pdf_bytes(b"not a pdf", "fax") == b"not a pdf"
+
+
+def test_optimize_pdf_bytes_disabled(scanned_pdf):
+    """Test optimization can be switched off."""
+    with patch.object(pdf_optimize.settings, "PDF_OPTIMIZE_ENABLED", False):
+        assert optimize_pdf_bytes(scanned_pdf, "fax") is scanned_pdf
+
+
+def test_low_resolution_images_are_kept():
+    """Test images already below the destination DPI are not resampled."""
+    low_res = create_scanned_pdf(pixels=300)  # 150 DPI
+
+    report = optimize_pdf(io.BytesIO(low_res), io.BytesIO(), "fax")
+
+    assert report.images_downsampled == 0
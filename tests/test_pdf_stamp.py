@@ -0,0 +1,112 @@
+"""Tests for Bates numbering and exhibit stamping during merges."""
+
+import io
+
+import pikepdf
+import pytest
+from pikepdf import Name
+
+from pi_auto_api.utils.pdf_merge import merge_pdfs
+from pi_auto_api.utils.pdf_stamp import STAMP_MARKER, BatesStamper
+
+
+def create_pdf(pages: int) -> bytes:
+    """Create a PDF whose pages each carry their own content stream."""
+    pdf = pikepdf.Pdf.new()
+    for number in range(pages):
+        page = pdf.add_blank_page(page_size=(200, 200))
+        page.Contents = pdf.make_stream(f"% original page {number}\n".encode())
+    output = io.BytesIO()
+    pdf.save(output)
+    return output.getvalue()
+
+
+def page_content(page: pikepdf.Page) -> bytes:
+    """Concatenated content streams of a page."""
+    return b"".join(stream.read_bytes() for stream in page.Contents)
+
+
+def overlays(page: pikepdf.Page) -> list:
+    """Form XObjects a page's resources refer to."""
+    xobjects = page.Resources.get(Name.XObject, {})
+    return [xobjects[name] for name in xobjects.keys()]
+
+
+def stamps(page: pikepdf.Page) -> list:
+    """Content streams added by the stamper."""
+    return [stream for stream in page.Contents if STAMP_MARKER in stream]
+
+
+@pytest.fixture
+def stamped_pdf():
+    """Two exhibits of two and one page merged with Bates numbers."""
+    stamper = BatesStamper(
+        prefix="INC7-",
+        header="Demand Package",
+        labels=["Exhibit 1", "Exhibit 2"],
+    )
+    merged = merge_pdfs([create_pdf(2), create_pdf(1)], stamper=stamper)
+    return pikepdf.Pdf.open(io.BytesIO(merged))
+
+
+def test_pages_are_numbered_consecutively(stamped_pdf):
+    """Test every page gets the next Bates number and its exhibit label."""
+    contents = [page_content(page) for page in stamped_pdf.pages]
+
+    for number, content in enumerate(contents, start=1):
+        assert f"(INC7-{number:06d})".encode() in content
+    first, _, last = stamped_pdf.pages
+    (overlay,) = overlays(first)
+    assert b"(Demand Package)" in overlay.read_bytes()
+    assert b"(Exhibit 1)" in overlay.read_bytes()
+    (overlay,) = overlays(last)
+    assert b"(Exhibit 2)" in overlay.read_bytes()
+
+
+def test_page_content_is_wrapped_not_rewritten(stamped_pdf):
+    """Test the original content is kept between the stamp's q and Q."""
+    page = stamped_pdf.pages[0]
+
+    save, original, stamp = page.Contents
+    assert save.read_bytes() == b"q\n"
+    assert original.read_bytes() == b"% original page 0\n"
+    assert stamp.read_bytes().startswith(b"Q q\n")
+
+
+def test_overlays_and_font_are_shared(stamped_pdf):
+    """Test pages of one exhibit reuse the same overlay and font objects."""
+    first, second, third = stamped_pdf.pages
+
+    assert overlays(first)[0].objgen == overlays(second)[0].objgen
+    assert overlays(first)[0].objgen != overlays(third)[0].objgen
+    fonts = {page.Resources.Font.PiAutoStampFont.objgen for page in stamped_pdf.pages}
+    assert len(fonts) == 1
+    assert first.Contents[0].objgen == third.Contents[0].objgen
+
+
+def test_restamping_replaces_existing_stamps(stamped_pdf):
+    """Test pages merged again get new numbers instead of a second stamp."""
+    output = io.BytesIO()
+    stamped_pdf.save(output)
+
+    merged = merge_pdfs(
+        [output.getvalue()], stamper=BatesStamper(prefix="INC7-", start=10)
+    )
+
+    with pikepdf.Pdf.open(io.BytesIO(merged)) as pdf:
+        page = pdf.pages[0]
+        assert len(stamps(page)) == 2
+        content = page_content(page)
+        assert b"(INC7-000010)" in content
+        assert b"(INC7-000001)" not in content
+        assert b"% original page 0" in content
+
+
+def test_bates_number_is_right_aligned():
+    """Test the Bates number ends at the right margin of the page."""
+    merged = merge_pdfs([create_pdf(1)], stamper=BatesStamper(digits=4))
+
+    with pikepdf.Pdf.open(io.BytesIO(merged)) as pdf:
+        stamp = stamps(pdf.pages[0])[-1].read_bytes()
+    # Four Courier characters at 9pt are 21.6pt wide: 200 - 18 - 21.6
+    assert b"160.40 18.00 Td (0001) Tj" in stamp
@@ -1,12 +1,18 @@
 """Tests for SendGrid email client functionality."""
 
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, patch
 
+import httpx
 import pytest
 from fastapi import HTTPException
-from sendgrid.helpers.mail import Mail
 
-from pi_auto_api.externals.sendgrid_client import send_mail
+from pi_auto_api.externals.sendgrid_client import (
+    MAX_PERSONALIZATIONS,
+    SENDGRID_MAIL_SEND_URL,
+    BatchSendError,
+    send_mail,
+    send_mail_batch,
+)
 
 # Test data
 TEST_EMAIL = "client@example.com"
@@ -47,17 +53,43 @@ def mock_template_path(tmp_path):
         yield template_file
 
 
+def sendgrid_response(status_code, message_id=None, text=""):
+    """Build a SendGrid Mail Send API response."""
+    headers = {"X-Message-Id": message_id} if message_id else None
+    return httpx.Response(
+        status_code,
+        text=text,
+        headers=headers,
+        request=httpx.Request("POST", SENDGRID_MAIL_SEND_URL),
+    )
+
+
+@pytest.fixture
+def mock_sendgrid_client():
+    """Mock the shared HTTP client used to call the SendGrid API."""
+    client = AsyncMock()
+    client.post.return_value = sendgrid_response(202, "test-message-id-123")
+    with patch(
+        "pi_auto_api.externals.sendgrid_client.get_client", return_value=client
+    ) as mock_get_client:
+        client.get_client = mock_get_client
+        yield client
+
+
+@pytest.fixture
+def mock_sendgrid_settings():
+    """Mock SendGrid settings."""
+    with patch("pi_auto_api.externals.sendgrid_client.settings") as mock_settings:
+        mock_settings.SENDGRID_API_KEY = "test_api_key"
+        yield mock_settings
+
+
 @pytest.mark.asyncio
-@patch("pi_auto_api.externals.sendgrid_client.settings")
-@patch("pi_auto_api.externals.sendgrid_client.SendGridAPIClient")
 @patch("pi_auto_api.externals.sendgrid_client.render_email_template")
 async def test_send_mail_success(
-    mock_render, mock_sendgrid, mock_settings, mock_template_path
+    mock_render, mock_sendgrid_client, mock_sendgrid_settings, mock_template_path
 ):
     """Test successful email sending."""
-    # Configure mocks
-    mock_settings.SENDGRID_API_KEY = "test_api_key"
-
     # Mock the render_email_template to return a known HTML string
     html_content = (
         "<html><body>"
@@ -68,14 +100,6 @@ async def test_send_mail_success(
     )
     mock_render.return_value = html_content
 
-    # Set up SendGrid mock
-    mock_client_instance = MagicMock()
-    mock_response = MagicMock()
-    mock_response.status_code = 202
-    mock_response.headers = {"X-Message-Id": "test-message-id-123"}
-    mock_client_instance.send.return_value = mock_response
-    mock_sendgrid.return_value = mock_client_instance
-
     # Call the function
     result = await send_mail(
         template_name=TEST_TEMPLATE, to_email=TEST_EMAIL, template_ctx=TEST_CONTEXT
@@ -84,20 +108,22 @@ async def test_send_mail_success(
     # Assertions
     assert result == "test-message-id-123"
 
-    # Check SendGrid client was initialized with API key
-    mock_sendgrid.assert_called_once_with("test_api_key")
-
     # Check render_email_template was called with correct args
     mock_render.assert_called_once_with(TEST_TEMPLATE, TEST_CONTEXT)
 
-    # Check send was called
-    mock_client_instance.send.assert_called_once()
+    # Check the shared client posted the message with the API key
+    mock_sendgrid_client.get_client.assert_called_with("sendgrid")
+    mock_sendgrid_client.post.assert_awaited_once()
+    call = mock_sendgrid_client.post.call_args
+    assert call.args[0] == SENDGRID_MAIL_SEND_URL
+    assert call.kwargs["headers"]["Authorization"] == "Bearer test_api_key"
 
-    # Validate the Mail object
-    mail_obj = mock_client_instance.send.call_args[0][0]
-    assert isinstance(mail_obj, Mail)
-    assert mail_obj.from_email.email == "no-reply@pi-auto.example.com"
-    assert str(mail_obj.subject) == "Test Template"
+    # Validate the Mail Send payload
+    payload = call.kwargs["json"]
+    assert payload["personalizations"] == [{"to": [{"email": TEST_EMAIL}]}]
+    assert payload["from"]["email"] == "no-reply@pi-auto.example.com"
+    assert payload["subject"] == "Test Template"
+    assert payload["content"] == [{"type": "text/html", "value": html_content}]
 
 
 @pytest.mark.asyncio
@@ -115,12 +141,11 @@ async def test_send_mail_missing_api_key(mock_settings):
 
 
 @pytest.mark.asyncio
-@patch("pi_auto_api.externals.sendgrid_client.settings")
 @patch("pi_auto_api.externals.sendgrid_client.render_email_template")
-async def test_send_mail_template_not_found(mock_render, mock_settings):
+async def test_send_mail_template_not_found(
+    mock_render, mock_sendgrid_client, mock_sendgrid_settings
+):
     """Test error when template file is not found."""
-    # Configure mocks
-    mock_settings.SENDGRID_API_KEY = "test_api_key"
     mock_render.side_effect = FileNotFoundError("Template not found")
 
     # Call the function and expect error
@@ -133,22 +158,19 @@ async def test_send_mail_template_not_found(mock_render, mock_settings):
 
     assert exc_info.value.status_code == 500
     assert "Email template not found" in exc_info.value.detail
+    mock_sendgrid_client.post.assert_not_awaited()
 
 
 @pytest.mark.asyncio
-@patch("pi_auto_api.externals.sendgrid_client.settings")
 @patch("pi_auto_api.externals.sendgrid_client.render_email_template")
-@patch("pi_auto_api.externals.sendgrid_client.SendGridAPIClient")
-async def test_send_mail_sendgrid_error(mock_sendgrid, mock_render, mock_settings):
+async def test_send_mail_sendgrid_error(
+    mock_render, mock_sendgrid_client, mock_sendgrid_settings
+):
     """Test handling of SendGrid API errors."""
-    # Configure mocks
-    mock_settings.SENDGRID_API_KEY = "test_api_key"
     mock_render.return_value = "<html><body>Test email content</body></html>"
-
-    # Set up SendGrid mock to raise an exception
-    mock_client_instance = MagicMock()
-    mock_client_instance.send.side_effect = Exception("SendGrid API error")
-    mock_sendgrid.return_value = mock_client_instance
+    mock_sendgrid_client.post.return_value = sendgrid_response(
+        400, text='{"errors": [{"message": "Bad Request"}]}'
+    )
 
     # Call the function and expect error
     with pytest.raises(HTTPException) as exc_info:
@@ -158,30 +180,34 @@ async def test_send_mail_sendgrid_error(mock_sendgrid, mock_render, mock_setting
 
     assert exc_info.value.status_code == 500
     assert "Failed to send email" in exc_info.value.detail
+    assert "400" in exc_info.value.detail
 
 
 @pytest.mark.asyncio
-@patch("pi_auto_api.externals.sendgrid_client.settings")
-@patch("pi_auto_api.externals.sendgrid_client.SendGridAPIClient")
 @patch("pi_auto_api.externals.sendgrid_client.render_email_template")
-async def test_send_mail_custom_from_and_subject(
-    mock_render, mock_sendgrid, mock_settings, mock_template_path
+async def test_send_mail_connection_error(
+    mock_render, mock_sendgrid_client, mock_sendgrid_settings
 ):
-    """Test sending email with custom from address and subject."""
-    # Configure mocks
-    mock_settings.SENDGRID_API_KEY = "test_api_key"
+    """Test handling of transport errors from the shared client."""
+    mock_render.return_value = "<html><body>Test email content</body></html>"
+    mock_sendgrid_client.post.side_effect = httpx.ConnectError("Connection refused")
 
-    # Mock the template rendering
-    html_content = "<html><body>Test email content</body></html>"
-    mock_render.return_value = html_content
+    with pytest.raises(HTTPException) as exc_info:
+        await send_mail(
+            template_name=TEST_TEMPLATE, to_email=TEST_EMAIL, template_ctx=TEST_CONTEXT
+        )
+
+    assert exc_info.value.status_code == 500
+    assert "Failed to send email" in exc_info.value.detail
 
-    # Set up SendGrid mock
-    mock_client_instance = MagicMock()
-    mock_response = MagicMock()
-    mock_response.status_code = 202
-    mock_response.headers = {"X-Message-Id": "test-message-id-123"}
-    mock_client_instance.send.return_value = mock_response
-    mock_sendgrid.return_value = mock_client_instance
+
+@pytest.mark.asyncio
+@patch("pi_auto_api.externals.sendgrid_client.render_email_template")
+async def test_send_mail_custom_from_and_subject(
+    mock_render, mock_sendgrid_client, mock_sendgrid_settings, mock_template_path
+):
+    """Test sending email with custom from address and subject."""
+    mock_render.return_value = "<html><body>Test email content</body></html>"
 
     custom_from = "custom@example.com"
     custom_subject = "Custom Email Subject"
@@ -196,6 +222,80 @@ async def test_send_mail_custom_from_and_subject(
     )
 
     # Assertions
-    mail_obj = mock_client_instance.send.call_args[0][0]
-    assert mail_obj.from_email.email == custom_from
-    assert str(mail_obj.subject) == custom_subject
+    payload = mock_sendgrid_client.post.call_args.kwargs["json"]
+    assert payload["from"]["email"] == custom_from
+    assert payload["subject"] == custom_subject
+
+
+@pytest.mark.asyncio
+@patch("pi_auto_api.externals.sendgrid_client.render_email_template")
+async def test_send_mail_batch_single_request(
+    mock_render, mock_sendgrid_client, mock_sendgrid_settings
+):
+    """Test a batch is rendered once and sent as one request."""
+    mock_render.return_value = "<html><body>Test email content</body></html>"
+    recipients = ["a@example.com", "b@example.com", "c@example.com"]
+
+    result = await send_mail_batch(TEST_TEMPLATE, recipients, TEST_CONTEXT)
+
+    # One message ID per recipient, in order
+    assert result == ["test-message-id-123"] * 3
+
+    mock_render.assert_called_once_with(TEST_TEMPLATE, TEST_CONTEXT)
+    mock_sendgrid_client.post.assert_awaited_once()
+    payload = mock_sendgrid_client.post.call_args.kwargs["json"]
+    assert payload["personalizations"] == [
+        {"to": [{"email": email}]} for email in recipients
+    ]
+
+
+@pytest.mark.asyncio
+@patch("pi_auto_api.externals.sendgrid_client.render_email_template")
+async def test_send_mail_batch_chunks_personalizations(
+    mock_render, mock_sendgrid_client, mock_sendgrid_settings
+):
+    """Test batches above the personalization limit are split into requests."""
+    mock_render.return_value = "<html><body>Test email content</body></html>"
+    mock_sendgrid_client.post.side_effect = [
+        sendgrid_response(202, "first-id"),
+        sendgrid_response(202, "second-id"),
+    ]
+    recipients = [f"user{i}@example.com" for i in range(MAX_PERSONALIZATIONS + 2)]
+
+    result = await send_mail_batch(TEST_TEMPLATE, recipients, TEST_CONTEXT)
+
+    assert result == ["first-id"] * MAX_PERSONALIZATIONS + ["second-id"] * 2
+    assert mock_sendgrid_client.post.await_count == 2
+    mock_render.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_send_mail_batch_empty(mock_sendgrid_client, mock_sendgrid_settings):
+    """Test an empty batch sends nothing."""
+    assert await send_mail_batch(TEST_TEMPLATE, [], TEST_CONTEXT) == []
+    mock_sendgrid_client.post.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+@patch("pi_auto_api.externals.sendgrid_client.render_email_template")
+async def test_send_mail_batch_reports_failed_chunks(
+    mock_render, mock_sendgrid_client, mock_sendgrid_settings
+):
+    """Test a failed request keeps the other requests' message IDs."""
+    mock_render.return_value = "<html><body>Test email content</body></html>"
+    mock_sendgrid_client.post.side_effect = [
+        sendgrid_response(503, text="Service Unavailable"),
+        sendgrid_response(202, "second-id"),
+    ]
+    recipients = [f"user{i}@example.com" for i in range(MAX_PERSONALIZATIONS + 2)]
+
+    with pytest.raises(BatchSendError) as exc_info:
+        await send_mail_batch(TEST_TEMPLATE, recipients, TEST_CONTEXT)
+
+    # The second request is still sent; only the first chunk needs a retry
+    assert mock_sendgrid_client.post.await_count == 2
+    assert exc_info.value.failed == recipients[:MAX_PERSONALIZATIONS]
+    assert exc_info.value.message_ids == (
+        [None] * MAX_PERSONALIZATIONS + ["second-id"] * 2
+    )
+    assert "503" in exc_info.value.detail
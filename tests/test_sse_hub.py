@@ -0,0 +1,496 @@
+"""Tests for the per-process SSE broadcast hub."""
+
+import asyncio
+import json
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+from pi_auto_api import outbox, sse_hub
+from pi_auto_api.config import settings
+from pi_auto_api.routers.sse import event_publisher, resolve_event_filter
+from pi_auto_api.tasks.disbursement import generate_disbursement_sheet
+
+
+class FakeStreamRedis:
+    """Minimal stand-in for a redis.asyncio client holding one stream."""
+
+    def __init__(self, entries=None):
+        """Store the stream entries as (id, fields) tuples in order."""
+        self.entries = list(entries or [])
+        self.added = asyncio.Event()
+        self.aclose = AsyncMock()
+
+    def add(self, entry_id, data):
+        """Append an entry and wake blocked readers."""
+        self.entries.append((entry_id, {"data": data}))
+        self.added.set()
+
+    async def xrevrange(self, stream, count=None):
+        """Return the newest entries first."""
+        return list(reversed(self.entries))[:count]
+
+    async def xrange(self, stream, min="-", max="+", count=None):
+        """Return entries after an exclusive "(id" lower bound, oldest first."""
+        entries = self.entries
+        if min.startswith("("):
+            after = sse_hub.parse_stream_id(min[1:])
+            entries = [e for e in entries if sse_hub.parse_stream_id(e[0]) > after]
+        return entries[:count]
+
+    async def xread(self, streams, count=None, block=None):
+        """Return entries after the cursor, blocking until there are some."""
+        ((stream, cursor),) = streams.items()
+        while True:
+            after = sse_hub.parse_stream_id(cursor)
+            entries = [e for e in self.entries if sse_hub.parse_stream_id(e[0]) > after]
+            if entries:
+                return [[stream, entries[:count]]]
+            self.added.clear()
+            await self.added.wait()
+
+
+@pytest.fixture
+def fake_redis():
+    """Patch redis.from_url in the hub with a FakeStreamRedis."""
+    client = FakeStreamRedis([("1-0", {"data": '{"type": "old"}'})])
+    with patch("pi_auto_api.sse_hub.redis.from_url", return_value=client):
+        yield client
+
+
+@pytest.fixture
+def database(mock_db_pool):
+    """A configured database whose pool is mock_db_pool."""
+    with patch.object(settings, "SUPABASE_URL", "postgresql://localhost/test"):
+        yield mock_db_pool
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    """Start and end every test with an empty hub registry."""
+    sse_hub._hubs.clear()
+    yield
+    sse_hub._hubs.clear()
+
+
+def sse_request(last_event_id=None):
+    """Build a request stub with an optional Last-Event-ID header."""
+    request = MagicMock()
+    request.headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+    return request
+
+
+def test_parse_stream_id():
+    """Test stream IDs parse into comparable tuples."""
+    assert sse_hub.parse_stream_id("1700000000000-3") == (1700000000000, 3)
+    assert sse_hub.parse_stream_id("1700000000000") == (1700000000000, 0)
+    assert sse_hub.parse_stream_id("not-an-id") is None
+    assert sse_hub.parse_stream_id(None) is None
+
+
+@pytest.mark.asyncio
+async def test_hub_fans_out_new_entries(fake_redis):
+    """Test every subscriber receives each new entry, using its stream ID."""
+    hub = sse_hub.ActivityHub()
+    first, second = hub.subscribe(), hub.subscribe()
+    await asyncio.sleep(0)
+
+    fake_redis.add("2-0", '{"type": "one"}')
+    fake_redis.add("3-0", '{"type": "two"}')
+
+    for subscriber in (first, second):
+        received = [await asyncio.wait_for(subscriber.get(), 1) for _ in range(2)]
+        assert [event["id"] for event in received] == ["2-0", "3-0"]
+        assert received[0]["data"] == '{"type": "one"}'
+
+    await hub.close()
+    fake_redis.aclose.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_unsubscribed_clients_stop_receiving():
+    """Test broadcast skips clients that have left."""
+    hub = sse_hub.ActivityHub()
+    hub._ensure_started = MagicMock()
+    staying, leaving = hub.subscribe(), hub.subscribe()
+    hub.unsubscribe(leaving)
+
+    hub.broadcast({"id": "1-0", "event": "message", "data": "x"})
+
+    assert staying.qsize() == 1
+    assert leaving.empty()
+
+
+def activity(entry_id, **payload):
+    """Build an SSE event for an activity payload."""
+    return sse_hub.format_stream_entry(entry_id, {"data": json.dumps(payload)})
+
+
+def test_event_filter_matching():
+    """Test filters match on every restricted field and ignore the rest."""
+    event_filter = sse_hub.EventFilter.build(incident_ids=[7, 8], types=["a"])
+    fields = sse_hub.routing_fields(
+        json.dumps({"incident_id": 7, "client_id": 3, "type": "a"})
+    )
+
+    assert event_filter
+    assert event_filter.matches(fields)
+    assert not event_filter.matches({**fields, "incident_id": "9"})
+    assert not event_filter.matches({"incident_id": "7"})
+    assert sorted(event_filter.index_keys()) == [
+        ("incident_id", "7"),
+        ("incident_id", "8"),
+    ]
+    assert not sse_hub.EventFilter.build()
+
+
+@pytest.mark.asyncio
+async def test_publish_routes_only_to_interested_subscribers():
+    """Test filtered subscribers only receive matching events."""
+    hub = sse_hub.ActivityHub()
+    hub._ensure_started = MagicMock()
+    everyone = hub.subscribe()
+    incident_7 = hub.subscribe(sse_hub.EventFilter.build(incident_ids=[7]))
+    bills = hub.subscribe(
+        sse_hub.EventFilter.build(incident_ids=[7, 8], types=["bill_received"])
+    )
+    type_a = hub.subscribe(sse_hub.EventFilter.build(types=["a"]))
+
+    hub.publish(activity("1-0", type="bill_received", incident_id=7))
+    hub.publish(activity("2-0", type="disbursement_sent", incident_id=8))
+
+    assert everyone.qsize() == 2
+    assert [incident_7.get_nowait()["id"]] == ["1-0"]
+    assert incident_7.empty()
+    assert [bills.get_nowait()["id"]] == ["1-0"]
+    assert bills.empty()
+    assert type_a.empty()
+
+    hub.unsubscribe(incident_7)
+    hub.unsubscribe(bills)
+    assert set(hub._index) == {("type", "a")}
+
+
+def test_overflow_drop_oldest():
+    """Test a full buffer discards its oldest events."""
+    subscriber = sse_hub.Subscriber(maxsize=2, overflow="drop_oldest")
+    for entry_id in ("1-0", "2-0", "3-0"):
+        subscriber.put(activity(entry_id, type="a"))
+
+    assert subscriber.get_nowait() == sse_hub.RESYNC_EVENT
+    assert [subscriber.get_nowait()["id"] for _ in range(2)] == ["2-0", "3-0"]
+    assert subscriber.dropped == 1
+
+
+def test_overflow_sends_one_resync_per_gap():
+    """Test repeated drops share a pending hint and a later gap gets its own."""
+    subscriber = sse_hub.Subscriber(maxsize=2, overflow="drop_oldest")
+    for entry_id in ("1-0", "2-0", "3-0", "4-0"):
+        subscriber.put(activity(entry_id, type="a"))
+
+    assert subscriber.get_nowait() == sse_hub.RESYNC_EVENT
+    assert [subscriber.get_nowait()["id"] for _ in range(2)] == ["3-0", "4-0"]
+
+    for entry_id in ("5-0", "6-0"):
+        subscriber.put(activity(entry_id, type="a"))
+    assert subscriber.get_nowait()["id"] == "5-0"
+
+    for entry_id in ("7-0", "8-0"):
+        subscriber.put(activity(entry_id, type="a"))
+    assert subscriber.get_nowait() == sse_hub.RESYNC_EVENT
+    assert [subscriber.get_nowait()["id"] for _ in range(2)] == ["7-0", "8-0"]
+    assert subscriber.empty()
+
+
+def test_overflow_coalesce_keeps_latest_per_key():
+    """Test a full buffer keeps only the newest event per type and incident."""
+    subscriber = sse_hub.Subscriber(maxsize=3, overflow="coalesce")
+    subscriber.put(activity("1-0", type="status", incident_id=1))
+    subscriber.put(activity("2-0", type="status", incident_id=2))
+    subscriber.put(activity("3-0", type="status", incident_id=1))
+    subscriber.put(activity("4-0", type="status", incident_id=2))
+
+    assert subscriber.get_nowait() == sse_hub.RESYNC_EVENT
+    assert [subscriber.get_nowait()["id"] for _ in range(2)] == ["3-0", "4-0"]
+    assert subscriber.empty()
+    assert subscriber.dropped == 2
+
+
+def test_overflow_disconnect_sends_resync():
+    """Test a client that falls behind gets a resync hint and is closed."""
+    subscriber = sse_hub.Subscriber(maxsize=2, overflow="disconnect")
+    for entry_id in ("1-0", "2-0", "3-0", "4-0"):
+        subscriber.put(activity(entry_id, type="a"))
+
+    assert subscriber.closed
+    assert subscriber.get_nowait() == sse_hub.RESYNC_EVENT
+    assert subscriber.empty()
+
+
+@pytest.mark.asyncio
+async def test_get_many_collects_a_burst():
+    """Test events within the batch window are returned together."""
+    subscriber = sse_hub.Subscriber()
+    for entry_id in ("1-0", "2-0"):
+        subscriber.put(activity(entry_id, type="a"))
+    subscriber.put(sse_hub.HEARTBEAT_EVENT)
+    subscriber.put(activity("3-0", type="a"))
+
+    burst = await subscriber.get_many(max_events=10, window=0.01)
+
+    # Collection stops after the heartbeat
+    assert [event.get("id") for event in burst] == ["1-0", "2-0", None]
+    assert await subscriber.get_many(max_events=10, window=0) == [
+        activity("3-0", type="a")
+    ]
+
+
+def test_batch_frame():
+    """Test several events become one frame holding a JSON array."""
+    events = [activity("1-0", type="a"), activity("2-0", type="b")]
+
+    frame = sse_hub.batch_frame(events)
+
+    assert frame["id"] == "2-0"
+    assert frame["event"] == "batch"
+    assert json.loads(frame["data"]) == [{"type": "a"}, {"type": "b"}]
+    assert sse_hub.batch_frame(events[:1]) == events[0]
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_is_sent_centrally(fake_redis):
+    """Test the hub sends keep-alive comments to all subscribers."""
+    hub = sse_hub.ActivityHub(heartbeat_interval=0.01)
+    subscriber = hub.subscribe()
+
+    event = await asyncio.wait_for(subscriber.get(), 1)
+
+    assert event == sse_hub.HEARTBEAT_EVENT
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_replay_returns_missed_entries(fake_redis):
+    """Test replay returns only entries after the client's last ID."""
+    fake_redis.add("2-0", "a")
+    fake_redis.add("2-1", "b")
+    hub = sse_hub.ActivityHub()
+
+    events = await hub.replay("2-0")
+
+    assert [event["id"] for event in events] == ["2-1"]
+    assert await hub.replay("garbage") == []
+
+
+@pytest.mark.asyncio
+async def test_replay_requests_resync_when_trimmed(fake_redis):
+    """Test a client whose missed entries were trimmed is told to resync."""
+    fake_redis.entries = [("5-0", {"data": "kept"})]
+    hub = sse_hub.ActivityHub()
+
+    assert await hub.replay("2-0") == [sse_hub.RESYNC_EVENT]
+
+
+@pytest.mark.asyncio
+async def test_replay_applies_filter(fake_redis):
+    """Test a filtered client is only replayed matching events."""
+    fake_redis.add("2-0", json.dumps({"type": "a", "incident_id": 7}))
+    fake_redis.add("3-0", json.dumps({"type": "a", "incident_id": 8}))
+    hub = sse_hub.ActivityHub()
+
+    events = await hub.replay("1-0", sse_hub.EventFilter.build(incident_ids=[8]))
+
+    assert [event["id"] for event in events] == ["3-0"]
+
+
+@pytest.mark.asyncio
+async def test_resolve_event_filter_turns_clients_and_assignees_into_incidents(
+    database,
+):
+    """Test client and assignee filters become the incidents they cover."""
+    conn = database.conn
+    conn.fetch.side_effect = [
+        [{"id": 7}, {"id": 8}],
+        [{"incident_id": 8}, {"incident_id": 9}],
+    ]
+
+    event_filter = await resolve_event_filter(
+        client_ids=[3], assignees=["Para@Example.com"], types=["bill_received"]
+    )
+
+    assert event_filter == sse_hub.EventFilter.build(
+        incident_ids=[8], types=["bill_received"]
+    )
+    assert conn.fetch.await_args_list[1].args[1] == ["para@example.com"]
+
+
+@pytest.mark.asyncio
+async def test_resolve_event_filter_without_incidents_matches_nothing(database):
+    """Test a client with no incidents does not get an unfiltered stream."""
+    database.conn.fetch.return_value = []
+
+    event_filter = await resolve_event_filter(client_ids=[3])
+
+    assert event_filter
+    assert not event_filter.matches({"incident_id": "7", "type": "bill_received"})
+
+
+@pytest.mark.asyncio
+async def test_resolve_event_filter_without_database(mock_db_pool):
+    """Test client filters are refused with 503 when no database is set up."""
+    with patch.object(settings, "SUPABASE_URL", None):
+        with pytest.raises(HTTPException) as exc_info:
+            await resolve_event_filter(assignees=["para@example.com"])
+        event_filter = await resolve_event_filter(incident_ids=[7])
+
+    assert exc_info.value.status_code == 503
+    assert event_filter == sse_hub.EventFilter.build(incident_ids=[7])
+    mock_db_pool.conn.fetch.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_client_stream_receives_produced_disbursement_event(database, fake_redis):
+    """Test a disbursement event reaches its client's stream end to end."""
+    conn = database.conn
+    conn.fetchrow.return_value = {
+        "incident_id": 123,
+        "incident_date": None,
+        "settlement_amount": Decimal("60000.00"),
+        "attorney_fee_pct": Decimal("33.33"),
+        "lien_total": Decimal("0.00"),
+        "client_id": 456,
+        "client_name": "John Doe",
+        "client_email": "john@example.com",
+    }
+    conn.fetchval.return_value = 789
+    totals = dict.fromkeys(
+        ["gross", "attorney_fee", "lien_total", "other_adjustments", "net_to_client"],
+        Decimal("1.00"),
+    )
+    with (
+        patch(
+            "pi_auto_api.tasks.disbursement.calc_split",
+            AsyncMock(return_value=totals),
+        ),
+        patch(
+            "pi_auto_api.tasks.disbursement.generate_letter",
+            AsyncMock(return_value=b"%PDF"),
+        ),
+        patch(
+            "pi_auto_api.tasks.disbursement.send_envelope",
+            AsyncMock(return_value="env-1"),
+        ),
+        patch("pi_auto_api.outbox.wake_relay"),
+    ):
+        assert await generate_disbursement_sheet(123) == "env-1"
+    ((_, kind, payload),) = [
+        call.args
+        for call in conn.execute.await_args_list
+        if call.args[0] == outbox._INSERT_QUERY
+    ]
+
+    # Streams of the incident's client and of another client
+    conn.fetch.side_effect = [[{"id": 123}], [{"id": 124}]]
+    hub = sse_hub.ActivityHub()
+    client_456 = hub.subscribe(await resolve_event_filter(client_ids=[456]))
+    client_999 = hub.subscribe(await resolve_event_filter(client_ids=[999]))
+    await asyncio.sleep(0)
+
+    # The outbox relay publishes the event to the activity stream
+    conn.fetch.side_effect = None
+    conn.fetch.return_value = [
+        {"id": 1, "kind": kind, "payload": payload, "attempts": 0}
+    ]
+    with patch(
+        "pi_auto_api.events.write_events",
+        AsyncMock(
+            side_effect=lambda batch: fake_redis.add("2-0", json.dumps(batch[0]))
+        ),
+    ):
+        assert await outbox.relay_batch() == 1
+
+    event = await asyncio.wait_for(client_456.get(), 1)
+    assert json.loads(event["data"]) == {
+        "type": "disbursement_sent",
+        "incident_id": 123,
+        "client_id": 456,
+        "envelope_id": "env-1",
+        "doc_id": 789,
+    }
+    assert client_999.empty()
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_event_publisher_unsubscribes_on_close():
+    """Test the SSE generator relays its queue and leaves the hub when closed."""
+    hub = sse_hub.get_hub()
+    hub._ensure_started = MagicMock()
+
+    publisher = event_publisher(sse_request())
+    next_event = asyncio.ensure_future(publisher.__anext__())
+    await asyncio.sleep(0)
+    assert len(hub.subscribers) == 1
+
+    hub.broadcast({"id": "1-0", "event": "message", "data": "hello"})
+    assert (await asyncio.wait_for(next_event, 1))["data"] == "hello"
+
+    await publisher.aclose()
+    assert not hub.subscribers
+
+
+@pytest.mark.asyncio
+async def test_event_publisher_closes_after_overflow_disconnect():
+    """Test a disconnected slow client is sent a resync and the stream ends."""
+    hub = sse_hub.get_hub()
+    hub._ensure_started = MagicMock()
+
+    publisher = event_publisher(sse_request())
+    next_event = asyncio.ensure_future(publisher.__anext__())
+    await asyncio.sleep(0)
+    (subscriber,) = hub.subscribers
+    subscriber.maxsize, subscriber.overflow = 1, "disconnect"
+    hub.broadcast(activity("1-0", type="a"))
+    hub.broadcast(activity("2-0", type="a"))
+
+    assert await asyncio.wait_for(next_event, 1) == sse_hub.RESYNC_EVENT
+    with pytest.raises(StopAsyncIteration):
+        await publisher.__anext__()
+    assert not hub.subscribers
+
+
+@pytest.mark.asyncio
+async def test_event_publisher_resumes_without_gaps_or_duplicates():
+    """Test replayed events are not repeated when they also arrive live."""
+    hub = sse_hub.get_hub()
+    hub._ensure_started = MagicMock()
+    replayed = [
+        {"id": "2-0", "event": "message", "data": "a"},
+        {"id": "3-0", "event": "message", "data": "b"},
+    ]
+    hub.replay = AsyncMock(return_value=replayed)
+
+    publisher = event_publisher(sse_request("1-0"))
+    assert [await publisher.__anext__() for _ in range(2)] == replayed
+
+    # The reader also broadcast 3-0 after the client subscribed
+    hub.broadcast(replayed[1])
+    hub.broadcast({"id": "4-0", "event": "message", "data": "c"})
+
+    assert (await asyncio.wait_for(publisher.__anext__(), 1))["id"] == "4-0"
+    hub.replay.assert_awaited_once_with("1-0", None)
+    await publisher.aclose()
+
+
+def test_hubs_are_per_event_loop():
+    """Test that each event loop gets its own hub."""
+
+    async def get():
+        return sse_hub.get_hub()
+
+    first = asyncio.run(get())
+    second = asyncio.run(get())
+
+    assert first is not second
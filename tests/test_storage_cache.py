@@ -0,0 +1,152 @@
+"""Tests for the on-disk storage cache and cached downloads."""
+
+import os
+import stat
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from pi_auto_api.utils import storage, storage_cache
+
+CONTENT = b"%PDF-1.7 exhibit"
+
+
+@pytest.fixture(autouse=True)
+def cache_settings(tmp_path):
+    """Point the cache at a temporary directory with Supabase configured."""
+    with (
+        patch.object(storage.settings, "SUPABASE_URL", "https://supabase.test"),
+        patch.object(storage.settings, "SUPABASE_KEY", "key"),
+        patch.object(storage.settings, "STORAGE_CACHE_ENABLED", True),
+        patch.object(storage.settings, "STORAGE_CACHE_DIR", str(tmp_path / "cache")),
+    ):
+        yield
+
+
+@pytest.fixture
+def storage_server():
+    """Serve one object with an ETag and answer If-None-Match with 304."""
+    state = {"etag": '"v1"', "content": CONTENT, "requests": []}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        state["requests"].append(request)
+        if request.headers.get("If-None-Match") == state["etag"]:
+            return httpx.Response(304)
+        return httpx.Response(
+            200, content=state["content"], headers={"ETag": state["etag"]}
+        )
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("pi_auto_api.utils.storage.get_client", return_value=client):
+        yield state
+
+
+async def _read(doc_id: str) -> bytes:
+    """Open a stored file and read it."""
+    with await storage.open_file(doc_id) as content:
+        return content.read()
+
+
+@pytest.mark.asyncio
+async def test_repeat_download_revalidates_cached_copy(storage_server):
+    """Test a second download sends the ETag and reuses the cached blob."""
+    assert await _read("doc1") == CONTENT
+    assert await _read("doc1") == CONTENT
+
+    first, second = storage_server["requests"]
+    assert "If-None-Match" not in first.headers
+    assert second.headers["If-None-Match"] == '"v1"'
+
+
+@pytest.mark.asyncio
+async def test_changed_object_is_downloaded_again(storage_server):
+    """Test a new ETag replaces the cached copy."""
+    await _read("doc1")
+    storage_server.update(etag='"v2"', content=b"%PDF-1.7 updated")
+
+    assert await _read("doc1") == b"%PDF-1.7 updated"
+    assert await _read("doc1") == b"%PDF-1.7 updated"
+
+
+@pytest.mark.asyncio
+async def test_identical_objects_share_a_blob(storage_server):
+    """Test content is stored once however many paths refer to it."""
+    await _read("doc1")
+    await _read("doc2")
+
+    assert len(os.listdir(storage_cache.cache_dir() / "blobs")) == 1
+
+
+@pytest.mark.asyncio
+async def test_download_without_cache(storage_server, tmp_path):
+    """Test files are still served when the cache is disabled."""
+    with patch.object(storage.settings, "STORAGE_CACHE_ENABLED", False):
+        assert await storage.get_file_content("doc1") == CONTENT
+
+    assert not (tmp_path / "cache").exists()
+
+
+@pytest.mark.asyncio
+async def test_missing_file_returns_none():
+    """Test a 404 is reported as a missing file."""
+    client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(404))
+    )
+    with patch("pi_auto_api.utils.storage.get_client", return_value=client):
+        assert await storage.open_file("missing") is None
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    """Test eviction deletes the oldest blobs first until the cache fits."""
+    blobs = storage_cache.cache_dir() / "blobs"
+    blobs.mkdir(parents=True)
+    for age, name in enumerate(["newest", "middle", "oldest"]):
+        path = blobs / name
+        path.write_bytes(b"x" * 10)
+        os.utime(path, (1000 - age, 1000 - age))
+
+    assert storage_cache.evict(max_bytes=15) == 2
+    assert os.listdir(blobs) == ["newest"]
+
+
+@pytest.mark.asyncio
+async def test_get_file_etag_uses_head(storage_server):
+    """Test the current ETag is read without downloading the file."""
+    assert await storage.get_file_etag("doc1") == '"v1"'
+
+    assert storage_server["requests"][0].method == "HEAD"
+
+
+def test_cache_dir_is_private(tmp_path):
+    """Test the cache directory is created readable by its owner only."""
+    assert stat.S_IMODE(storage_cache.cache_dir().stat().st_mode) == 0o700
+
+
+def test_shared_cache_dir_is_refused(tmp_path):
+    """Test a directory other users can read is not used for client files."""
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o755)
+
+    with patch.object(storage.settings, "STORAGE_CACHE_DIR", str(shared)):
+        with pytest.raises(PermissionError):
+            storage_cache.cache_dir()
+
+
+@pytest.mark.asyncio
+async def test_store_scans_only_over_the_limit(tmp_path):
+    """Test the cache directory is only scanned when the size estimate is over."""
+
+    async def chunks(data):
+        yield data
+
+    storage_cache.evict(max_bytes=100)
+    with (
+        patch.object(storage.settings, "STORAGE_CACHE_MAX_BYTES", 100),
+        patch.object(storage_cache, "evict", wraps=storage_cache.evict) as evict,
+    ):
+        (await storage_cache.store("a", '"1"', chunks(b"a" * 60))).close()
+        assert evict.call_count == 0
+        (await storage_cache.store("b", '"1"', chunks(b"b" * 60))).close()
+        assert evict.call_count == 1
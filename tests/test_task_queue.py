@@ -0,0 +1,112 @@
+"""Tests for the async Celery enqueue facade."""
+
+import asyncio
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pi_auto_api import task_queue
+
+
+@pytest.fixture
+def celery():
+    """Patch the Celery app with a mock that records sends per producer."""
+    app = MagicMock()
+    app.send_task.side_effect = lambda name, **options: MagicMock(id=options["task_id"])
+    with patch("pi_auto_api.celery_app.app", app):
+        yield app
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    """Start and end every test with no enqueuers."""
+    task_queue._enqueuers.clear()
+    yield
+    task_queue._enqueuers.clear()
+
+
+@pytest.mark.asyncio
+async def test_enqueue_returns_task_id(celery):
+    """Test enqueue publishes the task and returns its ID."""
+    task = MagicMock()
+    task.name = "generate_retainer"
+
+    task_id = await task_queue.enqueue(task, 42, force=True)
+
+    name = celery.send_task.call_args.args[0]
+    options = celery.send_task.call_args.kwargs
+    assert name == "generate_retainer"
+    assert options["args"] == [42]
+    assert options["kwargs"] == {"force": True}
+    assert options["task_id"] == task_id
+
+
+@pytest.mark.asyncio
+async def test_enqueue_publishes_off_the_event_loop(celery):
+    """Test the blocking broker call runs on a worker thread."""
+    threads = []
+    celery.producer_or_acquire.side_effect = lambda: (
+        threads.append(threading.current_thread()) or MagicMock()
+    )
+
+    await task_queue.enqueue("generate_retainer", 1)
+
+    assert threads and threads[0] is not threading.main_thread()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_sends_share_a_producer(celery):
+    """Test sends queued together are published over one producer."""
+    ids = await asyncio.gather(
+        *(task_queue.enqueue("send_insurance_notice", n) for n in range(5))
+    )
+
+    assert len(set(ids)) == 5
+    assert celery.send_task.call_count == 5
+    celery.producer_or_acquire.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_enqueue_many_batches_and_reports_errors(celery):
+    """Test failed sends are returned in place when requested."""
+
+    def send_task(name, **options):
+        if options["args"] == [2]:
+            raise ConnectionError("broker down")
+        return MagicMock(id=options["task_id"])
+
+    celery.send_task.side_effect = send_task
+
+    with patch.object(task_queue.settings, "TASK_ENQUEUE_MAX_BATCH", 2):
+        results = await task_queue.enqueue_many(
+            [("generate_retainer", [n], None) for n in range(3)],
+            return_exceptions=True,
+        )
+
+    assert isinstance(results[0], str)
+    assert isinstance(results[1], str)
+    assert isinstance(results[2], ConnectionError)
+    assert celery.producer_or_acquire.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_enqueue_raises_send_error(celery):
+    """Test a broker error reaches the awaiting caller."""
+    celery.send_task.side_effect = ConnectionError("broker down")
+
+    with pytest.raises(ConnectionError):
+        await task_queue.enqueue("generate_retainer", 1)
+
+
+@pytest.mark.asyncio
+async def test_close_publishes_pending_sends(celery):
+    """Test shutdown waits for queued sends to be published."""
+    futures = task_queue.get_enqueuer().submit(
+        [("generate_retainer", [1], {}, "task-1")]
+    )
+
+    await task_queue.close_enqueuer()
+
+    assert futures[0].result() == "task-1"
+    assert not task_queue._enqueuers
@@ -1,10 +1,11 @@
 """Tests for Twilio client functionality."""
 
-from unittest.mock import MagicMock, patch
+import asyncio
+from unittest.mock import AsyncMock, patch
 
+import httpx
 import pytest
 from fastapi import HTTPException
-from twilio.base.exceptions import TwilioRestException
 
 from pi_auto_api.externals.twilio_client import send_fax, send_sms
 
@@ -14,31 +15,35 @@ TEST_MESSAGE = "This is a test SMS message"
 TEST_MEDIA_URL = "https://example.com/document.pdf"
 TEST_SMS_SID = "SM123456789abcdef"
 TEST_FAX_SID = "FX123456789abcdef"
+SMS_URL = "https://api.twilio.com/2010-04-01/Accounts/test_account_sid/Messages.json"
+FAX_URL = "https://fax.twilio.com/v1/Faxes"
 
 
-@pytest.fixture
-def mock_twilio_client():
-    """Mock the Twilio client for testing."""
-    with patch("pi_auto_api.externals.twilio_client.Client") as mock_client:
-        # Create mock response objects
-        mock_message = MagicMock()
-        mock_message.sid = TEST_SMS_SID
+def twilio_response(status_code, url, json=None, headers=None):
+    """Build a Twilio REST API response for the given request URL."""
+    return httpx.Response(
+        status_code,
+        json=json or {"code": 20000 + status_code, "message": "Twilio error"},
+        headers=headers,
+        request=httpx.Request("POST", url),
+    )
 
-        mock_fax = MagicMock()
-        mock_fax.sid = TEST_FAX_SID
 
-        # Set up the mock client structure
-        client_instance = mock_client.return_value
-        client_instance.messages.create.return_value = mock_message
+@pytest.fixture
+def mock_twilio_client():
+    """Mock the shared HTTP client used to call the Twilio API."""
+    client = AsyncMock()
 
-        # For fax, we need to mock the nested structure
-        mock_faxes = MagicMock()
-        mock_faxes.create.return_value = mock_fax
-        mock_fax_v1 = MagicMock()
-        mock_fax_v1.faxes = mock_faxes
-        client_instance.fax.v1 = mock_fax_v1
+    async def post(url, data, auth):
+        sid = TEST_FAX_SID if url == FAX_URL else TEST_SMS_SID
+        return twilio_response(201, url, json={"sid": sid})
 
-        yield client_instance
+    client.post.side_effect = post
+    with patch(
+        "pi_auto_api.externals.twilio_client.get_client", return_value=client
+    ) as mock_get_client:
+        client.get_client = mock_get_client
+        yield client
 
 
 @pytest.fixture
@@ -49,9 +54,20 @@ def mock_twilio_settings():
         mock_settings.TWILIO_AUTH_TOKEN = "test_auth_token"
         mock_settings.TWILIO_SMS_FROM = "+15557654321"
         mock_settings.TWILIO_FAX_FROM = "+15557654321"
+        mock_settings.TWILIO_RETRY_BASE_DELAY = 1.0
+        mock_settings.TWILIO_RETRY_MAX_DELAY = 30.0
         yield mock_settings
 
 
+@pytest.fixture
+def mock_sleep():
+    """Patch asyncio.sleep in the Twilio client to avoid waiting in tests."""
+    with patch(
+        "pi_auto_api.externals.twilio_client.asyncio.sleep", new_callable=AsyncMock
+    ) as sleep:
+        yield sleep
+
+
 @pytest.mark.asyncio
 async def test_send_sms_success(mock_twilio_client, mock_twilio_settings):
     """Test successful SMS sending."""
@@ -60,9 +76,16 @@ async def test_send_sms_success(mock_twilio_client, mock_twilio_settings):
     # Verify the result
     assert result == TEST_SMS_SID
 
-    # Verify the client was called with correct parameters
-    mock_twilio_client.messages.create.assert_called_once_with(
-        body=TEST_MESSAGE, from_=mock_twilio_settings.TWILIO_SMS_FROM, to=TEST_PHONE
+    # Verify the shared client was called with correct parameters
+    mock_twilio_client.get_client.assert_called_with("twilio")
+    mock_twilio_client.post.assert_awaited_once_with(
+        SMS_URL,
+        data={
+            "To": TEST_PHONE,
+            "From": mock_twilio_settings.TWILIO_SMS_FROM,
+            "Body": TEST_MESSAGE,
+        },
+        auth=("test_account_sid", "test_auth_token"),
     )
 
 
@@ -74,11 +97,15 @@ async def test_send_fax_success(mock_twilio_client, mock_twilio_settings):
     # Verify the result
     assert result == TEST_FAX_SID
 
-    # Verify the client was called with correct parameters
-    mock_twilio_client.fax.v1.faxes.create.assert_called_once_with(
-        from_=mock_twilio_settings.TWILIO_FAX_FROM,
-        to=TEST_PHONE,
-        media_url=TEST_MEDIA_URL,
+    # Verify the shared client was called with correct parameters
+    mock_twilio_client.post.assert_awaited_once_with(
+        FAX_URL,
+        data={
+            "To": TEST_PHONE,
+            "From": mock_twilio_settings.TWILIO_FAX_FROM,
+            "MediaUrl": TEST_MEDIA_URL,
+        },
+        auth=("test_account_sid", "test_auth_token"),
     )
 
 
@@ -91,122 +118,161 @@ async def test_send_sms_with_custom_from(mock_twilio_client, mock_twilio_setting
     # Verify the result
     assert result == TEST_SMS_SID
 
-    # Verify the client was called with correct parameters
-    mock_twilio_client.messages.create.assert_called_once_with(
-        body=TEST_MESSAGE, from_=custom_from, to=TEST_PHONE
-    )
+    # Verify the custom sender was used
+    data = mock_twilio_client.post.call_args.kwargs["data"]
+    assert data["From"] == custom_from
 
 
 @pytest.mark.asyncio
-async def test_send_sms_retry_success(mock_twilio_client, mock_twilio_settings):
+async def test_send_sms_retry_success(
+    mock_twilio_client, mock_twilio_settings, mock_sleep
+):
     """Test SMS retry logic with eventual success."""
-    # Mock first call to fail with a 500 error, then succeed
-    error_response = TwilioRestException(
-        status=500, uri="test_uri", msg="Server error", method="POST", details={}
-    )
-
-    # Configure the mock to fail once then succeed
-    mock_twilio_client.messages.create.side_effect = [
-        error_response,
-        mock_twilio_client.messages.create.return_value,
+    # First call fails with a 500 error, then succeeds
+    mock_twilio_client.post.side_effect = [
+        twilio_response(500, SMS_URL),
+        twilio_response(201, SMS_URL, json={"sid": TEST_SMS_SID}),
     ]
 
-    # Patch sleep to avoid waiting in tests
-    with patch("time.sleep") as mock_sleep:
-        result = await send_sms(to=TEST_PHONE, body=TEST_MESSAGE)
+    result = await send_sms(to=TEST_PHONE, body=TEST_MESSAGE)
 
     # Verify the result
     assert result == TEST_SMS_SID
 
     # Verify the client was called twice
-    assert mock_twilio_client.messages.create.call_count == 2
+    assert mock_twilio_client.post.await_count == 2
 
-    # Verify sleep was called once with backoff time
-    mock_sleep.assert_called_once_with(1)
+    # Verify sleep was called once with a jittered first backoff
+    mock_sleep.assert_awaited_once()
+    assert 0.5 <= mock_sleep.await_args.args[0] <= 1.0
 
 
 @pytest.mark.asyncio
-async def test_send_fax_retry_success(mock_twilio_client, mock_twilio_settings):
-    """Test fax retry logic with eventual success."""
-    # Mock first call to fail with a 429 error, then succeed
-    error_response = TwilioRestException(
-        status=429, uri="test_uri", msg="Too Many Requests", method="POST", details={}
-    )
-
-    # Configure the mock to fail once then succeed
-    mock_twilio_client.fax.v1.faxes.create.side_effect = [
-        error_response,
-        mock_twilio_client.fax.v1.faxes.create.return_value,
+async def test_send_fax_retry_honors_retry_after(
+    mock_twilio_client, mock_twilio_settings, mock_sleep
+):
+    """Test fax retry logic waits as long as Retry-After asks."""
+    # First call is rate limited with Retry-After, then succeeds
+    mock_twilio_client.post.side_effect = [
+        twilio_response(429, FAX_URL, headers={"Retry-After": "7"}),
+        twilio_response(201, FAX_URL, json={"sid": TEST_FAX_SID}),
     ]
 
-    # Patch sleep to avoid waiting in tests
-    with patch("time.sleep") as mock_sleep:
-        result = await send_fax(to=TEST_PHONE, media_url=TEST_MEDIA_URL)
+    result = await send_fax(to=TEST_PHONE, media_url=TEST_MEDIA_URL)
 
     # Verify the result
     assert result == TEST_FAX_SID
+    assert mock_twilio_client.post.await_count == 2
+    mock_sleep.assert_awaited_once_with(7.0)
 
-    # Verify the client was called twice
-    assert mock_twilio_client.fax.v1.faxes.create.call_count == 2
 
-    # Verify sleep was called once with backoff time
-    mock_sleep.assert_called_once_with(1)
+@pytest.mark.asyncio
+async def test_retry_after_is_capped(
+    mock_twilio_client, mock_twilio_settings, mock_sleep
+):
+    """Test that a huge Retry-After is capped at TWILIO_RETRY_MAX_DELAY."""
+    mock_twilio_client.post.side_effect = [
+        twilio_response(503, FAX_URL, headers={"Retry-After": "3600"}),
+        twilio_response(201, FAX_URL, json={"sid": TEST_FAX_SID}),
+    ]
+
+    await send_fax(to=TEST_PHONE, media_url=TEST_MEDIA_URL)
+
+    mock_sleep.assert_awaited_once_with(30.0)
 
 
 @pytest.mark.asyncio
-async def test_send_sms_max_retries_exceeded(mock_twilio_client, mock_twilio_settings):
+async def test_send_fax_retries_connect_errors(
+    mock_twilio_client, mock_twilio_settings, mock_sleep
+):
+    """Test that connection failures (request never sent) are retried."""
+    mock_twilio_client.post.side_effect = [
+        httpx.ConnectError("connection refused"),
+        twilio_response(201, FAX_URL, json={"sid": TEST_FAX_SID}),
+    ]
+
+    result = await send_fax(to=TEST_PHONE, media_url=TEST_MEDIA_URL)
+
+    assert result == TEST_FAX_SID
+    assert mock_twilio_client.post.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_send_sms_max_retries_exceeded(
+    mock_twilio_client, mock_twilio_settings, mock_sleep
+):
     """Test SMS retry logic when max retries is exceeded."""
     # Mock a 500 error for all attempts
-    error_response = TwilioRestException(
-        status=500, uri="test_uri", msg="Server error", method="POST", details={}
-    )
-
-    # Configure the mock to always fail
-    mock_twilio_client.messages.create.side_effect = error_response
+    mock_twilio_client.post.side_effect = None
+    mock_twilio_client.post.return_value = twilio_response(500, SMS_URL)
 
-    # Patch sleep to avoid waiting in tests
-    with patch("time.sleep") as mock_sleep:
-        with pytest.raises(HTTPException) as exc_info:
-            await send_sms(to=TEST_PHONE, body=TEST_MESSAGE, max_attempts=3)
+    with pytest.raises(HTTPException) as exc_info:
+        await send_sms(to=TEST_PHONE, body=TEST_MESSAGE, max_attempts=3)
 
     # Verify exception details
     assert exc_info.value.status_code == 500
     assert "Failed to send SMS" in exc_info.value.detail
 
     # Verify the client was called 3 times (initial + 2 retries)
-    assert mock_twilio_client.messages.create.call_count == 3
+    assert mock_twilio_client.post.await_count == 3
 
-    # Verify sleep was called twice with increasing backoff times
-    assert mock_sleep.call_count == 2
-    mock_sleep.assert_any_call(1)  # First retry
-    mock_sleep.assert_any_call(2)  # Second retry with doubled backoff
+    # Verify sleep was called twice with increasing (jittered) backoff times
+    assert mock_sleep.await_count == 2
+    first, second = (c.args[0] for c in mock_sleep.await_args_list)
+    assert 0.5 <= first <= 1.0
+    assert 1.0 <= second <= 2.0
 
 
 @pytest.mark.asyncio
-async def test_send_fax_non_retryable_error(mock_twilio_client, mock_twilio_settings):
+async def test_send_fax_non_retryable_error(
+    mock_twilio_client, mock_twilio_settings, mock_sleep
+):
     """Test fax sending with a non-retryable error (4xx)."""
     # Mock a 400 error (not retryable)
-    error_response = TwilioRestException(
-        status=400, uri="test_uri", msg="Bad Request", method="POST", details={}
-    )
+    mock_twilio_client.post.side_effect = None
+    mock_twilio_client.post.return_value = twilio_response(400, FAX_URL)
 
-    # Configure the mock to fail
-    mock_twilio_client.fax.v1.faxes.create.side_effect = error_response
-
-    # Patch sleep to verify it's not called
-    with patch("time.sleep") as mock_sleep:
-        with pytest.raises(HTTPException) as exc_info:
-            await send_fax(to=TEST_PHONE, media_url=TEST_MEDIA_URL)
+    with pytest.raises(HTTPException) as exc_info:
+        await send_fax(to=TEST_PHONE, media_url=TEST_MEDIA_URL)
 
     # Verify exception details
     assert exc_info.value.status_code == 500
     assert "Failed to send fax" in exc_info.value.detail
 
     # Verify the client was called only once (no retries for 4xx)
-    assert mock_twilio_client.fax.v1.faxes.create.call_count == 1
+    assert mock_twilio_client.post.await_count == 1
 
     # Verify sleep was not called
-    mock_sleep.assert_not_called()
+    mock_sleep.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_retry_does_not_block_event_loop(
+    mock_twilio_client, mock_twilio_settings
+):
+    """Test that other coroutines keep running while a fax backs off."""
+    mock_twilio_settings.TWILIO_RETRY_BASE_DELAY = 0.2
+    mock_twilio_client.post.side_effect = [
+        twilio_response(503, FAX_URL),
+        twilio_response(201, FAX_URL, json={"sid": TEST_FAX_SID}),
+    ]
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker_task = asyncio.create_task(ticker())
+    try:
+        result = await send_fax(to=TEST_PHONE, media_url=TEST_MEDIA_URL)
+    finally:
+        ticker_task.cancel()
+
+    assert result == TEST_FAX_SID
+    # The ticker ran throughout the 0.1-0.2s backoff
+    assert ticks >= 5
 
 
 @pytest.mark.asyncio
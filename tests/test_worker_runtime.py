@@ -0,0 +1,80 @@
+"""Tests for the persistent per-process Celery event loop runtime."""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from pi_auto_api import worker_runtime
+from pi_auto_api.celery_app import app
+
+
+@pytest.fixture
+def runtime():
+    """Provide a fresh runtime and stop it after the test."""
+    worker_runtime.shutdown()
+    yield worker_runtime
+    worker_runtime.shutdown()
+
+
+@app.task(name="tests.async_echo")
+async def async_echo(value):
+    """Async task body used to exercise AsyncTask."""
+    await asyncio.sleep(0)
+    return {"value": value, "loop": id(asyncio.get_running_loop())}
+
+
+def test_run_async_reuses_one_loop(runtime):
+    """Test that consecutive coroutines share the same long-lived loop."""
+
+    async def current_loop():
+        return asyncio.get_running_loop()
+
+    first = runtime.run_async(current_loop())
+    second = runtime.run_async(current_loop())
+
+    assert first is second
+    assert first is runtime.get_loop()
+    assert not first.is_closed()
+
+
+def test_run_async_propagates_exceptions(runtime):
+    """Test that errors raised by the coroutine reach the caller."""
+
+    async def boom():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        runtime.run_async(boom())
+
+
+def test_async_task_body_runs_on_worker_loop(runtime):
+    """Test that calling an async task synchronously drives it on the loop."""
+    first = async_echo(1)
+    second = async_echo(2)
+
+    assert first["value"] == 1
+    assert second["value"] == 2
+    assert first["loop"] == second["loop"] == id(runtime.get_loop())
+
+
+@pytest.mark.asyncio
+async def test_async_task_is_awaitable_from_async_code():
+    """Test that awaiting a task from async code uses the caller's loop."""
+    result = await async_echo(3)
+
+    assert result == {"value": 3, "loop": id(asyncio.get_running_loop())}
+
+
+def test_shutdown_closes_resources(runtime):
+    """Test that shutdown releases loop-bound resources and stops the loop."""
+    loop = runtime.get_loop()
+    with (
+        patch("pi_auto_api.db_pool.close_pool", AsyncMock()) as mock_close_pool,
+        patch("pi_auto_api.events.close_redis_client", AsyncMock()) as mock_close_redis,
+    ):
+        runtime.shutdown()
+
+    mock_close_pool.assert_awaited_once()
+    mock_close_redis.assert_awaited_once()
+    assert loop.is_closed()